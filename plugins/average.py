@@ -37,17 +37,17 @@ from collections import OrderedDict
 import logging
 import numpy
 from odemis import model, dataio
+from odemis.acq.accumulator import FrameAccumulator
 import odemis.gui
 from odemis.gui.conf import get_acqui_conf
 from odemis.gui.plugin import Plugin, AcquisitionDialog
 import os
-import threading
 import time
 
 
 class AveragePlugin(Plugin):
     name = "Frame Average"
-    __version__ = "1.0"
+    __version__ = "1.1"
     __author__ = "Éric Piel"
     __license__ = "Public domain"
 
@@ -176,10 +176,9 @@ class AveragePlugin(Plugin):
             raise ValueError("No EM detector available")
         logging.info("Will acquire frame average on %d detectors", len(dets))
 
-        self._das = [None] * len(dets)  # Data just received
-        sumdas = [None] * len(dets)  # to store accumulated frame (in float)
-        md = [None] * len(dets)  # to store the metadata
-        self._prepare_acq(dets)
+        # One accumulator per detector, which sums the frames in the background
+        accs = [FrameAccumulator(d.data, nb) for d in dets]
+        self._prepare_acq(dets, accs)
 
         end = time.time() + self.expectedDuration.value
         if main_data.cld:
@@ -207,34 +206,22 @@ class AveragePlugin(Plugin):
                 # Start acquisition
                 dets[0].softwareTrigger.notify()
 
-                # Wait for the acquisition
-                for i, ev in enumerate(self._events):
-                    if not ev.wait(dur * 3 + 5):
+                # Wait for the acquisition. The frame is summed by the
+                # accumulator while the next frame is acquired.
+                for acc in accs:
+                    if not acc.waitReceived(i + 1, dur * 3 + 5):
                         raise IOError("Timeout while waiting for frame")
-                    ev.clear()
-
-                    # Add the latest frame to the sum
-                    # TODO: do this while waiting for the next frame (to save time)
-                    da = self._das[i]
-                    if sumdas[i] is None:
-                        # Convert to float, to handle very large numbers
-                        sumdas[i] = da.astype(numpy.float64)
-                        md[i] = da.metadata
-                    else:
-                        sumdas[i] += da
 
                 logging.info("Acquired frame %d", i + 1)
 
                 if f.cancelled():
                     logging.debug("Acquisition cancelled")
                     return
-        finally:
-            self._end_acq(dets)
 
-        # Compute the average data
-        fdas = []
-        for sd, md, ld in zip(sumdas, md, self._das):
-            fdas.append(self._average_data(self.accumulations.value, sd, md, ld.dtype))
+            # Compute the average data
+            fdas = [acc.getAverage(timeout=frt + 5) for acc in accs]
+        finally:
+            self._end_acq(dets, accs)
 
         logging.info("Exporting data to %s", self.filename.value)
         exporter = dataio.find_fittest_converter(self.filename.value)
@@ -245,47 +232,17 @@ class AveragePlugin(Plugin):
         self.showAcquisition(self.filename.value)
         dlg.Destroy()
 
-    def _prepare_acq(self, dets):
+    def _prepare_acq(self, dets, accs):
         # We could synchronize all the detectors, but doing just one will force
         # the others to wait, as they are all handled by the same e-beam driver
         d0 = dets[0]
         d0.data.synchronizedOn(d0.softwareTrigger)
 
-        # For each detector, create a listener to receive the data, and an event
-        # to let the main loop know this data has been received
-        self._events = []
-        self._listeners = []
-        for i, d in enumerate(dets):
-            ev = threading.Event()
-            self._events.append(ev)
-
-            # Ad-hoc function to receive the data
-            def on_data(df, data, i=i, ev=ev):
-                self._das[i] = data
-                ev.set()
+        # Each accumulator subscribes to the data of its detector
+        for acc in accs:
+            acc.start()
 
-            self._listeners.append(on_data)
-            d.data.subscribe(on_data)
-
-    def _end_acq(self, dets):
+    def _end_acq(self, dets, accs):
         dets[0].data.synchronizedOn(None)
-        for d, l in zip(dets, self._listeners):
-            d.data.unsubscribe(l)
-
-    def _average_data(self, nb, sumda, md, dtype):
-        """
-        nb (int): the number of acquisitions
-        sumda (DataArray): the accumulated acquisition from a detector
-        md (dict): the metadata
-        dtype (numpy.dtype): the data type to be converted to
-        return (DataArray): the averaged frame (with the correct metadata)
-        """
-        a = sumda / nb
-        a = model.DataArray(a.astype(dtype), md)
-
-        # The metadata is the on from the first DataArray, which is good for
-        # _almost_ everything
-        if model.MD_DWELL_TIME in a.metadata:
-            a.metadata[model.MD_DWELL_TIME] *= nb
-
-        return a
+        for acc in accs:
+            acc.stop()
@@ -23,10 +23,13 @@ You should have received a copy of the GNU General Public License along with Ode
 import Queue
 from collections import OrderedDict
 import logging
+import numpy
 from odemis import dataio, model, gui
+from odemis.dataio import rawrec, tiff
 from odemis.acq import stream
 from odemis.gui.conf import get_acqui_conf
 from odemis.gui.plugin import Plugin, AcquisitionDialog
+from odemis.gui.util import formats_to_wildcards
 import os
 import threading
 import time
@@ -38,7 +41,7 @@ LIVE_UPDATE_PERIOD = 10  # s, time between two images in the GUI (during acquisi
 
 class SRAcqPlugin(Plugin):
     name = "Super-resolution acquisition"
-    __version__ = "1.0"
+    __version__ = "1.1"
     __author__ = "Éric Piel"
     __license__ = "Public domain"
 
@@ -92,6 +95,8 @@ class SRAcqPlugin(Plugin):
         ("filename", {
             "tooltip": "Each acquisition will be saved with the name and the number appended.",
             "control_type": gui.CONTROL_SAVE_FILE,
+            "wildcard": formats_to_wildcards({tiff.FORMAT: tiff.EXTENSIONS,
+                                              rawrec.FORMAT: rawrec.EXTENSIONS})[0],
         }),
         ("expectedDuration", {
         }),
@@ -160,6 +165,8 @@ class SRAcqPlugin(Plugin):
         self._last_display = 0  # last time the GUI image was updated
         self._future = None  # future to represent the acquisition progress
         self._exporter = None  # to save the file
+        self._recorder = None  # RawRecorder, if saving as raw recording
+        self._use_rawrec = False
 
         self._q = Queue.Queue()  # queue of tuples (str, DataArray) for saving data
         self._qdisplay = Queue.Queue()
@@ -181,8 +188,8 @@ class SRAcqPlugin(Plugin):
         # Make the name "fn" -> "fn-XXXXXX.ext"
         bn, ext = os.path.splitext(fn)
         self._fntmpl = bn + "-%06d" + ext
-        if not ext.endswith(".tiff"):
-            logging.warning("Only TIFF format is recommended to use")
+        if not ext.endswith(".tiff") and ext != rawrec.EXTENSIONS[0]:
+            logging.warning("Only TIFF or raw recording formats are recommended to use")
 
         # Store the directory so that next filename is in the same place
         conf = get_acqui_conf()
@@ -254,6 +261,10 @@ class SRAcqPlugin(Plugin):
         # Make sure the stream is not playing
         self._stream.should_update.value = False
 
+        # For high frame rates, the raw recording format allows to save the
+        # frames directly from the DataFlow callback (and convert them later).
+        self._use_rawrec = self.filename.value.endswith(rawrec.EXTENSIONS[0])
+        self._recorder = None
         self._exporter = dataio.find_fittest_converter(self.filename.value)
 
         nb = self.number.value
@@ -281,6 +292,15 @@ class SRAcqPlugin(Plugin):
             self._stream._setup_emission()
             self._stream._setup_excitation()
 
+            if self._use_rawrec:
+                # Preallocate the file, so that the frames can be directly
+                # copied to it as soon as they arrive
+                res = self.ccd.resolution.value
+                depth = self.ccd.shape[-1]  # max value + 1
+                dtype = numpy.uint16 if depth <= 2 ** 16 else numpy.uint32
+                self._recorder = rawrec.RawRecorder(self.filename.value,
+                                                    res[::-1], dtype, nb)
+
             # Let it start!
             self.ccd.data.subscribe(self._on_image)
 
@@ -301,6 +321,11 @@ class SRAcqPlugin(Plugin):
                     pass
 
             logging.info("Waiting for all data to be saved")
+            if self._recorder:
+                stats = self._recorder.close()
+                logging.info("Raw recording: %d frames at %g MB/s, %d dropped, ~%d missed",
+                             stats["frames"], stats["throughput"] / 1e6,
+                             stats["dropped"], stats["missed"])
             dur = self._q.qsize() * 0.1  # very pessimistic
             f.set_progress(end=time.time() + dur)
             self._q.join()
@@ -310,6 +335,8 @@ class SRAcqPlugin(Plugin):
                 return
         except Exception as ex:
             self.ccd.data.unsubscribe(self._on_image)
+            if self._recorder:
+                self._recorder.close()
             # TODO: write this in the window
             logging.exception("Failure during SR acquisition")
             f.set_exception(ex)
@@ -338,15 +365,21 @@ class SRAcqPlugin(Plugin):
         """
         try:
             self._n += 1
-            self._q.put((self._n, data))
-            now = time.time()
-            fps = self._n / (now - self._startt)
-            logging.info("Received data %d (%g fps), queue size = %d",
-                         self._n, fps, self._q.qsize())
-
-            if self._q.qsize() > 8:
-                logging.warning("Saving queue is behind acquisition")
-            # TODO: if queue size too long => pause until it's all processed
+            if self._recorder:
+                # Directly copy the data to the (memory-mapped) file
+                self._recorder.onData(df, data)
+                now = time.time()
+                logging.debug("Recorded data %d", self._n)
+            else:
+                self._q.put((self._n, data))
+                now = time.time()
+                fps = self._n / (now - self._startt)
+                logging.info("Received data %d (%g fps), queue size = %d",
+                             self._n, fps, self._q.qsize())
+
+                if self._q.qsize() > 8:
+                    logging.warning("Saving queue is behind acquisition")
+                # TODO: if queue size too long => pause until it's all processed
 
             if self._future.cancelled():
                 logging.info("Stopping early due to cancellation")
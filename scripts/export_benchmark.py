@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Created on 19 Oct 2026
+
+@author: Éric Piel
+
+Copyright © 2026 Éric Piel, Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# This script measures the performance of the spatial export (as used by the
+# GUI "Export" menu), on synthetic streams. It doesn't need a display, nor a
+# backend. It reports, for several tile sizes and numbers of workers:
+#  * The time to export the print-ready image in memory
+#  * The time to export the print-ready image directly to a PNG file
+#  * The peak memory used during each export
+# The results are written to a JSON file, so that they can be compared between
+# versions. Example:
+# ./scripts/export_benchmark.py --output export-bench-$(git describe).json
+
+from __future__ import division
+
+import argparse
+import json
+import logging
+import multiprocessing
+import numpy
+import odemis
+from odemis import model
+from odemis.acq import stream
+from odemis.gui.util import img
+from odemis.util import driver
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+
+# Tile size (px), and number of workers (None = number of CPUs)
+TILE_SETTINGS = ((100000, 1), (img.EXPORT_TILE_SIZE, 1), (img.EXPORT_TILE_SIZE, None), (256, None))
+
+
+def create_streams(size):
+    """
+    Create synthetic streams similar to a SECOM acquisition: a SEM image, and
+    two fluorescence images with a bigger pixel size, rotation and shear.
+    size (int): width and height (in px) of the SEM image
+    return (list of Projections, (float, float), (float, float)): the
+      projections of the streams, the field of view and the center of the view
+    """
+    pxs = 10e-9  # m
+    pos = (-1.2e-3, 0.3e-3)
+    yy, xx = numpy.mgrid[0:size, 0:size]
+    sem_data = ((numpy.sin(xx / 37) + numpy.cos(yy / 23) + 2) * 1000).astype(numpy.uint16)
+    md = {model.MD_PIXEL_SIZE: (pxs, pxs),
+          model.MD_POS: pos,
+          model.MD_ACQ_DATE: time.time(),
+          model.MD_BPP: 12,
+          model.MD_DESCRIPTION: "Secondary electrons"}
+    streams = [stream.StaticSEMStream("SEM", model.DataArray(sem_data, md))]
+
+    fsize = size // 4
+    for i, (tint, rot) in enumerate((((255, 0, 0), 0.02), ((0, 255, 0), 0.1))):
+        fdata = numpy.random.randint(0, 4000, (fsize, fsize)).astype(numpy.uint16)
+        md = {model.MD_PIXEL_SIZE: (pxs * 5, pxs * 5),  # Upscaled when exported
+              model.MD_POS: pos,
+              model.MD_ACQ_DATE: time.time(),
+              model.MD_BPP: 12,
+              model.MD_ROTATION: rot,
+              model.MD_SHEAR: 0.01,
+              model.MD_USER_TINT: tint,
+              model.MD_DESCRIPTION: "Fluo %d" % (i + 1,)}
+        streams.append(stream.StaticFluoStream("Fluo %d" % (i + 1,), model.DataArray(fdata, md)))
+
+    projs = [stream.RGBSpatialProjection(s) for s in streams]
+
+    # Wait for all the streams to get an RGB image
+    for p in projs:
+        for i in range(100):
+            if p.image.value is not None:
+                break
+            time.sleep(0.1)
+
+    return projs, (size * pxs, size * pxs), pos
+
+
+def _measure(fn, *args, **kwargs):
+    """
+    Run a function, and measure its duration and peak memory usage
+    return (dict str -> float): duration (in s) and peak memory increase (in MB)
+    """
+    mem_start = driver.readMemoryUsage()
+    peak = [mem_start]
+    done = threading.Event()
+
+    def sample_memory():
+        while not done.wait(0.01):
+            peak[0] = max(peak[0], driver.readMemoryUsage())
+
+    t = threading.Thread(target=sample_memory, name="Memory sampling")
+    t.start()
+    try:
+        startt = time.time()
+        fn(*args, **kwargs)
+        dur = time.time() - startt
+    finally:
+        done.set()
+        t.join()
+
+    return {"duration": dur, "memory": (peak[0] - mem_start) / 2 ** 20}
+
+
+def run_benchmark(size, reps):
+    """
+    Export the synthetic streams with various settings, and measure the performance
+    size (int): width and height (in px) of the SEM image
+    reps (0<int): number of repetitions of each export
+    return (dict str -> value): all the results
+    """
+    results = {"version": odemis.__version__,
+               "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "host": platform.node(),
+               "python": platform.python_version(),
+               "cpus": multiprocessing.cpu_count(),
+               "settings": {"size": size, "reps": reps},
+               "exports": [],
+               }
+
+    projs, view_hfw, view_pos = create_streams(size)
+    fn = os.path.join(tempfile.gettempdir(), "export-benchmark.png")
+    try:
+        for tile_size, workers in TILE_SETTINGS:
+            for i in range(reps):
+                res = {"tile_size": tile_size, "workers": workers}
+                res["memory"] = _measure(img.images_to_export_data, projs, view_hfw,
+                                         view_pos, 0.3, False,
+                                         tile_size=tile_size, max_workers=workers)
+                res["file"] = _measure(img.images_to_export_file, fn, projs, view_hfw,
+                                       view_pos, 0.3,
+                                       tile_size=tile_size, max_workers=workers)
+                logging.info("Tiles of %d px with %s workers: %.3f s in memory (+%d MB), "
+                             "%.3f s to file (+%d MB)", tile_size, workers,
+                             res["memory"]["duration"], res["memory"]["memory"],
+                             res["file"]["duration"], res["file"]["memory"])
+                results["exports"].append(res)
+    finally:
+        try:
+            os.remove(fn)
+        except OSError:
+            pass
+
+    return results
+
+
+def main(args):
+    """
+    Handles the command line arguments
+    args is the list of arguments passed
+    return (int): value to return to the OS as program exit code
+    """
+    # arguments handling
+    parser = argparse.ArgumentParser(description="Measure the performance of "
+                                     "the spatial export on synthetic streams")
+
+    parser.add_argument("--log-level", dest="loglev", metavar="<level>", type=int,
+                        default=1, help="set verbosity level (0-2, default = 1)")
+    parser.add_argument("--size", "-s", dest="size", type=int, default=4096,
+                        help="width and height (in px) of the SEM image")
+    parser.add_argument("--reps", "-r", dest="reps", type=int, default=3,
+                        help="number of repetitions of each export")
+    parser.add_argument("--output", "-o", dest="output",
+                        help="name of the JSON file where to store the results")
+
+    options = parser.parse_args(args[1:])
+
+    # Set up logging before everything else
+    if options.loglev < 0:
+        logging.error("Log-level must be positive.")
+        return 127
+    loglev_names = (logging.WARNING, logging.INFO, logging.DEBUG)
+    loglev = loglev_names[min(len(loglev_names) - 1, options.loglev)]
+    logging.getLogger().setLevel(loglev)
+
+    try:
+        results = run_benchmark(options.size, options.reps)
+    except KeyboardInterrupt:
+        logging.info("Interrupted before the end of the execution")
+        return 1
+    except Exception:
+        logging.exception("Unexpected error while performing action.")
+        return 127
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        logging.info("Results written to %s", options.output)
+    else:
+        json.dump(results, sys.stdout, indent=1, sort_keys=True)
+        print ""
+
+    return 0
+
+if __name__ == '__main__':
+    ret = main(sys.argv)
+    exit(ret)
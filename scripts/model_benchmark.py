@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Created on 14 Oct 2026
+
+@author: Éric Piel
+
+Copyright © 2026 Éric Piel, Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# This script measures the performance of the remote object layer of Odemis
+# (Pyro4 calls, DataFlows via ZMQ, and VigilantAttributes), between a backend
+# container running simulated hardware (simcam and simsem) and this process.
+# It reports:
+#  * DataFlow throughput (frames/s and MB/s) for several frame sizes
+#  * End-to-end latency of the frames (from end of acquisition to reception)
+#  * Round-trip time for reading and writing a VA, and for the change
+#    notification of a VA to be received
+#  * Time to subscribe/unsubscribe to a DataFlow and receive the first frame
+# The results are written to a JSON file, so that they can be compared between
+# versions.
+#
+# It doesn't need (and shouldn't be run with) a running backend. Example:
+# ./scripts/model_benchmark.py --output bench-$(git describe).json
+
+from __future__ import division
+
+import argparse
+import json
+import logging
+import numpy
+import odemis
+from odemis import model
+from odemis.driver import simcam, simsem
+import platform
+import sys
+import threading
+import time
+
+
+CONFIG_CAM = {"name": "benchcam", "role": "ccd", "image": "simcam-fake-overview.h5"}
+CONFIG_SEM = {"name": "benchsem", "role": "sem", "image": "simsem-fake-output.h5",
+              "children": {"detector0": {"name": "benchsed", "role": "se-detector"},
+                           "scanner": {"name": "benchscanner", "role": "ebeam"}}
+              }
+
+# Binning (for the camera) or scale (for the SEM) used to change the frame size
+CAM_BINNINGS = (1, 2, 4, 8)
+SEM_SCALES = (1, 2, 4, 8, 16)
+
+
+def _stats(values):
+    """
+    Compute the summary statistics of a set of measurements
+    values (list of floats): the measurements (in s)
+    return (dict str -> float): number of values, mean, min, max, and the 50th,
+      90th, and 99th percentiles
+    """
+    if not values:
+        return {"count": 0}
+    a = numpy.array(values, dtype=numpy.float64)
+    p50, p90, p99 = numpy.percentile(a, [50, 90, 99])
+    return {"count": len(values),
+            "mean": float(a.mean()),
+            "min": float(a.min()),
+            "max": float(a.max()),
+            "p50": float(p50),
+            "p90": float(p90),
+            "p99": float(p99),
+            }
+
+
+class FrameCounter(object):
+    """
+    DataFlow listener which counts the frames received and records their
+    latency (based on the acquisition date and exposure time metadata).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.first = threading.Event()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.frames = 0
+            self.nbytes = 0
+            self.latencies = []
+            self.first_time = None
+            self.first.clear()
+
+    def onData(self, df, data):
+        now = time.time()
+        with self._lock:
+            self.frames += 1
+            self.nbytes += data.nbytes
+            if self.first_time is None:
+                self.first_time = now
+                self.first.set()
+            md = data.metadata
+            if model.MD_ACQ_DATE in md:
+                # Acquisition date is the _beginning_ of the acquisition
+                endt = md[model.MD_ACQ_DATE]
+                endt += md.get(model.MD_EXP_TIME, 0)
+                endt += md.get(model.MD_DWELL_TIME, 0) * data.size
+                self.latencies.append(now - endt)
+
+
+def measure_dataflow(df, duration):
+    """
+    Receive frames from a DataFlow during a given time
+    df (DataFlow): the DataFlow to subscribe to
+    duration (0<float): time to record the frames (in s)
+    return (dict str -> value): the throughput and latency measured
+    """
+    counter = FrameCounter()
+    df.subscribe(counter.onData)
+    try:
+        # Wait for the first frame, to not count the start-up time
+        if not counter.first.wait(10 + duration):
+            raise IOError("No frame received after %g s" % (10 + duration,))
+        time.sleep(0.1)
+        counter.reset()
+        startt = time.time()
+        time.sleep(duration)
+        with counter._lock:
+            dur = time.time() - startt
+            frames = counter.frames
+            nbytes = counter.nbytes
+            latencies = list(counter.latencies)
+    finally:
+        df.unsubscribe(counter.onData)
+
+    return {"frames": frames,
+            "duration": dur,
+            "fps": frames / dur,
+            "throughput": nbytes / dur,  # B/s
+            "frame_size": nbytes // frames if frames else 0,  # B
+            "latency": _stats(latencies),
+            }
+
+
+def measure_subscription(df, reps):
+    """
+    Measure the time to subscribe and unsubscribe to a DataFlow, and the time
+    until the first frame is received.
+    df (DataFlow): the DataFlow to subscribe to
+    reps (0<int): number of times to repeat the measurement
+    return (dict str -> dict): statistics for each step
+    """
+    sub_t = []
+    first_t = []
+    unsub_t = []
+    counter = FrameCounter()
+    for i in range(reps):
+        counter.reset()
+        startt = time.time()
+        df.subscribe(counter.onData)
+        sub_t.append(time.time() - startt)
+        if counter.first.wait(10):
+            first_t.append(counter.first_time - startt)
+        else:
+            logging.warning("No frame received after subscription %d", i)
+        startt = time.time()
+        df.unsubscribe(counter.onData)
+        unsub_t.append(time.time() - startt)
+
+    return {"subscribe": _stats(sub_t),
+            "first_frame": _stats(first_t),
+            "unsubscribe": _stats(unsub_t),
+            }
+
+
+def measure_va(va, values, reps):
+    """
+    Measure the round-trip time of a (remote) VA
+    va (VigilantAttribute): a read/write VA
+    values (list of 2 values): values to alternate when writing the VA
+    reps (0<int): number of times to repeat each measurement
+    return (dict str -> dict): statistics for reading, writing and the change
+      notification.
+    """
+    read_t = []
+    for i in range(reps):
+        startt = time.time()
+        va.value
+        read_t.append(time.time() - startt)
+
+    write_t = []
+    for i in range(reps):
+        v = values[i % 2]
+        startt = time.time()
+        va.value = v
+        write_t.append(time.time() - startt)
+
+    # Time between the write and the notification being received
+    notif_t = []
+    received = threading.Event()
+
+    def on_change(v):
+        received.set()
+
+    va.subscribe(on_change)
+    try:
+        for i in range(reps):
+            v = values[i % 2]
+            if va.value == v:
+                va.value = values[(i + 1) % 2]
+                received.wait(5)
+            received.clear()
+            startt = time.time()
+            va.value = v
+            if received.wait(5):
+                notif_t.append(time.time() - startt)
+            else:
+                logging.warning("No VA notification received after write %d", i)
+    finally:
+        va.unsubscribe(on_change)
+
+    # VA (un)subscription
+    vsub_t = []
+    for i in range(reps):
+        startt = time.time()
+        va.subscribe(on_change)
+        va.unsubscribe(on_change)
+        vsub_t.append(time.time() - startt)
+
+    return {"read": _stats(read_t),
+            "write": _stats(write_t),
+            "notification": _stats(notif_t),
+            "subscribe_unsubscribe": _stats(vsub_t),
+            }
+
+
+def bench_camera(cam, duration, reps):
+    """
+    Run all the measurements on a (simulated) camera
+    return (dict str -> value): the results
+    """
+    results = {"dataflow": []}
+    cam.exposureTime.value = cam.exposureTime.range[0]
+    for b in CAM_BINNINGS:
+        cam.binning.value = (b, b)
+        cam.resolution.value = cam.resolution.range[1]
+        res = cam.resolution.value
+        logging.info("Measuring camera DataFlow at %s px", res)
+        r = measure_dataflow(cam.data, duration)
+        r["resolution"] = res
+        r["exposure_time"] = cam.exposureTime.value
+        results["dataflow"].append(r)
+        logging.info("%s px: %.1f fps, %.1f MB/s, latency median = %.2f ms",
+                     res, r["fps"], r["throughput"] / 1e6,
+                     r["latency"].get("p50", 0) * 1e3)
+
+    cam.binning.value = (8, 8)
+    logging.info("Measuring camera subscription")
+    results["subscription"] = measure_subscription(cam.data, reps // 10 or 1)
+    expr = cam.exposureTime.range
+    logging.info("Measuring camera VA")
+    results["va"] = measure_va(cam.exposureTime, (expr[0], expr[0] * 2), reps)
+    return results
+
+
+def bench_sem(scanner, det, duration, reps):
+    """
+    Run all the measurements on a (simulated) SEM
+    return (dict str -> value): the results
+    """
+    results = {"dataflow": []}
+    scanner.dwellTime.value = scanner.dwellTime.range[0]
+    for s in SEM_SCALES:
+        scanner.scale.value = (s, s)
+        scanner.resolution.value = scanner.resolution.range[1]
+        res = scanner.resolution.value
+        logging.info("Measuring SEM DataFlow at %s px", res)
+        r = measure_dataflow(det.data, duration)
+        r["resolution"] = res
+        r["dwell_time"] = scanner.dwellTime.value
+        results["dataflow"].append(r)
+        logging.info("%s px: %.1f fps, %.1f MB/s, latency median = %.2f ms",
+                     res, r["fps"], r["throughput"] / 1e6,
+                     r["latency"].get("p50", 0) * 1e3)
+
+    scanner.scale.value = (SEM_SCALES[-1], SEM_SCALES[-1])
+    logging.info("Measuring SEM subscription")
+    results["subscription"] = measure_subscription(det.data, reps // 10 or 1)
+    dtr = scanner.dwellTime.range
+    logging.info("Measuring SEM VA")
+    results["va"] = measure_va(scanner.dwellTime, (dtr[0], dtr[0] * 2), reps)
+    return results
+
+
+def run_benchmark(duration, reps, in_own_process=True):
+    """
+    Start the simulators in a separate container, and measure the performance
+    duration (0<float): time for each throughput measurement (in s)
+    reps (0<int): number of repetitions for the round-trip measurements
+    return (dict str -> value): all the results
+    """
+    results = {"version": odemis.__version__,
+               "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "host": platform.node(),
+               "python": platform.python_version(),
+               "settings": {"duration": duration, "reps": reps},
+               }
+
+    # Start a container, which plays the role of the backend
+    container = model.createNewContainer("benchmark", validate=False,
+                                         in_own_process=in_own_process)
+    try:
+        startt = time.time()
+        cam = container.instantiate(simcam.Camera, CONFIG_CAM)
+        sem = container.instantiate(simsem.SimSEM, CONFIG_SEM)
+        results["startup"] = time.time() - startt
+        scanner = det = None
+        for c in sem.children.value:
+            if c.name == CONFIG_SEM["children"]["scanner"]["name"]:
+                scanner = c
+            elif c.name == CONFIG_SEM["children"]["detector0"]["name"]:
+                det = c
+
+        # Basic Pyro call round-trip
+        ping_t = []
+        for i in range(reps):
+            startt = time.time()
+            container.ping()
+            ping_t.append(time.time() - startt)
+        results["ping"] = _stats(ping_t)
+        logging.info("Ping median = %.3f ms", results["ping"]["p50"] * 1e3)
+
+        results["camera"] = bench_camera(cam, duration, reps)
+        results["sem"] = bench_sem(scanner, det, duration, reps)
+
+        sem.terminate()
+        cam.terminate()
+    finally:
+        container.terminate()
+
+    return results
+
+
+def main(args):
+    """
+    Handles the command line arguments
+    args is the list of arguments passed
+    return (int): value to return to the OS as program exit code
+    """
+    # arguments handling
+    parser = argparse.ArgumentParser(description="Measure the performance of "
+                                     "DataFlows and VAs on simulated hardware")
+
+    parser.add_argument("--log-level", dest="loglev", metavar="<level>", type=int,
+                        default=1, help="set verbosity level (0-2, default = 1)")
+    parser.add_argument("--duration", "-d", dest="duration", type=float, default=5,
+                        help="time (in s) of each throughput measurement")
+    parser.add_argument("--reps", "-r", dest="reps", type=int, default=200,
+                        help="number of repetitions of each round-trip measurement")
+    parser.add_argument("--threads", dest="threads", action="store_true", default=False,
+                        help="run the simulators in a thread instead of a separate process")
+    parser.add_argument("--output", "-o", dest="output",
+                        help="name of the JSON file where to store the results")
+
+    options = parser.parse_args(args[1:])
+
+    # Set up logging before everything else
+    if options.loglev < 0:
+        logging.error("Log-level must be positive.")
+        return 127
+    loglev_names = (logging.WARNING, logging.INFO, logging.DEBUG)
+    loglev = loglev_names[min(len(loglev_names) - 1, options.loglev)]
+    logging.getLogger().setLevel(loglev)
+
+    try:
+        results = run_benchmark(options.duration, options.reps,
+                                in_own_process=not options.threads)
+    except KeyboardInterrupt:
+        logging.info("Interrupted before the end of the execution")
+        return 1
+    except Exception:
+        logging.exception("Unexpected error while performing action.")
+        return 127
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        logging.info("Results written to %s", options.output)
+    else:
+        json.dump(results, sys.stdout, indent=1, sort_keys=True)
+        print ""
+
+    return 0
+
+if __name__ == '__main__':
+    ret = main(sys.argv)
+    exit(ret)
@@ -26,6 +26,7 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 
 from __future__ import division
 
+import Queue
 import collections
 from concurrent import futures
 from concurrent.futures import CancelledError
@@ -34,13 +35,17 @@ import math
 from odemis import model
 from odemis.acq import _futures
 from odemis.acq.stream import FluoStream, SEMCCDMDStream, \
-    OverlayStream, OpticalStream, EMStream, SEMMDStream
+    OverlayStream, OpticalStream, EMStream, SEMMDStream, MultipleDetectorStream
 from odemis.util import img, fluo
 import sys
 import threading
 import time
 
 
+# Maximum size (YX) of the thumbnail of an acquisition
+THUMBNAIL_SIZE = (512, 512)
+
+
 # TODO: Move this around so that acq.__init__ doesn't depend on acq.stream,
 # because it's a bit strange dependency.
 # This is the "manager" of an acquisition. The basic idea is that you give it
@@ -48,14 +53,16 @@ import time
 # background. You are in charge of ensuring that no other acquisition is
 # going on at the same time.
 # The manager receives a list of streams to acquire, order them in the best way,
-# and then creates a separate thread to run the acquisition of each stream. It
+# and then creates a separate thread to run the acquisition of each stream.
+# Streams which don't use the same hardware are acquired simultaneously. It
 # returns a special "ProgressiveFuture" which is a Future object that can be
 # stopped while already running, and reports from time to time progress on its
 # execution.
 def acquire(streams):
     """ Start an acquisition task for the given streams.
 
-    It will decide in which order the stream must be acquired.
+    It will decide in which order the stream must be acquired, and which
+    streams can be acquired simultaneously.
 
     ..Note:
         It is highly recommended to not have any other acquisition going on.
@@ -90,13 +97,14 @@ def estimateTime(streams):
     streams (list of Stream): the streams to acquire
     return (0 <= float): estimated time in s.
     """
-    tot_time = 0
     # We don't use mergeStreams() as it creates new streams at every call, and
-    # anyway sum of each stream should give already a good estimation.
-    for s in streams:
-        tot_time += s.estimateAcquisitionTime()
-
-    return tot_time
+    # anyway the time of each stream should give already a good estimation.
+    # The streams which use different hardware are acquired simultaneously.
+    streams = sorted(streams, key=_weight_stream, reverse=True)
+    times = dict((s, s.estimateAcquisitionTime()) for s in streams)
+    deps = _get_stream_dependencies(streams)
+    ends = _estimate_stream_ends(streams, deps, times, 0)
+    return max(ends.values()) if ends else 0
 
 def computeThumbnail(streamTree, acqTask):
     """
@@ -109,27 +117,53 @@ def computeThumbnail(streamTree, acqTask):
     """
     raw_data, e = acqTask.result() # get all the raw data from the acquisition
 
-    # FIXME: need to use the raw images of the acqTask as the source in the
-    # streams of the streamTree (instead of whatever is the latest content of
-    # .raw .
-
-    # FIXME: this call now doesn't work. We need to have a working .getImage()
-    # which do not depend on the GUI.
-    # thumbnail = self._streamTree.getImage()
-
-    # poor man's implementation: take the first image of the streams, hoping
-    # it actually has a renderer (.image)
+    # TODO: use the whole stream tree (ie, merge all the streams). For now,
+    # only the most important stream is used, as the projection of the other
+    # streams depends on the GUI.
     streams = sorted(streamTree.getStreams(), key=_weight_stream,
                      reverse=True)
     if not streams:
         logging.warning("No stream found in the stream tree")
         return None
 
-    iim = streams[0].image.value
+    s = streams[0]
+    data = _find_stream_data(s, raw_data)
+    if data is None:
+        # poor man's implementation: take the image of the stream, hoping
+        # it actually has a renderer (.image)
+        logging.info("No raw data found for stream %s, using its image", s.name.value)
+        iim = s.image.value
+    else:
+        # Reduce the data before projecting it, to avoid computing the whole
+        # (possibly huge) image just to rescale it afterwards.
+        irange = None
+        if model.hasVA(s, "intensityRange") and not (model.hasVA(s, "auto_bc") and s.auto_bc.value):
+            irange = s.intensityRange.value
+        tint = s.tint.value if model.hasVA(s, "tint") else (255, 255, 255)
+        iim = img.getThumbnail(data, THUMBNAIL_SIZE, irange, tint)
+
     # add some basic info to the image
     iim.metadata[model.MD_DESCRIPTION] = "Composited image preview"
     return iim
 
+def _find_stream_data(stream, raw_data):
+    """
+    Finds the raw data corresponding to a stream
+    stream (Stream): the stream
+    raw_data (list of DataArray or DataArrayShadow): the acquired data
+    return (DataArray or DataArrayShadow or None): the data of the stream,
+      or None if no data is available
+    """
+    name = stream.name.value
+    for d in raw_data:
+        if d.metadata.get(model.MD_DESCRIPTION) == name:
+            return d
+
+    # Not in the acquisition => use the latest data of the stream
+    if stream.raw:
+        return stream.raw[0]
+    return None
+
 def _weight_stream(stream):
     """
     Defines how much a stream is of priority (should be done first) for
@@ -168,6 +202,122 @@ def _weight_stream(stream):
         return 0
 
 
+def _get_stream_hardware(stream):
+    """
+    Finds the hardware used by a stream during its acquisition
+    stream (acq.stream.Stream): a stream
+    returns (None or (set of str, dict, set of str)): the names of the
+      components used, the optical path mode required for each optical path
+      manager, and the effects of the acquisition on the sample ("ebeam" if
+      the e-beam scans the sample, "fluo" if it's a fluorescence acquisition).
+      None if it's unknown, in which case the stream should be considered
+      as using all the hardware.
+    """
+    if isinstance(stream, OverlayStream):
+        # Uses both the SEM and the optical microscope, together
+        return None
+
+    comps = set()
+    paths = {}
+    effects = set()
+    if isinstance(stream, MultipleDetectorStream):
+        for s in stream.streams:
+            shw = _get_stream_hardware(s)
+            if shw is None:
+                return None
+            comps |= shw[0]
+            paths.update(shw[1])
+            effects |= shw[2]
+    else:
+        for attr in ("_detector", "_emitter", "_focuser", "_sstage"):
+            c = getattr(stream, attr, None)
+            if c is not None:
+                comps.add(c.name)
+        if not comps:
+            return None
+
+        emitter = getattr(stream, "_emitter", None)
+        if isinstance(stream, EMStream) or getattr(emitter, "role", None) == "e-beam":
+            effects.add("ebeam")
+        if isinstance(stream, FluoStream):
+            effects.add("fluo")
+
+    opm = getattr(stream, "_opm", None)
+    if opm is not None:
+        try:
+            paths[opm] = opm.guessMode(stream)
+        except LookupError:
+            pass  # The optical path doesn't need to be changed
+
+    return comps, paths, effects
+
+
+def _are_conflicting(hw1, hw2):
+    """
+    Checks whether two streams cannot be acquired simultaneously
+    hw1 (None or (set, dict, set)): the hardware used by the first stream, as
+      returned by _get_stream_hardware()
+    hw2 (None or (set, dict, set)): the hardware used by the second stream
+    returns (bool): True if the streams use some of the same hardware, or if
+      one scans the e-beam on the sample while the other one is a fluorescence
+      acquisition.
+    """
+    if hw1 is None or hw2 is None:
+        return True
+    comps1, paths1, effects1 = hw1
+    comps2, paths2, effects2 = hw2
+    if comps1 & comps2:
+        return True
+    # The same optical path manager cannot be in two different modes
+    for opm, mode in paths1.items():
+        if opm in paths2 and paths2[opm] != mode:
+            return True
+    # The e-beam bleaches the dyes (and causes cathodoluminescence), so the
+    # fluorescence must be acquired before (cf _weight_stream())
+    if ("ebeam" in effects1 and "fluo" in effects2 or
+        "fluo" in effects1 and "ebeam" in effects2):
+        return True
+    return False
+
+
+def _get_stream_dependencies(streams):
+    """
+    Computes which streams have to wait for other streams to be acquired.
+    streams (list of Stream): the streams, in the order of acquisition
+    returns (dict Stream -> set of Streams): for each stream, the streams
+      placed before it which use some of the same hardware, and so must be
+      finished before it can start.
+    """
+    hws = [_get_stream_hardware(s) for s in streams]
+    deps = {}
+    for i, s in enumerate(streams):
+        deps[s] = set(streams[j] for j in range(i)
+                      if _are_conflicting(hws[i], hws[j]))
+    return deps
+
+
+def _estimate_stream_ends(streams, deps, times, start, known_ends=None):
+    """
+    Estimates when each stream will be finished, considering each stream is
+      started as soon as all the streams it depends on are finished.
+    streams (list of Stream): the streams, in the order of acquisition
+    deps (dict Stream -> set of Streams): as returned by _get_stream_dependencies()
+    times (dict Stream -> float): the acquisition time of each stream
+    start (float): the time at which the streams can start
+    known_ends (None or dict Stream -> float): the end time of the streams
+      already started (or finished). They are not recomputed.
+    returns (dict Stream -> float): the end time of each stream
+    """
+    ends = dict(known_ends or {})
+    for s in streams:
+        if s in ends:
+            continue
+        # deps are always before in the list, so their end is already computed
+        sstart = max([start] + [ends[d] for d in deps[s]])
+        ends[s] = sstart + times[s]
+    return ends
+
+
 class AcquisitionTask(object):
 
     def __init__(self, streams, future, opm=None):
@@ -182,9 +332,14 @@ class AcquisitionTask(object):
         for s in streams:
             self._streamTimes[s] = s.estimateAcquisitionTime()
 
-        self._streams_left = set(self._streams) # just for progress update
-        self._current_stream = None
-        self._current_future = None
+        # Streams using the same hardware are acquired one after another, in
+        # the order of priority. The other ones are acquired simultaneously.
+        self._streamDeps = _get_stream_dependencies(self._streams)
+
+        self._lock = threading.Lock()  # protects the attributes below
+        self._streams_left = set(self._streams) # streams not yet started
+        self._current_futures = {}  # Stream -> Future, of the acquisitions in progress
+        self._streamEnds = {}  # Stream -> float: (expected) end time of the started streams
         self._cancelled = False
 
     def run(self):
@@ -197,69 +352,135 @@ class AcquisitionTask(object):
             Exception: if it failed before any result were acquired
         """
         exp = None
-        assert(self._current_stream is None) # Task should be used only once
-        expected_time = sum(self._streamTimes.values())
+        assert(not self._current_futures) # Task should be used only once
         # no need to set the start time of the future: it's automatically done
         # when setting its state to running.
-        self._future.set_progress(end=time.time() + expected_time)
+        self._update_progress()
 
         raw_images = {} # stream -> list of raw images
+        done_streams = Queue.Queue()  # streams which have just finished
         try:
-            for s in self._streams:
-
-                # Get the future of the acquisition, depending on the Stream type
-                if hasattr(s, "acquire"):
-                    f = s.acquire()
-                else: # fall-back to old style stream
-                    f = _futures.wrapSimpleStreamIntoFuture(s)
-                self._current_future = f
-                self._current_stream = s
-                self._streams_left.discard(s)
-
-                # in case acquisition was cancelled, before the future was set
-                if self._cancelled:
-                    f.cancel()
-                    raise CancelledError()
-
-                # If it's a ProgressiveFuture, listen to the time update
-                try:
-                    f.add_update_callback(self._on_progress_update)
-                except AttributeError:
-                    pass # not a ProgressiveFuture, fine
+            while True:
+                # Start all the streams which don't wait for any other one
+                # (unless something already failed)
+                if exp is None:
+                    for s in self._streams:
+                        if (s in self._streams_left and
+                            self._streamDeps[s] <= set(raw_images)):
+                            self._start_stream(s, done_streams)
+
+                if not self._current_futures:
+                    break
+
+                # Wait for one acquisition to be finished
+                s = done_streams.get()
+                with self._lock:
+                    f = self._current_futures.pop(s)
+                    self._streamEnds[s] = time.time()
 
-                # Wait for the acquisition to be finished.
                 # Will pass down exceptions, included in case it's cancelled
-                raw_images[s] = f.result()
-
-                # update the time left
-                expected_time -= self._streamTimes[s]
-                self._future.set_progress(end=time.time() + expected_time)
+                try:
+                    raw_images[s] = f.result()
+                except CancelledError:
+                    raise
+                except Exception as e:
+                    # Don't start any other acquisition, but let the current
+                    # ones finish, as their results might be useful.
+                    if exp is None:
+                        exp = e
+                        logging.warning("Exception during acquisition of %s",
+                                        s.name.value, exc_info=True)
+                self._update_progress()
+
+            if exp is not None and not raw_images:
+                # If no acquisition done => just raise the exception,
+                # otherwise, the results we got might already be useful
+                raise exp
 
             # Update metadata using OverlayStream (if there was one)
             self._adjust_metadata(raw_images)
 
         except CancelledError:
-            raise
+            raise  # Not a failure of the acquisition, just pass it on
         except Exception as e:
-            # If no acquisition yet => just raise the exception,
-            # otherwise, the results we got might already be useful
             if not raw_images:
                 raise
             logging.warning("Exception during acquisition (after some data already acquired)",
                             exc_info=True)
             exp = e
         finally:
+            # If the task is cancelled, or failed while some acquisitions are
+            # still running, cancel them, and wait for them to be over, so
+            # that the hardware is not used anymore once the task is done.
+            with self._lock:
+                fs = self._current_futures.values()
+            for f in fs:
+                f.cancel()
+            for f in fs:
+                try:
+                    f.result()
+                except Exception:
+                    pass  # Includes CancelledError, which is expected
+
             # Don't hold references to the streams once it's over
-            self._streams = []
-            self._streamTimes = {}
-            self._streams_left.clear()
-            self._current_stream = None
-            self._current_future = None
+            with self._lock:
+                self._streams = []
+                self._streamTimes = {}
+                self._streamDeps = {}
+                self._streams_left.clear()
+                self._current_futures = {}
+                self._streamEnds = {}
 
         # merge all the raw data (= list of DataArrays) into one long list
         ret = sum(raw_images.values(), [])
         return ret, exp
 
+    def _start_stream(self, s, done_streams):
+        """
+        Starts the acquisition of a stream
+        s (Stream): the stream to acquire
+        done_streams (Queue): the stream will be put in it when its
+          acquisition is finished
+        raises CancelledError: if the task was cancelled
+        """
+        logging.debug("Starting acquisition of stream %s", s.name.value)
+        # Get the future of the acquisition, depending on the Stream type
+        if hasattr(s, "acquire"):
+            f = s.acquire()
+        else: # fall-back to old style stream
+            f = _futures.wrapSimpleStreamIntoFuture(s)
+
+        with self._lock:
+            self._current_futures[s] = f
+            self._streamEnds[s] = time.time() + self._streamTimes[s]
+            self._streams_left.discard(s)
+
+        # in case acquisition was cancelled, before the future was set
+        if self._cancelled:
+            f.cancel()
+            raise CancelledError()
+
+        # If it's a ProgressiveFuture, listen to the time update
+        try:
+            f.add_update_callback(self._on_progress_update)
+        except AttributeError:
+            pass # not a ProgressiveFuture, fine
+
+        f.add_done_callback(lambda f, s=s: done_streams.put(s))
+
+    def _update_progress(self):
+        """
+        Updates the expected end time of the task, based on the (expected) end
+        of the streams started, and the time needed for the streams left.
+        """
+        now = time.time()
+        with self._lock:
+            known_ends = dict((s, max(e, now)) for s, e in self._streamEnds.items())
+            ends = _estimate_stream_ends(self._streams, self._streamDeps,
+                                         self._streamTimes, now, known_ends)
+        total_end = max(ends.values()) if ends else now
+        self._future.set_progress(end=total_end)
+
     def _adjust_metadata(self, raw_data):
         """
         Update/adjust the metadata of the raw data received based on global
@@ -298,16 +519,19 @@ class AcquisitionTask(object):
 
     def _on_progress_update(self, f, start, end):
         """
-        Called when the current future has made a progress (and so it should
-        provide a better time estimation).
+        Called when one of the current futures has made a progress (and so it
+        should provide a better time estimation).
         """
-        if self._current_future != f:
-            logging.warning("Progress update not from the current future: %s instead of %s",
-                            f, self._current_future)
-            return
+        with self._lock:
+            for s, sf in self._current_futures.items():
+                if sf == f:
+                    self._streamEnds[s] = end
+                    break
+            else:
+                logging.warning("Progress update not from a current future: %s", f)
+                return
 
-        total_end = end + sum(self._streamTimes[s] for s in self._streams_left)
-        self._future.set_progress(end=total_end)
+        self._update_progress()
 
     def cancel(self, future):
         """
@@ -316,13 +540,14 @@ class AcquisitionTask(object):
         # put the cancel flag
         self._cancelled = True
 
-        if self._current_future is not None:
-            cancelled = self._current_future.cancel()
-        else:
-            cancelled = False
+        with self._lock:
+            fs = self._current_futures.values()
+            streams_left = bool(self._streams_left)
+        # Cancel all of them (and not just until the first one which succeeds)
+        cancelled = [f.cancel() for f in fs]
 
         # Report it's too late for cancellation (and so result will come)
-        if not cancelled and not self._streams_left:
+        if not any(cancelled) and not streams_left:
             return False
 
         return True
@@ -84,6 +84,7 @@ class SimpleStreamFuture(futures.Future):
         futures.Future.__init__(self)
         self._stream = stream
         self._acq_over = threading.Event()
+        self._raw = []  # the acquisition data, once complete
 
     def cancel(self):
         """Cancel the future if possible.
@@ -144,7 +145,7 @@ class SimpleStreamFuture(futures.Future):
             if self._state in (CANCELLED, CANCELLED_AND_NOTIFIED):
                 raise CancelledError()
 
-        return self._stream.raw # the acquisition data
+        return self._raw  # the acquisition data
 
     def _image_listener(self, image):
         """
@@ -160,6 +161,14 @@ class SimpleStreamFuture(futures.Future):
         except KeyError:  # no MD_ACQ_DATE
             pass
 
+        # Only part of the frame has been received => wait for the rest.
+        # Note: the image metadata doesn't contain MD_FRAME_RES, only the raw
+        # data does.
+        raw = list(self._stream.raw)
+        if any(model.MD_FRAME_RES in d.metadata for d in raw):
+            return
+        self._raw = raw
+
         # stop acquisition
         self._stream.image.unsubscribe(self._image_listener)
         self._stream.is_active.value = False
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 12 Oct 2026
+
+@author: Éric Piel
+
+Copyright © 2026 Éric Piel, Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# Accumulation (averaging) of multiple frames of a detector, while it keeps
+# acquiring. The summation is done in a separate thread, so that it overlaps
+# with the acquisition of the next frame.
+
+from __future__ import division
+
+import Queue
+from concurrent.futures._base import CancelledError
+import logging
+import numpy
+from odemis import model
+from odemis.acq import _futures
+import threading
+import time
+
+
+class FrameAccumulator(object):
+    """
+    Subscribes to a DataFlow, and sums the first N frames received into a
+    preallocated buffer. The average can then be retrieved with getAverage().
+    The summation is done in a separate thread, so the DataFlow is never
+    blocked by it.
+    """
+
+    def __init__(self, dataflow, nb, drop=False, max_queue=2):
+        """
+        dataflow (DataFlow): the DataFlow to subscribe to
+        nb (0<int): number of frames to accumulate
+        drop (bool): if True, frames which arrive while the summation thread
+          is still busy with max_queue frames are dropped (and more frames are
+          received until nb frames are accumulated). If False, all the frames
+          are queued, whatever the memory usage.
+        max_queue (0<int): maximum number of frames waiting for summation, only
+          used if drop is True.
+        """
+        if nb < 1:
+            raise ValueError("Number of frames must be at least 1, got %s" % (nb,))
+        self._dataflow = dataflow
+        self._nb = nb
+        self._drop = drop
+        if drop:
+            self._queue = Queue.Queue(max_queue)
+        else:
+            self._queue = Queue.Queue()
+
+        self._sum = None  # numpy array of float64 or int64
+        self._dtype = None  # dtype of the data received
+        self._md = None  # metadata of the first frame
+        self._dates = []  # acquisition date of each frame accumulated
+        self._exp_time = 0  # s, sum of the exposure times
+        self._dwell_time = 0  # s, sum of the dwell times
+
+        self._lock = threading.Lock()
+        self._received_cond = threading.Condition(self._lock)
+        self._done = threading.Event()
+        self._error = None
+        self._running = False
+        self._sum_thread = None
+
+        self.received = 0  # number of frames received (and not dropped)
+        self.dropped = 0  # number of frames dropped
+        self.accumulated = 0  # number of frames already summed
+
+    def start(self):
+        """
+        Subscribe to the DataFlow and start accumulating
+        """
+        if self._running:
+            raise ValueError("Accumulator already running")
+        self._running = True
+        self._sum_thread = threading.Thread(target=self._sum_frames,
+                                            name="Frame accumulator")
+        self._sum_thread.daemon = True
+        self._sum_thread.start()
+        self._dataflow.subscribe(self._on_data)
+
+    def stop(self):
+        """
+        Unsubscribe from the DataFlow and stop the accumulation, even if not
+        all the frames have been received.
+        """
+        self._dataflow.unsubscribe(self._on_data)
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            self._received_cond.notify_all()
+        try:
+            self._queue.put_nowait(None)  # To stop the summation thread
+        except Queue.Full:
+            pass  # The thread will notice _running is False after the next frame
+
+    def waitReceived(self, n, timeout=None):
+        """
+        Wait until at least n frames have been received (but not necessarily
+        accumulated yet).
+        n (0<=int): number of frames to wait for
+        timeout (None or float): maximum time to wait in s
+        return (bool): True if the frames were received, False if timed out or
+          stopped before
+        """
+        if timeout is not None:
+            endt = time.time() + timeout
+        with self._lock:
+            while self.received < n:
+                if not self._running:
+                    return False
+                if timeout is None:
+                    self._received_cond.wait()
+                else:
+                    left = endt - time.time()
+                    if left <= 0:
+                        return False
+                    self._received_cond.wait(left)
+            return True
+
+    def getAverage(self, timeout=None, dtype=None):
+        """
+        Wait until all the frames are accumulated, and return their average.
+        timeout (None or float): maximum time to wait in s
+        dtype (None or numpy.dtype): data type of the output. If None, the
+          same type as the frames received is used.
+        return (DataArray): the average of the frames. The exposure time and
+          dwell time metadata is the sum of all the frames, and MD_AD_LIST
+          contains the acquisition date of each frame.
+        raises:
+          IOError: if timeout or the accumulation was stopped before receiving
+            enough frames.
+        """
+        if not self._done.wait(timeout):
+            raise IOError("Only accumulated %d frames out of %d after %s s" %
+                          (self.accumulated, self._nb, timeout))
+        if self._error:
+            raise self._error
+        if self.accumulated < self._nb:
+            raise IOError("Accumulation stopped after %d frames out of %d" %
+                          (self.accumulated, self._nb))
+
+        if dtype is None:
+            dtype = self._dtype
+        avg = self._sum / self._nb
+        if numpy.issubdtype(dtype, numpy.integer):
+            avg = numpy.round(avg)
+        md = self._md.copy()
+        if self._exp_time:
+            md[model.MD_EXP_TIME] = self._exp_time
+        if self._dwell_time:
+            md[model.MD_DWELL_TIME] = self._dwell_time
+        if self._dates:
+            md[model.MD_ACQ_DATE] = self._dates[0]
+            md[model.MD_AD_LIST] = tuple(self._dates)
+        return model.DataArray(avg.astype(dtype), md)
+
+    def _on_data(self, df, data):
+        """
+        Called in the DataFlow thread, for each new frame
+        """
+        with self._lock:
+            if not self._running or self.received >= self._nb:
+                return
+            if self._drop:
+                try:
+                    self._queue.put_nowait(data)
+                except Queue.Full:
+                    self.dropped += 1
+                    logging.debug("Dropping frame as summation is too slow (%d dropped)",
+                                  self.dropped)
+                    return
+            else:
+                self._queue.put(data)
+            self.received += 1
+            last = (self.received >= self._nb)
+            self._received_cond.notify_all()
+
+        if last:
+            self._dataflow.unsubscribe(self._on_data)
+
+    def _sum_frames(self):
+        """
+        Main loop of the summation thread
+        """
+        try:
+            while self.accumulated < self._nb:
+                data = self._queue.get()
+                if data is None:  # Stop requested
+                    return
+                self._add_frame(data)
+                self.accumulated += 1
+                if not self._running and self.accumulated < self._nb:
+                    return
+        except Exception as ex:
+            logging.exception("Failed to accumulate frame")
+            self._error = ex
+            self._dataflow.unsubscribe(self._on_data)
+        finally:
+            self._done.set()
+
+    def _add_frame(self, data):
+        """
+        Add one frame to the sum
+        data (DataArray): the new frame
+        """
+        if self._sum is None:
+            # Preallocate the buffer, big enough to never overflow
+            self._dtype = data.dtype
+            if numpy.issubdtype(data.dtype, numpy.integer):
+                sdtype = numpy.int64
+            else:
+                sdtype = numpy.float64
+            self._sum = numpy.zeros(data.shape, dtype=sdtype)
+            self._md = data.metadata.copy()
+        elif data.shape != self._sum.shape:
+            raise ValueError("Frame of shape %s while expected %s" %
+                             (data.shape, self._sum.shape))
+
+        numpy.add(self._sum, data, out=self._sum, casting="unsafe")
+        md = data.metadata
+        self._exp_time += md.get(model.MD_EXP_TIME, 0)
+        self._dwell_time += md.get(model.MD_DWELL_TIME, 0)
+        if model.MD_ACQ_DATE in md:
+            self._dates.append(md[model.MD_ACQ_DATE])
+
+
+def acquireAverage(dataflow, nb, drop=False, est_frame_time=0.1):
+    """
+    Acquire N frames from a DataFlow, and average them, while the DataFlow
+    keeps acquiring.
+    dataflow (DataFlow): the DataFlow to subscribe to
+    nb (0<int): number of frames to accumulate
+    drop (bool): whether frames can be dropped if the summation is too slow
+    est_frame_time (0<float): estimated time (in s) to acquire one frame, for
+      progress and timeout estimation
+    return (ProgressiveFuture -> DataArray): the averaged frame
+    """
+    est_start = time.time() + 0.1
+    f = model.ProgressiveFuture(start=est_start,
+                                end=est_start + nb * est_frame_time)
+    f._accumulator = FrameAccumulator(dataflow, nb, drop)
+    f._task_state_cancelled = False
+    f.task_canceller = _cancelAverage
+
+    # run task in separate thread
+    thread = threading.Thread(target=_futures.executeTask,
+                              name="Frame average acquisition",
+                              args=(f, _runAverage, f, nb, est_frame_time))
+    thread.start()
+    return f
+
+
+def _runAverage(future, nb, est_frame_time):
+    """
+    return (DataArray): the averaged frame
+    raises CancelledError: if cancelled
+    """
+    acc = future._accumulator
+    acc.start()
+    try:
+        while acc.received < nb:
+            if future._task_state_cancelled:
+                raise CancelledError()
+            if not acc.waitReceived(acc.received + 1, est_frame_time * 3 + 5):
+                if future._task_state_cancelled:
+                    raise CancelledError()
+                raise IOError("Timeout while waiting for frame %d" % (acc.received + 1,))
+            left = nb - acc.received
+            future.set_progress(end=time.time() + left * est_frame_time + 0.1)
+
+        avg = acc.getAverage(timeout=est_frame_time * 3 + 5)
+        logging.debug("Averaged %d frames (%d dropped)", nb, acc.dropped)
+        return avg
+    finally:
+        acc.stop()
+
+
+def _cancelAverage(future):
+    future._task_state_cancelled = True
+    future._accumulator.stop()
+    return True
@@ -26,6 +26,7 @@ import collections
 from concurrent.futures._base import CancelledError, CANCELLED, FINISHED, \
     RUNNING
 import logging
+import math
 import numpy
 from odemis import model
 from odemis.acq._futures import executeTask
@@ -138,6 +139,49 @@ def _discard_data(df, data):
     pass
 
 
+def _getDepthOfField(detector, emt):
+    """
+    Finds the depth of field of the detector (or emitter)
+    detector: model.DigitalCamera or model.Detector
+    emt (None or model.Emitter): In case of a SED this is the scanner used
+    return (float): depth of field (m)
+    """
+    avail_depths = (detector, emt)
+    if model.hasVA(emt, "dwellTime"):
+        # Hack in case of using the e-beam with a DigitalCamera detector.
+        # All the digital cameras have a depthOfField, which is updated based
+        # on the optical lens properties... but the depthOfField in this
+        # case depends on the e-beam lens.
+        avail_depths = (emt, detector)
+    for c in avail_depths:
+        if model.hasVA(c, "depthOfField"):
+            dof = c.depthOfField.value
+            break
+    else:
+        logging.debug("No depth of field info found")
+        dof = 1e-6  # m, not too bad value
+    logging.debug("Depth of field is %f", dof)
+    return dof
+
+
+def _getFocusMeasure(detector):
+    """
+    Picks the function to measure the focus level, based on the type of detector
+    detector: model.DigitalCamera or model.Detector
+    return (callable DataArray -> float): the function to measure the focus level
+    """
+    # Pick measurement method based on the heuristics that SEM detectors
+    # are typically just a point (ie, shape == data depth).
+    # TODO: is this working as expected? Alternatively, we could check
+    # MD_DET_TYPE.
+    if len(detector.shape) > 1:
+        logging.debug("Using Optical method to estimate focus")
+        return MeasureOpticalFocus
+    else:
+        logging.debug("Using SEM method to estimate focus")
+        return MeasureSEMFocus
+
+
 def _DoBinaryFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focus):
     """
     Iteratively acquires an optical image, measures its focus level and adjusts
@@ -175,21 +219,7 @@ def _DoBinaryFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focus):
 
     try:
         # use the .depthOfField on detector or emitter as maximum stepsize
-        avail_depths = (detector, emt)
-        if model.hasVA(emt, "dwellTime"):
-            # Hack in case of using the e-beam with a DigitalCamera detector.
-            # All the digital cameras have a depthOfField, which is updated based
-            # on the optical lens properties... but the depthOfField in this
-            # case depends on the e-beam lens.
-            avail_depths = (emt, detector)
-        for c in avail_depths:
-            if model.hasVA(c, "depthOfField"):
-                dof = c.depthOfField.value
-                break
-        else:
-            logging.debug("No depth of field info found")
-            dof = 1e-6  # m, not too bad value
-        logging.debug("Depth of field is %f", dof)
+        dof = _getDepthOfField(detector, emt)
         min_step = dof / 2
 
         # adjust to rng_focus if provided
@@ -211,16 +241,7 @@ def _DoBinaryFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focus):
         best_fm = 0
         last_pos = None
 
-        # Pick measurement method based on the heuristics that SEM detectors
-        # are typically just a point (ie, shape == data depth).
-        # TODO: is this working as expected? Alternatively, we could check
-        # MD_DET_TYPE.
-        if len(detector.shape) > 1:
-            logging.debug("Using Optical method to estimate focus")
-            Measure = MeasureOpticalFocus
-        else:
-            logging.debug("Using SEM method to estimate focus")
-            Measure = MeasureSEMFocus
+        Measure = _getFocusMeasure(detector)
 
         step_factor = 2 ** 7
         if good_focus is not None:
@@ -369,32 +390,8 @@ def _DoExhaustiveFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focu
 
     try:
         # use the .depthOfField on detector or emitter as maximum stepsize
-        avail_depths = (detector, emt)
-        if model.hasVA(emt, "dwellTime"):
-            # Hack in case of using the e-beam with a DigitalCamera detector.
-            # All the digital cameras have a depthOfField, which is updated based
-            # on the optical lens properties... but the depthOfField in this
-            # case depends on the e-beam lens.
-            avail_depths = (emt, detector)
-        for c in avail_depths:
-            if model.hasVA(c, "depthOfField"):
-                dof = c.depthOfField.value
-                break
-        else:
-            logging.debug("No depth of field info found")
-            dof = 1e-6  # m, not too bad value
-        logging.debug("Depth of field is %f", dof)
-
-        # Pick measurement method based on the heuristics that SEM detectors
-        # are typically just a point (ie, shape == data depth).
-        # TODO: is this working as expected? Alternatively, we could check
-        # MD_DET_TYPE.
-        if len(detector.shape) > 1:
-            logging.debug("Using Optical method to estimate focus")
-            Measure = MeasureOpticalFocus
-        else:
-            logging.debug("Using SEM method to estimate focus")
-            Measure = MeasureSEMFocus
+        dof = _getDepthOfField(detector, emt)
+        Measure = _getFocusMeasure(detector)
 
         # adjust to rng_focus if provided
         rng = focus.axes["z"].range
@@ -474,6 +471,218 @@ def _DoExhaustiveFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focu
             future._autofocus_state = FINISHED
 
 
+def _fitFocusModel(positions, levels):
+    """
+    Fits a model of the focus curve on the focus levels measured. The model is
+    a Gaussian, which is fitted as a parabola on the logarithm of the levels.
+    positions (list of floats): focus positions (m)
+    levels (list of floats): focus level at each position
+    returns:
+        (float): position of the peak of the model (m)
+        (float): uncertainty on the peak position, as the half width of the ~95%
+          confidence interval (m). It is inf if there are not enough positions
+          to estimate it (ie, less than 4).
+    raises:
+        ValueError: if the levels don't form a peak
+    """
+    if len(positions) < 3:
+        raise ValueError("At least 3 focus levels needed, got %d" % (len(positions),))
+
+    pos = numpy.asarray(positions, dtype=float)
+    lev = numpy.log(numpy.maximum(levels, 1e-12))
+    # Normalise the positions, for the numerical stability
+    pos0 = pos.mean()
+    scale = numpy.ptp(pos) or 1
+    x = (pos - pos0) / scale
+
+    a_mat = numpy.vander(x, 3)
+    coefs, _, rank, _ = numpy.linalg.lstsq(a_mat, lev, rcond=None)
+    if rank < 3:
+        raise ValueError("Focus positions too close to each other")
+    a, b, _ = coefs
+    if a >= 0:
+        raise ValueError("Focus levels don't form a peak")
+    xp = -b / (2 * a)
+
+    if len(x) > 3:
+        # Covariance of the coefficients, propagated to the peak position
+        res = lev - a_mat.dot(coefs)
+        cov = res.dot(res) / (len(x) - 3) * numpy.linalg.inv(a_mat.T.dot(a_mat))
+        grad = numpy.array([b / (2 * a ** 2), -1 / (2 * a), 0])
+        err = 2 * math.sqrt(max(0, grad.dot(cov).dot(grad))) * scale
+    else:
+        err = float("inf")
+
+    return pos0 + xp * scale, err
+
+
+def _measureFocusLevels(future, detector, focus, dfbkg, Measure, positions):
+    """
+    Acquires an image at each focus position, and measures its focus level.
+    The move to the next position takes place while the focus level of the
+    previous image is computed.
+    future (model.ProgressiveFuture): Progressive future provided by the wrapper
+    detector: model.DigitalCamera or model.Detector
+    focus (model.Actuator): The focus actuator
+    dfbkg (model.DataFlow): dataflow of se- or bs- detector
+    Measure (callable DataArray -> float): function to measure the focus level
+    positions (list of floats): focus positions to go to (m)
+    returns (list of (float, float)): the actual focus position and the focus
+      level for each position
+    raises:
+        CancelledError if cancelled
+    """
+    levels = []
+    prev = None  # (pos, image) acquired but not yet measured
+    for p in positions:
+        f = focus.moveAbs({"z": p})
+        if prev is not None:
+            levels.append((prev[0], Measure(prev[1])))
+            logging.debug("Focus level at %f is %f", levels[-1][0], levels[-1][1])
+        f.result()
+        if future._autofocus_state == CANCELLED:
+            raise CancelledError()
+
+        pos = focus.position.value["z"]
+        prev = pos, AcquireNoBackground(detector, dfbkg)
+
+    if prev is not None:
+        levels.append((prev[0], Measure(prev[1])))
+        logging.debug("Focus level at %f is %f", levels[-1][0], levels[-1][1])
+
+    return levels
+
+
+def _DoModelFocus(future, detector, emt, focus, dfbkg, good_focus, rng_focus):
+    """
+    Acquires images at a few focus positions, and fits a model of the focus
+    curve on their focus levels to pick the next positions, until the peak of
+    the model is known more precisely than the depth of field. Moves and focus
+    level measurements are done in parallel.
+    future (model.ProgressiveFuture): Progressive future provided by the wrapper
+    detector: model.DigitalCamera or model.Detector
+    emt (None or model.Emitter): In case of a SED this is the scanner used
+    focus (model.Actuator): The focus actuator
+    dfbkg (model.DataFlow): dataflow of se- or bs- detector
+    good_focus (float): if provided, an already known good focus position to be
+      taken into consideration while autofocusing
+    rng_focus (tuple): if provided, the search of the best focus position is limited
+      within this range
+    returns:
+        (float): Focus position (m)
+        (float): Focus level
+    raises:
+            CancelledError if cancelled
+            IOError if procedure failed
+    """
+    logging.debug("Starting model-based autofocus on detector %s...", detector.name)
+
+    best_pos = focus.position.value['z']
+    try:
+        dof = _getDepthOfField(detector, emt)
+        Measure = _getFocusMeasure(detector)
+
+        # adjust to rng_focus if provided
+        rng = focus.axes["z"].range
+        if rng_focus:
+            rng = (max(rng[0], rng_focus[0]), min(rng[1], rng_focus[1]))
+        if rng[1] <= rng[0]:
+            raise ValueError("Unexpected focus range %s" % (rng,))
+
+        def clip(p):
+            return max(rng[0], min(p, rng[1]))
+
+        # Like the binary search, start with big steps, but much smaller if
+        # we already know where the focus should be.
+        if good_focus is not None:
+            center = clip(good_focus)
+            step = 8 * dof
+        else:
+            center = best_pos
+            step = 64 * dof
+        step = min(step, (rng[1] - rng[0]) / 4)
+
+        focus_levels = {}  # focus pos (float) -> focus level (float)
+
+        def get_new_probes(probes):
+            # Don't measure again (almost) the same positions
+            new_probes = []
+            for p in probes:
+                p = clip(p)
+                if all(abs(p - m) > step / 4 for m in focus_levels.keys() + new_probes):
+                    new_probes.append(p)
+            return new_probes
+
+        peak, err = None, float("inf")
+        new_probes = get_new_probes([center - step, center, center + step])
+        while True:
+            if len(focus_levels) + len(new_probes) > MAX_STEPS_NUMBER:
+                logging.info("Auto focus gave up after %d steps", len(focus_levels))
+                break
+            focus_levels.update(_measureFocusLevels(future, detector, focus, dfbkg,
+                                                    Measure, new_probes))
+
+            measured = sorted(focus_levels.items())
+            i_best = max(range(len(measured)), key=lambda i: measured[i][1])
+            best_pos = measured[i_best][0]
+
+            # If the peak is not surrounded yet, continue in its direction
+            if i_best in (0, len(measured) - 1):
+                direction = -1 if i_best == 0 else 1
+                new_probes = get_new_probes([best_pos + direction * step,
+                                             best_pos + 2 * direction * step])
+                if new_probes:
+                    continue
+                # Otherwise, the peak is at the limit of the range
+
+            # Fit the model on the positions around the peak: the ones in the
+            # upper half of the peak (and at least the immediate neighbours)
+            min_fm = min(l for p, l in measured)
+            half_fm = (min_fm + measured[i_best][1]) / 2
+            i_min, i_max = max(0, i_best - 1), min(len(measured) - 1, i_best + 1)
+            while i_min > 0 and measured[i_min - 1][1] >= half_fm:
+                i_min -= 1
+            while i_max < len(measured) - 1 and measured[i_max + 1][1] >= half_fm:
+                i_max += 1
+            around = measured[i_min:i_max + 1]
+            try:
+                peak, err = _fitFocusModel(*zip(*around))
+                if not around[0][0] <= peak <= around[-1][0]:
+                    raise ValueError("Peak %g outside of the positions measured" % (peak,))
+            except ValueError as ex:
+                logging.debug("Failed to fit the focus model: %s", ex)
+                peak, err = best_pos, float("inf")
+            logging.debug("Focus model peak at %g ± %g m (step = %g m)", peak, err, step)
+
+            if err < dof / 2 or step < dof / 4:
+                break
+
+            step /= 2
+            new_probes = get_new_probes([peak - step, peak, peak + step])
+
+        # Check the peak of the model is indeed better than the best measured
+        best_fm = focus_levels[best_pos]
+        if peak is not None and all(abs(peak - p) > dof / 4 for p in focus_levels):
+            (peak_pos, peak_fm), = _measureFocusLevels(future, detector, focus, dfbkg,
+                                                       Measure, [peak])
+            if peak_fm >= best_fm:
+                best_pos, best_fm = peak_pos, peak_fm
+
+        focus.moveAbsSync({"z": best_pos})
+        logging.info("Auto focus found best level %g @ %g m, after %d steps",
+                     best_fm, best_pos, len(focus_levels))
+        return best_pos, best_fm
+
+    except CancelledError:
+        # Go to the best position known so far
+        focus.moveAbsSync({"z": best_pos})
+    finally:
+        with future._autofocus_lock:
+            if future._autofocus_state == CANCELLED:
+                raise CancelledError()
+            future._autofocus_state = FINISHED
+
+
 def _CancelAutoFocus(future):
     """
     Canceller of AutoFocus task.
@@ -514,7 +723,8 @@ def AutoFocus(detector, emt, focus, dfbkg=None, good_focus=None, rng_focus=None,
     rng_focus (tuple): if provided, the search of the best focus position is limited
       within this range
     method (str): focusing method, if 'binary' we follow a binary method while in
-      case of 'exhaustive' we iterate through the whole provided range
+      case of 'exhaustive' we iterate through the whole provided range. With
+      'model', a model of the focus curve is fitted to pick the next positions.
     returns (model.ProgressiveFuture):  Progress of DoAutoFocus, whose result() will return:
             Focus position (m)
             Focus level
@@ -542,6 +752,8 @@ def AutoFocus(detector, emt, focus, dfbkg=None, good_focus=None, rng_focus=None,
         autofocus_fn = _DoExhaustiveFocus
     elif method == "binary":
         autofocus_fn = _DoBinaryFocus
+    elif method == "model":
+        autofocus_fn = _DoModelFocus
     else:
         raise ValueError("Unknown autofocus method")
 
@@ -181,19 +181,10 @@ def FilterOutliers(image, subimages, subimage_coordinates, expected_spots):
             (List of tuples): The coordinates of the center of each subimage with respect
                             to the overall image
     """
-    number_of_subimages = len(subimages)
-    clean_subimages = []
-    clean_subimage_coordinates = []
-    filtered_subimages = []
-    filtered_subimage_coordinates = []
-
-    for i in xrange(number_of_subimages):
-        hist, bin_edges = histogram(subimages[i], bins=10)
-        # Remove subimage if its histogram implies a cosmic ray
-        hist_list = hist.tolist()
-        if hist_list.count(0) < 6:
-            clean_subimages.append(subimages[i])
-            clean_subimage_coordinates.append(subimage_coordinates[i])
+    # Remove subimage if its histogram implies a cosmic ray
+    clean = [numpy.count_nonzero(histogram(s, bins=10)[0] == 0) < 6 for s in subimages]
+    clean_subimages = list(compress(subimages, clean))
+    clean_subimage_coordinates = list(compress(subimage_coordinates, clean))
 
     # If we removed more than 3 subimages give up and return the initial list
     # This is based on the assumption that each image would contain at maximum
@@ -206,34 +197,17 @@ def FilterOutliers(image, subimages, subimage_coordinates, expected_spots):
     # with "stranger" distances from their closest spots. Only applied
     # if we have an at least 2x2 grid.
     if (expected_spots >= 4) and (len(clean_subimage_coordinates) > expected_spots):
-        points = numpy.array(clean_subimage_coordinates)
+        points = numpy.asarray(clean_subimage_coordinates, dtype=numpy.float)
         tree = cKDTree(points, 5)
-        distance, index = tree.query(clean_subimage_coordinates, 5)
-        list_distance = numpy.array(distance)
-        avg_1 = numpy.average(list_distance[:, 1])
-        avg_2 = numpy.average(list_distance[:, 2])
-        avg_3 = numpy.average(list_distance[:, 3])
-        avg_4 = numpy.average(list_distance[:, 4])
-        diff_avg_list = numpy.array(list_distance[:, 1:5])
-        for i in xrange(0, len(list_distance), 1):
-            diff_avg = [abs(list_distance[i, 1] - avg_1),
-                        abs(list_distance[i, 2] - avg_2),
-                        abs(list_distance[i, 3] - avg_3),
-                        abs(list_distance[i, 4] - avg_4)]
-            diff_avg_list[i] = diff_avg
-        var_1 = numpy.average(diff_avg_list[:, 0])
-        var_2 = numpy.average(diff_avg_list[:, 1])
-        var_3 = numpy.average(diff_avg_list[:, 2])
-        var_4 = numpy.average(diff_avg_list[:, 3])
-
-        for i in xrange(len(clean_subimage_coordinates)):
-            if (diff_avg_list[i, 0] <= var_1
-                or diff_avg_list[i, 1] <= var_2
-                or diff_avg_list[i, 2] <= var_3
-                or diff_avg_list[i, 3] <= var_4):
-                filtered_subimages.append(clean_subimages[i])
-                filtered_subimage_coordinates.append(clean_subimage_coordinates[i])
-        return filtered_subimages, filtered_subimage_coordinates
+        distance, index = tree.query(points, 5)
+        # Distance to the 4 closest neighbours (the first one is the point itself)
+        neighbour_dist = distance[:, 1:5]
+        diff_avg = numpy.abs(neighbour_dist - numpy.mean(neighbour_dist, axis=0))
+        var = numpy.mean(diff_avg, axis=0)
+        # Keep the points with at least one "normal" distance
+        keep = numpy.any(diff_avg <= var, axis=1)
+        return (list(compress(clean_subimages, keep)),
+                list(compress(clean_subimage_coordinates, keep)))
 
     return clean_subimages, clean_subimage_coordinates
 
@@ -253,7 +227,7 @@ def MatchCoordinates(input_coordinates, electron_coordinates, guess_scale, max_a
     """
     # Remove large outliers
     if len(input_coordinates) > 1:
-        optical_coordinates = _FindOuterOutliers(input_coordinates)
+        optical_coordinates = _FindOuterOutliers(numpy.asarray(input_coordinates, dtype=numpy.float))
         if len(optical_coordinates) > len(electron_coordinates):
             optical_coordinates = _FindInnerOutliers(optical_coordinates)
     else:
@@ -261,12 +235,16 @@ def MatchCoordinates(input_coordinates, electron_coordinates, guess_scale, max_a
                         len(input_coordinates))
         return [], []
 
+    electron_coordinates = numpy.asarray(electron_coordinates, dtype=numpy.float)
+    # The electron coordinates never change, so the same tree is used at every step
+    electron_tree = cKDTree(electron_coordinates)
+
     # Informed guess
-    guess_coordinates = _TransformCoordinates(optical_coordinates, (0, 0), 0, (guess_scale, guess_scale))
+    guess_coordinates = _TransformPoints(optical_coordinates, (0, 0), 0, (guess_scale, guess_scale))
 
     # Overlay center
     guess_center = numpy.mean(guess_coordinates, 0) - numpy.mean(electron_coordinates, 0)
-    transformed_coordinates = [(c[0] - guess_center[0], c[1] - guess_center[1]) for c in guess_coordinates]
+    transformed_coordinates = guess_coordinates - guess_center
 
     max_wrong_points = math.ceil(0.5 * math.sqrt(len(electron_coordinates)))
     for step in xrange(MAX_STEPS_NUMBER):
@@ -275,29 +253,28 @@ def MatchCoordinates(input_coordinates, electron_coordinates, guess_scale, max_a
             (estimated_coordinates, index1, e_wrong_points,
              o_wrong_points, total_shift) = _MatchAndCalculate(transformed_coordinates,
                                                                optical_coordinates,
-                                                               electron_coordinates)
+                                                               electron_coordinates,
+                                                               electron_tree)
         except LookupError as ex:
             logging.warning("Failed to get any coordinate match (%s)", ex)
             return [], []
 
         # Calculate successful
-        e_match_points = [not i for i in e_wrong_points]
-        o_match_points = [not i for i in o_wrong_points]
-        e_coord_exp = [estimated_coordinates[i] for i in compress(index1, e_match_points)]
-        e_coord_actual = list(compress(electron_coordinates, e_match_points))
+        e_match_points = ~e_wrong_points
+        o_match_points = ~o_wrong_points
 
         # Calculate distance between the expected and found electron coordinates
-        coord_diff = []
-        for ta, tb in zip(e_coord_exp, e_coord_actual):
-            coord_diff.append(math.hypot(ta[0] - tb[0], ta[1] - tb[1]))
+        coord_diff = (estimated_coordinates[index1[e_match_points]] -
+                      electron_coordinates[e_match_points])
+        coord_diff = numpy.hypot(coord_diff[:, 0], coord_diff[:, 1])
 
         # Look at the worse distance, not including 5% outliers
-        sort_diff = sorted(coord_diff)
+        sort_diff = numpy.sort(coord_diff)
         outlier_i = max(0, math.trunc(DIFF_NUMBER * len(sort_diff)) - 1)
         max_diff = sort_diff[outlier_i]
 
         if (max_diff < max_allowed_diff
-            and sum(e_wrong_points) <= max_wrong_points
+            and numpy.count_nonzero(e_wrong_points) <= max_wrong_points
             and total_shift <= max_allowed_diff
            ):
             break
@@ -306,40 +283,57 @@ def MatchCoordinates(input_coordinates, electron_coordinates, guess_scale, max_a
     else:
         logging.warning("Cannot find overlay: distance = %f px (> %f px), after %d steps.",
                         max_diff, max_allowed_diff, step + 1)
-        logging.warning("Optical coordinates found: %s", estimated_coordinates)
-        logging.warning("SEM coordinates distances: %s", sort_diff)
+        logging.warning("Optical coordinates found: %s", estimated_coordinates.tolist())
+        logging.warning("SEM coordinates distances: %s", sort_diff.tolist())
         return [], []
 
     # The ordered list gives for each electron coordinate the corresponding optical coordinates
-    ordered_coordinates_index = zip(index1, electron_coordinates)
-    ordered_coordinates_index.sort()
-    ordered_coordinates = []
-    for i in xrange(len(ordered_coordinates_index)):
-        ordered_coordinates.append(ordered_coordinates_index[i][1])
+    # (ordered by index, and then by coordinates)
+    order = numpy.lexsort((electron_coordinates[:, 1], electron_coordinates[:, 0], index1))
+    ordered_coordinates = electron_coordinates[order]
 
     # Remove unknown coordinates
-    known_ordered_coordinates = list(compress(ordered_coordinates, e_match_points))
+    known_ordered_coordinates = ordered_coordinates[e_match_points]
     if len(optical_coordinates) == len(known_ordered_coordinates):
         known_optical_coordinates = optical_coordinates
     else:
-        known_optical_coordinates = list(compress(optical_coordinates, o_match_points))
-    return known_ordered_coordinates, known_optical_coordinates
+        known_optical_coordinates = optical_coordinates[o_match_points]
+    return ([tuple(c) for c in known_ordered_coordinates.tolist()],
+            [tuple(c) for c in known_optical_coordinates.tolist()])
 
 
 def _KNNsearch(x_coordinates, y_coordinates):
     """
     Applies K-nearest neighbors search to the lists x_coordinates and y_coordinates.
-    x_coordinates (List of tuples): List of coordinates
+    x_coordinates (List of tuples or cKDTree): List of coordinates, or tree
+      already computed from the coordinates
     y_coordinates (List of tuples): List of coordinates
-    returns (List of integers): Contains the index of nearest neighbor in x_coordinates
+    returns (ndarray of integers): Contains the index of nearest neighbor in x_coordinates
                                 for the corresponding element in y_coordinates
     """
-    points = numpy.array(x_coordinates)
-    tree = cKDTree(points)
+    if isinstance(x_coordinates, cKDTree):
+        tree = x_coordinates
+    else:
+        tree = cKDTree(numpy.asarray(x_coordinates))
     distance, index = tree.query(y_coordinates)
-    list_index = numpy.array(index).tolist()
 
-    return list_index
+    return index
+
+
+def _TransformPoints(points, translation, rotation, scale):
+    """
+    Transforms the points according to the parameters.
+    points (ndarray of shape Nx2): coordinates
+    translation (Tuple of floats): Translation
+    rotation (float): Rotation in rad
+    scale (Tuple of floats): Scaling
+    returns (ndarray of shape Nx2): Transformed coordinates
+    """
+    # translation-scaling-rotation
+    scaled = (points + translation) * scale
+    x, y = scaled[:, 0], scaled[:, 1]
+    cos_r, sin_r = math.cos(-rotation), math.sin(-rotation)
+    return numpy.column_stack((x * cos_r - y * sin_r, x * sin_r + y * cos_r))
 
 
 def _TransformCoordinates(x_coordinates, translation, rotation, scale):
@@ -351,68 +345,71 @@ def _TransformCoordinates(x_coordinates, translation, rotation, scale):
     scale (Tuple of floats): Scaling
     returns (List of tuples): Transformed coordinates
     """
-    transformed_coordinates = []
-    for ta in x_coordinates:
-        # translation-scaling-rotation
-        translated = [a + t for a, t in zip(ta, translation)]
-        scaled = [t * s for t, s in zip(translated, scale)]
-        x, y = scaled
-        x_rotated = x * math.cos(-rotation) - y * math.sin(-rotation)
-        y_rotated = x * math.sin(-rotation) + y * math.cos(-rotation)
-        rotated = (x_rotated, y_rotated)
-        transformed_coordinates.append(rotated)
+    points = numpy.asarray(x_coordinates, dtype=numpy.float).reshape(-1, 2)
+    transformed = _TransformPoints(points, translation, rotation, scale)
+    return [tuple(c) for c in transformed.tolist()]
 
-    return transformed_coordinates
+
+def _WrapAngle(a):
+    """
+    a (ndarray of floats): angles in rad
+    returns (ndarray of floats): the same angles, between -Pi and Pi
+    """
+    a = numpy.mod(a, 2 * math.pi)
+    return numpy.where(a > math.pi, a - 2 * math.pi, a)
 
 
-def _MatchAndCalculate(transformed_coordinates, optical_coordinates, electron_coordinates):
+def _MatchAndCalculate(transformed_coordinates, optical_coordinates, electron_coordinates,
+                       electron_tree=None):
     """
     Applies transformation to the optical coordinates in order to match electron coordinates and returns
     the transformed coordinates. This function must be used recursively until the transformed coordinates
     reach the required accuracy.
-    transformed_coordinates (List of tuples): List of transformed coordinates
-    optical_coordinates (List of tuples): List of optical coordinates
-    electron_coordinates (List of tuples): List of electron coordinates
-    returns estimated_coordinates (List of tuples): Estimated optical coordinates
-            index1 (List of integers): Indexes of nearest points in optical with respect to electron
-            e_wrong_points (List of booleans): Electron coordinates that have no proper match
-            o_wrong_points (List of booleans): Optical coordinates that have no proper match
+    transformed_coordinates (ndarray of shape Nx2): transformed coordinates
+    optical_coordinates (ndarray of shape Nx2): optical coordinates
+    electron_coordinates (ndarray of shape Mx2): electron coordinates
+    electron_tree (None or cKDTree): tree of the electron coordinates, to avoid
+      recomputing it at every call
+    returns estimated_coordinates (ndarray of shape Nx2): Estimated optical coordinates
+            index1 (ndarray of integers): Indexes of nearest points in optical with respect to electron
+            e_wrong_points (ndarray of booleans): Electron coordinates that have no proper match
+            o_wrong_points (ndarray of booleans): Optical coordinates that have no proper match
             total_shift (float): Calculated total shift
     raises LookupError: if no match can be found
     """
+    if electron_tree is None:
+        electron_tree = cKDTree(electron_coordinates)
+
     index1 = _KNNsearch(transformed_coordinates, electron_coordinates)
     # Sort optical coordinates based on the _KNNsearch output index
-    knn_points1 = [optical_coordinates[i] for i in index1]
+    knn_points1 = optical_coordinates[index1]
 
-    index2 = _KNNsearch(electron_coordinates, transformed_coordinates)
+    index2 = _KNNsearch(electron_tree, transformed_coordinates)
     # Sort electron coordinates based on the _KNNsearch output index
-    knn_points2 = [electron_coordinates[i] for i in index2]
+    knn_points2 = electron_coordinates[index2]
 
     # Sort index1 based on index2 and the opposite
-    o_index = [index1[i] for i in index2]
-    e_index = [index2[i] for i in index1]
-
-    transformed_range = range(len(transformed_coordinates))
-    electron_range = range(len(electron_coordinates))
+    o_index = index1[index2]
+    e_index = index2[index1]
 
     # Coordinates that have no proper match (optical and electron)
-    o_wrong_points = [i != r for i, r in zip(o_index, transformed_range)]
-    o_match_points = [not i for i in o_wrong_points]
-    e_wrong_points = [i != r for i, r in zip(e_index, electron_range)]
-    e_match_points = [not i for i in e_wrong_points]
+    o_wrong_points = (o_index != numpy.arange(len(transformed_coordinates)))
+    o_match_points = ~o_wrong_points
+    e_wrong_points = (e_index != numpy.arange(len(electron_coordinates)))
+    e_match_points = ~e_wrong_points
 
-    if all(o_wrong_points) or all(e_wrong_points):
+    if o_wrong_points.all() or e_wrong_points.all():
         raise LookupError("Cannot perform matching.")
 
     # Calculate the transform parameters for the correct electron_coordinates
     move1, scale1, rotation1 = transform.CalculateTransform(
-                                           list(compress(electron_coordinates, e_match_points)),
-                                           list(compress(knn_points1, e_match_points)))
+                                           electron_coordinates[e_match_points],
+                                           knn_points1[e_match_points])
 
     # Calculate the transform parameters for the correct optical_coordinates
     move2, scale2, rotation2 = transform.CalculateTransform(
-                                           list(compress(knn_points2, o_match_points)),
-                                           list(compress(optical_coordinates, o_match_points)))
+                                           knn_points2[o_match_points],
+                                           optical_coordinates[o_match_points])
 
     # Average between the two parameters
     avg_move = ((move1[0] + move2[0]) / 2, (move1[1] + move2[1]) / 2)
@@ -423,19 +420,13 @@ def _MatchAndCalculate(transformed_coordinates, optical_coordinates, electron_co
     # Correct for shift if 'too many' points are wrong, with 'too many' defined by:
     threshold = math.ceil(0.5 * math.sqrt(len(electron_coordinates)))
     # If the number of wrong points is above threshold perform corrections
-    if sum(o_wrong_points) > threshold and sum(e_wrong_points) > threshold:
+    if (numpy.count_nonzero(o_wrong_points) > threshold and
+        numpy.count_nonzero(e_wrong_points) > threshold):
         # Shift
-        electron_o_index2 = [electron_coordinates[i] for i in compress(index2, o_wrong_points)]
-        transformed_o_points = list(compress(transformed_coordinates, o_wrong_points))
-        o_wrong_diff = []
-        for ta, tb in zip(electron_o_index2, transformed_o_points):
-            o_wrong_diff.append((ta[0] - tb[0], ta[1] - tb[1]))
-
-        transformed_e_index1 = [transformed_coordinates[i] for i in compress(index1, e_wrong_points)]
-        electron_e_points = list(compress(electron_coordinates, e_wrong_points))
-        e_wrong_diff = []
-        for ta, tb in zip(transformed_e_index1, electron_e_points):
-            e_wrong_diff.append((ta[0] - tb[0], ta[1] - tb[1]))
+        o_wrong_diff = (electron_coordinates[index2[o_wrong_points]] -
+                        transformed_coordinates[o_wrong_points])
+        e_wrong_diff = (transformed_coordinates[index1[e_wrong_points]] -
+                        electron_coordinates[e_wrong_points])
 
         mean_wrong_diff = numpy.mean(e_wrong_diff, 0) - numpy.mean(o_wrong_diff, 0)
         avg_move = (avg_move[0] - (0.65 * mean_wrong_diff[0]) / avg_scale[0],
@@ -445,58 +436,37 @@ def _MatchAndCalculate(transformed_coordinates, optical_coordinates, electron_co
 
         # Angle
         # Calculate angle with respect to its center, therefore move points towards center
-        electron_coordinates_vs_center = []
         mean_electron_coordinates = numpy.mean(electron_coordinates, 0)
-        for ta in electron_coordinates:
-            # translation
-            translated = tuple(map(operator.sub, ta, mean_electron_coordinates))
-            electron_coordinates_vs_center.append(translated)
-
-        transformed_coordinates_vs_center = []
-        for tb in transformed_coordinates:
-            # translation
-            translated = tuple(map(operator.sub, tb, mean_electron_coordinates))
-            transformed_coordinates_vs_center.append(translated)
+        electron_coordinates_vs_center = electron_coordinates - mean_electron_coordinates
+        transformed_coordinates_vs_center = transformed_coordinates - mean_electron_coordinates
 
         # Calculate the angle with its center for every point
-        angle_vect_electron = numpy.arctan2([float(i[0]) for i in electron_coordinates_vs_center], [float(i[1]) for i in electron_coordinates_vs_center])
-        angle_vect_transformed = numpy.arctan2([float(i[0]) for i in transformed_coordinates_vs_center], [float(i[1]) for i in transformed_coordinates_vs_center])
+        angle_vect_electron = numpy.arctan2(electron_coordinates_vs_center[:, 0],
+                                            electron_coordinates_vs_center[:, 1])
+        angle_vect_transformed = numpy.arctan2(transformed_coordinates_vs_center[:, 0],
+                                               transformed_coordinates_vs_center[:, 1])
 
         # Calculate the angle difference for the wrong electron_coordinates
-        angle_vect_transformed_e_index1 = [angle_vect_transformed[i] for i in compress(index1, e_wrong_points)]
-        angle_diff_electron_wrong = []
-        for x, y in zip(compress(angle_vect_electron, e_wrong_points), angle_vect_transformed_e_index1):
-            a = (x - y)
-            # Ensure the angle is between -Pi and Pi
-            a %= (2 * math.pi)
-            if a > math.pi:
-                a -= 2 * math.pi
-            angle_diff_electron_wrong.append(a)
+        angle_diff_electron_wrong = _WrapAngle(angle_vect_electron[e_wrong_points] -
+                                               angle_vect_transformed[index1[e_wrong_points]])
 
         # Calculate the angle difference for the wrong transformed_coordinates
-        angle_vect_electron_o_index2 = [angle_vect_electron[i] for i in compress(index2, o_wrong_points)]
-        angle_diff_transformed_wrong = []
-        for x, y in zip(compress(angle_vect_transformed, o_wrong_points), angle_vect_electron_o_index2):
-            a = (x - y)
-            # Ensure the angle is between -Pi and Pi
-            a %= (2 * math.pi)
-            if a > math.pi:
-                a -= 2 * math.pi
-            angle_diff_transformed_wrong.append(a)
+        angle_diff_transformed_wrong = _WrapAngle(angle_vect_transformed[o_wrong_points] -
+                                                  angle_vect_electron[index2[o_wrong_points]])
 
         # Apply correction
         angle_correction = 0.5 * (numpy.mean(angle_diff_electron_wrong) - numpy.mean(angle_diff_transformed_wrong))
         avg_rotation += angle_correction
 
     # Perform transformation
-    estimated_coordinates = _TransformCoordinates(optical_coordinates, avg_move,
-                                                  avg_rotation,
-                                                  avg_scale)
+    estimated_coordinates = _TransformPoints(optical_coordinates, avg_move,
+                                             avg_rotation,
+                                             avg_scale)
     index1 = _KNNsearch(estimated_coordinates, electron_coordinates)
-    index2 = _KNNsearch(electron_coordinates, estimated_coordinates)
-    e_index = [index2[i] for i in index1]
-    e_wrong_points = [i != r for i, r in zip(e_index, electron_range)]
-    if all(e_wrong_points) or index1.count(index1[0]) == len(index1):
+    index2 = _KNNsearch(electron_tree, estimated_coordinates)
+    e_index = index2[index1]
+    e_wrong_points = (e_index != numpy.arange(len(electron_coordinates)))
+    if e_wrong_points.all() or (index1 == index1[0]).all():
         raise LookupError("Cannot perform matching.")
 
     return estimated_coordinates, index1, e_wrong_points, o_wrong_points, total_shift
@@ -505,43 +475,36 @@ def _MatchAndCalculate(transformed_coordinates, optical_coordinates, electron_co
 def _FindOuterOutliers(x_coordinates):
     """
     Removes large outliers from the optical coordinates.
-    x_coordinates (List of tuples): List of coordinates
-    returns (List of tuples): Coordinates without outer outliers
+    x_coordinates (ndarray of shape Nx2): coordinates
+    returns (ndarray of shape Mx2): Coordinates without outer outliers
     """
     # For each point, search for the 2 closest neighbors
-    points = numpy.array(x_coordinates)
-    tree = cKDTree(points, 2)
+    tree = cKDTree(x_coordinates, 2)
     distance, index = tree.query(x_coordinates, 2)
-    list_distance = numpy.array(distance)
 
     # Keep only the second ones because the first ones are the points themselves
-    sorted_distance = sorted(list_distance[:, 1])
+    neighbour_dist = distance[:, 1]
+    sorted_distance = numpy.sort(neighbour_dist)
     outlier_value = 1.5 * sorted_distance[int(math.ceil(0.5 * len(sorted_distance)))]
-    no_outlier_index = list_distance[:, 1] < outlier_value
 
-    return list(compress(x_coordinates, no_outlier_index))
+    return x_coordinates[neighbour_dist < outlier_value]
 
 
 def _FindInnerOutliers(x_coordinates):
     """
     Removes inner outliers from the optical coordinates. It assumes
     that our grid is rectangular.
-    x_coordinates (List of tuples): List of coordinates
-    returns (List of tuples): Coordinates without inner outliers
+    x_coordinates (ndarray of shape Nx2): coordinates
+    returns (ndarray of shape (N-1)x2): Coordinates without inner outliers
     """
-    points = numpy.array(x_coordinates)
-    tree = cKDTree(points, 2)
+    tree = cKDTree(x_coordinates, 2)
     distance, index = tree.query(x_coordinates, 2)
-    list_index = numpy.array(index)
-
-    counts = numpy.bincount(list_index[:, 1])
-    inner_outliers = numpy.argwhere(counts == numpy.amax(counts))
-    inner_outliers = inner_outliers.flatten().tolist()
-    inner_outlier = numpy.max(inner_outliers)
 
-    del x_coordinates[inner_outlier]
+    # The point which is the closest neighbour of the most points
+    counts = numpy.bincount(index[:, 1])
+    inner_outlier = numpy.flatnonzero(counts == numpy.amax(counts))[-1]
 
-    return x_coordinates
+    return numpy.delete(x_coordinates, inner_outlier, axis=0)
 
 
 def _BandPassFilter(image, len_noise, len_object):
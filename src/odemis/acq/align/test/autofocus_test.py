@@ -21,6 +21,7 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 '''
 from concurrent.futures._base import CancelledError
 import logging
+import numpy
 from odemis import model
 import odemis
 from odemis.acq import align
@@ -144,6 +145,79 @@ class TestAutofocus(unittest.TestCase):
         self.assertAlmostEqual(foc_pos, self._sem_good_focus, 3)
         self.assertGreater(foc_lev, 0)
 
+    @timeout(1000)
+    def test_autofocus_model(self):
+        """
+        Test AutoFocus with the model method, and compare its duration with the
+        binary method
+        """
+        for det, emt, focus, good_focus, offset in (
+                (self.ccd, self.ebeam, self.focus, self._opt_good_focus, 400e-6),
+                (self.sed, self.ebeam, self.efocus, self._sem_good_focus, 100e-6)):
+            if model.hasVA(det, "exposureTime"):
+                det.exposureTime.value = det.exposureTime.range[0]
+            else:
+                emt.dwellTime.value = emt.dwellTime.range[0]
+
+            durs = {}
+            for method in ("binary", "model"):
+                focus.moveAbs({"z": good_focus - offset}).result()
+                startt = time.time()
+                future_focus = align.AutoFocus(det, emt, focus, method=method)
+                foc_pos, foc_lev = future_focus.result(timeout=900)
+                durs[method] = time.time() - startt
+                self.assertAlmostEqual(foc_pos, good_focus, 3)
+                self.assertGreater(foc_lev, 0)
+
+            logging.info("Autofocus on %s took %g s with the binary method, and %g s with the model",
+                         det.name, durs["binary"], durs["model"])
+
+    def test_cancel_model(self):
+        """
+        Test cancelling the model AutoFocus
+        """
+        self.efocus.moveAbs({"z": self._sem_good_focus - 100e-06}).result()
+        self.ebeam.dwellTime.value = self.ebeam.dwellTime.range[0]
+        future_focus = align.AutoFocus(self.sed, self.ebeam, self.efocus, method="model")
+        time.sleep(0.5)
+        future_focus.cancel()
+        self.assertTrue(future_focus.cancelled())
+        with self.assertRaises(CancelledError):
+            future_focus.result(timeout=900)
+
+
+class TestFocusModel(unittest.TestCase):
+    """
+    Test the fitting of the focus curve model
+    """
+
+    def test_gaussian(self):
+        pos = numpy.linspace(-3e-6, 3e-6, 7) + 50e-6
+        levels = 5 * numpy.exp(-(pos - 50.4e-6) ** 2 / (2 * 2e-6 ** 2))
+        peak, err = autofocus._fitFocusModel(pos, levels)
+        self.assertAlmostEqual(peak, 50.4e-6)
+        self.assertLess(err, 1e-9)
+
+        # Only 3 points => no idea of the precision
+        peak, err = autofocus._fitFocusModel(pos[2:5], levels[2:5])
+        self.assertAlmostEqual(peak, 50.4e-6)
+        self.assertEqual(err, float("inf"))
+
+    def test_noisy(self):
+        pos = numpy.linspace(-20e-6, 20e-6, 21)
+        levels = 100 / (1 + (pos / 10e-6) ** 2) + 10
+        levels *= numpy.random.normal(1, 0.02, levels.shape)
+        peak, err = autofocus._fitFocusModel(pos, levels)
+        self.assertAlmostEqual(peak, 0, delta=max(err, 1e-6))
+        self.assertLess(err, 5e-6)
+
+    def test_no_peak(self):
+        pos = numpy.linspace(-3e-6, 3e-6, 7)
+        with self.assertRaises(ValueError):
+            autofocus._fitFocusModel(pos, (pos / 1e-6) ** 2 + 100)
+        with self.assertRaises(ValueError):
+            autofocus._fitFocusModel(pos[:2], pos[:2])
+
 
 class TestAutofocusSpectrometer(unittest.TestCase):
     """
@@ -30,6 +30,7 @@ from odemis.acq.align import transform
 from odemis.dataio import hdf5
 from odemis.util import spot
 import operator
+import time
 import unittest
 
 
@@ -373,6 +374,72 @@ class TestMatchCoordinates(unittest.TestCase):
 
         if known_estimated_coordinates != []:
             numpy.testing.assert_equal(known_estimated_coordinates.__len__(), electron_coordinates.__len__() - 1)
-            
+
+    def test_match_coordinates_speed_20x20(self):
+        """
+        Benchmark MatchCoordinates on a noisy, shuffled grid, and check every
+        spot is matched to the electron coordinate it comes from
+        """
+        electron_coordinates = [(i + 1, j + 1) for i in xrange(20) for j in xrange(20)]
+        translation_x, translation_y = self.translation_x, self.translation_y
+        scale_x, scale_y = self.scale_x, self.scale_y
+        rotation = self.rotation
+
+        ntrials = 10
+        dur = 0
+        for i in xrange(ntrials):
+            transformed_coordinates = coordinates._TransformCoordinates(electron_coordinates, (translation_x, translation_y), rotation, (scale_x, scale_y))
+            # Add noise
+            transformed_coordinates = [(x + uniform(-0.1, 0.1), y + uniform(-0.1, 0.1))
+                                       for x, y in transformed_coordinates]
+            # optical coordinates -> electron coordinates it was generated from
+            origin = dict(zip(transformed_coordinates, electron_coordinates))
+            shuffle(transformed_coordinates)
+
+            startt = time.time()
+            known_estimated_coordinates, known_optical_coordinates = coordinates.MatchCoordinates(transformed_coordinates, electron_coordinates, 0.25, 0.25)
+            dur += time.time() - startt
+
+            self.assertEqual(len(known_estimated_coordinates), len(electron_coordinates))
+            self.assertEqual(len(known_optical_coordinates), len(electron_coordinates))
+            for ec, oc in zip(known_estimated_coordinates, known_optical_coordinates):
+                self.assertEqual(tuple(ec), origin[tuple(oc)])
+            (calc_translation_x, calc_translation_y), (calc_scaling_x, calc_scaling_y), calc_rotation = transform.CalculateTransform(known_optical_coordinates, known_estimated_coordinates)
+            numpy.testing.assert_almost_equal((calc_translation_x, calc_translation_y, calc_scaling_x, calc_scaling_y, calc_rotation), (translation_x, translation_y, scale_x, scale_y, rotation), 1)
+
+        logging.info("Matching 20x20 grid took %g s", dur / ntrials)
+
+    def test_match_coordinates_speed_missing_20x20(self):
+        """
+        Benchmark MatchCoordinates on a noisy, shuffled grid with missing spots
+        """
+        electron_coordinates = [(i + 1, j + 1) for i in xrange(20) for j in xrange(20)]
+        translation_x, translation_y = self.translation_x, self.translation_y
+        scale_x, scale_y = self.scale_x, self.scale_y
+        rotation = self.rotation
+
+        ntrials = 10
+        dur = 0
+        for i in xrange(ntrials):
+            transformed_coordinates = coordinates._TransformCoordinates(electron_coordinates, (translation_x, translation_y), rotation, (scale_x, scale_y))
+            shuffle(transformed_coordinates)
+            # Add noise, and remove a few spots
+            transformed_coordinates = [(x + uniform(-0.1, 0.1), y + uniform(-0.1, 0.1))
+                                       for x, y in transformed_coordinates[:-3]]
+
+            startt = time.time()
+            known_estimated_coordinates, known_optical_coordinates = coordinates.MatchCoordinates(transformed_coordinates, electron_coordinates, 0.25, 0.25)
+            dur += time.time() - startt
+            # With missing spots, the grid can be matched shifted, so only
+            # check that every spot found is matched to a different coordinate
+            self.assertEqual(len(known_estimated_coordinates), len(transformed_coordinates))
+            self.assertEqual(sorted(tuple(c) for c in known_optical_coordinates),
+                             sorted(transformed_coordinates))
+            self.assertEqual(len(set(tuple(c) for c in known_estimated_coordinates)),
+                             len(known_estimated_coordinates))
+
+        logging.info("Matching 20x20 grid with missing spots took %g s", dur / ntrials)
+
+
 if __name__ == '__main__':
     unittest.main()
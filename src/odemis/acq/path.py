@@ -26,9 +26,11 @@ from concurrent.futures.thread import ThreadPoolExecutor
 import copy
 import logging
 import math
-from odemis import model
+import numbers
+from odemis import model, util
 from odemis.acq import stream
 from odemis.model import isasync
+import time
 
 GRATING_NOT_MIRROR = ("NOTMIRROR",)  # A tuple, so that no grating position can be like this
 
@@ -215,6 +217,8 @@ class OpticalPathManager(object):
         """
         self.microscope = microscope
         self._graph = affectsGraph(self.microscope)
+        # str (name) -> set of str: all the components affected (transitively)
+        self._reachable = {}
 
         # Use subset for modes guessed
         if microscope.role == "sparc2":
@@ -234,6 +238,19 @@ class OpticalPathManager(object):
             if hasattr(comp, 'axes') and isinstance(comp.axes, dict):
                 self._actuators.append(comp)
 
+        # (str, str) -> dict str -> value: moves of the selectors (based on the
+        # axes choices) for a component (name) to target another one (name)
+        self._selector_moves = {}
+
+        # Snapshots of the components state, only valid during a setPath
+        self._positions = {}  # str (name) -> dict str -> value: expected position
+        self._metadata = {}  # str (name) -> dict: metadata
+        self._startt = time.time()  # time the last setPath started
+
+        # str (name) -> float: time (in s) between the start of the last
+        # setPath and the end of the move of each component
+        self.timing = {}
+
         # last known axes position
         self._stored = {}
         self._last_mode = None  # previous mode that was set
@@ -328,6 +345,57 @@ class OpticalPathManager(object):
 
         return comp
 
+    def _getPosition(self, comp):
+        """
+        Read the position of a component, only once per setPath.
+        return (dict str -> value): the position, as expected after the moves
+          already requested
+        """
+        try:
+            return self._positions[comp.name]
+        except KeyError:
+            pos = comp.position.value.copy()
+            self._positions[comp.name] = pos
+            return pos
+
+    def _getMetadata(self, comp):
+        """
+        Read the metadata of a component, only once per setPath.
+        return (dict str -> value): the metadata
+        """
+        try:
+            return self._metadata[comp.name]
+        except KeyError:
+            md = comp.getMetadata()
+            self._metadata[comp.name] = md
+            return md
+
+    def _moveAbs(self, comp, mv):
+        """
+        Request a move of the component, but only for the axes which are not
+        already at the target position.
+        comp (Actuator): the component to move
+        mv (dict str -> value): target position for each axis
+        return (Future or None): the future of the move, or None if no move is
+          needed.
+        """
+        pos = self._getPosition(comp)
+        mv = {a: p for a, p in mv.items() if not _isSamePosition(pos.get(a), p)}
+        if not mv:
+            logging.debug("Not moving %s, as it is already at the target position",
+                          comp.name)
+            return None
+
+        f = comp.moveAbs(mv)
+        pos.update(mv)
+        startt = self._startt
+
+        def on_move_done(f, name=comp.name):
+            self.timing[name] = max(self.timing.get(name, 0), time.time() - startt)
+
+        f.add_done_callback(on_move_done)
+        return f
+
     @isasync
     def setPath(self, mode):
         """
@@ -362,188 +430,212 @@ class OpticalPathManager(object):
 
         logging.debug("Going to optical path '%s', with target detector %s.", mode, target)
 
-        fmoves = []  # moves in progress
-
-        # Restore the spectrometer focus before any other move, as (on the SR193),
-        # the value is grating/output dependent
-        if self._chamber_view_own_focus and self._last_mode == "chamber-view":
-            focus_comp = self._getComponent("focus")
-            self._focus_in_chamber_view = focus_comp.position.value.copy()
-            if self._focus_out_chamber_view is not None:
-                logging.debug("Restoring focus from before coming to chamber view to %s",
-                              self._focus_out_chamber_view)
-                fmoves.append(focus_comp.moveAbs(self._focus_out_chamber_view))
+        # Take a new snapshot of the current state of the components
+        self._positions = {}
+        self._metadata = {}
+        self._startt = time.time()
+        self.timing = {}
 
-        modeconf = self._modes[mode][1]
-        for comp_role, conf in modeconf.items():
-            # Try to access the component needed
-            try:
-                comp = self._getComponent(comp_role)
-            except LookupError:
-                logging.debug("Failed to find component %s, skipping it", comp_role)
-                continue
-
-            mv = {}
-            for axis, pos in conf.items():
-                if axis == "power":
-                    if model.hasVA(comp, "power"):
-                        try:
-                            if pos == 'on':
-                                comp.power.value = comp.power.range[1]
-                            else:
-                                comp.power.value = comp.power.range[0]
-                            logging.debug("Updating power of comp %s to %f", comp.name, comp.power.value)
-                        except AttributeError:
-                            logging.debug("Could not retrieve power range of %s component", comp_role)
+        try:
+            fmoves = []  # moves in progress
+
+            # Restore the spectrometer focus before any other move, as (on the SR193),
+            # the value is grating/output dependent
+            if self._chamber_view_own_focus and self._last_mode == "chamber-view":
+                focus_comp = self._getComponent("focus")
+                self._focus_in_chamber_view = focus_comp.position.value.copy()
+                if self._focus_out_chamber_view is not None:
+                    logging.debug("Restoring focus from before coming to chamber view to %s",
+                                  self._focus_out_chamber_view)
+                    fmoves.append(self._moveAbs(focus_comp, self._focus_out_chamber_view))
+
+            modeconf = self._modes[mode][1]
+            for comp_role, conf in modeconf.items():
+                # Try to access the component needed
+                try:
+                    comp = self._getComponent(comp_role)
+                except LookupError:
+                    logging.debug("Failed to find component %s, skipping it", comp_role)
                     continue
-                if isinstance(pos, str) and pos.startswith("MD:"):
-                    pos = self.mdToValue(comp, pos[3:])[axis]
-                if axis in comp.axes:
-                    if axis == "band":
-                        # Handle the filter wheel in a special way. Search
-                        # for the key that corresponds to the value, most probably
-                        # to the 'pass-through'
-                        choices = comp.axes[axis].choices
-                        for key, value in choices.items():
-                            if value == pos:
-                                pos = key
-                                # Just to store current band in order to restore
-                                # it once we leave this mode
-                                if self._last_mode not in ALIGN_MODES:
-                                    self._stored[axis] = comp.position.value[axis]
-                                break
-                        else:
-                            logging.debug("Choice %s is not present in %s axis", pos, axis)
-                            continue
-                    elif axis == "grating":
-                        # If mirror is to be used but not found in grating
-                        # choices, then we use zero order. In case of
-                        # GRATING_NOT_MIRROR we either use the last known
-                        # grating or the first grating that is not mirror.
-                        choices = comp.axes[axis].choices
-                        if pos == "mirror":
-                            # Store current grating (if we use one at the moment)
-                            # to restore it once we use a normal grating again
-                            if choices[comp.position.value[axis]] != "mirror":
-                                self._stored[axis] = comp.position.value[axis]
-                                self._stored['wavelength'] = comp.position.value['wavelength']
-                            # Use the special "mirror" grating, if it exists
+
+                mv = {}
+                for axis, pos in conf.items():
+                    if axis == "power":
+                        if model.hasVA(comp, "power"):
+                            try:
+                                if pos == 'on':
+                                    power = comp.power.range[1]
+                                else:
+                                    power = comp.power.range[0]
+                                if comp.power.value != power:
+                                    comp.power.value = power
+                                    logging.debug("Updating power of comp %s to %f", comp.name, power)
+                            except AttributeError:
+                                logging.debug("Could not retrieve power range of %s component", comp_role)
+                        continue
+                    if isinstance(pos, str) and pos.startswith("MD:"):
+                        pos = self.mdToValue(comp, pos[3:])[axis]
+                    if axis in comp.axes:
+                        if axis == "band":
+                            # Handle the filter wheel in a special way. Search
+                            # for the key that corresponds to the value, most probably
+                            # to the 'pass-through'
+                            choices = comp.axes[axis].choices
                             for key, value in choices.items():
-                                if value == "mirror":
+                                if value == pos:
                                     pos = key
+                                    # Just to store current band in order to restore
+                                    # it once we leave this mode
+                                    if self._last_mode not in ALIGN_MODES:
+                                        self._stored[axis] = self._getPosition(comp)[axis]
                                     break
                             else:
-                                # Fallback to zero order (aka "low-quality mirror")
-                                axis = 'wavelength'
-                                pos = 0
-                        elif pos == GRATING_NOT_MIRROR:
-                            if choices[comp.position.value[axis]] == "mirror":
-                                # if there is a grating stored use this one
-                                # otherwise find the non-mirror grating
-                                if axis in self._stored:
-                                    pos = self._stored[axis]
+                                logging.debug("Choice %s is not present in %s axis", pos, axis)
+                                continue
+                        elif axis == "grating":
+                            # If mirror is to be used but not found in grating
+                            # choices, then we use zero order. In case of
+                            # GRATING_NOT_MIRROR we either use the last known
+                            # grating or the first grating that is not mirror.
+                            choices = comp.axes[axis].choices
+                            cpos = self._getPosition(comp)
+                            if pos == "mirror":
+                                # Store current grating (if we use one at the moment)
+                                # to restore it once we use a normal grating again
+                                if choices[cpos[axis]] != "mirror":
+                                    self._stored[axis] = cpos[axis]
+                                    self._stored['wavelength'] = cpos['wavelength']
+                                # Use the special "mirror" grating, if it exists
+                                for key, value in choices.items():
+                                    if value == "mirror":
+                                        pos = key
+                                        break
+                                else:
+                                    # Fallback to zero order (aka "low-quality mirror")
+                                    axis = 'wavelength'
+                                    pos = 0
+                            elif pos == GRATING_NOT_MIRROR:
+                                if choices[cpos[axis]] == "mirror":
+                                    # if there is a grating stored use this one
+                                    # otherwise find the non-mirror grating
+                                    if axis in self._stored:
+                                        pos = self._stored[axis]
+                                    else:
+                                        pos = self.findNonMirror(choices)
+                                    if 'wavelength' in self._stored:
+                                        mv['wavelength'] = self._stored['wavelength']
                                 else:
-                                    pos = self.findNonMirror(choices)
-                                if 'wavelength' in self._stored:
-                                    mv['wavelength'] = self._stored['wavelength']
+                                    pos = cpos[axis]  # no change
+                                try:
+                                    del self._stored[axis]
+                                except KeyError:
+                                    pass
+                                try:
+                                    del self._stored['wavelength']
+                                except KeyError:
+                                    pass
                             else:
-                                pos = comp.position.value[axis]  # no change
-                            try:
-                                del self._stored[axis]
-                            except KeyError:
-                                pass
-                            try:
-                                del self._stored['wavelength']
-                            except KeyError:
-                                pass
-                        else:
-                            logging.debug("Using grating position as-is: '%s'", pos)
-                            pass  # use pos as-is
-                    elif axis == "slit-in":
-                        if self._last_mode not in ALIGN_MODES:
-                            # TODO: save also the component
-                            self._stored[axis] = comp.position.value[axis]
-                    elif hasattr(comp.axes[axis], "choices") and isinstance(comp.axes[axis].choices, dict):
-                        choices = comp.axes[axis].choices
-                        for key, value in choices.items():
-                            if value == pos:
-                                pos = key
-                                break
-                    mv[axis] = pos
-                else:
-                    logging.debug("Not moving axis %s.%s as it is not present", comp_role, axis)
+                                logging.debug("Using grating position as-is: '%s'", pos)
+                                pass  # use pos as-is
+                        elif axis == "slit-in":
+                            if self._last_mode not in ALIGN_MODES:
+                                # TODO: save also the component
+                                self._stored[axis] = self._getPosition(comp)[axis]
+                        elif hasattr(comp.axes[axis], "choices") and isinstance(comp.axes[axis].choices, dict):
+                            choices = comp.axes[axis].choices
+                            for key, value in choices.items():
+                                if value == pos:
+                                    pos = key
+                                    break
+                        mv[axis] = pos
+                    else:
+                        logging.debug("Not moving axis %s.%s as it is not present", comp_role, axis)
 
-            try:
-                fmoves.append(comp.moveAbs(mv))
-            except AttributeError:
-                logging.debug("%s not an actuator", comp_role)
+                if not mv:
+                    continue
+                if not hasattr(comp, "moveAbs"):
+                    logging.debug("%s not an actuator", comp_role)
+                    continue
+                fmoves.append(self._moveAbs(comp, mv))
 
-        # Now take care of the selectors based on the target detector
-        fmoves.extend(self.selectorsToPath(target))
+            # Now take care of the selectors based on the target detector
+            fmoves.extend(self.selectorsToPath(target))
 
-        # If we are about to leave alignment modes, restore values
-        if self._last_mode in ALIGN_MODES and mode not in ALIGN_MODES:
-            if 'band' in self._stored:
-                try:
-                    flter = self._getComponent("filter")
-                    fmoves.append(flter.moveAbs({"band": self._stored['band']}))
-                except LookupError:
-                    logging.debug("No filter component available")
-            if 'slit-in' in self._stored:
-                try:
-                    spectrograph = self._getComponent("spectrograph")
-                    fmoves.append(spectrograph.moveAbs({"slit-in": self._stored['slit-in']}))
-                except LookupError:
-                    logging.debug("No spectrograph component available")
+            # If we are about to leave alignment modes, restore values
+            if self._last_mode in ALIGN_MODES and mode not in ALIGN_MODES:
+                if 'band' in self._stored:
+                    try:
+                        flter = self._getComponent("filter")
+                        fmoves.append(self._moveAbs(flter, {"band": self._stored['band']}))
+                    except LookupError:
+                        logging.debug("No filter component available")
+                if 'slit-in' in self._stored:
+                    try:
+                        spectrograph = self._getComponent("spectrograph")
+                        fmoves.append(self._moveAbs(spectrograph, {"slit-in": self._stored['slit-in']}))
+                    except LookupError:
+                        logging.debug("No spectrograph component available")
 
-        # Save last mode
-        self._last_mode = mode
+            # Save last mode
+            self._last_mode = mode
 
-        # wait for all the moves to be completed
-        for f in fmoves:
-            try:
-                f.result()
-            except IOError as e:
-                logging.warning("Actuator move failed giving the error %s", e)
-
-        # When going to chamber view, store the current focus position, and
-        # restore the special focus position for chamber, after _really_ all
-        # the other moves have finished, because the grating/output selector
-        # moves affects the current position of the focus.
-        if self._chamber_view_own_focus and mode == "chamber-view":
-            focus_comp = self._getComponent("focus")
-            self._focus_out_chamber_view = focus_comp.position.value.copy()
-            if self._focus_in_chamber_view is not None:
-                logging.debug("Restoring focus from previous chamber view to %s",
-                              self._focus_in_chamber_view)
+            # wait for all the moves to be completed
+            for f in fmoves:
+                if f is None:  # No move needed
+                    continue
                 try:
-                    focus_comp.moveAbsSync(self._focus_in_chamber_view)
+                    f.result()
                 except IOError as e:
                     logging.warning("Actuator move failed giving the error %s", e)
 
+            # When going to chamber view, store the current focus position, and
+            # restore the special focus position for chamber, after _really_ all
+            # the other moves have finished, because the grating/output selector
+            # moves affects the current position of the focus.
+            if self._chamber_view_own_focus and mode == "chamber-view":
+                focus_comp = self._getComponent("focus")
+                self._focus_out_chamber_view = focus_comp.position.value.copy()
+                if self._focus_in_chamber_view is not None:
+                    logging.debug("Restoring focus from previous chamber view to %s",
+                                  self._focus_in_chamber_view)
+                    try:
+                        focus_comp.moveAbsSync(self._focus_in_chamber_view)
+                    except IOError as e:
+                        logging.warning("Actuator move failed giving the error %s", e)
+
+            logging.info("Optical path '%s' set in %g s%s", mode, time.time() - self._startt,
+                         "".join(", %s: %g s" % (n, t) for n, t in sorted(self.timing.items())))
+        finally:
+            # The snapshot is only valid during the setPath
+            self._positions = {}
+            self._metadata = {}
+
     def selectorsToPath(self, target):
         """
         Sets the selectors so the optical path leads to the target component
         (usually a detector).
         target (str): component name
-        return (list of futures)
+        return (list of futures): the moves requested (None if the selector
+          was already at the right position)
         """
         fmoves = []
         for comp in self._actuators:
-            # TODO: pre-cache this as comp/target -> axis/pos
-
             # TODO: extend the path computation to "for every actuator which _affects_
             # the target, move if if position known, and update path to that actuator"?
             # Eg, this would improve path computation on SPARCv2 with fiber aligner
-            mv = {}
-            for an, ad in comp.axes.items():
-                if hasattr(ad, "choices") and isinstance(ad.choices, dict):
-                    for pos, value in ad.choices.items():
-                        if target in value:
-                            # set the position so it points to the target
-                            mv[an] = pos
-
-            comp_md = comp.getMetadata()
+            try:
+                mv = self._selector_moves[(comp.name, target)].copy()
+            except KeyError:
+                mv = {}
+                for an, ad in comp.axes.items():
+                    if hasattr(ad, "choices") and isinstance(ad.choices, dict):
+                        for pos, value in ad.choices.items():
+                            if target in value:
+                                # set the position so it points to the target
+                                mv[an] = pos
+                self._selector_moves[(comp.name, target)] = mv.copy()
+
+            comp_md = self._getMetadata(comp)
             if target in comp_md.get(model.MD_FAV_POS_ACTIVE_DEST, {}):
                 mv.update(comp_md[model.MD_FAV_POS_ACTIVE])
             elif target in comp_md.get(model.MD_FAV_POS_DEACTIVE_DEST, {}):
@@ -551,7 +643,7 @@ class OpticalPathManager(object):
 
             if mv:
                 logging.debug("Move %s added so %s targets to %s", mv, comp.name, target)
-                fmoves.append(comp.moveAbs(mv))
+                fmoves.append(self._moveAbs(comp, mv))
                 # make sure this component is also on the optical path
                 fmoves.extend(self.selectorsToPath(comp.name))
 
@@ -649,11 +741,33 @@ class OpticalPathManager(object):
         Returns True if "affecting" component affects -directly of indirectly-
         the "affected" component
         """
-        path = self.findPath(affecting, affected)
-        if path is None:
-            return False
-        else:
+        if affecting == affected:
             return True
+        return affected in self._getReachable(affecting)
+
+    def _getReachable(self, node):
+        """
+        Find all the nodes which can be reached from the given node. The result
+        is cached, as the graph never changes.
+        node (str): name of the component
+        return (set of str): names of the components affected (transitively)
+        """
+        try:
+            return self._reachable[node]
+        except KeyError:
+            pass
+
+        reachable = set()
+        tocheck = [node]
+        while tocheck:
+            n = tocheck.pop()
+            for child in self._graph.get(n, ()):
+                if child not in reachable:
+                    reachable.add(child)
+                    tocheck.append(child)
+
+        self._reachable[node] = reachable
+        return reachable
 
     def findPath(self, node1, node2, path=[]):
         """
@@ -670,3 +784,18 @@ class OpticalPathManager(object):
                 if new_path:
                     return new_path
         return None
+
+
+def _isSamePosition(current, target):
+    """
+    Check whether an axis is already at the target position
+    current (value or None): the current position (None if unknown)
+    target (value): the requested position
+    return (bool): True if the axis doesn't need to move
+    """
+    if current is None:
+        return False
+    if (isinstance(current, numbers.Real) and isinstance(target, numbers.Real) and
+        not isinstance(target, bool)):
+        return util.almost_equal(current, target)
+    return current == target
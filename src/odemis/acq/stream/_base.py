@@ -95,6 +95,12 @@ class Stream(object):
         # image display is done via a dataflow (in a separate thread), instead
         # of a VA.
         self._im_needs_recompute = threading.Event()
+
+        # Area displayed by each view: view -> (rect, mpp), see setViewRegion()
+        self._view_regions = weakref.WeakKeyDictionary()
+        self._view_regions_lock = threading.Lock()
+        self._view_reduced = False  # True if .image only contains part of .raw
+
         self._init_thread()
 
         # list of DataArray received and used to generate the image
@@ -803,6 +809,89 @@ class Stream(object):
         # synchronization allows to delay it (without accumulation).
         self._im_needs_recompute.set()
 
+    def setViewRegion(self, view, rect, mpp=None):
+        """
+        Indicates which part of the data is displayed, and at which scale. While
+          the stream is active, the .image is only computed for the union of
+          the areas displayed, at the finest scale requested. When the stream
+          is not active (eg, for export), .image is always the full data.
+        view (object): the display (typically a View) which shows the stream
+        rect (None or tuple of 4 floats): left, top, right, bottom positions
+          of the displayed area (in m). None to indicate the view doesn't
+          display the stream anymore.
+        mpp (None or float): size of a pixel of the display (in m). If None,
+          the data is kept at full resolution.
+        """
+        with self._view_regions_lock:
+            if rect is None:
+                prev = self._view_regions.pop(view, None)
+                new = None
+            else:
+                # Store as left, bottom, right, top (ie, y going up)
+                l, t, r, b = rect
+                new = ((min(l, r), min(t, b), max(l, r), max(t, b)), mpp or 0)
+                prev = self._view_regions.get(view)
+                self._view_regions[view] = new
+
+        if prev != new and self.is_active.value:
+            self._shouldUpdateImage()
+
+    def _reduceToViewRegion(self, data):
+        """
+        Crops and subsamples the data to only what is displayed, as indicated
+          via setViewRegion()
+        data (DataArray): 2D data
+        return (DataArray, dict): the data reduced (can be the original data),
+          and the metadata to update on the projection (empty if the data is
+          not reduced)
+        """
+        with self._view_regions_lock:
+            regions = self._view_regions.values()
+        if not regions:
+            return data, {}
+
+        md = self._find_metadata(data.metadata)
+        pxs = md[MD_PIXEL_SIZE]
+        pos = md[MD_POS]
+        h, w = data.shape
+
+        # Take one pixel out of "binning", so that a pixel is at most the size
+        # of a displayed pixel. Simple subsampling (instead of averaging) is
+        # the fastest, and looks the same on the display.
+        mpp = min(m for rect, m in regions)
+        binning = max(1, int(mpp / max(pxs)))
+
+        if abs(md[MD_ROTATION]) > 1e-6 or abs(md[MD_SHEAR]) > 1e-6:
+            # Too complicated to find the displayed area => only subsample,
+            # centred so that the position stays the same (within half a pixel)
+            x0, y0 = (w % binning) // 2, (h % binning) // 2
+            x1, y1 = w - (w % binning) + x0, h - (h % binning) + y0
+        else:
+            # Union of all the areas, in pixels, from the top-left corner
+            left = min(rect[0] for rect, m in regions)
+            bottom = min(rect[1] for rect, m in regions)
+            right = max(rect[2] for rect, m in regions)
+            top = max(rect[3] for rect, m in regions)
+            x0 = max(0, int(math.floor((left - pos[0]) / pxs[0] + w / 2)))
+            x1 = min(w, int(math.ceil((right - pos[0]) / pxs[0] + w / 2)))
+            y0 = max(0, int(math.floor((pos[1] - top) / pxs[1] + h / 2)))
+            y1 = min(h, int(math.ceil((pos[1] - bottom) / pxs[1] + h / 2)))
+            if x1 <= x0 or y1 <= y0:
+                # Not visible at all, but keep it simple: only subsample
+                x0, y0, x1, y1 = 0, 0, w, h
+
+        if binning == 1 and (x0, y0, x1, y1) == (0, 0, w, h):
+            return data, {}
+
+        rdata = data[y0:y1:binning, x0:x1:binning]
+        # Centre of the area covered by the reduced data (in original pixels)
+        cx = x0 + rdata.shape[1] * binning / 2
+        cy = y0 + rdata.shape[0] * binning / 2
+        rmd = {MD_POS: (pos[0] + (cx - w / 2) * pxs[0],
+                        pos[1] - (cy - h / 2) * pxs[1]),
+               MD_PIXEL_SIZE: (pxs[0] * binning, pxs[1] * binning)}
+        return rdata, rmd
+
     @staticmethod
     def _image_thread(wstream):
         """ Called as a separate thread, and recomputes the image whenever it receives an event
@@ -897,7 +986,15 @@ class Stream(object):
                     raw = self.raw[0]
                     if raw.ndim != 2:
                         raw = img.ensure2DImage(raw)  # Remove extra dimensions (of length 1)
-                    self.image.value = self._projectXY2RGB(raw, self.tint.value)
+                    if self.is_active.value:
+                        # Only compute what is displayed
+                        raw, rmd = self._reduceToViewRegion(raw)
+                    else:
+                        rmd = {}
+                    rgbim = self._projectXY2RGB(raw, self.tint.value)
+                    rgbim.metadata.update(rmd)
+                    self._view_reduced = bool(rmd)
+                    self.image.value = rgbim
             else:
                 raise AttributeError(".raw must be a list of DA/DAS")
 
@@ -985,7 +1082,7 @@ class Stream(object):
             raise ValueError("Cannot compute bounding-box as stream has no data")
         # Use .image if possible as the metadata is already processed but
         # fallback to the raw, if the image is not yet available
-        if self.image.value is None:
+        if self.image.value is None or self._view_reduced:
             data = self.raw[0]
             md = self._find_metadata(data.metadata)
         else:
@@ -35,7 +35,7 @@ from odemis.util import img
 import time
 
 from ._base import Stream, UNDEFINED_ROI
-from ._live import LiveStream
+from ._live import LiveStream, TimeWindowMixin
 
 
 class RepetitionStream(LiveStream):
@@ -427,7 +427,7 @@ class SpectrumSettingsStream(CCDSettingsStream):
         pass
 
 
-class MonochromatorSettingsStream(PMTSettingsStream):
+class MonochromatorSettingsStream(TimeWindowMixin, PMTSettingsStream):
     """
     A stream acquiring a count corresponding to the light at a given wavelength,
     typically with a counting PMT as a detector via a spectrograph.
@@ -465,17 +465,8 @@ class MonochromatorSettingsStream(PMTSettingsStream):
         del self.auto_bc_outliers
         del self.histogram
 
-        # .raw is an array of floats with time on the first dim, and count/date
-        # on the second dim.
-        self.raw = model.DataArray(numpy.empty((0, 2), dtype=numpy.float64))
-        self.image.value = model.DataArray([]) # start with an empty array
-
         # TODO: grating/cw as VAs (from the spectrograph)
 
-        # Time over which to accumulate the data. 0 indicates that only the last
-        # value should be included
-        self.windowPeriod = model.FloatContinuous(30, range=(0, 1e6), unit="s")
-
         # TODO: once the semcomedi works with any value, remove this
         if hasattr(self, "emtDwellTime"):
             dt = self.emtDwellTime
@@ -484,6 +475,8 @@ class MonochromatorSettingsStream(PMTSettingsStream):
             mn, mx = dt.range
             dt.range = (max(0.1e-3, mn), mx)
 
+        self._initWindow()
+
     def estimateAcquisitionTime(self):
         # 1 pixel => the dwell time (of the emitter)
         duration = self._getEmitterVA("dwellTime").value
@@ -497,35 +490,9 @@ class MonochromatorSettingsStream(PMTSettingsStream):
     # TODO: if the dwell time is small (eg, < 0.1s), do multiple acquisitions
     # at the same spot (how?)
 
-    def _append(self, count, date):
-        """
-        Adds a new count and updates the window
-        """
-        # find first element still part of the window
-        oldest = date - self.windowPeriod.value
-        first = numpy.searchsorted(self.raw[:, 1], oldest)
-
-        # We must update .raw atomically as _updateImage() can run simultaneously
-        new = numpy.array([[count, date]], dtype=numpy.float64)
-        self.raw = model.DataArray(numpy.append(self.raw[first:], new, axis=0))
-
-    def _updateImage(self):
-
-        # convert the list into a DataArray
-        raw = self.raw  # read in one shot
-        count, date = raw[:, 0], raw[:, 1]
-        im = model.DataArray(count)
-        # save the relative time of each point as ACQ_DATE, unorthodox but should not
-        # cause much problems as the data is so special anyway.
-        if len(date) > 0:
-            age = date - date[-1]
-        else:
-            age = date  # empty
-        im.metadata[model.MD_ACQ_DATE] = age
-        assert len(im) == len(date)
-        assert im.ndim == 1
-
-        self.image.value = im
+    def _getValuePeriod(self):
+        # One value per dwell time (at best)
+        return self._getEmitterVA("dwellTime").value
 
     def _onNewData(self, dataflow, data):
         # we absolutely need the acquisition time
@@ -24,6 +24,7 @@ import collections
 from concurrent.futures.thread import ThreadPoolExecutor
 import gc
 import logging
+import math
 import numpy
 from odemis import model
 from odemis.acq import drift
@@ -36,6 +37,9 @@ import weakref
 
 from ._base import Stream, UNDEFINED_ROI
 
+# Maximum number of pixels used to compute the histogram of the live images.
+# Larger images are subsampled, which is precise enough for display.
+HISTOGRAM_MAX_PIXELS = 1024 * 1024
 
 class LiveStream(Stream):
     """
@@ -96,6 +100,10 @@ class LiveStream(Stream):
             msg = "Unsubscribing from dataflow of component %s"
             logging.debug(msg, self._detector.name)
             self._dataflow.unsubscribe(self._onNewData)
+            if self._view_reduced:
+                # The image only contained what was displayed => compute the
+                # full image, so that it can be exported
+                self._shouldUpdateImage()
 
     def _startAcquisition(self, future=None):
         if not self.is_active.value or (future and future.cancelled()):
@@ -150,6 +158,23 @@ class LiveStream(Stream):
         # synchronization allows to delay it (without accumulation).
         self._ht_needs_recompute.set()
 
+    def _updateHistogram(self, data=None):
+        """
+        data (DataArray): the raw data to use, default to .raw[0]. In such
+          case, if the stream is active and the data is large, it is subsampled.
+        """
+        if data is None and self.raw and self.is_active.value:
+            data = self.raw[0]
+            if data.ndim >= 2:
+                npixels = data.shape[-1] * data.shape[-2]
+                step = int(math.ceil(math.sqrt(npixels / HISTOGRAM_MAX_PIXELS)))
+                if step > 1:
+                    # The data range needs all the values, to not miss the extremes
+                    self._updateDRange(data)
+                    data = data[..., ::step, ::step]
+
+        super(LiveStream, self)._updateHistogram(data)
+
     @staticmethod
     def _histogram_thread(wstream):
         """
@@ -208,10 +233,21 @@ class SEMStream(LiveStream):
     It basically knows how to activate the scanning electron and the detector.
     Warning: do not use local .resolution and .translation, but use the ROI.
     Local VA .resolution is supported, but only as read-only.
+    If the detector sends partial frames (on .partialData), they are received
+    while the stream is active, and the image is updated as soon as new lines
+    are acquired.
     """
     def __init__(self, name, detector, dataflow, emitter, **kwargs):
         super(SEMStream, self).__init__(name, detector, dataflow, emitter, **kwargs)
 
+        # The frame being assembled from partial frames (or None)
+        self._partial_frame = None
+        # True if the partial frame contains the previous frame for the parts
+        # not yet received.
+        self._partial_frame_bg = False
+        # MD_ACQ_DATE of the last complete frame received
+        self._last_frame_date = None
+
         # To restart directly acquisition if settings change
         try:
             self._getEmitterVA("dwellTime").subscribe(self._onDwellTime)
@@ -350,6 +386,23 @@ class SEMStream(LiveStream):
             logging.exception(msg, self.name.value)
             return Stream.estimateAcquisitionTime(self)
 
+    def _getPartialDataFlow(self):
+        """
+        returns (DataFlow or None): the DataFlow of the detector sending the
+          partial frames, if it has one
+        """
+        df = getattr(self._detector, "partialData", None)
+        if isinstance(df, model.DataFlowBase):
+            return df
+        return None
+
+    def _onActive(self, active):
+        if not active:
+            pdf = self._getPartialDataFlow()
+            if pdf:
+                pdf.unsubscribe(self._onPartialFrame)
+        super(SEMStream, self)._onActive(active)
+
     def _startAcquisition(self, future=None):
         # Note: blank => unblank, is done automatically by the driver
 
@@ -360,8 +413,64 @@ class SEMStream(LiveStream):
             raise NotImplementedError("SEM drift correction on simple SEM "
                                       "acquisition not yet implemented")
 
+        # Only this stream receives the partial frames, the other users of
+        # the detector only get complete frames.
+        pdf = self._getPartialDataFlow()
+        if pdf:
+            pdf.subscribe(self._onPartialFrame)
+
         super(SEMStream, self)._startAcquisition()
 
+    def _onNewData(self, dataflow, data):
+        self._partial_frame = None
+        self._last_frame_date = data.metadata.get(model.MD_ACQ_DATE)
+        super(SEMStream, self)._onNewData(dataflow, data)
+
+    def _onPartialFrame(self, dataflow, data):
+        """
+        Copies the partial frame into the frame being assembled, and updates
+          the image with it.
+        dataflow (DataFlow): the DataFlow of the partial frames
+        data (DataArray): partial frame, with MD_FRAME_POS and MD_FRAME_RES
+        """
+        # The partial frames are on a separate DataFlow, so they might arrive
+        # after the complete frame, or after the end of the acquisition.
+        if (not self.is_active.value or
+            (self._last_frame_date is not None and
+             data.metadata.get(model.MD_ACQ_DATE) == self._last_frame_date)):
+            return
+
+        md = data.metadata.copy()
+        x, y = md.pop(model.MD_FRAME_POS)
+        shape = tuple(md[model.MD_FRAME_RES][::-1])
+        frame = self._partial_frame
+        if (frame is None or frame.shape != shape or frame.dtype != data.dtype or
+            frame.metadata.get(model.MD_ACQ_DATE) != md.get(model.MD_ACQ_DATE)):
+            # New frame => start from the previous frame, if it's compatible,
+            # so that the lines not yet received still show something.
+            prev = self.raw[0] if self.raw else None
+            if prev is not None and prev.shape == shape and prev.dtype == data.dtype:
+                fdata = numpy.array(prev)
+                self._partial_frame_bg = True
+            else:
+                fdata = numpy.zeros(shape, dtype=data.dtype)
+                self._partial_frame_bg = False
+            # MD_FRAME_RES is kept, to indicate the frame is not complete
+            frame = model.DataArray(fdata, md)
+            self._partial_frame = frame
+
+        frame[y:y + data.shape[0], x:x + data.shape[1]] = data
+
+        if not self.raw:
+            self.raw.append(frame)
+        else:
+            self.raw[0] = frame
+
+        # If the rest of the frame is empty, the histogram would be misleading
+        if self._partial_frame_bg:
+            self._shouldUpdateHistogram()
+        self._shouldUpdateImage()
+
     def _onDwellTime(self, value):
         self._updateAcquisitionTime()
 
@@ -729,23 +838,131 @@ class BrightfieldStream(CameraStream):
         self._emitter.emissions.value = em
 
 
-class CameraCountStream(CameraStream):
+class TimeWindowBuffer(object):
     """
-    Special stream dedicated to count the entire data, and represent it over
-    time.
-    The .image is a one dimension DataArray with the mean of the whole sensor
-     data over time. The last acquired data is the last value in the array.
+    Ring buffer of (value, date), which only keeps the values received within
+    a given period of time before the latest one.
+    Adding a value is O(1) (amortized), and reading the window doesn't copy the
+    data. Only one thread should add values, but any thread can read the window
+    at the same time, without locking.
+    Each value is stored twice, at position i and i + capacity, so that the
+    window is always a contiguous part of the array.
     """
-    def __init__(self, *args, **kwargs):
-        super(CameraCountStream, self).__init__(*args, **kwargs)
 
-        # B/C and histogram are meaningless on a chronogram
-        del self.auto_bc
-        del self.auto_bc_outliers
-        del self.histogram
+    def __init__(self, period, capacity=1024, max_capacity=2 ** 20):
+        """
+        period (0<=float): duration (in s) of the window. 0 means only the latest
+          value is kept.
+        capacity (0<int): initial number of values which can be stored. It is
+          automatically increased if the window needs more.
+        max_capacity (0<int): maximum number of values which can be stored. If
+          more values are received within the period, the oldest ones are
+          dropped.
+        """
+        self.period = period
+        self._max_capacity = max_capacity
+        self._lock = threading.Lock()  # only for the writers
+        capacity = min(max(1, capacity), max_capacity)
+        # buffer (ndarray of shape 2*capacity, 2), first (int), length (int):
+        # updated in one go, so that the readers always get a consistent state
+        self._state = (numpy.empty((2 * capacity, 2), dtype=numpy.float64), 0, 0)
+
+    @property
+    def capacity(self):
+        return self._state[0].shape[0] // 2
+
+    def __len__(self):
+        return self._state[2]
+
+    def append(self, value, date):
+        """
+        Adds a new value, and drops the values which are not part of the window
+        anymore.
+        value (float)
+        date (float): time at which the value was acquired. It must be greater
+          or equal to the date of the previous value.
+        """
+        with self._lock:
+            buf, first, length = self._state
+            cap = buf.shape[0] // 2
+
+            # Drop all the values out of the window
+            if length:
+                oldest = date - self.period
+                n = int(numpy.searchsorted(buf[first:first + length, 1], oldest))
+                first = (first + n) % cap
+                length -= n
+
+            if length >= cap:
+                if cap < self._max_capacity:
+                    buf, first = self._grow(buf, first, length)
+                    cap = buf.shape[0] // 2
+                else:
+                    # Full => drop the oldest value
+                    first = (first + 1) % cap
+                    length -= 1
+                    self._state = (buf, first, length)
+
+            i = (first + length) % cap
+            buf[i] = value, date
+            buf[i + cap] = value, date
+            self._state = (buf, first, length + 1)
+
+    def reserve(self, capacity):
+        """
+        Ensures the buffer can contain at least the given number of values
+        capacity (0<int)
+        """
+        capacity = min(capacity, self._max_capacity)
+        with self._lock:
+            buf, first, length = self._state
+            if capacity > buf.shape[0] // 2:
+                buf, first = self._grow(buf, first, length, capacity)
+                self._state = (buf, first, length)
+
+    def _grow(self, buf, first, length, capacity=None):
+        """
+        Copy the values into a bigger buffer
+        return (ndarray, int): the new buffer, and the position of the first value
+        """
+        if capacity is None:
+            capacity = min(buf.shape[0], self._max_capacity)  # = 2x more
+        logging.debug("Increasing window buffer capacity to %d values", capacity)
+        nbuf = numpy.empty((2 * capacity, 2), dtype=numpy.float64)
+        nbuf[:length] = buf[first:first + length]
+        nbuf[capacity:capacity + length] = buf[first:first + length]
+        return nbuf, 0
+
+    def clear(self):
+        with self._lock:
+            buf, first, length = self._state
+            self._state = (buf, 0, 0)
+
+    def getWindow(self):
+        """
+        Get the values within the window. Note that it is a view on the buffer,
+        so it will be overridden once the buffer wraps around (ie, after
+        capacity - len(self) new values). Copy it if it must be kept.
+        return (ndarray of shape N, 2): the values and dates, ordered by date.
+        """
+        buf, first, length = self._state  # read in one shot
+        return buf[first:first + length]
+
+
+class TimeWindowMixin(object):
+    """
+    Mixin for the streams which represent a count over time, within a time
+    window. .raw is an array of floats with time on the first dim, and
+    count/date on the second dim. .image is a one dimension DataArray with the
+    counts, the last acquired one being the last value in the array.
+    The stream must provide _getValuePeriod(), and call _initWindow() at init.
+    """
 
-        # .raw is an array of floats with time on the first dim, and count/date
-        # on the second dim.
+    def _initWindow(self):
+        """
+        Creates the window buffer, .raw, .image and .windowPeriod
+        """
+        # .raw is updated with the image
         self.raw = model.DataArray(numpy.empty((0, 2), dtype=numpy.float64))
         self.image.value = model.DataArray([]) # start with an empty array
 
@@ -753,40 +970,44 @@ class CameraCountStream(CameraStream):
         # value should be included
         # TODO: immediately cut window when the value changes
         self.windowPeriod = model.FloatContinuous(30, range=(0, 1e6), unit="s")
+        self._window = TimeWindowBuffer(self.windowPeriod.value)
+        self.windowPeriod.subscribe(self._onWindowPeriod, init=True)
 
-    # TODO: use .roi to select which part of the CCD to use
+    def _getValuePeriod(self):
+        """
+        return (0<float): the expected minimum time (in s) between two values
+        """
+        raise NotImplementedError()
 
-    def _getCount(self, data):
+    def _onWindowPeriod(self, period):
+        self._window.period = period
+        self._reserveWindow()
+
+    def _reserveWindow(self):
         """
-        Compute the "count" corresponding to a specific DataArray.
-        Currently, this is the mean.
-        data (DataArray)
-        return (number): the count
+        Ensures the window buffer is big enough for the current settings
         """
-        # DEBUG: return random value, which is more fun than always the same number
-        # return random.uniform(300, 2 ** 15)
+        dur = max(1e-6, self._getValuePeriod())
+        self._window.reserve(int(self.windowPeriod.value / dur * 1.2) + 16)
 
-        # Mean is handy because it avoid very large numbers and still give
-        # useful info if the CCD is saturated
-        return data.mean()
+    def _onActive(self, active):
+        if active:
+            self._reserveWindow()
+        super(TimeWindowMixin, self)._onActive(active)
 
     def _append(self, count, date):
         """
         Adds a new count and updates the window
         """
-        # delete all old data
-        oldest = date - self.windowPeriod.value
-        first = numpy.searchsorted(self.raw[:, 1], oldest)
-
-        # We must update .raw atomically as _updateImage() can run simultaneously
-        new = numpy.array([[count, date]], dtype=numpy.float64)
-        self.raw = model.DataArray(numpy.append(self.raw[first:], new, axis=0))
+        self._window.append(count, date)
 
     def _updateImage(self):
-        # convert the list into a DataArray
-        raw = self.raw  # read in one shot
+        # convert the window into a DataArray
+        # The window buffer will be reused, so .raw needs its own copy
+        raw = self._window.getWindow().copy()  # read in one shot
+        self.raw = model.DataArray(raw)
         count, date = raw[:, 0], raw[:, 1]
-        im = model.DataArray(count)
+        im = model.DataArray(count.copy())  # contiguous
         # save the relative time of each point as ACQ_DATE, unorthodox but should not
         # cause much problems as the data is so special anyway.
         if len(date) > 0:
@@ -799,6 +1020,45 @@ class CameraCountStream(CameraStream):
 
         self.image.value = im
 
+
+class CameraCountStream(TimeWindowMixin, CameraStream):
+    """
+    Special stream dedicated to count the entire data, and represent it over
+    time.
+    The .image is a one dimension DataArray with the mean of the whole sensor
+     data over time. The last acquired data is the last value in the array.
+    """
+    def __init__(self, *args, **kwargs):
+        super(CameraCountStream, self).__init__(*args, **kwargs)
+
+        # B/C and histogram are meaningless on a chronogram
+        del self.auto_bc
+        del self.auto_bc_outliers
+        del self.histogram
+
+        self._initWindow()
+
+    # TODO: use .roi to select which part of the CCD to use
+
+    def _getValuePeriod(self):
+        # The readout is typically overlapping with the exposure, so the time
+        # between two frames is between the two.
+        return self.estimateAcquisitionTime() - self.SETUP_OVERHEAD
+
+    def _getCount(self, data):
+        """
+        Compute the "count" corresponding to a specific DataArray.
+        Currently, this is the mean.
+        data (DataArray)
+        return (number): the count
+        """
+        # DEBUG: return random value, which is more fun than always the same number
+        # return random.uniform(300, 2 ** 15)
+
+        # Mean is handy because it avoid very large numbers and still give
+        # useful info if the CCD is saturated
+        return data.mean()
+
     def _onNewData(self, dataflow, data):
         # we absolutely need the acquisition time
         try:
@@ -595,8 +595,27 @@ class SEMCCDMDStream(MultipleDetectorStream):
        automatically synchronises the CCD. As the dwell time is constant, it
        must be bigger than the worst time for CCD acquisition. Less overhead,
        so good for short dwell times.
+    The software synchronised acquisition can also be "pipelined": the SEM
+    continuously scans the current spot, the e-beam is moved to the next spot
+    as soon as the CCD exposure is over, while it is still reading out the
+    image, and the preprocessing of the CCD data is done in a pool of worker
+    threads.
     """
 
+    def __init__(self, name, main_stream, rep_stream, stage=None):
+        super(SEMCCDMDStream, self).__init__(name, main_stream, rep_stream, stage)
+
+        # If True, the software synchronised acquisition overlaps the e-beam
+        # positioning and the data preprocessing with the CCD acquisition
+        self.pipelined = model.BooleanVA(False)
+
+        # Time spent per pixel in addition to the exposure time (in s), during
+        # the last pipelined acquisition
+        self._px_overhead = []
+        # Time at which the e-beam reached the current spot, during the
+        # pipelined acquisition
+        self._spot_date = None
+
     def _estimateRawAcquisitionTime(self):
         """
         return (float): time in s for acquiring the whole image, without drift
@@ -684,6 +703,8 @@ class SEMCCDMDStream(MultipleDetectorStream):
         """
         if model.hasVA(self._rep_stream, "useScanStage") and self._rep_stream.useScanStage.value:
             return self._runAcquisitionScanStage(future)
+        elif self.pipelined.value:
+            return self._runAcquisitionPipelined(future)
 
         # TODO: handle better very large grid acquisition (than memory oops)
         try:
@@ -708,25 +729,7 @@ class SEMCCDMDStream(MultipleDetectorStream):
 
             tot_num = numpy.prod(rep)
             n = 0  # number of points acquired so far
-
-            # Translate dc_period to a number of pixels
-            if self._dc_estimator is not None:
-                rep_time_psmt = self._estimateRawAcquisitionTime() / numpy.prod(rep)
-                pxs_dc_period = self._dc_estimator.estimateCorrectionPeriod(
-                                        self._main_stream.dcPeriod.value,
-                                        rep_time_psmt,
-                                        rep)
-                # number of points left to acquire until next drift correction
-                n_til_dc = pxs_dc_period.next()
-                dc_acq_time = self._dc_estimator.estimateAcquisitionTime()
-
-                # First acquisition of anchor area
-                self._dc_estimator.acquire()
-            else:
-                dc_acq_time = 0
-                n_til_dc = tot_num
-
-            dc_period = n_til_dc  # approx. (just for time estimation)
+            n_til_dc, dc_period, dc_acq_time, pxs_dc_period = self._initDriftCorrection(rep)
 
             # We need to use synchronisation event because without it, either we
             # use .get() but it's not possible to cancel the acquisition, or we
@@ -742,14 +745,7 @@ class SEMCCDMDStream(MultipleDetectorStream):
             # while starting the next acquisition.
 
             for i in numpy.ndindex(*rep[::-1]):  # last dim (X) iterates first
-                trans = (spot_pos[i[::-1]][0], spot_pos[i[::-1]][1])
-                cptrans = self._emitter.translation.clip(trans)
-                if cptrans != trans:
-                    logging.error("Drift of %s px caused acquisition region out "
-                                  "of bounds: needed to scan spot at %s.",
-                                  drift_shift, trans)
-                self._emitter.translation.value = cptrans
-                self._acq_min_date = time.time()
+                self._acq_min_date = self._moveSpot(spot_pos, i, drift_shift)
                 logging.debug("E-beam spot after drift correction: %s",
                               self._emitter.translation.value)
                 logging.debug("Scanning resolution is %s and scale %s",
@@ -764,69 +760,29 @@ class SEMCCDMDStream(MultipleDetectorStream):
                     start = time.time()
                     ccd_trigger.notify()
 
-                    # A big timeout in the wait can cause up to 50 ms latency.
-                    # => after waiting the expected time only do small waits
-                    endt = start + rep_time * 3 + 5
-                    timedout = not self._acq_rep_complete.wait(rep_time + 0.01)
-                    if timedout:
-                        logging.debug("Waiting more for rep")
-                        while time.time() < endt:
-                            timedout = not self._acq_rep_complete.wait(0.005)
-                            if not timedout:
-                                break
-
+                    timedout = not self._waitRepData(start, rep_time)
                     if self._acq_state == CANCELLED:
                         raise CancelledError()
 
                     # Check whether it went fine (= not too long and not too short)
                     dur = time.time() - start
                     if timedout or dur < rep_time * 0.95:
-                        if timedout:
-                            # Note: it can happen we don't receive the data if there
-                            # no more memory left (without any other warning).
-                            # So we log the memory usage here too.
-                            # TODO: Support also for Windows
-                            import odemis.util.driver as udriver
-                            memu = udriver.readMemoryUsage()
-                            # Too bad, need to use VmSize to get any good value
-                            logging.warning("Acquisition of repetition stream for "
-                                            "pixel %s timed out after %g s. "
-                                            "Memory usage is %d. Will try again",
-                                            i, rep_time * 3 + 5, memu)
-                        else:  # too fast to be possible (< the expected time - 5%)
-                            logging.warning("Repetition stream acquisition took less than %g s: %g s, will try again",
-                                            rep_time, dur)
-                        failures += 1
-                        if failures >= 3:
-                            # In three failures we just give up
-                            raise IOError("Repetition stream acquisition repeatedly fails to synchronize")
-                        else:
-                            self._main_df.unsubscribe(self._onMainImage)
-                            # Ensure we don't keep the SEM data for this run
-                            self._main_data = self._main_data[:n]
-                            # Stop and restart the acquisition, hoping this time we will synchronize
-                            # properly
-                            self._rep_df.unsubscribe(self._onRepetitionImage)
-                            time.sleep(1)
-                            self._rep_df.subscribe(self._onRepetitionImage)
-                            continue
+                        failures = self._onRepFailure(i, dur, rep_time, timedout, failures)
+                        self._main_df.unsubscribe(self._onMainImage)
+                        # Ensure we don't keep the SEM data for this run
+                        self._main_data = self._main_data[:n]
+                        self._restartRepAcquisition()
+                        continue
 
                     # Normally, the SEM acquisition has already completed
-                    if not self._acq_main_complete.wait(sem_time * 1.5 + 5):
-                        raise TimeoutError("Acquisition of SEM pixel %s timed out after %g s"
-                                           % (i, sem_time * 1.5 + 5))
+                    self._waitMainData(i, sem_time)
                     logging.debug("Got main synchronisation")
                     self._main_df.unsubscribe(self._onMainImage)
 
                     if self._acq_state == CANCELLED:
                         raise CancelledError()
 
-                    # MD_POS default to the center of the stage, but it needs to be
-                    # the position of the e-beam (corrected for drift)
-                    raw_pos = self._main_data[-1].metadata[MD_POS]
-                    cor_pos = (raw_pos[0] + drift_shift[0] * main_pxs[0],
-                               raw_pos[1] - drift_shift[1] * main_pxs[1])  # Y is upside down
-                    self._rep_data.metadata[MD_POS] = cor_pos
+                    self._updateRepPos(self._rep_data, self._main_data[-1], drift_shift, main_pxs)
                     rep_buf.append(self._preprocessRepData(self._rep_data, i))
 
                     n += 1
@@ -839,69 +795,425 @@ class SEMCCDMDStream(MultipleDetectorStream):
                     n_til_dc -= 1
                     if self._dc_estimator is not None and n_til_dc <= 0:
                         n_til_dc = pxs_dc_period.next()
-
-                        # Acquisition of anchor area
-                        # Cannot cancel during this time, but hopefully it's short
-                        self._dc_estimator.acquire()
-
-                        if self._acq_state == CANCELLED:
-                            raise CancelledError()
-
-                        # Estimate drift and update next positions
-                        shift = self._dc_estimator.estimate()
-                        spot_pos[:, :, 0] -= shift[0]
-                        spot_pos[:, :, 1] -= shift[1]
-                        drift_shift = (drift_shift[0] + shift[0],
-                                       drift_shift[1] + shift[1])
+                        drift_shift = self._correctDrift(spot_pos, drift_shift)
                     # Since we reached this point means everything went fine, so
                     # no need to retry
                     break
 
-            # Done!
-            self._rep_df.unsubscribe(self._onRepetitionImage)
-            self._rep_df.synchronizedOn(None)
+            self._completeAcquisition(rep, roi, rep_buf)
+        except Exception as exp:
+            self._abortAcquisition(exp, "Software sync acquisition of multiple detectors failed")
+            raise
+        else:
+            return self.raw
+        finally:
+            self._cleanUpAcquisition()
 
-            with self._acq_lock:
-                if self._acq_state == CANCELLED:
-                    raise CancelledError()
-                self._acq_state = FINISHED
+    def _initDriftCorrection(self, rep):
+        """
+        Prepares the drift correction (if any), by acquiring the first anchor
+        area and computing how often it should be acquired.
+        rep (int, int): number of pixels acquired in X and Y
+        return:
+          n_til_dc (int): number of points left to acquire until next drift
+            correction
+          dc_period (int): approximate drift correction period (in number of
+            points), just for time estimation
+          dc_acq_time (float): time to acquire the anchor area (in s)
+          pxs_dc_period (iterator of int or None): the following drift
+            correction periods
+        """
+        tot_num = numpy.prod(rep)
+        if self._dc_estimator is None:
+            return tot_num, tot_num, 0, None
 
-            if self._emitter.resolution.value != (1, 1):  # means fuzzing was applied
-                # Handle data generated by fuzzing
-                main_one = self._assembleTiles(rep, roi, self._main_data)
-            else:
-                main_one = self._assembleMainData(rep, roi, self._main_data)  # shape is (Y, X)
-            # explicitly add names to make sure they are different
-            main_one.metadata[MD_DESCRIPTION] = self._main_stream.name.value
-            self._onMultipleDetectorData(main_one, rep_buf, rep)
+        # Translate dc_period to a number of pixels
+        rep_time_psmt = self._estimateRawAcquisitionTime() / tot_num
+        pxs_dc_period = self._dc_estimator.estimateCorrectionPeriod(
+                                self._main_stream.dcPeriod.value,
+                                rep_time_psmt,
+                                rep)
+        n_til_dc = pxs_dc_period.next()
+        dc_acq_time = self._dc_estimator.estimateAcquisitionTime()
 
-            if self._dc_estimator is not None:
-                self._anchor_raw.append(self._assembleAnchorData(self._dc_estimator.raw))
-        except Exception as exp:
-            if not isinstance(exp, CancelledError):
-                logging.exception("Software sync acquisition of multiple detectors failed")
+        # First acquisition of anchor area
+        self._dc_estimator.acquire()
 
-            # make sure it's all stopped
-            self._main_df.unsubscribe(self._onMainImage)
-            self._rep_df.unsubscribe(self._onRepetitionImage)
-            self._rep_df.synchronizedOn(None)
+        return n_til_dc, n_til_dc, dc_acq_time, pxs_dc_period
 
+    def _correctDrift(self, spot_pos, drift_shift):
+        """
+        Acquires the anchor area and shifts the next spot positions to
+        compensate for the drift measured.
+        spot_pos (ndarray of shape (X, Y, 2)): as returned by _getSpotPositions(),
+          updated in place
+        drift_shift (float, float): total drift shift so far (in sem px)
+        return (float, float): new total drift shift (in sem px)
+        raises:
+          CancelledError() if cancelled
+        """
+        # Acquisition of anchor area
+        # Cannot cancel during this time, but hopefully it's short
+        self._dc_estimator.acquire()
+
+        if self._acq_state == CANCELLED:
+            raise CancelledError()
+
+        # Estimate drift and update next positions
+        shift = self._dc_estimator.estimate()
+        spot_pos[:, :, 0] -= shift[0]
+        spot_pos[:, :, 1] -= shift[1]
+        return (drift_shift[0] + shift[0],
+                drift_shift[1] + shift[1])
+
+    def _moveSpot(self, spot_pos, i, drift_shift):
+        """
+        Move the e-beam to the given spot of the repetition grid
+        spot_pos (ndarray of shape (X, Y, 2)): as returned by _getSpotPositions()
+        i (int, int): iteration number in Y, X
+        drift_shift (float, float): total drift shift (in sem px), only used
+          for logging
+        return (float): time at which the e-beam was in position
+        """
+        trans = (spot_pos[i[::-1]][0], spot_pos[i[::-1]][1])
+        cptrans = self._emitter.translation.clip(trans)
+        if cptrans != trans:
+            logging.error("Drift of %s px caused acquisition region out "
+                          "of bounds: needed to scan spot at %s.",
+                          drift_shift, trans)
+        self._emitter.translation.value = cptrans
+        return time.time()
+
+    def _waitRepData(self, start, rep_time):
+        """
+        Waits for the data of the repetition detector
+        start (float): time at which the acquisition was triggered
+        rep_time (float): expected duration of the acquisition (in s)
+        return (bool): True if the data was received, False if timed out
+        """
+        # A big timeout in the wait can cause up to 50 ms latency.
+        # => after waiting the expected time only do small waits
+        endt = start + rep_time * 3 + 5
+        if self._acq_rep_complete.wait(max(0, start + rep_time + 0.01 - time.time())):
+            return True
+        logging.debug("Waiting more for rep")
+        while time.time() < endt:
+            if self._acq_rep_complete.wait(0.005):
+                return True
+        return False
+
+    def _waitMainData(self, i, sem_time):
+        """
+        Waits for the data of the main detector
+        i (int, int): iteration number in Y, X, only used for logging
+        sem_time (float): expected duration of the SEM scan (in s)
+        raises:
+          TimeoutError() if the data wasn't received in time
+        """
+        if not self._acq_main_complete.wait(sem_time * 1.5 + 5):
+            raise TimeoutError("Acquisition of SEM pixel %s timed out after %g s"
+                               % (i, sem_time * 1.5 + 5))
+
+    def _onRepFailure(self, i, dur, rep_time, timedout, failures):
+        """
+        Reports a repetition acquisition which didn't synchronise properly
+        i (int, int): iteration number in Y, X
+        dur (float): duration of the acquisition (in s)
+        rep_time (float): expected duration of the acquisition (in s)
+        timedout (bool): True if no data was received
+        failures (int): number of failures so far for this pixel
+        return (int): the updated number of failures
+        raises:
+          IOError() if it failed too many times
+        """
+        if timedout:
+            # Note: it can happen we don't receive the data if there
+            # no more memory left (without any other warning).
+            # So we log the memory usage here too.
+            # TODO: Support also for Windows
+            import odemis.util.driver as udriver
+            memu = udriver.readMemoryUsage()
+            # Too bad, need to use VmSize to get any good value
+            logging.warning("Acquisition of repetition stream for "
+                            "pixel %s timed out after %g s. "
+                            "Memory usage is %d. Will try again",
+                            i, rep_time * 3 + 5, memu)
+        else:  # too fast to be possible (< the expected time - 5%)
+            logging.warning("Repetition stream acquisition took less than %g s: %g s, will try again",
+                            rep_time, dur)
+        failures += 1
+        if failures >= 3:
+            # In three failures we just give up
+            raise IOError("Repetition stream acquisition repeatedly fails to synchronize")
+        return failures
+
+    def _restartRepAcquisition(self):
+        """
+        Stop and restart the acquisition of the repetition detector, hoping
+        this time it will synchronize properly
+        """
+        self._rep_df.unsubscribe(self._onRepetitionImage)
+        time.sleep(1)
+        self._rep_df.subscribe(self._onRepetitionImage)
+
+    def _updateRepPos(self, rep_data, main_data, drift_shift, main_pxs):
+        """
+        Sets the position of the repetition data to the position of the e-beam
+        rep_data (DataArray): the data, its metadata is updated
+        main_data (DataArray): the SEM data acquired at the same spot
+        drift_shift (float, float): total drift shift (in sem px)
+        main_pxs (float, float): pixel size of the SEM (in m)
+        """
+        # MD_POS default to the center of the stage, but it needs to be
+        # the position of the e-beam (corrected for drift)
+        raw_pos = main_data.metadata[MD_POS]
+        cor_pos = (raw_pos[0] + drift_shift[0] * main_pxs[0],
+                   raw_pos[1] - drift_shift[1] * main_pxs[1])  # Y is upside down
+        rep_data.metadata[MD_POS] = cor_pos
+
+    def _completeAcquisition(self, rep, roi, rep_buf):
+        """
+        Stops the detectors and assembles the data, once all the pixels have
+        been acquired
+        rep (int, int): number of pixels acquired in X and Y
+        roi (4 floats): region of interest acquired
+        rep_buf (list of DataArray): the (preprocessed) repetition data
+        raises:
+          CancelledError() if cancelled
+        """
+        self._rep_df.unsubscribe(self._onRepetitionImage)
+        self._rep_df.synchronizedOn(None)
+
+        with self._acq_lock:
+            if self._acq_state == CANCELLED:
+                raise CancelledError()
+            self._acq_state = FINISHED
+
+        if self._emitter.resolution.value != (1, 1):  # means fuzzing was applied
+            # Handle data generated by fuzzing
+            main_one = self._assembleTiles(rep, roi, self._main_data)
+        else:
+            main_one = self._assembleMainData(rep, roi, self._main_data)  # shape is (Y, X)
+        # explicitly add names to make sure they are different
+        main_one.metadata[MD_DESCRIPTION] = self._main_stream.name.value
+        self._onMultipleDetectorData(main_one, rep_buf, rep)
+
+        if self._dc_estimator is not None:
+            self._anchor_raw.append(self._assembleAnchorData(self._dc_estimator.raw))
+
+    def _abortAcquisition(self, exp, msg):
+        """
+        Stops the detectors and drops the data, after the acquisition failed
+        exp (Exception): the exception which stopped the acquisition
+        msg (str): message logged if it's not a cancellation
+        raises:
+          CancelledError() if the acquisition was cancelled in the mean time
+        """
+        if not isinstance(exp, CancelledError):
+            logging.exception(msg)
+
+        # make sure it's all stopped
+        self._main_df.unsubscribe(self._onMainImage)
+        self._rep_df.unsubscribe(self._onRepetitionImage)
+        self._rep_df.synchronizedOn(None)
+
+        self._rep_raw = []
+        self._main_raw = []
+        self._anchor_raw = []
+        if not isinstance(exp, CancelledError) and self._acq_state == CANCELLED:
+            logging.warning("Converting exception to cancellation")
+            raise CancelledError()
+
+    def _cleanUpAcquisition(self):
+        """
+        Restores the state of the stream, at the end of any acquisition
+        """
+        self._main_stream._unlinkHwVAs()
+        self._rep_stream._unlinkHwVAs()
+        self._dc_estimator = None
+        self._current_future = None
+        del self._main_data  # regain a bit of memory
+        self._acq_done.set()
+
+    def _runAcquisitionPipelined(self, future):
+        """
+        Acquires images from the multiple detectors via software synchronisation,
+        overlapping the e-beam positioning of the next pixel with the readout
+        of the CCD, and running the preprocessing in worker threads.
+        Warning: can be quite memory consuming if the grid is big
+        returns (list of DataArray): all the data acquired
+        raises:
+          CancelledError() if cancelled
+          Exceptions if error
+        """
+        # The idea of the pipelined acquisition:
+        #  * The CCD stays subscribed for the whole acquisition, and each image
+        #    is started via the software trigger.
+        #  * The SEM also stays subscribed for the whole acquisition, and
+        #    continuously scans the current spot with short frames. Every time
+        #    the spot is moved, the frames started before are dropped, and the
+        #    first one started after is kept.
+        #  * As soon as the exposure time has passed since the CCD trigger, the
+        #    e-beam is moved to the next spot, while the CCD data is being read
+        #    out and transferred.
+        #  * When the CCD data is received, the next CCD image is triggered
+        #    immediately, and the preprocessing of the data is queued.
+        prep_executor = futures.ThreadPoolExecutor(max_workers=4)
+        try:
+            self._acq_done.clear()
+            rep_time = self._adjustHardwareSettings()
+            exp_time = self._rep_det.exposureTime.value
+            if self._emitter.resolution.value == (1, 1):  # no fuzzing
+                # Short enough so that a complete frame at the new spot is
+                # always received before the end of the exposure
+                self._emitter.dwellTime.value = self._emitter.dwellTime.clip(exp_time / 2)
+            dwell_time = self._emitter.dwellTime.value
+            sem_time = dwell_time * numpy.prod(self._emitter.resolution.value)
+            spot_pos = self._getSpotPositions()
+            logging.debug("Generating %s spots for %g (dt=%g) s, pipelined",
+                          spot_pos.shape[:2], rep_time, dwell_time)
+            rep = self._rep_stream.repetition.value
+            roi = self._rep_stream.roi.value
+            drift_shift = (0, 0)  # total drift shift (in sem px)
+            main_pxs = self._emitter.pixelSize.value
+            self._main_data = []
+            self._rep_data = None
+            rep_buf = []  # Futures returning the preprocessed data
             self._rep_raw = []
             self._main_raw = []
             self._anchor_raw = []
-            if not isinstance(exp, CancelledError) and self._acq_state == CANCELLED:
-                logging.warning("Converting exception to cancellation")
-                raise CancelledError()
+            self._px_overhead = []
+            logging.debug("Starting pipelined repetition stream acquisition with components %s and %s",
+                          self._main_det.name, self._rep_det.name)
+
+            tot_num = numpy.prod(rep)
+            pixels = list(numpy.ndindex(*rep[::-1]))  # last dim (X) iterates first
+            n_til_dc, dc_period, dc_acq_time, pxs_dc_period = self._initDriftCorrection(rep)
+
+            ccd_trigger = self._rep_det.softwareTrigger
+            self._rep_df.synchronizedOn(ccd_trigger)
+            self._rep_df.subscribe(self._onRepetitionImage)
+
+            self._changeSpot(spot_pos, pixels[0], drift_shift)
+            self._main_df.subscribe(self._onMainSpotImage)
+
+            n = 0  # number of points acquired so far
+            failures = 0  # Keep track of synchronizing failures
+            prev_start = None
+            while n < tot_num:
+                i = pixels[n]
+                self._acq_min_date = self._spot_date
+                self._acq_rep_complete.clear()
+                start = time.time()
+                ccd_trigger.notify()
+                if prev_start is not None:
+                    self._px_overhead.append(start - prev_start - exp_time)
+                prev_start = start
+
+                # Wait for the end of the exposure (or the CCD data, if it's
+                # faster). The SEM data normally arrived already.
+                self._waitMainData(i, sem_time)
+                self._acq_rep_complete.wait(max(0, start + exp_time - time.time()))
+                if self._acq_state == CANCELLED:
+                    raise CancelledError()
+
+                # Move the e-beam to the next spot while the CCD data is
+                # transferred, unless the drift needs to be corrected first.
+                dc_due = self._dc_estimator is not None and n_til_dc <= 1
+                if n + 1 < tot_num and not dc_due:
+                    self._changeSpot(spot_pos, pixels[n + 1], drift_shift)
+
+                timedout = not self._waitRepData(start, rep_time)
+                if self._acq_state == CANCELLED:
+                    raise CancelledError()
+
+                # Check whether it went fine (= not too long and not too short)
+                dur = time.time() - start
+                if timedout or dur < rep_time * 0.95:
+                    failures = self._onRepFailure(i, dur, rep_time, timedout, failures)
+                    # Ensure we don't keep the SEM data for this run
+                    self._spot_date = float("inf")
+                    self._main_data = self._main_data[:n]
+                    self._restartRepAcquisition()
+                    self._changeSpot(spot_pos, i, drift_shift)
+                    prev_start = None
+                    continue
+
+                failures = 0
+                rep_data = self._rep_data
+                self._updateRepPos(rep_data, self._main_data[n], drift_shift, main_pxs)
+                pf = prep_executor.submit(self._preprocessRepData, rep_data, i)
+                if n == 0:
+                    # Let the first preprocessing finish, as subclasses may
+                    # initialise some state during it.
+                    pf.result()
+                rep_buf.append(pf)
+
+                n += 1
+                # guess how many drift anchors to acquire
+                n_anchor = (tot_num - n) // dc_period
+                anchor_time = n_anchor * dc_acq_time
+                self._updateProgress(future, dur, n, tot_num, anchor_time)
+
+                # Check if it is time for drift correction
+                n_til_dc -= 1
+                if self._dc_estimator is not None and n_til_dc <= 0:
+                    n_til_dc = pxs_dc_period.next()
+                    # The anchor region is scanned with the same SEM detector
+                    self._main_df.unsubscribe(self._onMainSpotImage)
+                    drift_shift = self._correctDrift(spot_pos, drift_shift)
+                    prev_start = None  # Don't count the anchor acquisition as overhead
+                    if n < tot_num:
+                        self._changeSpot(spot_pos, pixels[n], drift_shift)
+                        self._main_df.subscribe(self._onMainSpotImage)
+
+            self._main_df.unsubscribe(self._onMainSpotImage)
+
+            if self._px_overhead:
+                logging.info("Pipelined acquisition of %d pixels: overhead per pixel "
+                             "(in addition to %s exposure) median = %s, max = %s",
+                             tot_num, units.readable_str(exp_time, "s", sig=3),
+                             units.readable_str(numpy.median(self._px_overhead), "s", sig=3),
+                             units.readable_str(max(self._px_overhead), "s", sig=3))
+
+            rep_buf = [pf.result() for pf in rep_buf]
+            self._completeAcquisition(rep, roi, rep_buf)
+        except Exception as exp:
+            self._main_df.unsubscribe(self._onMainSpotImage)
+            self._abortAcquisition(exp, "Pipelined acquisition of multiple detectors failed")
             raise
         else:
             return self.raw
         finally:
-            self._main_stream._unlinkHwVAs()
-            self._rep_stream._unlinkHwVAs()
-            self._dc_estimator = None
-            self._current_future = None
-            del self._main_data  # regain a bit of memory
-            self._acq_done.set()
+            prep_executor.shutdown(wait=False)
+            self._cleanUpAcquisition()
+
+    def _changeSpot(self, spot_pos, i, drift_shift):
+        """
+        Move the e-beam to the given spot of the repetition grid, while the SEM
+        is continuously scanning, and wait for the SEM data at this new spot.
+        spot_pos (ndarray of shape (X, Y, 2)): as returned by _getSpotPositions()
+        i (int, int): iteration number in Y, X
+        drift_shift (float, float): total drift shift (in sem px), only used
+          for logging
+        """
+        # Drop all the SEM data until the e-beam is at the new position
+        self._spot_date = float("inf")
+        self._acq_main_complete.clear()
+        self._spot_date = self._moveSpot(spot_pos, i, drift_shift)
+
+    def _onMainSpotImage(self, df, data):
+        """
+        Receives the SEM data while the spot is continuously scanned, during
+        the pipelined acquisition. Only the first data acquired after the
+        e-beam reached the current spot is kept.
+        """
+        if self._spot_date > data.metadata.get(model.MD_ACQ_DATE, 0):
+            return  # Scanned (partly) before the e-beam was at the current spot
+
+        if not self._acq_main_complete.is_set():
+            self._main_data.append(data)
+            self._acq_main_complete.set()
 
     def _adjustHardwareSettingsScanStage(self):
         """
@@ -1091,7 +1403,7 @@ class SEMCCDMDStream(MultipleDetectorStream):
                     # MD_POS default to the center of the sample stage, but it
                     # needs to be the position of the
                     # sample stage + e-beam + scan stage translation (without the drift cor)
-                    raw_pos = self._main_data[-1].metadata[MD_POS]
+                    raw_pos = main_data.metadata[MD_POS]
                     strans = spos[0] - orig_spos["x"], spos[1] - orig_spos["y"]
                     cor_pos = raw_pos[0] + strans[0], raw_pos[1] + strans[1]
                     logging.debug("Updating pixel pos from %s to %s", raw_pos, cor_pos)
@@ -1513,6 +1825,7 @@ class MomentOfInertiaMDStream(SEMCCDMDStream):
 
         # For computing the moment of inertia in background
         self._executor = None
+        self._metrics = None  # spot.SpotMetrics, for the current acquisition
 
     def _adjustHardwareSettings(self):
         """
@@ -1561,6 +1874,9 @@ class MomentOfInertiaMDStream(SEMCCDMDStream):
     def _runAcquisition(self, future):
         # TODO: More than one thread useful? Use processes instead? + based on number of CPUs
         self._executor = futures.ThreadPoolExecutor(2)
+        # The background is the same for the whole acquisition, so the noise
+        # level and coordinates grids can be shared between all the images.
+        self._metrics = spot.SpotMetrics(self.background.value)
         try:
             return super(MomentOfInertiaMDStream, self)._runAcquisition(future)
         finally:
@@ -1583,7 +1899,7 @@ class MomentOfInertiaMDStream(SEMCCDMDStream):
         if i == self._center_image_i:
             self._center_raw = data
 
-        return self._executor.submit(self.ComputeMoI, data, self.background.value, self._drange, ss)
+        return self._executor.submit(self.ComputeMoI, data, self._metrics, self._drange, ss)
 
     def _onMultipleDetectorData(self, main_data, rep_data, repetition):
         """
@@ -1611,11 +1927,12 @@ class MomentOfInertiaMDStream(SEMCCDMDStream):
         self._rep_raw = [moi_da, valid_da, model.DataArray(spot_size), self._center_raw]
         self._main_raw = [main_data]
 
-    def ComputeMoI(self, data, background, drange, spot_size=False):
+    def ComputeMoI(self, data, metrics, drange, spot_size=False):
         """
         It performs the moment of inertia calculation (and a bit more)
         data (model.DataArray): The AR optical image
-        background (None or model.DataArray): Background image that we use for subtraction
+        metrics (spot.SpotMetrics): to compute the MoI, with the background
+          subtraction
         drange (tuple of floats): drange of data
         spot_size (bool): if True also calculate the spot size
         returns:
@@ -1628,16 +1945,12 @@ class MomentOfInertiaMDStream(SEMCCDMDStream):
         logging.debug("Moment of inertia calculation...")
 
         try:
-            moment_of_inertia = spot.MomentOfInertia(data, background)
+            moment_of_inertia, _, spot_estimation = metrics.compute(data, spot_size)
 #             moment_of_inertia += random.uniform(0, 10)  # DEBUG
 #             if random.randint(0, 10) == 0:  # DEBUG
 #                 moment_of_inertia = float("NaN")
             valid = not img.isClipping(data, drange) and not math.isnan(moment_of_inertia)
             # valid = random.choice((True, False))  # DEBUG
-            if spot_size:
-                spot_estimation = spot.SpotIntensity(data, background)
-            else:
-                spot_estimation = None
             return moment_of_inertia, valid, spot_estimation
         except Exception:
             # This is a future running in a future... a pain to get the traceback
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 12 Oct 2026
+
+@author: Éric Piel
+
+Copyright © 2026 Éric Piel, Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+from __future__ import division
+
+from concurrent.futures._base import CancelledError
+import logging
+import numpy
+from odemis import model
+from odemis.acq import accumulator
+import threading
+import time
+import unittest
+
+
+logging.getLogger().setLevel(logging.DEBUG)
+
+
+class CountingDataFlow(model.DataFlow):
+    """
+    Generates frames of shape (32, 64) filled with the frame number, at a
+    given period.
+    """
+    def __init__(self, period=0.01, dtype=numpy.uint16):
+        model.DataFlow.__init__(self)
+        self._period = period
+        self._dtype = dtype
+        self._must_stop = threading.Event()
+        self._thread = None
+
+    def _thread_main(self):
+        i = 0
+        while not self._must_stop.wait(self._period):
+            md = {model.MD_EXP_TIME: self._period,
+                  model.MD_ACQ_DATE: time.time()}
+            data = model.DataArray(numpy.full((32, 64), i, dtype=self._dtype), md)
+            i += 1
+            self.notify(data)
+        self._must_stop.clear()
+
+    def start_generate(self):
+        if self._thread:
+            self._thread.join()
+        self._thread = threading.Thread(target=self._thread_main, name="flow thread")
+        self._thread.start()
+
+    def stop_generate(self):
+        self._must_stop.set()
+
+
+class TestFrameAccumulator(unittest.TestCase):
+
+    def test_simple(self):
+        df = CountingDataFlow(0.01)
+        nb = 20
+        acc = accumulator.FrameAccumulator(df, nb)
+        acc.start()
+        self.assertTrue(acc.waitReceived(nb, timeout=5))
+        avg = acc.getAverage(timeout=5)
+        acc.stop()
+
+        self.assertEqual(avg.shape, (32, 64))
+        self.assertEqual(avg.dtype, numpy.uint16)
+        # Average of frames 0 -> 19 = 9.5, rounded
+        self.assertEqual(avg[0, 0], 10)
+        md = avg.metadata
+        self.assertAlmostEqual(md[model.MD_EXP_TIME], nb * 0.01)
+        self.assertEqual(len(md[model.MD_AD_LIST]), nb)
+        self.assertEqual(md[model.MD_ACQ_DATE], md[model.MD_AD_LIST][0])
+
+        # The DataFlow should be unsubscribed automatically after nb frames
+        time.sleep(0.1)
+        self.assertEqual(acc.received, nb)
+        self.assertEqual(acc.accumulated, nb)
+
+    def test_float(self):
+        df = CountingDataFlow(0.01, dtype=numpy.float32)
+        acc = accumulator.FrameAccumulator(df, 4)
+        acc.start()
+        avg = acc.getAverage(timeout=5, dtype=numpy.float64)
+        acc.stop()
+        self.assertEqual(avg.dtype, numpy.float64)
+        self.assertEqual(avg[0, 0], 1.5)
+
+    def test_drop(self):
+        """
+        Frames arriving faster than the summation should be dropped
+        """
+        df = CountingDataFlow(0.001)
+        acc = accumulator.FrameAccumulator(df, 10, drop=True, max_queue=1)
+        # Make the summation artificially slow
+        orig_add = acc._add_frame
+        def slow_add(data):
+            time.sleep(0.02)
+            orig_add(data)
+        acc._add_frame = slow_add
+
+        acc.start()
+        avg = acc.getAverage(timeout=10)
+        acc.stop()
+        self.assertEqual(acc.accumulated, 10)
+        self.assertGreater(acc.dropped, 0)
+        self.assertEqual(len(avg.metadata[model.MD_AD_LIST]), 10)
+
+    def test_stop_early(self):
+        df = CountingDataFlow(0.01)
+        acc = accumulator.FrameAccumulator(df, 1000)
+        acc.start()
+        time.sleep(0.1)
+        acc.stop()
+        self.assertFalse(acc.waitReceived(1000, timeout=1))
+        with self.assertRaises(IOError):
+            acc.getAverage(timeout=1)
+
+    def test_future(self):
+        df = CountingDataFlow(0.01)
+        f = accumulator.acquireAverage(df, 50, est_frame_time=0.01)
+        avg = f.result(10)
+        self.assertEqual(avg.shape, (32, 64))
+        self.assertEqual(len(avg.metadata[model.MD_AD_LIST]), 50)
+
+        # Cancel
+        f = accumulator.acquireAverage(df, 1000, est_frame_time=0.01)
+        time.sleep(0.1)
+        self.assertTrue(f.cancel())
+        self.assertTrue(f.cancelled())
+        with self.assertRaises(CancelledError):
+            f.result(1)
+
+    def test_overhead(self):
+        """
+        Averaging N frames should take about N frame periods
+        """
+        period = 0.005
+        nb = 100
+        df = CountingDataFlow(period)
+        startt = time.time()
+        f = accumulator.acquireAverage(df, nb, est_frame_time=period)
+        f.result(10)
+        dur = time.time() - startt
+        logging.info("Averaging %d frames of %g s took %g s", nb, period, dur)
+        self.assertLess(dur, nb * period * 3 + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -26,6 +26,7 @@ from odemis import model, acq
 import odemis
 from odemis.util import test
 import os
+import threading
 import time
 import unittest
 from unittest.case import skip
@@ -40,11 +41,191 @@ CONFIG_PATH = os.path.dirname(odemis.__file__) + "/../../install/linux/usr/share
 SPARC_CONFIG = CONFIG_PATH + "sim/sparc-pmts-sim.odm.yaml"
 SECOM_CONFIG = CONFIG_PATH + "sim/secom-sim.odm.yaml"
 
+class FakeComponent(object):
+    def __init__(self, name, role=None):
+        self.name = name
+        self.role = role
+
+
+class FakeStream(object):
+    """
+    Stream which only waits during its acquisition, and records when it was
+    acquired
+    """
+    def __init__(self, name, detector, emitter, duration, error=False):
+        self.name = model.StringVA(name)
+        self._detector = detector
+        self._emitter = emitter
+        self.duration = duration
+        self.error = error
+        self.start = None
+        self.end = None
+        self.future = None
+
+    def estimateAcquisitionTime(self):
+        return self.duration
+
+    def acquire(self):
+        f = model.ProgressiveFuture()
+        f._must_stop = threading.Event()
+        f.task_canceller = self._cancel
+        thread = threading.Thread(target=acq._futures.executeTask,
+                                  args=(f, self._run, f))
+        thread.start()
+        self.future = f
+        return f
+
+    def _run(self, f):
+        self.start = time.time()
+        f.set_progress(end=self.start + self.duration)
+        if f._must_stop.wait(self.duration):
+            raise CancelledError()
+        self.end = time.time()
+        if self.error:
+            raise IOError("Failed to acquire %s" % (self.name.value,))
+        return [model.DataArray(numpy.zeros((2, 3)))]
+
+    def _cancel(self, f):
+        f._must_stop.set()
+        return True
+
+
+class FailingStream(FakeStream):
+    """
+    Stream which fails to start its acquisition
+    """
+    def acquire(self):
+        raise IOError("Failed to start %s" % (self.name.value,))
+
+
+class FakeFluoStream(FakeStream, stream.FluoStream):
+    """
+    Fake stream which is considered as a fluorescence stream
+    """
+    def __init__(self, name, detector, emitter, duration, error=False):
+        FakeStream.__init__(self, name, detector, emitter, duration, error)
+        self.emission = model.TupleVA((500e-9, 520e-9, 530e-9, 540e-9, 550e-9))
+        self.excitation = model.TupleVA((465e-9, 470e-9, 480e-9, 490e-9, 495e-9))
+
+
 class TestNoBackend(unittest.TestCase):
     # No backend, and only fake streams that don't generate anything
 
-    # TODO
-    pass
+    def setUp(self):
+        self.ccd = FakeComponent("ccd")
+        self.ccd2 = FakeComponent("ccd2")
+        self.light = FakeComponent("light")
+        self.ebeam = FakeComponent("ebeam", "e-beam")
+        self.sed = FakeComponent("sed")
+
+    def test_parallel(self):
+        """
+        Streams with different hardware are acquired simultaneously
+        """
+        s1 = FakeStream("opt", self.ccd, self.light, 1)
+        s2 = FakeStream("sem", self.sed, self.ebeam, 1.5)
+        streams = [s1, s2]
+        self.assertAlmostEqual(acq.estimateTime(streams), 1.5)
+
+        start = time.time()
+        data, e = acq.acquire(streams).result()
+        dur = time.time() - start
+        self.assertIsNone(e)
+        self.assertEqual(len(data), 2)
+        self.assertLess(dur, 2.2)
+        self.assertLess(s2.start, s1.end)
+        self.assertLess(s1.start, s2.end)
+
+    def test_conflict(self):
+        """
+        Streams using the same hardware are acquired one after another, in order
+        """
+        s1 = FakeStream("opt1", self.ccd, self.light, 1)
+        s2 = FakeStream("opt2", self.ccd, self.light, 0.5)
+        s3 = FakeStream("opt3", self.ccd2, self.light, 0.5)  # same emitter
+        s4 = FakeStream("sem", self.sed, self.ebeam, 1)
+        streams = [s1, s2, s3, s4]
+        self.assertAlmostEqual(acq.estimateTime(streams), 2)
+
+        self.updates = 0
+        start = time.time()
+        f = acq.acquire(streams)
+        f.add_update_callback(self.on_progress_update)
+        data, e = f.result()
+        dur = time.time() - start
+        self.assertIsNone(e)
+        self.assertEqual(len(data), 4)
+        self.assertGreaterEqual(self.updates, 4)
+        self.assertLess(dur, 2.8)
+        self.assertGreaterEqual(s2.start, s1.end)
+        self.assertGreaterEqual(s3.start, s2.end)
+        self.assertLess(s4.start, s1.end)
+
+    def test_fluo_ebeam(self):
+        """
+        Fluorescence streams are acquired before the streams using the e-beam,
+        even if they use different hardware
+        """
+        s1 = FakeStream("sem", self.sed, self.ebeam, 0.5)
+        s2 = FakeFluoStream("fluo", self.ccd, self.light, 1)
+        s3 = FakeStream("opt", self.ccd2, FakeComponent("light2"), 1)
+        streams = [s1, s2, s3]
+        self.assertAlmostEqual(acq.estimateTime(streams), 1.5)
+
+        data, e = acq.acquire(streams).result()
+        self.assertIsNone(e)
+        self.assertEqual(len(data), 3)
+        self.assertGreaterEqual(s1.start, s2.end)
+        self.assertLess(s3.start, s2.end)
+
+    def test_error(self):
+        """
+        If a stream fails, the data from the other streams is still returned
+        """
+        s1 = FakeStream("opt1", self.ccd, self.light, 0.5, error=True)
+        s2 = FakeStream("opt2", self.ccd, self.light, 0.5)
+        s3 = FakeStream("sem", self.sed, self.ebeam, 1)
+        data, e = acq.acquire([s1, s2, s3]).result()
+        self.assertIsInstance(e, IOError)
+        self.assertEqual(len(data), 1)
+        self.assertIsNone(s2.start)  # Not started after the failure
+
+        # Everything failed => exception raised
+        s1 = FakeStream("opt1", self.ccd, self.light, 0.5, error=True)
+        with self.assertRaises(IOError):
+            acq.acquire([s1]).result()
+
+    def test_start_error(self):
+        """
+        If a stream fails to start, the streams running are stopped before
+        the end of the task
+        """
+        s1 = FakeStream("sem", self.sed, self.ebeam, 2)
+        s2 = FailingStream("opt", self.ccd, self.light, 1)
+        with self.assertRaises(IOError):
+            acq.acquire([s1, s2]).result()
+        self.assertIsNotNone(s1.start)
+        self.assertTrue(s1.future.done())
+        self.assertIsNone(s1.end)
+
+    def test_cancel(self):
+        s1 = FakeStream("opt1", self.ccd, self.light, 1)
+        s2 = FakeStream("opt2", self.ccd, self.light, 1)
+        s3 = FakeStream("sem", self.sed, self.ebeam, 2)
+        f = acq.acquire([s1, s2, s3])
+        time.sleep(0.5)
+        self.assertTrue(f.cancel())
+        self.assertTrue(f.cancelled())
+        with self.assertRaises(CancelledError):
+            f.result(1)
+        time.sleep(0.1)
+        self.assertIsNone(s1.end)
+        self.assertIsNone(s2.start)
+        self.assertIsNone(s3.end)
+
+    def on_progress_update(self, future, start, end):
+        self.updates += 1
+
 
 # @skip("simple")
 class SECOMTestCase(unittest.TestCase):
@@ -133,6 +314,25 @@ class SECOMTestCase(unittest.TestCase):
         self.assertIsNone(e)
         self.assertGreaterEqual(self.updates, 3) # at least one update per stream
 
+    def test_sem_optical(self):
+        """
+        SEM and brightfield streams use different hardware, so they are
+        acquired simultaneously
+        """
+        sems = stream.SEMStream("sem", self.sed, self.sed.data, self.ebeam)
+        streams = [self.streams[2], sems]
+        sum_time = sum(s.estimateAcquisitionTime() for s in streams)
+        est_time = acq.estimateTime(streams)
+        self.assertLess(est_time, sum_time)
+
+        start = time.time()
+        data, e = acq.acquire(streams).result()
+        dur = time.time() - start
+        self.assertIsNone(e)
+        self.assertEqual(len(data), 2)
+        logging.info("Acquired in %g s, for an estimated time of %g s (%g s if sequential)",
+                     dur, est_time, sum_time)
+
     def test_cancel(self):
         """
         try a bit the cancelling possibility
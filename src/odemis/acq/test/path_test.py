@@ -27,6 +27,7 @@ import odemis
 from odemis.acq import path, stream
 from odemis.util import test
 import os
+import time
 import unittest
 from unittest.case import skip
 
@@ -563,6 +564,32 @@ class Sparc2PathTestCase(unittest.TestCase):
         self.optmngr.setPath("chamber-view").result()
         self.assertEqual(self.focus.position.value, chamber_focus)
 
+    # @skip("simple")
+    def test_set_path_twice(self):
+        """
+        Test setting the same mode again doesn't move anything
+        """
+        self.optmngr.setPath("spectral").result()
+        self.assertTrue(self.optmngr.timing)  # at least something moved
+
+        startt = time.time()
+        self.optmngr.setPath("spectral").result()
+        logging.info("Setting again the same path took %g s", time.time() - startt)
+        self.assertEqual(self.optmngr.timing, {})
+        self.assert_pos_as_in_mode(self.lenswitch, "spectral")
+        self.assertEqual(self.spec_det_sel.position.value, {'rx': 1.5707963267948966})
+
+        # If one component is moved, only that one is moved back
+        self.optmngr.setPath("ar").result()
+        self.assertIn(self.lenswitch.name, self.optmngr.timing)
+        for key, value in self.lenswitch.axes["x"].choices.items():
+            if value == "off":
+                self.lenswitch.moveAbs({"x": key}).result()
+                break
+        self.optmngr.setPath("ar").result()
+        self.assertEqual(set(self.optmngr.timing.keys()), {self.lenswitch.name})
+        self.assert_pos_as_in_mode(self.lenswitch, "ar")
+
     # @skip("simple")
     def test_guess_mode(self):
         # test guess mode for ar
@@ -27,6 +27,7 @@ import math
 import numpy
 from odemis import model
 import odemis
+from odemis import acq
 from odemis.acq import stream, calibration, path
 from odemis.dataio import tiff
 from odemis.driver import simcam
@@ -78,6 +79,74 @@ class FakeDetector(model.Detector):
         self._shape = (2 ** 16,)
 
 
+class SubscriptionCounter(object):
+    """
+    Wraps a DataFlow, and counts how many times it has been subscribed
+    """
+    def __init__(self, df):
+        self._df = df
+        self.subscriptions = 0
+
+    def subscribe(self, listener):
+        self.subscriptions += 1
+        self._df.subscribe(listener)
+
+    def __getattr__(self, name):
+        return getattr(self._df, name)
+
+
+class TimeWindowBufferTestCase(unittest.TestCase):
+
+    def test_window(self):
+        wb = stream.TimeWindowBuffer(10, capacity=4)
+        self.assertEqual(len(wb), 0)
+        self.assertEqual(wb.getWindow().shape, (0, 2))
+
+        for i in range(100):
+            wb.append(i, i * 0.5)
+        window = wb.getWindow()
+        # Only the values within the last 10 s
+        self.assertEqual(len(window), 21)
+        self.assertEqual(tuple(window[0]), (79, 39.5))
+        self.assertEqual(tuple(window[-1]), (99, 49.5))
+        self.assertGreaterEqual(wb.capacity, 21)
+
+        # Period == 0 => only the last value
+        wb.period = 0
+        wb.append(100, 60)
+        self.assertEqual(wb.getWindow().tolist(), [[100, 60]])
+
+        wb.clear()
+        self.assertEqual(len(wb), 0)
+
+    def test_full(self):
+        wb = stream.TimeWindowBuffer(1e6, capacity=4, max_capacity=8)
+        for i in range(20):
+            wb.append(i, i)
+        # Only the newest values are kept
+        numpy.testing.assert_array_equal(wb.getWindow()[:, 0], range(12, 20))
+
+        wb.reserve(100)  # Can't go above the maximum
+        self.assertEqual(wb.capacity, 8)
+
+    def test_speed(self):
+        """
+        Report the sustained insertion rate, with a 60 s window at 10 kHz
+        """
+        wb = stream.TimeWindowBuffer(60)
+        n = 10 ** 5
+        date = time.time()
+        startt = time.time()
+        for i in range(n):
+            wb.append(i, date + i * 1e-4)
+            if i % 1000 == 0:
+                wb.getWindow()
+        dur = time.time() - startt
+        logging.info("Appended %d values at %g values/s", n, n / dur)
+        self.assertEqual(len(wb), n)
+        self.assertGreater(n / dur, 10000)
+
+
 # @skip("simple")
 class StreamTestCase(unittest.TestCase):
 
@@ -315,6 +384,171 @@ class StreamTestCase(unittest.TestCase):
         self.assertLessEqual(len(h), 1024)
         self.assertEqual((ir[0][0], ir[1][1]), (0, (2 ** 12) - 1))
 
+    def test_view_region(self):
+        """
+        Check the live image is only computed for the displayed area
+        """
+        class FakeView(object):
+            pass
+
+        ebeam = FakeEBeam("ebeam")
+        se = FakeDetector("se")
+        ss = stream.SEMStream("test", se, se.data, ebeam)
+        ss.should_update.value = True
+        ss.is_active.value = True
+
+        d = numpy.zeros((1024, 1024), "uint16")
+        d[::4, ::4] = 1000
+        md = {model.MD_BPP: 12,
+              model.MD_PIXEL_SIZE: (1e-6, 1e-6),  # m/px
+              model.MD_POS: (1e-3, -30e-3),  # m
+              }
+        da = model.DataArray(d, md)
+        full_bbox = (1e-3 - 512e-6, -30e-3 - 512e-6, 1e-3 + 512e-6, -30e-3 + 512e-6)
+
+        # Whole image displayed, with 4 image pixels per screen pixel
+        view = FakeView()
+        ss.setViewRegion(view, (1e-3 - 1e-3, -30e-3 + 1e-3, 1e-3 + 1e-3, -30e-3 - 1e-3), 4e-6)
+        se.data.notify(da)
+        time.sleep(0.5)
+        im = ss.image.value
+        self.assertEqual(im.shape, (256, 256, 3))
+        self.assertTupleAlmostEqual(im.metadata[model.MD_PIXEL_SIZE], (4e-6, 4e-6))
+        self.assertTupleAlmostEqual(im.metadata[model.MD_POS], md[model.MD_POS])
+        self.assertTupleAlmostEqual(ss.getBoundingBox(), full_bbox)
+
+        # Only the top-left quarter displayed, at full resolution
+        ss.setViewRegion(view, (1e-3 - 512e-6, -30e-3 + 512e-6, 1e-3, -30e-3), 1e-6)
+        time.sleep(0.5)
+        im = ss.image.value
+        self.assertEqual(im.shape, (512, 512, 3))
+        self.assertTupleAlmostEqual(im.metadata[model.MD_PIXEL_SIZE], (1e-6, 1e-6))
+        self.assertTupleAlmostEqual(im.metadata[model.MD_POS], (1e-3 - 256e-6, -30e-3 + 256e-6))
+        self.assertTupleAlmostEqual(ss.getBoundingBox(), full_bbox)
+
+        # A second view showing the whole image at low resolution => union
+        view2 = FakeView()
+        ss.setViewRegion(view2, (1e-3 - 1e-3, -30e-3 + 1e-3, 1e-3 + 1e-3, -30e-3 - 1e-3), 8e-6)
+        time.sleep(0.5)
+        self.assertEqual(ss.image.value.shape, (1024, 1024, 3))
+
+        # When stopped, the whole image is computed (eg, for export)
+        ss.setViewRegion(view2, None)
+        time.sleep(0.5)
+        self.assertEqual(ss.image.value.shape, (512, 512, 3))
+        ss.is_active.value = False
+        time.sleep(0.5)
+        im = ss.image.value
+        self.assertEqual(im.shape, (1024, 1024, 3))
+        self.assertTupleAlmostEqual(im.metadata[model.MD_POS], md[model.MD_POS])
+
+    def test_partial_frames(self):
+        """
+        Check the image is updated as soon as partial frames are received
+        """
+        ebeam = FakeEBeam("ebeam")
+        se = FakeDetector("se")
+        se.partialData = model.DataFlow()
+        ss = stream.SEMStream("test", se, se.data, ebeam)
+        ss.should_update.value = True
+        ss.is_active.value = True
+        self.assertEqual(len(se.partialData._listeners), 1)
+
+        md = {model.MD_BPP: 12,
+              model.MD_PIXEL_SIZE: (1e-6, 1e-6),  # m/px
+              model.MD_POS: (1e-3, -30e-3),  # m
+              model.MD_ACQ_DATE: time.time(),
+              model.MD_FRAME_RES: (200, 100),
+              }
+        # Send the first 30 lines
+        pmd = md.copy()
+        pmd[model.MD_FRAME_POS] = (0, 0)
+        se.partialData.notify(model.DataArray(numpy.full((30, 200), 1000, "uint16"), pmd))
+        time.sleep(0.5)
+        raw = ss.raw[0]
+        self.assertEqual(raw.shape, (100, 200))
+        self.assertIn(model.MD_FRAME_RES, raw.metadata)
+        self.assertNotIn(model.MD_FRAME_POS, raw.metadata)
+        self.assertEqual(raw[29, 0], 1000)
+        self.assertEqual(raw[30, 0], 0)
+        im = ss.image.value
+        self.assertEqual(im.shape, (100, 200, 3))
+        self.assertTupleAlmostEqual(im.metadata[model.MD_POS], md[model.MD_POS])
+
+        # Next lines
+        pmd[model.MD_FRAME_POS] = (0, 30)
+        se.partialData.notify(model.DataArray(numpy.full((30, 200), 2000, "uint16"), pmd))
+        time.sleep(0.5)
+        raw = ss.raw[0]
+        self.assertEqual(raw[29, 0], 1000)
+        self.assertEqual(raw[30, 0], 2000)
+        self.assertEqual(raw[60, 0], 0)
+
+        # Complete frame
+        del md[model.MD_FRAME_RES]
+        se.data.notify(model.DataArray(numpy.full((100, 200), 3000, "uint16"), md))
+        time.sleep(0.5)
+        raw = ss.raw[0]
+        self.assertNotIn(model.MD_FRAME_RES, raw.metadata)
+        self.assertNotIn(model.MD_FRAME_RES, ss.image.value.metadata)
+
+        # A partial frame arriving late, after the complete frame, is ignored
+        se.partialData.notify(model.DataArray(numpy.full((30, 200), 2500, "uint16"), pmd))
+        time.sleep(0.5)
+        self.assertEqual(ss.raw[0][30, 0], 3000)
+
+        # A new frame starts on top of the previous one
+        md[model.MD_ACQ_DATE] = time.time()
+        pmd = md.copy()
+        pmd[model.MD_FRAME_POS] = (0, 0)
+        pmd[model.MD_FRAME_RES] = (200, 100)
+        se.partialData.notify(model.DataArray(numpy.full((30, 200), 4000, "uint16"), pmd))
+        time.sleep(0.5)
+        raw = ss.raw[0]
+        self.assertEqual(raw[0, 0], 4000)
+        self.assertEqual(raw[30, 0], 3000)
+
+        ss.is_active.value = False
+        self.assertEqual(len(se.partialData._listeners), 0)
+
+    def test_acquire_partial_frames(self):
+        """
+        Check the acquisition only ends once the whole frame is received
+        """
+        ebeam = FakeEBeam("ebeam")
+        se = FakeDetector("se")
+        se.partialData = model.DataFlow()
+        ss = stream.SEMStream("test", se, se.data, ebeam)
+
+        f = acq.acquire([ss])
+        # Wait until the acquisition has started
+        for i in range(50):
+            if se.data._listeners:
+                break
+            time.sleep(0.1)
+        else:
+            self.fail("Acquisition didn't start")
+
+        md = {model.MD_PIXEL_SIZE: (1e-6, 1e-6),  # m/px
+              model.MD_POS: (1e-3, -30e-3),  # m
+              model.MD_ACQ_DATE: time.time(),
+              }
+        pmd = md.copy()
+        pmd[model.MD_FRAME_RES] = (200, 100)
+        pmd[model.MD_FRAME_POS] = (0, 0)
+        se.partialData.notify(model.DataArray(numpy.full((30, 200), 1000, "uint16"), pmd))
+        time.sleep(0.5)
+        self.assertFalse(f.done())
+
+        se.data.notify(model.DataArray(numpy.full((100, 200), 3000, "uint16"), md))
+        data, exp = f.result(5)
+        self.assertIsNone(exp)
+        self.assertEqual(len(data), 1)
+        self.assertNotIn(model.MD_FRAME_RES, data[0].metadata)
+        self.assertEqual(data[0].shape, (100, 200))
+        self.assertTrue(numpy.all(data[0] == 3000))
+        self.assertEqual(len(se.partialData._listeners), 0)
+
     def test_hwvas(self):
         ebeam = FakeEBeam("ebeam")
         se = FakeDetector("se")
@@ -971,6 +1205,60 @@ class SPARCTestCase(unittest.TestCase):
         numpy.testing.assert_allclose(spec_md[model.MD_PIXEL_SIZE], exp_pxs)
 
 
+#     @skip("simple")
+    def test_acq_spec_pipelined(self):
+        """
+        Test pipelined acquisition for Spectrometer
+        """
+        # Create the stream
+        sems = stream.SEMStream("test sem", self.sed, self.sed.data, self.ebeam)
+        specs = stream.SpectrumSettingsStream("test spec", self.spec, self.spec.data, self.ebeam)
+        sps = stream.SEMSpectrumMDStream("test sem-spec", sems, specs)
+        sps.pipelined.value = True
+        sps._main_df = SubscriptionCounter(sps._main_df)
+
+        specs.roi.value = (0.15, 0.6, 0.8, 0.8)
+
+        self.spec.exposureTime.value = 0.01  # s
+        specs.repetition.value = (25, 20)
+        exp_pos, exp_pxs, exp_res = self._roiToPhys(specs)
+
+        # Start acquisition
+        timeout = 1 + 1.5 * sps.estimateAcquisitionTime()
+        start = time.time()
+        f = sps.acquire()
+
+        # wait until it's over
+        data = f.result(timeout)
+        dur = time.time() - start
+        logging.debug("Acquisition took %g s", dur)
+        self.assertTrue(f.done())
+        self.assertEqual(len(data), len(sps.raw))
+        self.assertEqual(len(sps._main_raw), 1)
+        self.assertEqual(sps._main_raw[0].shape, exp_res[::-1])
+        self.assertEqual(len(sps._rep_raw), 1)
+        sshape = sps._rep_raw[0].shape
+        self.assertEqual(len(sshape), 5)
+        self.assertEqual(sshape[-2:], exp_res[::-1])
+        sem_md = sps._main_raw[0].metadata
+        spec_md = sps._rep_raw[0].metadata
+        numpy.testing.assert_allclose(sem_md[model.MD_POS], spec_md[model.MD_POS])
+        numpy.testing.assert_allclose(spec_md[model.MD_POS], exp_pos)
+        numpy.testing.assert_allclose(spec_md[model.MD_PIXEL_SIZE], exp_pxs)
+
+        # The SEM keeps scanning during the whole acquisition
+        self.assertEqual(sps._main_df.subscriptions, 1)
+
+        # One overhead per pixel, except the first one
+        self.assertEqual(len(sps._px_overhead), numpy.prod(exp_res) - 1)
+        logging.info("Median overhead per pixel: %g s", numpy.median(sps._px_overhead))
+
+        # Cancelling should stop quickly
+        f = sps.acquire()
+        time.sleep(0.5)
+        self.assertTrue(f.cancel())
+        self.assertTrue(f.cancelled())
+
 #     @skip("simple")
     def test_acq_fuz(self):
         """
@@ -31,17 +31,24 @@ from odemis import dataio, model
 import odemis
 from odemis.util import spectrum
 import os
+import resource
 import sys
+import time
 
 
 logging.getLogger().setLevel(logging.INFO) # use DEBUG for more messages
 
+# Images bigger than this (in X or Y) are automatically exported in pyramidal
+# format, when the output format supports it.
+AUTO_PYRAMID_SIZE = 4096 # px
+
 
 def open_acq(fn):
     """
     Read the content of an acquisition file
-    return (list of DataArray, list of DataArray):
-        list of the data in the file
+    return (list of DataArray or DataArrayShadow, list of DataArray):
+        list of the data in the file. If the format supports it, the data is
+          not read yet (DataArrayShadow), but only when needed.
         thumbnail (if available, might be empty)
     """
     fmt_mng = dataio.find_fittest_converter(fn, default=None, mode=os.O_RDONLY)
@@ -54,7 +61,11 @@ def open_acq(fn):
         raise NotImplementedError("No support for importing format %s" % fmt_mng.FORMAT)
 
     try:
-        data = fmt_mng.read_data(fn)
+        if hasattr(fmt_mng, "open_data"):
+            acd = fmt_mng.open_data(fn)
+            data = list(acd.content)
+        else:
+            data = fmt_mng.read_data(fn)
     except Exception:
         raise ValueError("Failed to open the file '%s' as %s" % (fn, fmt_mng.FORMAT))
 
@@ -73,6 +84,35 @@ def open_acq(fn):
     return data, thumb
 
 
+def load_data(data):
+    """
+    Ensures the data is fully read
+    data (list of DataArray or DataArrayShadow)
+    return (list of DataArray): the data, with the DataArrayShadows replaced by
+      the corresponding DataArray
+    """
+    return [d.getData() if isinstance(d, model.DataArrayShadow) else d
+            for d in data]
+
+
+def data_size(data):
+    """
+    Computes the size of the data, as it would be in memory
+    data (list of DataArray or DataArrayShadow)
+    return (int): number of bytes
+    """
+    return sum(int(numpy.prod(d.shape)) * numpy.dtype(d.dtype).itemsize
+               for d in data)
+
+
+def get_peak_memory():
+    """
+    return (int): the maximum amount of memory used by the process (in bytes)
+    """
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
 def open_ec(fn):
     """
     Read a csv file of format "wavelength(nm)\tcoefficient" into a standard
@@ -100,6 +140,12 @@ def open_ec(fn):
 def save_acq(fn, data, thumbs, pyramid=False):
     """
     Saves to a file the data and thumbnail
+    data (list of DataArray or DataArrayShadow): the data to save. If the
+      exporter supports it, the DataArrayShadows are read image per image while
+      writing, otherwise they are fully read first.
+    pyramid (bool or None): if True, export in pyramidal format. If None, the
+      pyramidal format is used only if the format supports it, and the data
+      is larger than AUTO_PYRAMID_SIZE.
     """
     exporter = dataio.find_fittest_converter(fn)
 
@@ -109,16 +155,26 @@ def save_acq(fn, data, thumbs, pyramid=False):
     else:
         thumb = None
 
+    can_pyramid = getattr(exporter, "CAN_SAVE_PYRAMID", False)
+    if pyramid is None:
+        pyramid = False
+        if can_pyramid and any(max(d.shape[-2:]) > AUTO_PYRAMID_SIZE for d in data):
+            logging.info("Large image, so exporting in pyramidal format")
+            pyramid = True
+
     # Add pyramid as argument only when it's True, because the exporters which
     # don't support pyramidal format, don't even allow pyramid=False
     kwargs = {}
     if pyramid:
-        if exporter.CAN_SAVE_PYRAMID:
+        if can_pyramid:
             kwargs["pyramid"] = True
         else:
             raise ValueError("Format %s doesn't support pyramidal export" %
                              (exporter.FORMAT,))
 
+    if not getattr(exporter, "CAN_SAVE_SHADOW", False):
+        data = load_data(data)
+
     exporter.export(fn, data, thumb, **kwargs)
 
 
@@ -196,11 +252,15 @@ def main(args):
             help="name of the output file. "
             "The file format is derived from the extension (%s are supported)." %
             (" and ".join(fmts)))
-    # TODO: automatically select pyramidal format if image > 4096px?
-    parser.add_argument("--pyramid", "-p", dest="pyramid", action='store_true',
+    parser.add_argument("--pyramid", "-p", dest="pyramid", action='store_const',
+                        const=True, default=None,
                         help="Export the data in pyramidal format. "
                         "It takes about 2x more space, but allows to visualise large images. "
-                        "Currently, only the TIFF format supports this option.")
+                        "Currently, only the TIFF format supports this option. "
+                        "By default, it is used for images larger than %d px." % (AUTO_PYRAMID_SIZE,))
+    parser.add_argument("--no-pyramid", dest="pyramid", action='store_const',
+                        const=False,
+                        help="Never export the data in pyramidal format.")
     parser.add_argument("--minus", "-m", dest="minus", action='append',
             help="name of an acquisition file whose data is subtracted from the input file.")
 
@@ -242,13 +302,20 @@ def main(args):
         if thumbs:
             logging.info("Dropping thumbnail due to subtraction")
             thumbs = []
+        data = load_data(data)
         for fn in options.minus:
             sdata, _ = open_acq(fn)
-            data = minus(data, sdata)
+            data = minus(data, load_data(sdata))
 
+    startt = time.time()
     save_acq(outfn, data, thumbs, options.pyramid)
+    dur = time.time() - startt
 
+    size = data_size(data)
     logging.info("Successfully generated file %s", outfn)
+    logging.info("Converted %g MB in %g s (%g MB/s), with a peak memory usage of %g MB",
+                 size / 1e6, dur, size / 1e6 / max(dur, 1e-6),
+                 get_peak_memory() / 1e6)
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2018
+
+@author: Éric Piel
+Testing class for convert.py of cli.
+
+Copyright © 2018 Éric Piel, Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+from __future__ import division
+
+import logging
+import numpy
+from odemis import model
+from odemis.cli import convert
+from odemis.dataio import tiff, hdf5
+import os
+import unittest
+
+
+logging.getLogger().setLevel(logging.DEBUG)
+
+FILENAME_IN = u"test-convert-in.ome.tiff"
+FILENAME_OUT = u"test-convert-out.ome.tiff"
+FILENAME_H5 = u"test-convert-out.h5"
+
+
+class TestConvert(unittest.TestCase):
+
+    def tearDown(self):
+        for fn in (FILENAME_IN, FILENAME_OUT, FILENAME_H5):
+            try:
+                os.remove(fn)
+            except OSError:
+                pass
+
+    def _create_input(self, shape, dtype=numpy.uint16):
+        md = {model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+              model.MD_POS: (1e-3, -3e-3),
+              model.MD_DESCRIPTION: "test data",
+              model.MD_DIMS: "CTZYX"[-len(shape):],
+              }
+        data = numpy.arange(numpy.prod(shape), dtype=numpy.uint32) % 4096
+        da = model.DataArray(data.astype(dtype).reshape(shape), md)
+        tiff.export(FILENAME_IN, [da])
+        return da
+
+    def test_lazy_open(self):
+        """
+        Check the data is not read when opening the file
+        """
+        # Note: 4 (or 3) images along C would be stored as RGB, so use T
+        self._create_input((1, 4, 1, 200, 300))
+        data, thumbs = convert.open_acq(FILENAME_IN)
+        self.assertEqual(len(data), 1)
+        self.assertIsInstance(data[0], model.DataArrayShadow)
+        self.assertEqual(data[0].shape, (1, 4, 1, 200, 300))
+        self.assertEqual(convert.data_size(data), 4 * 200 * 300 * 2)
+
+        # Reading only one image gives the same as reading everything
+        da = data[0].getData()
+        numpy.testing.assert_array_equal(data[0].getPlane((0, 1, 0)), da[0, 1, 0])
+
+    def test_tiff_to_tiff(self):
+        """
+        Convert a multi-plane TIFF, which is read plane per plane
+        """
+        orig = self._create_input((1, 4, 1, 200, 300))
+        convert.main(["convert", "--input", FILENAME_IN, "--output", FILENAME_OUT])
+
+        rdata = tiff.read_data(FILENAME_OUT)
+        self.assertEqual(len(rdata), 1)
+        numpy.testing.assert_array_equal(rdata[0], orig)
+        self.assertEqual(rdata[0].metadata[model.MD_POS], orig.metadata[model.MD_POS])
+
+        # Not pyramidal, as it's small
+        acd = tiff.open_data(FILENAME_OUT)
+        self.assertFalse(hasattr(acd.content[0], "maxzoom"))
+
+    def test_pyramid(self):
+        """
+        Convert to pyramidal TIFF, automatically for large images
+        """
+        orig = self._create_input((600, convert.AUTO_PYRAMID_SIZE + 100))
+        convert.main(["convert", "--input", FILENAME_IN, "--output", FILENAME_OUT])
+
+        acd = tiff.open_data(FILENAME_OUT)
+        self.assertEqual(acd.content[0].maxzoom, 2)
+        numpy.testing.assert_array_equal(acd.content[0].getData(), orig)
+
+        # Can be explicitly disabled
+        convert.main(["convert", "--input", FILENAME_IN, "--output", FILENAME_OUT,
+                      "--no-pyramid"])
+        acd = tiff.open_data(FILENAME_OUT)
+        self.assertFalse(hasattr(acd.content[0], "maxzoom"))
+
+    def test_tiff_to_hdf5(self):
+        """
+        Convert to a format which doesn't support DataArrayShadow
+        """
+        orig = self._create_input((2, 1, 1, 100, 120))
+        convert.main(["convert", "--input", FILENAME_IN, "--output", FILENAME_H5])
+
+        rdata = hdf5.read_data(FILENAME_H5)
+        self.assertEqual(len(rdata), 1)
+        numpy.testing.assert_array_equal(rdata[0], orig)
+
+    def test_hdf5_to_tiff(self):
+        """
+        Convert from HDF5, which is also opened without reading the data
+        """
+        orig = self._create_input((1, 4, 1, 200, 300))
+        hdf5.export(FILENAME_H5, [orig])
+
+        data, thumbs = convert.open_acq(FILENAME_H5)
+        self.assertIsInstance(data[0], model.DataArrayShadow)
+
+        convert.main(["convert", "--input", FILENAME_H5, "--output", FILENAME_OUT])
+        rdata = tiff.read_data(FILENAME_OUT)
+        self.assertEqual(len(rdata), 1)
+        numpy.testing.assert_array_equal(rdata[0], orig)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -26,6 +26,7 @@ import h5py
 import logging
 import numpy
 from odemis import model
+from odemis.model import DataArrayShadow, AcquisitionData
 from odemis.util import spectrum, img, fluo
 import os
 import time
@@ -114,11 +115,13 @@ def _create_image_dataset(group, dataset_name, image, **kwargs):
 
     return image_dataset
 
-def _read_image_dataset(dataset):
+def _read_image_dataset(dataset, lazy=False):
     """
     Get a numpy array from a dataset respecting the HDF5 image specification.
-    returns (numpy.ndimage): it has at least 2 dimensions and if RGB, it has
-     a 3 dimensions and the metadata MD_DIMS indicates the order.
+    lazy (bool): if True, the data is not read, and a DataArrayShadow is
+     returned instead.
+    returns (DataArray or DataArrayShadow): it has at least 2 dimensions and
+     if RGB, it has a 3 dimensions and the metadata MD_DIMS indicates the order.
     raises
      IOError: if it doesn't conform to the standard
      NotImplementedError: if the image uses so fancy standard features
@@ -133,7 +136,10 @@ def _read_image_dataset(dataset):
     # conversion is almost entirely different depending on subclass
     subclass = dataset.attrs.get("IMAGE_SUBCLASS", "IMAGE_GRAYSCALE")
 
-    image = model.DataArray(dataset[...])
+    if lazy:
+        image = DataArrayShadowHDF5(dataset)
+    else:
+        image = model.DataArray(dataset[...])
     if subclass == "IMAGE_GRAYSCALE":
         pass
     elif subclass == "IMAGE_TRUECOLOR":
@@ -487,9 +493,10 @@ def _parse_physical_data(pdgroup, da):
     """
     Parse the metadata found in PhysicalData, and cut the DataArray if necessary.
     pdgroup (HDF Group): the group "PhysicalData" associated to an image
-    da (DataArray): the DataArray that was obtained by reading the ImageData
-    returns (list of DataArrays): The same data, but broken into smaller 
-      DataArrays if necessary, and with additional metadata.
+    da (DataArray or DataArrayShadowHDF5): the DataArray that was obtained by
+      reading the ImageData
+    returns (list of DataArrays or DataArrayShadowHDF5s): The same data, but
+      broken into smaller DataArrays if necessary, and with additional metadata.
     """
     # The information in PhysicalData might be different for each channel (e.g.
     # fluorescence image). In this case, the DA must be separated into smaller
@@ -509,6 +516,9 @@ def _parse_physical_data(pdgroup, da):
             logging.warning("Image has %d channels and %d metadata, failed to map",
                             da.shape[0], n)
             das = [da]
+        elif isinstance(da, DataArrayShadowHDF5):
+            das = [DataArrayShadowHDF5(da.dataset, da.index + (c,), da.metadata.copy())
+                   for c in range(n)]
         else:
             # list(da) does almost what we need, but metadata is shared
             das = [model.DataArray(c, da.metadata.copy()) for c in da]
@@ -1212,11 +1222,12 @@ def _updateRGBMD(da):
 
     da.metadata[model.MD_DIMS] = dims
 
-def _thumbFromHDF5(filename):
+def _thumbFromHDF5(filename, lazy=False):
     """
     Read thumbnails from an HDF5 file.
     Expects to find them as IMAGE in Preview/Image.
-    return (list of model.DataArray)
+    lazy (bool): if True, the data is not read, only DataArrayShadows are returned
+    return (list of model.DataArray or DataArrayShadowHDF5)
     """
     f = h5py.File(filename, "r")
 
@@ -1233,7 +1244,7 @@ def _thumbFromHDF5(filename):
         # an image? (== has the attribute CLASS: IMAGE)
         if isinstance(ds, h5py.Dataset) and ds.attrs.get("CLASS") == "IMAGE":
             try:
-                da = _read_image_dataset(ds)
+                da = _read_image_dataset(ds, lazy)
             except Exception:
                 logging.info("Skipping image '%s' which couldn't be read.", name)
                 continue
@@ -1249,12 +1260,13 @@ def _thumbFromHDF5(filename):
 
     return thumbs
 
-def _dataFromSVIHDF5(f):
+def _dataFromSVIHDF5(f, lazy=False):
     """
     Read microscopy data from an HDF5 file using the SVI convention.
     Expects to find them as IMAGE in XXX/ImageData/Image + XXX/PhysicalData.
     f (h5py.File): the root of the file
-    return (list of model.DataArray)
+    lazy (bool): if True, the data is not read, only DataArrayShadows are returned
+    return (list of model.DataArray or DataArrayShadowHDF5)
     """
     data = []
 
@@ -1270,7 +1282,7 @@ def _dataFromSVIHDF5(f):
 
         # Read the raw data
         try:
-            da = _read_image_dataset(image)
+            da = _read_image_dataset(image, lazy)
         except Exception:
             logging.exception("Failed to read data of acquisition '%s'", obj.name)
 
@@ -1284,11 +1296,12 @@ def _dataFromSVIHDF5(f):
         data.extend(das)
     return data
 
-def _dataFromHDF5(filename):
+def _dataFromHDF5(filename, lazy=False):
     """
     Read microscopy data from an HDF5 file.
     filename (string): path of the file to read
-    return (list of model.DataArray)
+    lazy (bool): if True, the data is not read, only DataArrayShadows are returned
+    return (list of model.DataArray or DataArrayShadowHDF5)
     """
     f = h5py.File(filename, "r")
 
@@ -1297,7 +1310,7 @@ def _dataFromHDF5(filename):
     for obj in f.values():
         if (isinstance(obj, h5py.Group) and
             isinstance(obj.get("SVIData"), h5py.Group)):
-            return _dataFromSVIHDF5(f)
+            return _dataFromSVIHDF5(f, lazy)
 
     data = []
     # go rough: return any dataset with numbers (and more than one element)
@@ -1311,7 +1324,10 @@ def _dataFromHDF5(filename):
                 return
             # TODO: if it's an image, open it as an image
             # TODO: try to get some metadata?
-            da = model.DataArray(obj[...])
+            if lazy:
+                da = DataArrayShadowHDF5(obj)
+            else:
+                da = model.DataArray(obj[...])
         except Exception:
             logging.info("Skipping '%s' as it doesn't seem a correct data", name)
         data.append(da)
@@ -1430,3 +1446,63 @@ def read_thumbnail(filename):
 
     return _thumbFromHDF5(filename)
 
+
+def open_data(filename):
+    """
+    Opens an HDF5 file, and return an AcquisitionData instance
+    filename (string): path to the file
+    return (AcquisitionData): an opened file
+    """
+    return AcquisitionDataHDF5(filename)
+
+
+class DataArrayShadowHDF5(DataArrayShadow):
+    """
+    This class implements the read of an HDF5 dataset. The data is only read
+    from the file when requested.
+    """
+
+    def __init__(self, dataset, index=(), metadata=None):
+        """
+        Constructor
+        dataset (h5py.Dataset): the dataset containing the data
+        index (tuple of int): index in the first dimensions of the dataset of
+          the data represented. IOW, the data is dataset[index].
+        metadata (dict str->val): The metadata
+        """
+        self.dataset = dataset
+        self.index = index
+        DataArrayShadow.__init__(self, dataset.shape[len(index):], dataset.dtype, metadata)
+
+    def getData(self):
+        """
+        Fetches the whole data of the image.
+        return DataArray: the data, with its metadata
+        """
+        data = self.dataset[self.index + (Ellipsis,)]
+        return model.DataArray(data, metadata=self.metadata.copy())
+
+    def getPlane(self, index):
+        """
+        Fetches one image (typically 2D) of the data, only reading that image
+          from the file.
+        index (tuple of int): index in the dimensions higher than the image.
+          IOW, the data returned is equal to getData()[index].
+        return DataArray: the image, with its metadata
+        """
+        image = self.dataset[self.index + tuple(index) + (Ellipsis,)]
+        return model.DataArray(image, metadata=self.metadata.copy())
+
+
+class AcquisitionDataHDF5(AcquisitionData):
+    """
+    Implements AcquisitionData for HDF5 files
+    """
+    def __init__(self, filename):
+        """
+        Constructor
+        filename (string): The name of the HDF5 file
+        """
+        content = _dataFromHDF5(filename, lazy=True)
+        thumbnails = _thumbFromHDF5(filename, lazy=True)
+        AcquisitionData.__init__(self, tuple(content), tuple(thumbnails))
@@ -18,10 +18,13 @@ You should have received a copy of the GNU General Public License along with Ode
 from __future__ import division
 
 import logging
+import numpy
 from odemis import model
 from odemis.util import img
 import os
 import scipy
+import struct
+import zlib
 
 
 FORMAT = "PNG"
@@ -59,6 +62,76 @@ def _saveAsPNG(filename, data):
     # save to file
     scipy.misc.imsave(filename, rgb8)
 
+class PNGRowWriter(object):
+    """
+    Writes a 8-bit RGB(A) PNG file progressively, a few rows at a time. This
+    allows to save very large images without holding them completely in memory.
+    """
+
+    def __init__(self, filename, width, height, alpha=True):
+        """
+        filename (unicode): filename of the file to create (including path)
+        width (int): number of pixels of each row
+        height (int): total number of rows which will be written
+        alpha (bool): if True, the image is RGBA, otherwise RGB
+        """
+        self.width = width
+        self.height = height
+        self._channels = 4 if alpha else 3
+        self._nrows = 0  # number of rows already written
+        self._compressor = zlib.compressobj(6)
+        self._f = open(filename, "wb")
+
+        self._f.write(b"\x89PNG\r\n\x1a\n")
+        # bit depth = 8, colour type = RGBA (6) or RGB (2), standard compression
+        # & filtering, no interlace
+        ctype = 6 if alpha else 2
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, ctype, 0, 0, 0))
+
+    def _write_chunk(self, ctype, data):
+        self._f.write(struct.pack(">I", len(data)))
+        self._f.write(ctype)
+        self._f.write(data)
+        self._f.write(struct.pack(">I", zlib.crc32(ctype + data) & 0xffffffff))
+
+    def write_rows(self, rows):
+        """
+        Append rows to the image
+        rows (numpy.array of shape YXC and dtype uint8): the next rows of the image
+        raise ValueError: if the shape of the rows doesn't fit the image
+        """
+        if rows.shape[1:] != (self.width, self._channels):
+            raise ValueError("Rows of shape %s while expected N x %d x %d" %
+                             (rows.shape, self.width, self._channels))
+        if self._nrows + rows.shape[0] > self.height:
+            raise ValueError("Trying to write %d rows, while only %d left" %
+                             (rows.shape[0], self.height - self._nrows))
+
+        # Each row starts with the filter type (0 = no filter)
+        fdata = numpy.zeros((rows.shape[0], 1 + self.width * self._channels), dtype=numpy.uint8)
+        fdata[:, 1:] = rows.reshape(rows.shape[0], -1)
+        cdata = self._compressor.compress(fdata.tostring())
+        if cdata:
+            self._write_chunk(b"IDAT", cdata)
+        self._nrows += rows.shape[0]
+
+    def close(self):
+        """
+        Finish writing the file. It's fine to call it multiple times.
+        """
+        if self._f is None:
+            return
+        try:
+            if self._nrows != self.height:
+                logging.warning("Closing PNG file after only %d rows out of %d",
+                                self._nrows, self.height)
+            self._write_chunk(b"IDAT", self._compressor.flush())
+            self._write_chunk(b"IEND", b"")
+        finally:
+            self._f.close()
+            self._f = None
+
+
 def export(filename, data, thumbnail=None):
     '''
     Write a PNG file with the given image
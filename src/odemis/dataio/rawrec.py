@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 13 Oct 2026
+
+@author: Éric Piel
+
+Copyright © 2026 Éric Piel, Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+from __future__ import division
+
+import json
+import logging
+import numpy
+from odemis import model
+import os
+import threading
+import time
+
+
+# User-friendly name
+FORMAT = "Raw recording"
+# list of file-name extensions possible, the first one is the default when saving a file
+EXTENSIONS = [u".rawrec"]
+
+# A raw recording is made of 3 files:
+#  * NAME.rawrec: all the frames, one after another, in C order, without any
+#    header. It is memory-mapped and preallocated when the recording starts.
+#  * NAME.rawrec.md: one record per frame (see FRAME_MD_DTYPE), also
+#    memory-mapped and preallocated.
+#  * NAME.rawrec.json: the header, written when the recording is closed. It
+#    contains the shape and dtype of the frames, the number of frames
+#    recorded, and the metadata of the first frame.
+# This format is only meant for recording as fast as possible. The data can be
+# converted afterwards to a more standard format (eg, with odemis-convert).
+# There is no export() function, the recording must be done with RawRecorder.
+
+# Metadata stored for each frame
+FRAME_MD_DTYPE = numpy.dtype([("acq_date", numpy.float64),  # MD_ACQ_DATE
+                              ("exp_time", numpy.float64),  # MD_EXP_TIME
+                              ("rec_date", numpy.float64),  # time it was recorded
+                              ])
+
+MD_SUFFIX = ".md"
+HEADER_SUFFIX = ".json"
+
+
+class RawRecorder(object):
+    """
+    Records frames received from a DataFlow into a preallocated memory-mapped
+    file. Pass .onData as listener to the DataFlow.
+    Once the recording is over, call .close() to write the header.
+    """
+
+    def __init__(self, filename, shape, dtype, nframes):
+        """
+        filename (unicode): name of the file to create (with the .rawrec extension)
+        shape (tuple of ints): shape of each frame
+        dtype (numpy.dtype): data type of each frame
+        nframes (0<int): maximum number of frames to record
+        """
+        self.filename = filename
+        self._shape = tuple(shape)
+        self._dtype = numpy.dtype(dtype)
+        self._nframes = nframes
+        self._fsize = self._dtype.itemsize * int(numpy.prod(self._shape))  # bytes per frame
+
+        # Preallocate the files, the OS will take care of writing them to disk
+        self._frames = numpy.memmap(filename, dtype=self._dtype, mode="w+",
+                                    shape=(nframes,) + self._shape)
+        self._fmd = numpy.memmap(filename + MD_SUFFIX, dtype=FRAME_MD_DTYPE,
+                                 mode="w+", shape=(nframes,))
+
+        self._lock = threading.Lock()
+        self._md = None  # metadata of the first frame
+        self._startt = None  # time the first frame was received
+        self._lastt = None  # time the last frame was recorded
+        self._stats = None  # statistics, once closed
+
+        self.recorded = 0  # number of frames recorded
+        self.dropped = 0  # number of frames received but not recorded
+        self.full = threading.Event()  # set when all the frames are recorded
+
+    def onData(self, df, data):
+        """
+        DataFlow listener: copy the data into the next slot of the file
+        """
+        now = time.time()
+        with self._lock:
+            if self.recorded >= self._nframes:
+                self.dropped += 1
+                return
+            if data.shape != self._shape:
+                logging.warning("Dropping frame of shape %s, while expected %s",
+                                data.shape, self._shape)
+                self.dropped += 1
+                return
+
+            n = self.recorded
+            if n == 0:
+                self._startt = now
+                self._md = data.metadata.copy()
+            self._frames[n] = data  # copy (and convert if needed)
+            md = data.metadata
+            self._fmd[n] = (md.get(model.MD_ACQ_DATE, now),
+                            md.get(model.MD_EXP_TIME, 0),
+                            now)
+            self.recorded = n + 1
+            self._lastt = time.time()
+            if self.recorded >= self._nframes:
+                self.full.set()
+
+    def getStatistics(self):
+        """
+        return (dict str -> value): information about the recording:
+          "frames": number of frames recorded
+          "dropped": number of frames received but not recorded
+          "missed": estimated number of frames not received, based on gaps
+             in the acquisition dates
+          "duration": time between the first and last frame recorded (s)
+          "fps": average number of frames per second
+          "throughput": average data throughput (B/s)
+        """
+        with self._lock:
+            if self._stats is not None:  # Already closed
+                return self._stats
+            n = self.recorded
+            if n == 0:
+                dur = 0
+            else:
+                dur = self._lastt - self._startt
+            fps = (n - 1) / dur if dur > 0 else 0
+            missed = _estimateMissedFrames(self._fmd["acq_date"][:n])
+            return {"frames": n,
+                    "dropped": self.dropped,
+                    "missed": missed,
+                    "duration": dur,
+                    "fps": fps,
+                    "throughput": fps * self._fsize,
+                    }
+
+    def close(self):
+        """
+        Flush the data to disk, write the header, and truncate the files to the
+        number of frames actually recorded.
+        return (dict str -> value): the statistics, as getStatistics()
+        """
+        with self._lock:
+            if self._stats is not None:  # Already closed
+                return self._stats
+            n = self.recorded
+            self._frames.flush()
+            self._fmd.flush()
+            # Stop recording (any new frame will be dropped)
+            self._nframes = n
+
+        stats = self.getStatistics()
+        with self._lock:
+            self._stats = stats
+            # Release the memory maps before truncating
+            self._frames = None
+            self._fmd = None
+        with open(self.filename, "r+b") as f:
+            f.truncate(n * self._fsize)
+        with open(self.filename + MD_SUFFIX, "r+b") as f:
+            f.truncate(n * FRAME_MD_DTYPE.itemsize)
+
+        header = {"version": 1,
+                  "shape": self._shape,
+                  "dtype": self._dtype.str,
+                  "frames": n,
+                  "metadata": _md_to_json(self._md or {}),
+                  "statistics": stats,
+                  }
+        with open(self.filename + HEADER_SUFFIX, "w") as f:
+            json.dump(header, f, indent=1)
+
+        logging.info("Recorded %d frames in %g s (%g fps, %g MB/s), %d dropped, ~%d missed",
+                     n, stats["duration"], stats["fps"], stats["throughput"] / 1e6,
+                     stats["dropped"], stats["missed"])
+        return stats
+
+
+def _estimateMissedFrames(dates):
+    """
+    Estimate the number of frames missing in a sequence, based on the gaps in
+    the acquisition dates.
+    dates (ndarray of floats): acquisition date of each frame
+    return (int): number of frames probably missing
+    """
+    if len(dates) < 3:
+        return 0
+    periods = numpy.diff(dates)
+    period = numpy.median(periods)
+    if period <= 0:
+        return 0
+    # Any gap > 1.5 period is considered as missing frames
+    gaps = periods[periods > period * 1.5]
+    return int(numpy.sum(numpy.round(gaps / period) - 1))
+
+
+def _md_to_json(md):
+    """
+    Convert the metadata into something JSON can store. Values which cannot
+    be converted are dropped.
+    md (dict str -> value)
+    return (dict str -> value)
+    """
+    jmd = {}
+    for k, v in md.items():
+        if isinstance(v, numpy.ndarray):
+            v = v.tolist()
+        try:
+            json.dumps(v)
+        except (TypeError, ValueError):
+            logging.debug("Not storing metadata %s, of type %s", k, type(v))
+            continue
+        jmd[k] = v
+    return jmd
+
+
+def _json_to_md(jmd):
+    """
+    Convert back the metadata from JSON. Lists are converted to tuples, as
+    most of the metadata is stored as tuples.
+    """
+    md = {}
+    for k, v in jmd.items():
+        if isinstance(v, list):
+            v = tuple(v)
+        md[k] = v
+    return md
+
+
+def read_data(filename):
+    """
+    Read a raw recording. The data is memory-mapped, so it is only read from
+    the disk when accessed.
+    filename (unicode): filename of the file to read
+    return (list of one model.DataArray): the frames, in one DataArray of
+      shape 1, N, 1, Y, X (ie, with the time on the T dimension).
+    raises:
+        IOError in case the file format is not as expected.
+    """
+    try:
+        with open(filename + HEADER_SUFFIX, "r") as f:
+            header = json.load(f)
+    except (IOError, ValueError) as ex:
+        raise IOError("Failed to read header of raw recording %s: %s" % (filename, ex))
+
+    n = header["frames"]
+    shape = tuple(header["shape"])
+    dtype = numpy.dtype(str(header["dtype"]))
+    if n == 0:
+        return []
+    fsize = dtype.itemsize * int(numpy.prod(shape))
+    if os.path.getsize(filename) < n * fsize:
+        raise IOError("Raw recording %s is too small for %d frames" % (filename, n))
+
+    frames = numpy.memmap(filename, dtype=dtype, mode="r", shape=(n,) + shape)
+    fmd = numpy.fromfile(filename + MD_SUFFIX, dtype=FRAME_MD_DTYPE, count=n)
+
+    md = _json_to_md(header["metadata"])
+    md[model.MD_ACQ_DATE] = float(fmd["acq_date"][0])
+    md[model.MD_AD_LIST] = tuple(float(d) for d in fmd["acq_date"])
+    # Add the C, T, Z dimensions
+    if len(shape) == 2:
+        frames = frames.reshape((1, n, 1) + shape)
+    return [model.DataArray(frames, md)]
+
+
+def read_thumbnail(filename):
+    """
+    No thumbnail in raw recording
+    return (list of model.DataArray): always empty
+    """
+    return []
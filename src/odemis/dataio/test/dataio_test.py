@@ -18,7 +18,7 @@ from __future__ import division
 
 from odemis import dataio
 from odemis.dataio import get_available_formats, get_converter, \
-    find_fittest_converter
+    find_fittest_converter, rawrec
 import os
 import unittest
 from unittest.case import skip
@@ -40,6 +40,12 @@ class TestDataIO(unittest.TestCase):
         all_fmts = get_available_formats(os.O_RDWR, allowlossy=True)
         self.assertEqual(len(dataio.__all__), len(all_fmts))
 
+        # read-only formats are not proposed for writing
+        fmts = get_available_formats(os.O_WRONLY, allowlossy=True)
+        self.assertNotIn(rawrec.FORMAT, fmts)
+        for fmt in fmts:
+            self.assertTrue(hasattr(get_converter(fmt), "export"))
+
     def test_get_converter(self):
         fmts = get_available_formats()
         for fmt in fmts:
@@ -401,6 +401,47 @@ class TestHDF5IO(unittest.TestCase):
         self.assertEqual(im[blue[::-1]].tolist(), [0, 0, 255])
         self.assertAlmostEqual(im.metadata[model.MD_POS], thumbnail.metadata[model.MD_POS])
 
+    def testOpenData(self):
+        """
+        Checks that we can open a file without reading the data, and read it
+        afterwards, fully or image per image.
+        """
+        # 2 fluorescence images stored as one array, and a time-series
+        size = (512, 256)
+        dtype = numpy.dtype("uint16")
+        ldata = []
+        for i, wl in enumerate(((500e-9, 520e-9), (600e-9, 620e-9))):
+            md = {model.MD_DESCRIPTION: "dye %d" % i,
+                  model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+                  model.MD_POS: (13.7e-3, -30e-3),
+                  model.MD_IN_WL: wl,
+                  model.MD_OUT_WL: (650e-9, 660e-9),
+                  }
+            a = model.DataArray(numpy.zeros(size[::-1], dtype), md)
+            a[i, i] = i + 1 # "watermark" it
+            ldata.append(a)
+
+        tdata = numpy.arange(4 * 20 * 30, dtype=dtype).reshape(1, 4, 1, 20, 30)
+        ldata.append(model.DataArray(tdata, {model.MD_DESCRIPTION: "time"}))
+
+        hdf5.export(FILENAME, ldata)
+
+        rdata = hdf5.read_data(FILENAME)
+        acd = hdf5.open_data(FILENAME)
+        self.assertEqual(len(acd.content), len(rdata))
+
+        for das, im in zip(acd.content, rdata):
+            self.assertIsInstance(das, model.DataArrayShadow)
+            self.assertEqual(das.shape, im.shape)
+            self.assertEqual(das.dtype, im.dtype)
+            self.assertEqual(das.metadata[model.MD_DESCRIPTION],
+                             im.metadata[model.MD_DESCRIPTION])
+            self.assertEqual(das.metadata.get(model.MD_IN_WL),
+                             im.metadata.get(model.MD_IN_WL))
+            numpy.testing.assert_array_equal(das.getData(), im)
+            for i in numpy.ndindex(*das.shape[:-2]):
+                numpy.testing.assert_array_equal(das.getPlane(i), im[i])
+
     def testReadMDSpec(self):
         """
         Checks that we can read back the metadata of an image
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Created on 13 Oct 2026
+
+@author: Éric Piel
+
+Copyright © 2026 Éric Piel, Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+from __future__ import division
+
+import logging
+import numpy
+from odemis import model, dataio
+from odemis.dataio import rawrec, tiff
+import os
+import time
+import unittest
+
+
+logging.getLogger().setLevel(logging.DEBUG)
+
+FILENAME = u"test" + rawrec.EXTENSIONS[0]
+
+
+class TestRawRecorder(unittest.TestCase):
+
+    def tearDown(self):
+        # clean up
+        for fn in (FILENAME, FILENAME + rawrec.MD_SUFFIX,
+                   FILENAME + rawrec.HEADER_SUFFIX, u"test.ome.tiff"):
+            try:
+                os.remove(fn)
+            except Exception:
+                pass
+
+    def _gen_frames(self, n, shape, dtype, period=0.001):
+        das = []
+        t0 = time.time()
+        for i in range(n):
+            md = {model.MD_ACQ_DATE: t0 + i * period,
+                  model.MD_EXP_TIME: period,
+                  model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+                  model.MD_DESCRIPTION: u"fast cam"}
+            das.append(model.DataArray(numpy.full(shape, i, dtype=dtype), md))
+        return das
+
+    def test_record_read(self):
+        shape = (64, 128)
+        n = 50
+        rec = rawrec.RawRecorder(FILENAME, shape, numpy.uint16, n + 10)
+        for da in self._gen_frames(n, shape, numpy.uint16):
+            rec.onData(None, da)
+        self.assertEqual(rec.recorded, n)
+        self.assertFalse(rec.full.is_set())
+        stats = rec.close()
+
+        self.assertEqual(stats["frames"], n)
+        self.assertEqual(stats["dropped"], 0)
+        self.assertEqual(stats["missed"], 0)
+        # File was truncated to the actual number of frames
+        self.assertEqual(os.path.getsize(FILENAME), n * numpy.prod(shape) * 2)
+
+        data = rawrec.read_data(FILENAME)
+        self.assertEqual(len(data), 1)
+        da = data[0]
+        self.assertEqual(da.shape, (1, n, 1) + shape)
+        self.assertEqual(da.dtype, numpy.uint16)
+        self.assertEqual(da[0, 7, 0, 3, 3], 7)
+        md = da.metadata
+        self.assertEqual(md[model.MD_PIXEL_SIZE], (1e-6, 1e-6))
+        self.assertEqual(md[model.MD_DESCRIPTION], u"fast cam")
+        self.assertEqual(len(md[model.MD_AD_LIST]), n)
+
+        # Check it can be found via the generic functions, but not for writing
+        conv = dataio.find_fittest_converter(FILENAME, mode=os.O_RDONLY)
+        self.assertEqual(conv.FORMAT, rawrec.FORMAT)
+        conv = dataio.find_fittest_converter(FILENAME, mode=os.O_WRONLY)
+        self.assertNotEqual(conv.FORMAT, rawrec.FORMAT)
+
+        # Convert to OME-TIFF
+        tiff.export(u"test.ome.tiff", data)
+        tdata = tiff.read_data(u"test.ome.tiff")
+        self.assertEqual(tdata[0].shape, da.shape)
+
+    def test_overflow(self):
+        shape = (16, 16)
+        rec = rawrec.RawRecorder(FILENAME, shape, numpy.uint8, 10)
+        for da in self._gen_frames(15, shape, numpy.uint8):
+            rec.onData(None, da)
+        # Bad shape
+        rec.onData(None, model.DataArray(numpy.zeros((8, 8), dtype=numpy.uint8)))
+        self.assertTrue(rec.full.is_set())
+        stats = rec.close()
+        self.assertEqual(stats["frames"], 10)
+        self.assertEqual(stats["dropped"], 6)
+
+    def test_missed(self):
+        shape = (16, 16)
+        das = self._gen_frames(20, shape, numpy.uint8)
+        del das[5:8]  # 3 frames "lost"
+        rec = rawrec.RawRecorder(FILENAME, shape, numpy.uint8, 20)
+        for da in das:
+            rec.onData(None, da)
+        stats = rec.close()
+        self.assertEqual(stats["frames"], 17)
+        self.assertEqual(stats["missed"], 3)
+
+    def test_speed(self):
+        """
+        Report the sustained recording rate (of 2048x2048 16-bit frames)
+        """
+        shape = (2048, 2048)
+        n = 50
+        da = model.DataArray(numpy.ones(shape, dtype=numpy.uint16),
+                             {model.MD_ACQ_DATE: time.time()})
+        rec = rawrec.RawRecorder(FILENAME, shape, numpy.uint16, n)
+        startt = time.time()
+        for i in range(n):
+            rec.onData(None, da)
+        dur = time.time() - startt
+        stats = rec.close()
+        logging.info("Recorded %d frames in %g s = %g fps = %g MB/s",
+                     n, dur, n / dur, n * da.nbytes / dur / 1e6)
+        self.assertEqual(stats["frames"], n)
+
+
+if __name__ == "__main__":
+    unittest.main()
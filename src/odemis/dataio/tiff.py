@@ -64,6 +64,7 @@ EXTENSIONS = [u".ome.tiff", u".ome.tif", u".tiff", u".tif"]
 STIFF_SPLIT = ".0."  # pattern to replace with the "stiff" multiple file
 
 CAN_SAVE_PYRAMID = True # indicates the support for pyramidal export
+CAN_SAVE_SHADOW = True # indicates export() also accepts DataArrayShadows (read image per image)
 TILE_SIZE = 256 # Tile size of pyramidal images
 
 # We try to make it as much as possible looking like a normal (multi-page) TIFF,
@@ -1390,15 +1391,53 @@ def _createPointROI(rois, name, p, shp_attrib=None):
     rois[rid] = roie
     return rid
 
+class _DataArrayShadowMD(DataArrayShadow):
+    """
+    A DataArrayShadow which reads the data from another DataArrayShadow, but
+    has its own metadata. The data is only read when requested.
+    """
+
+    def __init__(self, das, metadata):
+        """
+        das (DataArrayShadow): the shadow to read the data from
+        metadata (dict str->val): the metadata to use instead of the one of das
+        """
+        DataArrayShadow.__init__(self, das.shape, numpy.dtype(das.dtype), metadata)
+        self._das = das
+
+    def getData(self):
+        """
+        Fetches the whole data (at full resolution) of image.
+        return DataArray: the data, with its metadata
+        """
+        return model.DataArray(self._das.getData(), self.metadata.copy())
+
+    def getPlane(self, index):
+        """
+        Fetches one image (typically 2D) of the data.
+        index (tuple of int): index in the dimensions higher than the image.
+        return DataArray: the image, with its metadata
+        """
+        if hasattr(self._das, "getPlane"):
+            im = self._das.getPlane(index)
+        else:
+            im = self._das.getData()[index]
+        return model.DataArray(im, self.metadata.copy())
+
+
 def _mergeCorrectionMetadata(da):
     """
     Create a new DataArray with metadata updated to with the correction metadata
     merged.
-    da (DataArray): the original data
-    return (DataArray): new DataArray (view) with the updated metadata
+    da (DataArray or DataArrayShadow): the original data
+    return (DataArray or DataArrayShadow): new DataArray (view) with the
+      updated metadata. If da is a DataArrayShadow, a new DataArrayShadow
+      reading its data from da.
     """
     md = da.metadata.copy() # to avoid modifying the original one
     img.mergeMetadata(md)
+    if isinstance(da, DataArrayShadow):
+        return _DataArrayShadowMD(da, md) # No data is read
     return model.DataArray(da, md) # create a view
 
 def _saveAsMultiTiffLT(filename, ldata, thumbnail, compressed=True, multiple_files=False,
@@ -1406,7 +1445,9 @@ def _saveAsMultiTiffLT(filename, ldata, thumbnail, compressed=True, multiple_fil
     """
     Saves a list of DataArray as a multiple-page TIFF file.
     filename (string): name of the file to save
-    ldata (list of DataArray): list of 2D data of int or float. Should have at least one array
+    ldata (list of DataArray or DataArrayShadow): list of 2D data of int or float.
+      Should have at least one array. The DataArrayShadows are read one image
+      at a time, so that the whole data never has to be held in memory.
     thumbnail (None or DataArray): see export
     compressed (boolean): whether the file is LZW compressed or not.
     multiple_files (boolean): whether the data is distributed across multiple
@@ -1545,11 +1586,18 @@ def _saveAsMultiTiffLT(filename, ldata, thumbnail, compressed=True, multiple_fil
             # Write an RGB image, instead of 3 images along C
             write_rgb = True
             hdim = data.shape[1:3]
+            if isinstance(data, DataArrayShadow):
+                data = data.getData() # The C axis is spread over several images
             data = numpy.rollaxis(data, 0, -2) # move C axis near YX
         else:
             write_rgb = False
             hdim = data.shape[:-2]
 
+        if data.dtype in [numpy.int64, numpy.uint64]:
+            c = None # libtiff doesn't support compression on these types
+        else:
+            c = compression
+
         for i in numpy.ndindex(*hdim):
             # Save metadata (before the image)
             for key, val in tags.items():
@@ -1557,11 +1605,12 @@ def _saveAsMultiTiffLT(filename, ldata, thumbnail, compressed=True, multiple_fil
                     f.SetField(key, val)
                 except Exception:
                     logging.exception("Failed to store tag %s with value '%s'", key, val)
-            if data[i].dtype in [numpy.int64, numpy.uint64]:
-                c = None # libtiff doesn't support compression on these types
+            if isinstance(data, DataArrayShadow):
+                im = data.getPlane(i)
             else:
-                c = compression
-            write_image(f, data[i], write_rgb=write_rgb, compression=c, pyramid=pyramid)
+                im = data[i]
+            write_image(f, im, write_rgb=write_rgb, compression=c, pyramid=pyramid)
+            del im # Allows to free the memory before reading the next image
 
 
 def _thumbsFromTIFF(filename):
@@ -1645,9 +1694,11 @@ def write_image(f, arr, compression=None, write_rgb=False, pyramid=False):
     # write the original image
     f.write_tiles(arr, TILE_SIZE, TILE_SIZE, compression, write_rgb)
     # generate the rescaled images and write the tiled image
+    subim = arr
     for resized_shape in resized_shapes:
-        # rescale the image
-        subim = img.rescale_hq(arr, resized_shape)
+        # rescale the image from the previous zoom level, which is much faster
+        # than from the original image (and gives almost the same result)
+        subim = img.rescale_hq(subim, resized_shape)
 
         # Before writting the actual data, we set the special metadata
         f.SetField(T.TIFFTAG_SUBFILETYPE, T.FILETYPE_REDUCEDIMAGE)
@@ -1797,6 +1848,23 @@ class DataArrayShadowTIFF(DataArrayShadow):
             image = self._readImage(self.tiff_info)
             return model.DataArray(image, metadata=self.metadata.copy())
 
+    def getPlane(self, index):
+        """
+        Fetches one image (typically 2D) of the data, only reading that image
+          from the file, when possible.
+        index (tuple of int): index in the dimensions higher than the image.
+          IOW, the data returned is equal to getData()[index].
+        return DataArray: the image, with its metadata
+        """
+        if type(self.tiff_info) is list:
+            for tiff_info_item in self.tiff_info:
+                if tiff_info_item['hdim_index'] == index:
+                    image = self._readImage(tiff_info_item)
+                    return model.DataArray(image, metadata=self.metadata.copy())
+
+        # The data is stored in a single page (or in an unexpected way)
+        return self.getData()[index]
+
     def _readImage(self, tiff_info):
         """
         Reads the image of a given directory
@@ -31,8 +31,10 @@ import numbers
 import numpy
 from odemis import model, util
 from odemis.model import (CancellableThreadPoolExecutor, CancellableFuture,
-                          isasync, MD_PIXEL_SIZE_COR, MD_ROTATION_COR, MD_POS_COR)
+                          ParallelThreadPoolExecutor, isasync,
+                          MD_PIXEL_SIZE_COR, MD_ROTATION_COR, MD_POS_COR)
 import threading
+import time
 
 
 class MultiplexActuator(model.Actuator):
@@ -89,12 +91,26 @@ class MultiplexActuator(model.Actuator):
                                 children=children, **kwargs)
 
         if len(self.children.value) > 1:
-            # will take care of executing axis move asynchronously
-            self._executor = CancellableThreadPoolExecutor(max_workers=1)  # one task at a time
+            # will take care of executing axis move asynchronously. Moves on
+            # different children are run in parallel, while the moves sharing
+            # a child are run in order.
+            self._executor = ParallelThreadPoolExecutor()
             # TODO: make use of the 'Cancellable' part (for now cancelling a running future doesn't work)
         else:  # Only one child => optimize by passing all requests directly
             self._executor = None
 
+        # To merge consecutive "update" moves, while they are still queued
+        self._sched_lock = threading.Lock()
+        # (future, function, dict str -> float) or None: last update move queued
+        self._last_update = None
+        self._pending = set()  # futures of the moves queued but not yet started
+        self._sched_stats = {"moves": 0,  # number of moves scheduled
+                             "coalesced": 0,  # number of moves merged into a queued move
+                             "max_queued": 0,  # maximum number of moves waiting
+                             "wait_total": 0,  # s, sum of the time spent waiting in queue
+                             "wait_max": 0,  # s, longest time spent waiting in queue
+                             }
+
         # keep a reference to the subscribers so that they are not
         # automatically garbage collected
         self._subfun = []
@@ -108,7 +124,8 @@ class MultiplexActuator(model.Actuator):
                 children_axes[child] = {axis}
 
         # position & speed: special VAs combining multiple VAs
-        self.position = model.VigilantAttribute(self._position, readonly=True)
+        self.position = model.VigilantAttribute(self._applyInversion(self._position),
+                                                readonly=True)
         for c, ax in children_axes.items():
             def update_position_per_child(value, ax=ax, c=c):
                 logging.debug("updating position of child %s", c.name)
@@ -122,7 +139,7 @@ class MultiplexActuator(model.Actuator):
             self._subfun.append(update_position_per_child)
 
         # TODO: change the speed range to a dict of speed ranges
-        self.speed = model.MultiSpeedVA(self._speed, [0., 10.], setter=self._setSpeed)
+        self.speed = model.MultiSpeedVA(self._speed.copy(), [0., 10.], setter=self._setSpeed)
         for axis in self._speed.keys():
             c, ca = self._axis_to_child[axis]
             def update_speed_per_child(value, a=axis, ca=ca, cname=c.name):
@@ -189,8 +206,10 @@ class MultiplexActuator(model.Actuator):
         update the speed VA
         """
         # we must not call the setter, so write directly the raw value
-        self.speed._value = self._speed
-        self.speed.notify(self._speed)
+        # .speed is copied, so that the value is not modified on next update
+        speed = self._speed.copy()
+        self.speed._value = speed
+        self.speed.notify(speed)
 
     def _updateReferenced(self):
         """
@@ -240,8 +259,9 @@ class MultiplexActuator(model.Actuator):
         """
         Move the stage the defined values in m for each axis given.
         shift dict(string-> float): name of the axis and shift in m
-        **kwargs: Mostly there to support "update" argument (but currently works
-          only if there is only one child)
+        **kwargs: Mostly there to support "update" argument. If update is True,
+          and the previous move requested was also an update move on the same
+          axes, which has not started yet, both moves are merged.
         """
         if not shift:
             return model.InstantaneousFuture()
@@ -249,7 +269,7 @@ class MultiplexActuator(model.Actuator):
         shift = self._applyInversion(shift)
 
         if self._executor:
-            f = self._executor.submit(self._doMoveRel, shift, **kwargs)
+            f = self._scheduleMove(self._doMoveRel, shift, kwargs)
         else:
             cmv = self._moveToChildMove(shift)
             child, move = cmv.popitem()
@@ -258,14 +278,102 @@ class MultiplexActuator(model.Actuator):
 
         return f
 
+    def _scheduleMove(self, fn, mv, kwargs):
+        """
+        Queue a move. The moves are executed in parallel, excepted if they
+        share a child actuator, in which case they are executed in order.
+        fn (callable): _doMoveRel or _doMoveAbs
+        mv (dict str -> float): the move (in internal coordinates)
+        kwargs (dict): extra arguments for the children
+        return (Future): the future corresponding to the move
+        """
+        update = kwargs.get("update", False)
+        with self._sched_lock:
+            if update and self._last_update:
+                lf, lfn, lmv = self._last_update
+                if (lfn == fn and set(lmv.keys()) == set(mv.keys()) and
+                    lf in self._pending):
+                    # Not yet started => merge the new move into it
+                    if fn == self._doMoveRel:
+                        for a, v in mv.items():
+                            lmv[a] += v
+                    else:
+                        lmv.update(mv)
+                    self._sched_stats["coalesced"] += 1
+                    logging.debug("Merged update move %s into queued move, now %s", mv, lmv)
+                    return lf
+
+            mv = dict(mv)  # copy, as it might be modified by a later update
+            deps = set(c.name for c in self._axesToChildAxes(mv.keys()))
+            f = futures.Future()
+            self._pending.add(f)
+            self._sched_stats["moves"] += 1
+            self._sched_stats["max_queued"] = max(self._sched_stats["max_queued"],
+                                                  len(self._pending))
+            if update:
+                self._last_update = (f, fn, mv)
+            else:
+                self._last_update = None
+
+        f.add_done_callback(self._onMoveDone)
+        return self._executor.submitf(deps, f, self._runMove, f, fn, mv,
+                                      time.time(), kwargs)
+
+    def _runMove(self, f, fn, mv, submitt, kwargs):
+        """
+        Called in the executor thread, when the move can be started
+        """
+        with self._sched_lock:
+            # From now on, the move cannot be modified anymore
+            self._pending.discard(f)
+            if self._last_update and self._last_update[0] is f:
+                self._last_update = None
+            mv = dict(mv)
+            wait = time.time() - submitt
+            self._sched_stats["wait_total"] += wait
+            self._sched_stats["wait_max"] = max(self._sched_stats["wait_max"], wait)
+
+        return fn(mv, **kwargs)
+
+    def _onMoveDone(self, f):
+        # In case it was cancelled before being started
+        with self._sched_lock:
+            self._pending.discard(f)
+            if self._last_update and self._last_update[0] is f:
+                self._last_update = None
+
+    def getSchedulingStatistics(self):
+        """
+        return (dict str -> number): information on the moves scheduling:
+          "queued": number of moves currently waiting to start
+          "max_queued": maximum number of moves which were waiting at the same time
+          "moves": number of moves scheduled
+          "coalesced": number of update moves merged into a previous move
+          "wait_mean": average time a move waited before starting (s)
+          "wait_max": longest time a move waited before starting (s)
+        """
+        with self._sched_lock:
+            stats = self._sched_stats.copy()
+            stats["queued"] = len(self._pending)
+        started = stats["moves"] - stats["queued"]
+        stats["wait_mean"] = stats.pop("wait_total") / started if started else 0
+        return stats
+
+    def _childKwargs(self, child, axes, kwargs):
+        """
+        Remove the "update" argument if the child doesn't support it. As the
+        update moves are merged anyway, it's fine to do a normal move.
+        return (dict): the arguments to pass to the child
+        """
+        if kwargs.get("update") and not all(child.axes[a].canUpdate for a in axes):
+            kwargs = kwargs.copy()
+            del kwargs["update"]
+        return kwargs
+
     def _doMoveRel(self, shift, **kwargs):
-        # TODO: updates don't work because we still wait for the end of the
-        # move before we get to the next one => multi-threaded queue? Still need
-        # to ensure the order (ie, X>AB>X can be executed as X/AB>X or X>AB/X but
-        # XA>AB>X must be in the order XA>AB/X
         futures = []
         for child, move in self._moveToChildMove(shift).items():
-            f = child.moveRel(move, **kwargs)
+            f = child.moveRel(move, **self._childKwargs(child, move, kwargs))
             futures.append(f)
 
         # just wait for all futures to finish
@@ -280,7 +388,7 @@ class MultiplexActuator(model.Actuator):
         pos = self._applyInversion(pos)
 
         if self._executor:
-            f = self._executor.submit(self._doMoveAbs, pos, **kwargs)
+            f = self._scheduleMove(self._doMoveAbs, pos, kwargs)
         else:
             cmv = self._moveToChildMove(pos)
             child, move = cmv.popitem()
@@ -292,7 +400,7 @@ class MultiplexActuator(model.Actuator):
     def _doMoveAbs(self, pos, **kwargs):
         futures = []
         for child, move in self._moveToChildMove(pos).items():
-            f = child.moveAbs(move, **kwargs)
+            f = child.moveAbs(move, **self._childKwargs(child, move, kwargs))
             futures.append(f)
 
         # just wait for all futures to finish
@@ -305,7 +413,8 @@ class MultiplexActuator(model.Actuator):
             return model.InstantaneousFuture()
         self._checkReference(axes)
         if self._executor:
-            f = self._executor.submit(self._doReference, axes)
+            deps = set(c.name for c in self._axesToChildAxes(axes))
+            f = self._executor.submit(deps, self._doReference, axes)
         else:
             cmv = self._axesToChildAxes(axes)
             child, a = cmv.popitem()
@@ -33,11 +33,13 @@ from ctypes import *
 import gc
 import glob
 import logging
+import math
 import numpy
 from odemis import model, util
 from odemis.model import HwError, oneway
 import os
 import re
+import sys
 import threading
 import time
 import weakref
@@ -178,6 +180,80 @@ LENGTH_FIELD_SIZE = 4
 CID_FIELD_SIZE = 4
 CID_TIMESTAMP = 1
 
+# Queue of buffers given to the SDK
+QUEUE_DURATION = 0.1  # s, (minimum) duration of the frames queued in advance
+MIN_QUEUE_LEN = 3  # number of buffers
+MAX_QUEUE_LEN = 32  # number of buffers
+MAX_QUEUE_BYTES = 512 * 1024 * 1024  # B, maximum memory used by the queue
+
+
+class BufferPool(object):
+    """
+    Pool of (aligned) memory buffers to receive the frames from the SDK.
+    A buffer is reused as soon as nothing refers to it anymore, which is the
+    case once all the DataArrays created from it (which are views on the
+    buffer) have been deleted. This avoids allocating a new buffer for every
+    frame.
+    """
+    def __init__(self, image_size, max_buffers=MAX_QUEUE_LEN * 2):
+        """
+        image_size (int): size of each buffer in bytes
+        max_buffers (int): maximum number of buffers kept in the pool. If more
+          buffers are needed, the oldest one still in use is forgotten by the
+          pool (and will be freed once it's not used anymore).
+        """
+        self.image_size = image_size
+        self.max_buffers = max_buffers
+        self._buffers = []  # numpy arrays of uint64: all the buffers of the pool
+        # Statistics
+        self.allocated = 0
+        self.reused = 0
+
+    def __len__(self):
+        return len(self._buffers)
+
+    def _get_free(self):
+        """
+        return (numpy.ndarray or None): a buffer not used by anything else, or
+          None if all the buffers are used.
+        """
+        for b in self._buffers:
+            # When not used, it's only referenced by the list, b, and the
+            # argument of getrefcount(). Each view holds a reference.
+            if sys.getrefcount(b) <= 3:
+                return b
+        return None
+
+    def get(self):
+        """
+        Provides a buffer which is not used anywhere else.
+        return (numpy.ndarray of uint64): buffer of at least image_size bytes,
+          aligned on 8 bytes, with undefined content.
+        """
+        b = self._get_free()
+        if b is not None:
+            self.reused += 1
+            return b
+
+        if len(self._buffers) >= self.max_buffers:
+            # Maybe some DataArrays are only referenced by garbage cycles
+            gc.collect()
+            b = self._get_free()
+            if b is not None:
+                self.reused += 1
+                return b
+            logging.debug("All the %d buffers are still in use, forgetting the oldest one",
+                          len(self._buffers))
+            del self._buffers[0]
+
+        # Allocating a uint64 array ensures it's aligned on 8 bytes, as the SDK needs
+        b = numpy.empty((self.image_size + 7) // 8, dtype=numpy.uint64)
+        assert b.ctypes.data % 8 == 0
+        self._buffers.append(b)
+        self.allocated += 1
+        return b
+
+
 class AndorCam3(model.DigitalCamera):
     """
     Represents one Andor camera and provides all the basic interfaces typical of
@@ -368,6 +444,9 @@ class AndorCam3(model.DigitalCamera):
 
         self.acquisition_lock = threading.Lock()
         self.acquire_must_stop = threading.Event()
+        self._buffer_pool = None  # BufferPool for the current image size
+        self._frame_period = None  # s, observed time between two frames
+        self._last_frame_time = None
         self.acquire_thread = None
         # for synchronized acquisition
         self._got_event = threading.Event()
@@ -613,11 +692,13 @@ class AndorCam3(model.DigitalCamera):
             raise HwError("Device not opened")
         self.atcore.AT_Command(self.handle, command)
 
-    def QueueBuffer(self, cbuffer):
+    def QueueBuffer(self, cbuffer, size):
         """
-        cbuffer (ctypes.array): the buffer to queue
+        cbuffer (numpy.ndarray): the buffer to queue
+        size (int): number of bytes of the buffer to use (<= cbuffer.nbytes)
         """
-        self.atcore.AT_QueueBuffer(self.handle, cbuffer, sizeof(cbuffer))
+        assert size <= cbuffer.nbytes
+        self.atcore.AT_QueueBuffer(self.handle, cbuffer.ctypes.data_as(POINTER(c_byte)), size)
 
     def WaitBuffer(self, timeout=None):
         """
@@ -1426,22 +1507,57 @@ class AndorCam3(model.DigitalCamera):
 
         return (self._resolution[0], self._resolution[1], itemsize), synchronised
 
-    def _allocate_buffer(self, size):
+    def _setup_buffer_pool(self, size):
         """
-        size (3 ints)
-        returns a cbuffer of the right size for an image
+        Ensures the buffer pool is fitting the current image size
+        size (3 ints): width, height, itemsize
         """
         image_size = self.GetInt(u"ImageSizeBytes")
         # The buffer might be bigger than AOIStride * AOIHeight if there is metadata
         assert image_size >= (size[0] * size[1] * size[2])
 
-        # allocating directly a numpy array doesn't work if there is metadata:
-        # ndbuffer = numpy.empty(shape=(stride / 2, size[1]), dtype="uint16")
-        # cbuffer = numpy.ctypeslib.as_ctypes(ndbuffer)
-        cbuffer = (c_byte * image_size)() # empty array
-        assert(addressof(cbuffer) % 8 == 0) # the SDK wants it aligned
+        if self._buffer_pool is None or self._buffer_pool.image_size != image_size:
+            if self._buffer_pool is not None:
+                logging.debug("Dropping buffer pool of %d B buffers (%d allocated, %d reused)",
+                              self._buffer_pool.image_size,
+                              self._buffer_pool.allocated, self._buffer_pool.reused)
+            self._buffer_pool = BufferPool(image_size)
 
-        return cbuffer
+    def _queue_buffer(self, buffers):
+        """
+        Queue a buffer from the pool
+        buffers (deque of numpy.ndarray): queue of buffers given to the SDK,
+          it will be updated
+        """
+        cbuffer = self._buffer_pool.get()
+        self.QueueBuffer(cbuffer, self._buffer_pool.image_size)
+        buffers.append(cbuffer)
+
+    def _get_queue_len(self):
+        """
+        Computes how many buffers should be queued, based on the frame rate
+        return (int): number of buffers
+        """
+        max_len = min(MAX_QUEUE_LEN, MAX_QUEUE_BYTES // self._buffer_pool.image_size)
+        max_len = max(MIN_QUEUE_LEN, max_len)
+        if not self._frame_period:
+            return MIN_QUEUE_LEN
+        qlen = int(math.ceil(QUEUE_DURATION / self._frame_period)) + 1
+        return min(max(MIN_QUEUE_LEN, qlen), max_len)
+
+    def _update_frame_period(self, nframes=1):
+        """
+        Update the estimation of the time between two frames
+        nframes (int): number of frames received since the last call
+        """
+        now = time.time()
+        if self._last_frame_time is not None:
+            period = (now - self._last_frame_time) / nframes
+            if self._frame_period is None:
+                self._frame_period = period
+            else:  # smooth it, to not change the queue length too often
+                self._frame_period = 0.8 * self._frame_period + 0.2 * period
+        self._last_frame_time = now
 
     def _buffer_as_array(self, cbuffer, size, metadata=None):
         """
@@ -1463,8 +1579,10 @@ class AndorCam3(model.DigitalCamera):
             # SimCam doesn't support stride
             stride = self.GetInt(u"AOIWidth")
 
-        p = cast(cbuffer, POINTER(ityp))
-        ndbuffer = numpy.ctypeslib.as_array(p, (size[1], stride))  # numpy shape is H, W
+        # Note: the array is a view on the buffer, so the buffer pool knows
+        # whether it's still in use.
+        ndbuffer = cbuffer.view(ityp)[:size[1] * stride]
+        ndbuffer.shape = (size[1], stride)  # numpy shape is H, W
         dataarray = model.DataArray(ndbuffer, metadata)
         # crop the array in case of stride (should not cause copy)
         return dataarray[:, :size[0]]
@@ -1482,7 +1600,7 @@ class AndorCam3(model.DigitalCamera):
         # Metadata is read from the end to the beginning of the data
         # ...TAG | CID | LENGTH
         # Length is the length of the tag + CID
-        addl = addressof(cbuffer) + len(cbuffer) - LENGTH_FIELD_SIZE
+        addl = cbuffer.ctypes.data + self._buffer_pool.image_size - LENGTH_FIELD_SIZE
         while addl > data_size:
             pl = cast(addl, POINTER(c_uint32))
             l = pl.contents.value
@@ -1532,13 +1650,10 @@ class AndorCam3(model.DigitalCamera):
                                                args=(callback,))
         self.acquire_thread.start()
 
-    GC_PERIOD = 10 # how often the garbage collector should run (in number of buffers)
     def _acquire_thread_run(self, callback):
         """
         The core of the acquisition thread. Runs until acquire_must_stop is True.
         """
-        nbuffers = 2
-        num_gc = 0
         num_errors = 0
         need_reinit = True
         logging.debug("beginning of acq thread")
@@ -1581,14 +1696,15 @@ class AndorCam3(model.DigitalCamera):
                     else: # for SimCam
                         readout_time = size[0] * size[1] / self.readoutRate.value # s
 
-                    # Allocates a pipeline of buffers, so that when we are processing
+                    # Queue a pipeline of buffers, so that when we are processing
                     # one buffer, the driver can already acquire the next image.
                     self.Flush()
-                    buffers = []
-                    for i in range(nbuffers):
-                        cbuffer = self._allocate_buffer(size)
-                        self.QueueBuffer(cbuffer)
-                        buffers.append(cbuffer)
+                    self._setup_buffer_pool(size)
+                    self._frame_period = None
+                    self._last_frame_time = None
+                    buffers = collections.deque()
+                    for i in range(MIN_QUEUE_LEN - 1):
+                        self._queue_buffer(buffers)
 
                     # Acquire the images
                     self.Command(u"AcquisitionStart")
@@ -1643,14 +1759,9 @@ class AndorCam3(model.DigitalCamera):
                                       metadata[model.MD_ACQ_DATE] - hw_ts)
 
                 callback(self._transposeDAToUser(array))
+                # Drop our references, so that the buffer can be reused as soon
+                # as the subscribers are done with it
                 del cbuffer, array
-
-                # force the GC to free non-used buffers, for some reason, without
-                # this the GC runs only after we've managed to fill up the memory
-                num_gc += 1
-                if num_gc >= self.GC_PERIOD:
-                    gc.collect()
-                    num_gc = 0
         except CancelledError:
             # received a must-stop event
             pass
@@ -1675,7 +1786,7 @@ class AndorCam3(model.DigitalCamera):
         """
         time_end (float): time before which the image is expected to arrive
         size (tuple of int): dimensions of the image to acquire
-        buffers (list of buffer): queue of buffers for receiving the data
+        buffers (deque of numpy.ndarray): queue of buffers for receiving the data
         max_discard (0<=int): maximum number of frames that can be discarded if
           several frames are available
         return (buffer): buffer containing the frame
@@ -1683,13 +1794,14 @@ class AndorCam3(model.DigitalCamera):
           error with the hardware.
             CancelledError: In case tha acquisition was cancelled
         """
-        # We have (probably) time now, let's queue next buffer here
-        # Note we cannot reuse the buffer because we don't know if
-        # the callee still needs it or not
-        logging.debug("Queuing a new buffer (queue len = %d)", len(buffers))
-        cbuffer = self._allocate_buffer(size)
-        self.QueueBuffer(cbuffer)
-        buffers.append(cbuffer)
+        # We have (probably) time now, let's queue the next buffers here.
+        # The pool only provides buffers not used anymore by the callees.
+        # The queue length is adapted to the frame rate, but there should
+        # always be at least one buffer to receive the frame.
+        qlen = max(len(buffers) + 1, self._get_queue_len())
+        logging.debug("Queuing %d buffers (queue len = %d)", qlen - len(buffers), len(buffers))
+        while len(buffers) < qlen:
+            self._queue_buffer(buffers)
 
         # Wait for the data, while regularly checking for cancellation
         while True:
@@ -1710,8 +1822,8 @@ class AndorCam3(model.DigitalCamera):
         # Cannot directly use pbuffer because we'd lose the reference to the
         # memory allocation... and it'd get free'd at the end of the method
         # So rely on the assumption cbuffer is used as is
-        cbuffer = buffers.pop(0)
-        assert(addressof(pbuffer.contents) == addressof(cbuffer))
+        cbuffer = buffers.popleft()
+        assert(addressof(pbuffer.contents) == cbuffer.ctypes.data)
 
         # Check if there is already a newer image
         discarded = 0
@@ -1727,15 +1839,17 @@ class AndorCam3(model.DigitalCamera):
                 logging.exception("Failure while checking for newer data in hardware queue")
                 raise
 
-            # Queue immediately a new buffer to compensate
-            logging.debug("Queuing a new buffer (queue len = %d)", len(buffers))
-            cbuffer = self._allocate_buffer(size)
-            self.QueueBuffer(cbuffer)
-            buffers.append(cbuffer)
+            # Queue immediately a buffer to compensate (it can be the buffer
+            # of the discarded frame, as it's not used anywhere)
+            logging.debug("Queuing a buffer (queue len = %d)", len(buffers))
+            cbuffer = None
+            self._queue_buffer(buffers)
 
             # get the newer image (and forget about the old one)
-            cbuffer = buffers.pop(0)
-            assert(addressof(pbuffer.contents) == addressof(cbuffer))
+            cbuffer = buffers.popleft()
+            assert(addressof(pbuffer.contents) == cbuffer.ctypes.data)
+
+        self._update_frame_period(1 + discarded)
 
         if discarded > 0:
             if discarded >= max_discard:
@@ -35,6 +35,12 @@ MAXDEVNUM = 8
 
 HISTCHAN = 65536  # number of histogram channels
 TTREADMAX = 131072  # 128K event records
+T3HISTCHAN = 4096  # number of histogram channels in T3 mode (12 bits of dtime)
+
+# Number of time units (T2: base resolution, T3: sync period) after which the
+# time counter of the records overflows (and an overflow record is inserted)
+T2WRAPAROUND = 210698240
+T3WRAPAROUND = 65536
 
 MODE_HIST = 0
 MODE_T2 = 2
@@ -187,7 +193,7 @@ class PH300(model.Detector):
     """
 
     def __init__(self, name, role, device=None, children=None, daemon=None,
-                 disc_volt=None, zero_cross=None, **kwargs):
+                 disc_volt=None, zero_cross=None, tttr=False, **kwargs):
         """
         device (None or str): serial number (eg, 1020345) of the device to use
           or None if any device is fine.
@@ -195,6 +201,10 @@ class PH300(model.Detector):
          detector1 are valid) to the arguments.
         disc_volt (2 (0 <= float <= 0.8)): discriminator voltage for the APD 0 and 1 (in V)
         zero_cross (2 (0 <= float <= 2e-3)): zero cross voltage for the APD0 and 1 (in V)
+        tttr (bool): if True, the device is used in time-tagged (T3) mode: the
+          events are continuously read and the histograms are computed by
+          software, so there is no dead time between each dwell time.
+          Otherwise, the device is used in histogram mode.
         """
         if children is None:
             children = {}
@@ -215,8 +225,11 @@ class PH300(model.Detector):
 
         # TODO: metadata for indicating the range? cf WL_LIST?
 
-        # TODO: do we need TTTR mode?
-        self.Initialise(MODE_HIST)
+        self._tttr = tttr
+        if tttr:
+            self.Initialise(MODE_T3)
+        else:
+            self.Initialise(MODE_HIST)
         self._swVersion = self.GetLibraryVersion()
         self._metadata[model.MD_SW_VERSION] = self._swVersion
         mod, partnum, ver = self.GetHardwareInfo()
@@ -255,7 +268,10 @@ class PH300(model.Detector):
 
         # Indicate first dim is time and second dim is (useless) X (in reversed order)
         self._metadata[model.MD_DIMS] = "XT"
-        self._shape = (HISTCHAN, 1, 2**16) # Histogram is 32 bits, but only return 16 bits info
+        if tttr:
+            self._shape = (T3HISTCHAN, 1, 2**32)  # Histogram computed on 32 bits
+        else:
+            self._shape = (HISTCHAN, 1, 2**16) # Histogram is 32 bits, but only return 16 bits info
 
         # Set the CFD parameters (in mV)
         for i, (dv, zc) in enumerate(zip(disc_volt, zero_cross)):
@@ -293,7 +309,11 @@ class PH300(model.Detector):
         # * "E" to end
         # * "T" to terminate
         self._genmsg = Queue.Queue()
-        self._generator = threading.Thread(target=self._acquire,
+        if tttr:
+            acq_fun = self._acquire_tttr
+        else:
+            acq_fun = self._acquire
+        self._generator = threading.Thread(target=acq_fun,
                                            name="PicoHarp300 acquisition thread")
         self._generator.start()
 
@@ -496,6 +516,14 @@ class PH300(model.Detector):
         self._dll.PH_GetHistogram(self._idx, buf_ct, block)
         return buf
 
+    def GetFlags(self):
+        """
+        return (int): the status flags (FLAG_*)
+        """
+        flags = c_int()
+        self._dll.PH_GetFlags(self._idx, byref(flags))
+        return flags.value
+
     def GetElapsedMeasTime(self):
         """
         return 0<=float: time since the measurement started (in s)
@@ -526,15 +554,18 @@ class PH300(model.Detector):
         #   counter overflow.
         # See also https://github.com/tsbischof/libpicoquant
 
-        assert 0 < count < TTREADMAX
+        assert 0 < count <= TTREADMAX
         buf = numpy.empty((count,), dtype=numpy.uint32)
         buf_ct = buf.ctypes.data_as(POINTER(c_uint32))
         nactual = c_int()
         self._dll.PH_ReadFiFo(self._idx, buf_ct, count, byref(nactual))
 
         # only return the values which were read
-        # TODO: if it's really smaller (eg, 0), copy the data to avoid holding all the mem
-        return buf[:nactual.value]
+        n = nactual.value
+        if n < count // 2:
+            # copy the data to avoid holding all the memory
+            return buf[:n].copy()
+        return buf[:n]
 
     def _setPixelDuration(self, pxd):
         # TODO: delay until the end of an acquisition
@@ -697,6 +728,140 @@ class PH300(model.Detector):
 
         logging.debug("Acquisition thread ended")
 
+    def _acquire_tttr(self):
+        """
+        Acquisition thread, for the TTTR (T3) mode
+        Managed via the .genmsg Queue
+        """
+        try:
+            while True:
+                # Wait until we have a start (or terminate) message
+                self._acq_wait_start()
+                self._run_tttr()
+                logging.debug("Acquisition stopped")
+        except StopIteration:
+            logging.debug("Acquisition thread requested to terminate")
+        except Exception:
+            logging.exception("Failure in acquisition thread")
+        else:
+            logging.error("Acquisition thread ended without exception")
+
+        logging.debug("Acquisition thread ended")
+
+    def _run_tttr(self):
+        """
+        Acquire continuously in T3 mode, and send one histogram per dwell time,
+        until a stop message is received.
+        The dwell time windows are defined by the sync counter, so the events
+        are never lost between two windows.
+        raise StopIteration: if a terminate message was received
+        """
+        syncrate = self.GetCountRate(0)  # Hz
+        if syncrate <= 0:
+            logging.warning("No sync signal detected, histograms will be empty")
+
+        fifoq = Queue.Queue()
+        must_stop = threading.Event()
+        reader = threading.Thread(target=self._read_fifo, args=(fifoq, must_stop),
+                                  name="PicoHarp300 FIFO reader")
+
+        tstart = time.time()
+        self.StartMeas(ACQTMAX)
+        reader.start()
+        try:
+            sync_offset = 0  # sync counter at the end of the last records decoded
+            win_start = 0  # sync counter at the beginning of the current window
+            win_startt = tstart
+            hist = numpy.zeros((T3HISTCHAN,), dtype=numpy.uint32)
+            while True:
+                dt = self.dwellTime.value
+                if syncrate > 0:
+                    win_end = win_start + max(1, int(round(dt * syncrate)))
+                else:
+                    win_end = None
+
+                if self._acq_should_stop():
+                    return
+
+                try:
+                    recs = fifoq.get(timeout=min(dt, 0.1))
+                except Queue.Empty:
+                    recs = None
+                    if win_end is None and time.time() >= win_startt + dt:
+                        # No sync => just rely on the computer clock
+                        self._send_histogram(hist, win_startt, time.time() - win_startt)
+                        win_startt = time.time()
+                        hist = numpy.zeros((T3HISTCHAN,), dtype=numpy.uint32)
+                    continue
+                if isinstance(recs, Exception):
+                    raise recs
+
+                chan, dtime, sync, sync_offset = decodeT3Records(recs, sync_offset)
+                if win_end is None:
+                    hist += numpy.bincount(dtime, minlength=T3HISTCHAN).astype(numpy.uint32)
+                    continue
+
+                # The last sync counter known is either the last event or the
+                # last overflow
+                last_sync = sync_offset
+                if sync.size:
+                    last_sync = max(last_sync, sync[-1])
+
+                # Split the events in windows of dwell time
+                while True:
+                    i = numpy.searchsorted(sync, win_end)
+                    hist += numpy.bincount(dtime[:i], minlength=T3HISTCHAN).astype(numpy.uint32)
+                    if last_sync < win_end:
+                        break  # Window not yet finished
+                    dur = (win_end - win_start) / syncrate
+                    self._send_histogram(hist, tstart + win_start / syncrate, dur)
+                    hist = numpy.zeros((T3HISTCHAN,), dtype=numpy.uint32)
+                    dtime = dtime[i:]
+                    sync = sync[i:]
+                    win_start = win_end
+                    win_end = win_start + max(1, int(round(self.dwellTime.value * syncrate)))
+                win_startt = tstart + win_start / syncrate
+        finally:
+            must_stop.set()
+            reader.join(5)
+            # Must always be called, whether the measurement finished or not
+            self.StopMeas()
+
+    def _send_histogram(self, hist, tstart, dur):
+        """
+        Send the histogram computed from the events
+        hist (ndarray of shape T3HISTCHAN): the histogram
+        tstart (float): time of the beginning of the window
+        dur (float): duration of the window (s)
+        """
+        md = self._metadata.copy()
+        md[model.MD_ACQ_DATE] = tstart
+        md[model.MD_DWELL_TIME] = dur
+        da = model.DataArray(hist.reshape((1, T3HISTCHAN)), md)
+        self.data.notify(da)
+
+    def _read_fifo(self, fifoq, must_stop):
+        """
+        FIFO reader thread: continuously empties the FIFO of the device, and
+        passes the records to the acquisition thread (without decoding them,
+        to be as fast as possible).
+        fifoq (Queue): queue where the records (or an exception) are put
+        must_stop (Event): set to stop reading
+        """
+        try:
+            while not must_stop.is_set():
+                recs = self.ReadFiFo(TTREADMAX)
+                if recs.size:
+                    fifoq.put(recs)
+                if recs.size < TTREADMAX // 8:
+                    # Almost empty FIFO => give the device a bit of time
+                    must_stop.wait(5e-3)
+                elif self.GetFlags() & FLAG_FIFOFULL:
+                    logging.warning("FIFO overrun, some events have been lost")
+        except Exception as ex:
+            logging.exception("Failure while reading the FIFO")
+            fifoq.put(ex)
+
     @classmethod
     def scan(cls):
         """
@@ -721,6 +886,62 @@ class PH300(model.Detector):
         return dev
 
 
+def decodeT3Records(records, sync_offset=0):
+    """
+    Decode the records of the T3 mode. Only the (photon) events are returned,
+    the overflow records are used to compute the sync counter, and the markers
+    are dropped.
+    records (ndarray of uint32): the raw records, as read from the FIFO
+    sync_offset (int): sync counter at the end of the previous records, to
+      continue decoding a stream of records
+    return:
+      channel (ndarray of uint8): channel of each event (0 -> 3)
+      dtime (ndarray of uint16): start-stop time of each event (in time bins)
+      sync (ndarray of int64): sync counter of each event
+      sync_offset (int): sync counter at the end of the records
+    """
+    # Each record: 4 bits channel | 12 bits dtime | 16 bits sync counter
+    chan = (records >> 28).astype(numpy.uint8)
+    dtime = ((records >> 16) & 0xfff).astype(numpy.uint16)
+    # channel 15 = special record: marker, or overflow if the marker is 0
+    ovfl = (chan == 15) & ((dtime & 0xf) == 0)
+    novfl = numpy.cumsum(ovfl, dtype=numpy.int64)
+    sync = (records & 0xffff).astype(numpy.int64)
+    sync += novfl * T3WRAPAROUND + sync_offset
+    if novfl.size:
+        sync_offset += int(novfl[-1]) * T3WRAPAROUND
+
+    events = (chan >= 1) & (chan <= 4)
+    return chan[events] - 1, dtime[events], sync[events], sync_offset
+
+
+def decodeT2Records(records, time_offset=0):
+    """
+    Decode the records of the T2 mode. Only the events (sync and photons) are
+    returned, the overflow records are used to compute the time, and the markers
+    are dropped.
+    records (ndarray of uint32): the raw records, as read from the FIFO
+    time_offset (int): time at the end of the previous records, to continue
+      decoding a stream of records
+    return:
+      channel (ndarray of uint8): channel of each event (0 = sync, 1 -> 4 = inputs)
+      time (ndarray of int64): time of each event (in base resolution units)
+      time_offset (int): time at the end of the records
+    """
+    # Each record: 4 bits channel | 28 bits time
+    chan = (records >> 28).astype(numpy.uint8)
+    ttime = (records & 0xfffffff).astype(numpy.int64)
+    # channel 15 = special record: marker, or overflow if the marker is 0
+    ovfl = (chan == 15) & ((ttime & 0xf) == 0)
+    novfl = numpy.cumsum(ovfl, dtype=numpy.int64)
+    ttime += novfl * T2WRAPAROUND + time_offset
+    if novfl.size:
+        time_offset += int(novfl[-1]) * T2WRAPAROUND
+
+    events = (chan <= 4)
+    return chan[events], ttime[events], time_offset
+
+
 class PH300RawDetector(model.Detector):
     """
     Represents a raw detector (eg, APD) accessed via PicoQuant PicoHarp 300.
@@ -840,6 +1061,12 @@ class FakePHDLL(object):
         self._acq_end = None
         self._last_acq_dur = None  # s
 
+        # For the T-modes
+        self._sync_rate = 1e6  # Hz
+        self._photon_rate = 1e5  # counts/s
+        self._tttr_last = None  # time of the last record generated
+        self._tttr_pos = 0  # number of time units since the start
+
     def PH_OpenDevice(self, i, sn_str):
         if i == self._idx:
             sn_str.value = self._sn
@@ -868,7 +1095,11 @@ class FakePHDLL(object):
 
     def PH_GetCountRate(self, i, channel, p_rate):
         rate = _deref(p_rate, c_int)
-        rate.value = random.randint(0, 5000)
+        if self._mode in (MODE_T2, MODE_T3) and _val(channel) == 0:
+            # In T-modes, the channel 0 is used for the sync
+            rate.value = int(self._sync_rate)
+        else:
+            rate.value = random.randint(0, 5000)
 
     def PH_GetBaseResolution(self, i, p_resolution, p_binsteps):
         resolution = _deref(p_resolution, c_double)
@@ -909,6 +1140,8 @@ class FakePHDLL(object):
             raise PHError(-16, PHDLL.err_code[-16])
         self._acq_start = time.time()
         self._acq_end = self._acq_start + _val(tacq) * 1e-3
+        self._tttr_last = self._acq_start
+        self._tttr_pos = 0
 
     def PH_StopMeas(self, i):
         if self._acq_start is not None:
@@ -923,6 +1156,81 @@ class FakePHDLL(object):
         else:
             ctcstatus.value = 1
 
+    def PH_GetFlags(self, i, p_flags):
+        flags = _deref(p_flags, c_int)
+        flags.value = 0
+
+    def PH_ReadFiFo(self, i, p_buffer, count, p_nactual):
+        if self._mode not in (MODE_T2, MODE_T3):
+            raise PHError(-18, PHDLL.err_code[-18])  # ERROR_INVALID_MODE
+        nactual = _deref(p_nactual, c_int)
+        if self._acq_start is None:
+            nactual.value = 0
+            return
+
+        count = _val(count)
+        recs = self._generate_records(count)
+        p = cast(p_buffer, POINTER(c_uint32))
+        ndbuffer = numpy.ctypeslib.as_array(p, (count,))
+        ndbuffer[:recs.size] = recs
+        nactual.value = recs.size
+
+    def _generate_records(self, count):
+        """
+        Generate (T2 or T3) records corresponding to the time elapsed since the
+        last records generated.
+        count (0 < int): maximum number of records to generate
+        return (ndarray of uint32): the records
+        """
+        now = min(time.time(), self._acq_end)
+        if self._mode == MODE_T3:
+            unit_rate = self._sync_rate  # time unit = 1 sync period
+            wrap = T3WRAPAROUND
+        else:
+            unit_rate = 1e12 / self._base_res  # time unit = base resolution
+            wrap = T2WRAPAROUND
+
+        # Limit the duration to what fits in the buffer (with some margin)
+        rec_per_unit = self._photon_rate / unit_rate + 1 / wrap
+        nunits = int((now - self._tttr_last) * unit_rate)
+        nunits = min(nunits, int(count * 0.8 / rec_per_unit))
+        if nunits <= 0:
+            return numpy.empty((0,), dtype=numpy.uint32)
+        start = self._tttr_pos
+        end = start + nunits
+        self._tttr_pos = end
+        self._tttr_last += nunits / unit_rate
+
+        # Photons arrive at random times, on channel 1
+        nph = min(numpy.random.poisson(self._photon_rate * nunits / unit_rate),
+                  int(count * 0.9))
+        ph_t = numpy.sort(numpy.random.randint(start, end, nph).astype(numpy.int64))
+        ph_rec = numpy.empty(nph, dtype=numpy.uint32)
+        ph_rec[:] = 1 << 28
+        if self._mode == MODE_T3:
+            # Exponential decay
+            dtime = numpy.random.exponential(200, nph).astype(numpy.uint32)
+            numpy.minimum(dtime, T3HISTCHAN - 1, out=dtime)
+            ph_rec |= (dtime << 16) | (ph_t % wrap).astype(numpy.uint32)
+        else:
+            ph_rec |= (ph_t % wrap).astype(numpy.uint32)
+
+        # Overflow records each time the time counter wraps around
+        first = -(-start // wrap) * wrap  # first multiple of wrap >= start
+        if first == 0:
+            first = wrap
+        ovfl_t = numpy.arange(first, end, wrap, dtype=numpy.int64)
+        ovfl_rec = numpy.empty(ovfl_t.size, dtype=numpy.uint32)
+        ovfl_rec[:] = 15 << 28
+
+        # Merge by time, with the overflow first if at the same time
+        times = numpy.concatenate([ovfl_t, ph_t])
+        recs = numpy.concatenate([ovfl_rec, ph_rec])
+        is_ph = numpy.concatenate([numpy.zeros(ovfl_t.size, dtype=numpy.uint8),
+                                   numpy.ones(nph, dtype=numpy.uint8)])
+        order = numpy.lexsort((is_ph, times))
+        return recs[order]
+
     def PH_GetElapsedMeasTime(self, i, p_elapsed):
         elapsed = _deref(p_elapsed, c_double)
         if self._acq_start is None:
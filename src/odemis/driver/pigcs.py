@@ -729,6 +729,16 @@ class Controller(object):
             raise NotImplementedError("Command %s not supported by the controller" % (com,))
 
         resp = self._sendQueryCommand("%s %d\n" % (com, axis))
+        return self._parseAxisValue(com, axis, resp)
+
+    def _parseAxisValue(self, com, axis, resp):
+        """
+        Parses the answer to a command with axis.
+        com (str): the 4 letter command (including the ?)
+        axis (1<int<16): axis number
+        resp (str): the answer of the controller (ex: "1=25.3")
+        returns (int or float or str): value returned depending on the type detected
+        """
         try:
             value_str = resp.split("=")[1]
         except IndexError:
@@ -1520,6 +1530,51 @@ class Controller(object):
         # takes more characters and for CL, we need a more clever code anyway
         return not axes.isdisjoint(self.GetMotionStatus())
 
+    def getPositionQuery(self, axis):
+        """
+        Provides the query to read the position of an axis, so that it can be
+          sent together with the queries to other controllers (cf
+          BusAccesser.sendQueryCommands()).
+        axis (int)
+        return (None or str): the query, or None if the position cannot be read
+          this way, in which case getPosition() must be used.
+        """
+        # The position is interpolated in open-loop
+        return None
+
+    def parsePosition(self, axis, ans):
+        """
+        axis (int)
+        ans (str): the answer to the query of getPositionQuery()
+        return (float): the current position of the given axis
+        """
+        raise NotImplementedError("This method must be overridden by a subclass")
+
+    def getMovingQueries(self, axis):
+        """
+        Provides the queries to know whether an axis is moving, so that they
+          can be sent together with the queries to other controllers (cf
+          BusAccesser.sendQueryCommands()).
+        axis (int)
+        return (None or list of str): the queries, or None if it cannot be
+          known this way, in which case isMoving() must be used.
+        """
+        # Same as GetMotionStatus()
+        return ["ERR?\n", "\x05"]
+
+    def parseMoving(self, axis, answers):
+        """
+        axis (int)
+        answers (list of str): the answers to the queries of getMovingQueries()
+        return (boolean): True if the axis is moving
+        raise PIGCSError if an error on the controller happened
+        """
+        err = int(answers[0])
+        if err:
+            raise PIGCSError(err)
+        bitmap = int(answers[1], 16)
+        return bool(bitmap & (1 << (axis - 1)))
+
     def stopMotion(self):
         """
         Stop the motion on all axes immediately
@@ -1749,6 +1804,14 @@ class CLAbsController(Controller):
         self._lastpos[axis] = (pos, time.time())
         return pos
 
+    def getPositionQuery(self, axis):
+        return "POS? %d\n" % (axis,)
+
+    def parsePosition(self, axis, ans):
+        pos = self._parseAxisValue("POS?", axis, ans) * self._upm[axis]
+        self._lastpos[axis] = (pos, time.time())
+        return pos
+
     def isMoving(self, axes=None):
         """
         Indicate whether the motors are moving (ie, last requested move is over)
@@ -1770,6 +1833,16 @@ class CLAbsController(Controller):
 
         return False
 
+    def getMovingQueries(self, axis):
+        # Same as IsOnTarget()
+        return ["ERR?\n", "ONT? %d\n" % (axis,)]
+
+    def parseMoving(self, axis, answers):
+        err = int(answers[0])
+        if err:
+            raise PIGCSError(err)
+        return self._parseAxisValue("ONT?", axis, answers[1]) != 1
+
     # TODO allow to reference, but need to get multiple axes, and to check the
     # status, isMoving() cannot be used, but just GetMotionStatus()
     # def startReferencing(self, axis):
@@ -2232,6 +2305,10 @@ class CLRelController(Controller):
     def getTargetPosition(self, axis):
         return self.GetTargetPosition(axis) * self._upm[axis]
 
+    def getMovingQueries(self, axis):
+        # isMoving() also takes care of releasing the axes which are not moving
+        return None
+
     # Warning: if the settling window is too small or settling time too big,
     # it might take several seconds to reach target (or even never reach it)
     def isMoving(self, axes=None):
@@ -2668,6 +2745,10 @@ class SMOController(Controller):
         self._storeMove(axis, ad, duration)
         return ad
 
+    def getMovingQueries(self, axis):
+        # The moves are not reported by the controller, cf isMoving()
+        return None
+
     def isMoving(self, axes=None):
         """
         See Controller.isMoving
@@ -2855,18 +2936,87 @@ class Bus(model.Actuator):
             pos = self.position._value.copy()
 
         npos = {}
+        queries = []  # axis name, queries: the positions to read all at once
         for a, (controller, channel) in self._axis_to_cc.items():
             if axes is None or a in axes:
+                q = controller.getPositionQuery(channel)
+                if q is not None:
+                    queries.append((a, [q]))
+                    continue
                 try:
                     npos[a] = controller.getPosition(channel)
                 except PIGCSError:
                     logging.warning("Failed to update position of axis %s", a, exc_info=True)
 
+        if queries:
+            try:
+                answers = self._queryAxes(queries)
+            except PIGCSError:
+                logging.warning("Failed to update position of axes %s",
+                                [a for a, q in queries], exc_info=True)
+            else:
+                for a, ans in answers.items():
+                    controller, channel = self._axis_to_cc[a]
+                    npos[a] = controller.parsePosition(channel, ans[0])
+
         pos.update(self._applyInversion(npos))
         logging.debug("Reporting new position at %s", pos)
 
         self.position._set_value(pos, force_write=True)
 
+    def _queryAxes(self, queries):
+        """
+        Sends the queries for multiple axes in a row, without waiting for the
+        answer of each controller before sending the next query.
+        queries (list of (str, list of str)): name of the axis, and queries to
+          send to its controller
+        return (dict str -> list of str): name of the axis -> answer to each query
+        raise PIGCSError: if a controller reported an error while recovering
+        """
+        try:
+            answers = self.accesser.sendQueryCommands(
+                   [(self._axis_to_cc[a][0].address, q) for a, qs in queries for q in qs])
+        except IOError:
+            # Query each controller separately, so that it can try to recover
+            logging.warning("Failed to query axes %s together, will query them separately",
+                            [a for a, qs in queries], exc_info=True)
+            answers = []
+            for a, qs in queries:
+                answers.extend(self._axis_to_cc[a][0]._sendQueryCommand(qs))
+
+        ret = {}
+        i = 0
+        for a, qs in queries:
+            ret[a] = answers[i:i + len(qs)]
+            i += len(qs)
+        return ret
+
+    def _getMovingAxes(self, axes):
+        """
+        Checks which axes are still moving. The controllers which support it
+          are all queried at once.
+        axes (set of str): the axes names to check
+        return (set of str): the axes still moving
+        raise PIGCSError: if a controller reported an error
+        """
+        moving_axes = set()
+        queries = []  # axis name, queries: the statuses to read all at once
+        for an in axes:
+            controller, channel = self._axis_to_cc[an]
+            qs = controller.getMovingQueries(channel)
+            if qs is not None:
+                queries.append((an, qs))
+            elif controller.isMoving({channel}):
+                moving_axes.add(an)
+
+        if queries:
+            for an, answers in self._queryAxes(queries).items():
+                controller, channel = self._axis_to_cc[an]
+                if controller.parseMoving(channel, answers):
+                    moving_axes.add(an)
+
+        return moving_axes
+
     def _refreshPosition(self):
         """
         Called regularly to update the position of the closed-loop axes
@@ -3103,11 +3253,7 @@ class Bus(model.Actuator):
                     logging.debug("Ending move control early as next move is an update containing %s", moving_axes)
                     return
 
-                for an in moving_axes.copy():  # need copy to remove during iteration
-                    controller, channel = self._axis_to_cc[an]
-                    # TODO: change isMoving to report separate info on multiple channels
-                    if not controller.isMoving({channel}):
-                        moving_axes.discard(an)
+                moving_axes = self._getMovingAxes(moving_axes)
                 if not moving_axes:
                     # no more axes to wait for
                     break
@@ -3390,18 +3536,33 @@ class Bus(model.Actuator):
         return sock
 
 
-class SerialBusAccesser(object):
+class BusAccesser(object):
     """
-    Manages connections to the low-level bus
+    Manages connections to the low-level bus.
+    Abstract class, which takes care of encoding the commands and decoding the
+    answers. The subclasses must provide _write() and _readAvailable().
     """
-    def __init__(self, ser):
-        self.serial = ser
-        # to acquire before sending anything on the serial port
+    def __init__(self):
+        # to acquire before sending anything on the bus
         self.ser_access = threading.RLock()
-        self.driverInfo = "serial driver: %s" % (driver.getSerialDriver(ser.port),)
+        self._latencies = {}  # str (command name) -> LatencyStats
 
-    def terminate(self):
-        self.serial.close()
+    def _write(self, data):
+        """
+        Send data on the bus
+        data (str): data to send
+        """
+        raise NotImplementedError()
+
+    def _readAvailable(self, addr, end_time):
+        """
+        Read the data available on the bus, or wait for some data to come.
+        addr (None or int): address of the controller expected to answer
+        end_time (float): time at which the communication is considered broken
+        return (str): the data read (can be empty if nothing was received yet)
+        raise HwError: if the controller doesn't answer
+        """
+        raise NotImplementedError()
 
     def sendOrderCommand(self, addr, com):
         """
@@ -3411,24 +3572,24 @@ class SerialBusAccesser(object):
         com (string): command to send (including the \n if necessary)
         """
         assert(len(com) <= 100) # commands can be quite long (with floats)
-        assert(addr is None or 1 <= addr <= 16 or addr == 254 or addr == 255)
+        assert(addr is None or 1 <= addr <= 16 or addr == 254 or addr == 255)  # 255 means "broadcast"
         if addr is None:
             full_com = com
         else:
             full_com = "%d %s" % (addr, com)
         with self.ser_access:
             logging.debug("Sending: '%s'", full_com.encode('string_escape'))
-            self.serial.write(full_com)
-            # We don't flush, as it will be done anyway if an answer is needed
+            self._write(full_com)
 
     def sendQueryCommand(self, addr, com):
         """
         Send a command and return its report (raw)
         addr (None or 1<=int<=16): address of the controller
-        com (string): the command to send (without address prefix but with \n)
+        com (str or list of str): the command(s) to send (without address prefix but with \n)
         return (string or list of strings): the report without prefix
            (e.g.,"0 1") nor newline.
            If answer is multiline: returns a list of each line
+           If command was a list: one str or list of str per command
         Note: multiline answers seem to always begin with a \x00 character, but
          it's left as is.
         raise:
@@ -3437,40 +3598,65 @@ class SerialBusAccesser(object):
            IOError: if error during the communication (such as the protocol is
               not respected)
         """
-        assert(addr is None or 1 <= addr <= 16 or addr == 254)
-
         if isinstance(com, basestring):
-            com = [com]
-            multicom = False
+            return self.sendQueryCommands([(addr, com)])[0]
         else:
-            multicom = True
-
-        for c in com:
+            return self.sendQueryCommands([(addr, c) for c in com])
+
+    def sendQueryCommands(self, queries):
+        """
+        Send multiple commands in a row, possibly to different controllers,
+        without waiting for the answer of each command before sending the next
+        one. The answers are then matched to the commands, in order.
+        queries (list of (None or 1<=int<=16, str)): the address of the
+          controller and the command to send (without address prefix but with \n).
+          If the address is None, it must be None for every query.
+        return (list of (str or list of str)): the report of each query,
+          without prefix nor newline. If answer is multiline, it's a list of
+          each line.
+        raise:
+           HwError: if error communicating with the hardware, probably due to
+              the hardware not being in a good state (or connected)
+           IOError: if error during the communication (such as the protocol is
+              not respected)
+        """
+        prefixes = {}  # address -> prefix of the answer
+        expected = {}  # address -> number of answers expected
+        for addr, c in queries:
+            assert(addr is None or 1 <= addr <= 16 or addr == 254)
             assert(len(c) <= 100)  # commands can be quite long (with floats)
+            prefixes[addr] = "" if addr is None else "0 %d " % addr
+            expected[addr] = expected.get(addr, 0) + 1
+        if None in prefixes and len(prefixes) > 1:
+            raise ValueError("Cannot mix queries with and without address")
 
-        if addr is None:
-            full_com = "".join(com)
-            prefix = ""
-        else:
-            full_com = "".join("%d %s" % (addr, c) for c in com)
-            prefix = "0 %d " % addr
+        full_com = "".join(c if addr is None else "%d %s" % (addr, c)
+                           for addr, c in queries)
+        first_addr = queries[0][0]
 
         with self.ser_access:
             logging.debug("Sending: '%s'", full_com.encode('string_escape'))
-            self.serial.write(full_com)
-
-            # ensure everything is received, before expecting an answer
-            self.serial.flush()
+            start = time.time()
+            self._write(full_com)
 
+            # Read the answer
+            # The basic is simple. An answer starts with a prefix, and finishes
+            # with \n. If it actually finishes with " \n", then it's just a new
+            # line and not the end of the answer.
+            # However, it gets muddy sometimes with empty answers. For instance,
+            # it can answer "0 1 \n", which is an empty answer. But some
+            # controllers answer "1 HLP\n" with "0 1 \nBla bla \nBla\n"
+            end_time = start + 0.5
             ans = ""  # received data not yet processed
-            ret = []  # one answer per command
+            rets = dict((a, []) for a in prefixes)  # address -> list of answers
+            ans_times = dict((a, []) for a in prefixes)  # address -> time of each answer
             continuing = False
+            cur_addr = first_addr  # address of the controller currently answering
             while True:
-                char = self.serial.read()  # empty if timeout
-                if not char:
-                    raise model.HwError("Controller %s timed out, check the device is "
-                                        "plugged in and turned on." % addr)
-                ans += char
+                data = self._readAvailable(first_addr, end_time)
+                if not data:
+                    continue
+                ans += data
 
                 anssplited = ans.split("\n")
                 # if the answer finishes with \n, last split is empty
@@ -3481,14 +3667,19 @@ class SerialBusAccesser(object):
                 for l in anssplited:
                     if not continuing:
                         lines = []  # one string per answer line
-                        # remove the prefix
-                        if l.startswith(prefix):
-                            l = l[len(prefix):]
+                        # remove the prefix (and find out who is answering)
+                        for a, p in prefixes.items():
+                            if l.startswith(p):
+                                cur_addr = a
+                                l = l[len(p):]
+                                break
                         else:
                             # Maybe the previous line was actually continuing (but the hardware is strange)?
+                            ret = rets[cur_addr]
                             if ret and ret[-1] == "":
                                 logging.debug("Reconcidering previous line as beginning of multi-line")
-                                ret = ret[:-1]
+                                ret.pop()
+                                ans_times[cur_addr].pop()
                             else:
                                 logging.debug("Failed to decode answer '%s'", l.encode('string_escape'))
                                 raise IOError("Report prefix unexpected after '%s': '%s'." % (full_com, l))
@@ -3501,25 +3692,80 @@ class SerialBusAccesser(object):
                         continuing = False
                         lines.append(l)
                         if len(lines) == 1:
-                            ret.append(lines[0])
+                            rets[cur_addr].append(lines[0])
                         else:
-                            ret.append(lines)
+                            rets[cur_addr].append(lines)
+                        ans_times[cur_addr].append(time.time())
 
-                # does it look like we received the end of an answer?
-                if not continuing and not ans and len(ret) >= len(com):
+                # does it look like we received the end of all the answers?
+                if (not continuing and not ans and
+                    all(len(rets[a]) >= n for a, n in expected.items())):
                     break
 
-        if len(ret) > len(com):
-            logging.warning("Skipping previous answers from hardware %r",
-                            ret[:-len(com)])
-            ret = ret[-len(com):]
-        elif len(ret) < len(com):
-            logging.error("Expected %d answers but only got %d", len(com), len(ret))
+        for a, n in expected.items():
+            if len(rets[a]) > n:
+                logging.warning("Skipping previous answers from hardware %r",
+                                rets[a][:-n])
+                rets[a] = rets[a][-n:]
+                ans_times[a] = ans_times[a][-n:]
 
-        if not multicom:
-            return ret[0]
-        else:
-            return ret
+        # Reorder the answers, following the order of the queries
+        ret = []
+        for addr, c in queries:
+            ret.append(rets[addr].pop(0))
+            self._addLatency(c, ans_times[addr].pop(0) - start)
+
+        return ret
+
+    def _addLatency(self, com, dur):
+        """
+        Record the latency of a command
+        com (str): the command (with arguments)
+        dur (float): time between the sending and the end of the answer (in s)
+        """
+        name = com.split(" ", 1)[0].strip()
+        try:
+            stats = self._latencies[name]
+        except KeyError:
+            stats = driver.LatencyStats()
+            self._latencies[name] = stats
+        stats.add(dur)
+
+    def getLatencyStatistics(self):
+        """
+        return (dict str -> driver.LatencyStats): for each type of command (eg, "POS?"),
+          the statistics on the time between sending the command and receiving
+          the whole answer.
+        """
+        return dict(self._latencies)
+
+
+class SerialBusAccesser(BusAccesser):
+    """
+    Manages connections to the low-level bus
+    """
+    def __init__(self, ser):
+        BusAccesser.__init__(self)
+        self.serial = ser
+        self.driverInfo = "serial driver: %s" % (driver.getSerialDriver(ser.port),)
+
+    def terminate(self):
+        self.serial.close()
+
+    def _write(self, data):
+        self.serial.write(data)
+        # We don't flush, as it will be done anyway if an answer is needed
+
+    def _readAvailable(self, addr, end_time):
+        # ensure everything is sent, before expecting an answer
+        self.serial.flush()
+        # Read everything already received, or at least one byte (which will
+        # block until the timeout of the serial port)
+        data = self.serial.read(max(1, self.serial.inWaiting()))
+        if not data:
+            raise model.HwError("Controller %s timed out, check the device is "
+                                "plugged in and turned on." % addr)
+        return data
 
     def flushInput(self):
         """
@@ -3536,7 +3782,7 @@ class SerialBusAccesser(object):
                 logging.debug("Flushing data %s", data.encode('string_escape'))
 
 
-class IPBusAccesser(object):
+class IPBusAccesser(BusAccesser):
     """
     Manages connections to the low-level bus
     """
@@ -3544,10 +3790,8 @@ class IPBusAccesser(object):
         """
         master (1<=int<=255 or None): address of the master
         """
-
+        BusAccesser.__init__(self)
         self.socket = socket
-        # to acquire before sending anything on the socket
-        self.ser_access = threading.RLock()
 
         if master is None:
             self.driverInfo = "TCP/IP connection"
@@ -3562,141 +3806,27 @@ class IPBusAccesser(object):
     def terminate(self):
         self.socket.close()
 
-    def sendOrderCommand(self, addr, com):
-        """
-        Send a command which does not expect any report back
-        addr (None or 1<=int<=16): address of the controller. If None, no address
-        is used (and it's typically controller 1 answering)
-        com (string): command to send (including the \n if necessary)
-        """
-        assert(len(com) <= 100) # commands can be quite long (with floats)
-        assert(addr is None or 1 <= addr <= 16 or addr == 254 or addr == 255)  # 255 means "broadcast"
-        if addr is None:
-            full_com = com
-        else:
-            full_com = "%d %s" % (addr, com)
-        with self.ser_access:
-            logging.debug("Sending: '%s'", full_com.encode('string_escape'))
-            self.socket.sendall(full_com)
-
-    def sendQueryCommand(self, addr, com):
-        """
-        Send a command and return its report (raw)
-        addr (None or 1<=int<=16): address of the controller
-        com (str or list of str): the command(s) to send (without address prefix but with \n)
-        return (string or list of strings): the report without prefix
-           (e.g.,"0 1") nor newline.
-           If answer is multiline: returns a list of each line
-           If command was a list: one str or list of str per command
-        raise:
-           HwError: if error communicating with the hardware, probably due to
-              the hardware not being in a good state (or connected)
-           IOError: if error during the communication (such as the protocol is
-              not respected)
-        """
-        assert(addr is None or 1 <= addr <= 16 or addr == 254)
-
-        if isinstance(com, basestring):
-            com = [com]
-            multicom = False
-        else:
-            multicom = True
-
-        for c in com:
-            assert(len(c) <= 100)  # commands can be quite long (with floats)
-
-        if addr is None:
-            full_com = "".join(com)
-            prefix = ""
-        else:
-            full_com = "".join("%d %s" % (addr, c) for c in com)
-            prefix = "0 %d " % addr
-
-        with self.ser_access:
-            logging.debug("Sending: '%s'", full_com.encode('string_escape'))
-            self.socket.sendall(full_com)
-
-            # Read the answer
-            # The basic is simple. An answer starts with a prefix, and finishes
-            # with \n. If it actually finishes with " \n", then it's just a new
-            # line and not the end of the answer.
-            # However, it gets muddy sometimes with empty answers. For instance,
-            # it can answer "0 1 \n", which is an empty answer. But some
-            # controllers answer "1 HLP\n" with "0 1 \nBla bla \nBla\n"
-            end_time = time.time() + 0.5
-            ans = ""  # received data not yet processed
-            ret = []  # one answer per command
-            continuing = False
-            while True:
-                try:
-                    data = self.socket.recv(4096)
-                except socket.timeout:
-                    raise model.HwError("Controller %s timed out, check the device is "
-                                        "plugged in and turned on." % addr)
-                # If the master is already accessed from somewhere else it will just
-                # immediately answer an empty message
-                if not data:
-                    if time.time() > end_time:
-                        raise model.HwError("Controller not answering. "
-                                            "It might be already connected with another client.")
-                    else:
-                        logging.debug("Received empty data packet")
-                    time.sleep(0.01)
-                    continue
-
-                logging.debug("Received: '%s'", data.encode('string_escape'))
-                ans += data
-
-                anssplited = ans.split("\n")
-                # if the answer finishes with \n, last split is empty
-                anssplited, ans = anssplited[:-1], anssplited[-1]
+    def _write(self, data):
+        self.socket.sendall(data)
 
-                for l in anssplited:
-                    # logging.debug("Processing %s", l)
-                    if not continuing:
-                        lines = []  # one string per answer line
-                        # remove the prefix
-                        if l.startswith(prefix):
-                            l = l[len(prefix):]
-                        else:
-                            # Maybe the previous line was actually continuing (but the hardware is strange)?
-                            if ret and ret[-1] == "":
-                                logging.debug("Reconcidering previous line as beginning of multi-line")
-                                ret = ret[:-1]
-                            else:
-                                # TODO: maybe we got some garbage data from before,
-                                # check if there is already data available that fits the
-                                # prefix. (=> keep reading but with a short timeout)
-                                logging.debug("Failed to decode answer '%s'", l.encode('string_escape'))
-                                raise IOError("Report prefix unexpected after '%s': '%s'." % (full_com, l))
-
-                    if l[-1:] == " ":  # multi-line
-                        continuing = True
-                        lines.append(l[:-1])  # remove the space indicating multi-line
-                    else:
-                        # End of the answer for that command
-                        continuing = False
-                        lines.append(l)
-                        if len(lines) == 1:
-                            ret.append(lines[0])
-                        else:
-                            ret.append(lines)
-
-                # does it look like we received the end of an answer?
-                if not continuing and not ans and len(ret) >= len(com):
-                    break
-
-        if len(ret) > len(com):
-            logging.warning("Skipping previous answers from hardware %r",
-                            ret[:-len(com)])
-            ret = ret[-len(com):]
-        elif len(ret) < len(com):
-            logging.error("Expected %d answers but only got %d", len(com), len(ret))
-
-        if not multicom:
-            return ret[0]
+    def _readAvailable(self, addr, end_time):
+        try:
+            data = self.socket.recv(4096)
+        except socket.timeout:
+            raise model.HwError("Controller %s timed out, check the device is "
+                                "plugged in and turned on." % addr)
+        # If the master is already accessed from somewhere else it will just
+        # immediately answer an empty message
+        if not data:
+            if time.time() > end_time:
+                raise model.HwError("Controller not answering. "
+                                    "It might be already connected with another client.")
+            else:
+                logging.debug("Received empty data packet")
+            time.sleep(0.01)
         else:
-            return ret
+            logging.debug("Received: '%s'", data.encode('string_escape'))
+        return data
 
     def flushInput(self):
         """
@@ -3838,6 +3968,9 @@ class E861Simulator(object):
 
         return ret
 
+    def inWaiting(self):
+        return len(self._output_buf)
+
     def close(self):
         # using read or write will fail after that
         del self._output_buf
@@ -4214,17 +4347,27 @@ class DaisyChainSimulator(object):
 
         return ret
 
+    def inWaiting(self):
+        return len(self._output_buf)
+
     def _thread_read_serial(self, ser):
         """
         Push the output of the given serial port into our output
         """
+        # Like on a real daisy chain, each answer is pushed at once, so that
+        # the answers of different controllers are never mixed.
+        ans = ""
         try:
             while not self._is_terminated:
                 c = ser.read(1)
                 if len(c) == 0:
                     time.sleep(0.01)
                 else:
-                    self._output_buf += c
+                    ans += c
+                    # An answer finishes with \n, unless it's " \n" (multi-line)
+                    if c == "\n" and ans[-2:-1] != " ":
+                        self._output_buf += ans
+                        ans = ""
         except Exception:
             logging.exception("Fake daisy chain thread received an exception")
 
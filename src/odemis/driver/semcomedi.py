@@ -110,6 +110,10 @@ NI_AO_TRIG_AI_START1 = 19  # Trigger number for AI Start1 (= beginning of a comm
 ACQ_CMD_UPD = 1
 ACQ_CMD_TERM = 2
 
+# Approximate size (in bytes) of the raw data processed at once when a whole
+# frame is acquired in one command.
+STREAM_BLOCK_SIZE = 4 * 2 ** 20
+
 # helper functions
 def get_best_dtype_for_acc(idtype, count):
     """
@@ -258,8 +262,12 @@ class SEMComedi(model.HwComponent):
         # make them as fast as possible, so it doesn't matter.
         # On the NI-6251, we get about 0.8 s.
         self._max_ao_period_ns = self._get_max_ao_period_ns()
+        # maximum number of scans that can be read/written by one command
+        self._max_ai_scans = self._get_max_scans(self._ai_subdevice)
+        self._max_ao_scans = self._get_max_scans(self._ao_subdevice)
         # maximum number of samples that can be acquired by one command
         self._max_bufsz = self._get_max_buffer_size()
+        self._frame_dead_time = None  # s, time lost during the last frame
 
         # acquisition thread setup
         # FIXME: we have too many locks. Need to simplify the acquisition and cancellation code
@@ -514,19 +522,27 @@ class SEMComedi(model.HwComponent):
 
         #  * the maximum amount of samples the DAQ device can read in one shot
         #    (on the NI 652x, it's 2**24 samples)
+        bufsz = min(self._max_ai_scans * self._reader.dtype.itemsize, bufsz)
+
+        return bufsz
+
+    def _get_max_scans(self, subdevice):
+        """
+        Returns the maximum number of scans for one command
+        subdevice (int): the subdevice which will run the command
+        returns (0 < int): number of scans
+        """
         try:
             # see how much the device is willing to accept by asking for the maximum
             cmd = comedi.cmd_struct()
-            comedi.get_cmd_generic_timed(self._device, self._ai_subdevice, cmd, 1, 1)
+            comedi.get_cmd_generic_timed(self._device, subdevice, cmd, 1, 1)
             cmd.stop_src = comedi.TRIG_COUNT
             cmd.stop_arg = 0xffffffff # max of uint32
             self._prepare_command(cmd)
-            bufsz = min(cmd.stop_arg * self._reader.dtype.itemsize, bufsz)
-        except comedi.ComediError:
+            return cmd.stop_arg
+        except (IOError, comedi.ComediError):
             # consider it can take the max
-            pass
-
-        return bufsz
+            return 0xffffffff
 
     def _get_converter_actual(self, subdevice, channel, range, direction):
         """
@@ -939,7 +955,7 @@ class SEMComedi(model.HwComponent):
         comedi.command(self._device, cmd)
 
     def write_read_2d_data_raw(self, wchannels, wranges, rchannels, rranges,
-                               period, margin, osr, dpr, data):
+                               period, margin, osr, dpr, data, on_lines=None):
         """
         write data on the given analog output channels and read synchronously on
          the given analog input channels and convert back to 2d array
@@ -955,6 +971,10 @@ class SEMComedi(model.HwComponent):
         data (3D numpy.ndarray of int): array to write (raw values)
           first dimension is along the slow axis, second is along the fast axis,
           third is along the channels
+        on_lines (None or callable (list of 2D numpy.array, int) -> None): if
+          not None, called whenever new lines have been read, with the buffers
+          being filled (same as the returned value) and the number of complete
+          lines. The buffers should only be read.
         return (list of 2D numpy.array with shape=(data.shape[0], data.shape[1]-margin)
          and dtype=device type): the data read (raw) for each channel, after
          decimation.
@@ -975,8 +995,13 @@ class SEMComedi(model.HwComponent):
         linesz = data.shape[1] * nrchans * osr * self._reader.dtype.itemsize
         if linesz < self._max_bufsz and not force_per_pixel:
             lines = self._max_bufsz // linesz
+            if on_lines:
+                # Read few enough lines at a time to report them regularly
+                linedur = data.shape[1] * period
+                lines = max(1, min(lines, int(driver.PARTIAL_FRAME_PERIOD // linedur)))
             return self._write_read_2d_lines(wchannels, wranges, rchannels, rranges,
-                                             period, margin, osr, lines, data)
+                                             period, margin, osr, lines, data,
+                                             on_lines)
 
         # fit a pixel
         max_dpr = (self._max_bufsz / self._reader.dtype.itemsize) // osr
@@ -989,7 +1014,8 @@ class SEMComedi(model.HwComponent):
                               "<= %d", pixelsz / 2 ** 20, dpr, max_dpr)
 
             return self._write_read_2d_pixel(wchannels, wranges, rchannels, rranges,
-                                             period, margin, osr, dpr, data)
+                                             period, margin, osr, dpr, data,
+                                             on_lines)
 
         # separate each pixel into #dpr acquisitions
         pixelsz = nrchans * osr * self._reader.dtype.itemsize
@@ -1000,22 +1026,21 @@ class SEMComedi(model.HwComponent):
                           pixelsz / 2 ** 20, osr, dpr)
 
         return self._write_read_2d_subpixel(wchannels, wranges, rchannels, rranges,
-                                            period, margin, osr, dpr, data)
+                                            period, margin, osr, dpr, data,
+                                            on_lines)
 
     def _write_read_2d_lines(self, wchannels, wranges, rchannels, rranges,
-                             period, margin, osr, maxlines, data):
+                             period, margin, osr, maxlines, data, on_lines=None):
         """
         Implementation of write_read_2d_data_raw by reading the input data n
           lines at a time.
         """
-        if self._scanner.newPosition.hasListeners() and margin > 0:
-            # we don't support margin detection on multiple lines for
-            # newPosition trigger.
+        # we don't support margin detection on multiple lines for
+        # newPosition trigger.
+        single_line = self._scanner.newPosition.hasListeners() and margin > 0
+        if single_line:
             maxlines = 1
 
-        logging.debug("Reading %d lines at a time: %d samples/read every %g µs",
-                      maxlines, maxlines * data.shape[1] * osr * len(rchannels),
-                      period * 1e6)
         rshape = (data.shape[0], data.shape[1] - margin)
 
         # allocate one full buffer per channel
@@ -1026,6 +1051,20 @@ class SEMComedi(model.HwComponent):
         # better use the max_data of the device directly.
         adtype = get_best_dtype_for_acc(self._reader.dtype, osr)
 
+        nwscans = data.shape[0] * data.shape[1] + 1  # +1 for the rest position
+        if (not single_line and maxlines < data.shape[0] and
+            nwscans * osr <= self._max_ai_scans and nwscans <= self._max_ao_scans):
+            # The whole frame fits in one command => avoid the dead time between
+            # each command by streaming the data
+            self._write_read_2d_stream(wchannels, wranges, rchannels, rranges,
+                                       period, margin, osr, maxlines, data,
+                                       buf, adtype, on_lines)
+            return buf
+
+        logging.debug("Reading %d lines at a time: %d samples/read every %g µs",
+                      maxlines, maxlines * data.shape[1] * osr * len(rchannels),
+                      period * 1e6)
+
         # read "maxlines" lines at a time
         x = 0
         while x < data.shape[0]:
@@ -1044,9 +1083,51 @@ class SEMComedi(model.HwComponent):
                                         rbuf[..., i], b[x:x + lines, ...], adtype)
 
             x += lines
+            if on_lines and not islast:
+                on_lines(buf, x)
 
         return buf
 
+    def _write_read_2d_stream(self, wchannels, wranges, rchannels, rranges,
+                              period, margin, osr, maxlines, data, buf, adtype,
+                              on_lines=None):
+        """
+        Implementation of write_read_2d_data_raw by writing and reading the
+          whole frame in one command. The input data is decimated n lines at a
+          time, while the rest of the frame is being acquired.
+        maxlines (int): maximum number of lines to decimate at once
+        buf (list of 2D numpy.array): the output buffer for each channel
+        adtype (dtype): intermediary type to use for the accumulator
+        """
+        nrchans = len(rchannels)
+        rshape = buf[0].shape
+        linelen = data.shape[1] * osr * nrchans  # number of values read per line
+        linesz = linelen * self._reader.dtype.itemsize
+        lines = max(1, min(maxlines, STREAM_BLOCK_SIZE // linesz))
+        logging.debug("Reading all the %d lines in one command, processed by "
+                      "%d lines: %d samples every %g µs",
+                      data.shape[0], lines, data.shape[0] * linelen, period * 1e6)
+
+        def on_data(offset, rdata):
+            # The blocks always start at the beginning of a line
+            x = offset // linelen
+            # Drop the data read during rest positioning
+            n = min(rdata.size // linelen, rshape[0] - x)
+            if n <= 0:
+                return
+            rdata = rdata[:n * linelen].reshape(-1, nrchans)
+            for i, b in enumerate(buf):
+                self._scan_raw_to_lines(rshape, margin, osr, x,
+                                        rdata[:, i], b[x:x + n, ...], adtype)
+            if on_lines and x + n < rshape[0]:
+                on_lines(buf, x + n)
+
+        wdata = data.reshape(-1, data.shape[2])  # flatten X/Y
+        self._write_read_raw_one_cmd(wchannels, wranges, rchannels,
+                                     rranges, period, osr, wdata, margin,
+                                     rest=self._scanner.fast_park,
+                                     block=lines * linelen, on_data=on_data)
+
     @staticmethod
     def _scan_raw_to_lines(shape, margin, osr, x, data, oarray, adtype):
         """
@@ -1073,7 +1154,7 @@ class SEMComedi(model.HwComponent):
             umath.true_divide(acc, osr, out=oarray, casting='unsafe', subok=False)
 
     def _write_read_2d_pixel(self, wchannels, wranges, rchannels, rranges,
-                             period, margin, osr, dpr, data):
+                             period, margin, osr, dpr, data, on_lines=None):
         """
         Implementation of write_read_2d_data_raw by reading the input data one
           pixel at a time.
@@ -1107,10 +1188,13 @@ class SEMComedi(model.HwComponent):
             for i, b in enumerate(buf):
                 self._scan_raw_to_pixel(rshape, margin, osr, dpr, x, y,
                                         rbuf[..., i], b, adtype)
+
+            if on_lines and y == data.shape[1] - 1 and x < data.shape[0] - 1:
+                on_lines(buf, x + 1)
         return buf
 
     def _write_read_2d_subpixel(self, wchannels, wranges, rchannels, rranges,
-                                period, margin, osr, dpr, data):
+                                period, margin, osr, dpr, data, on_lines=None):
         """
         Implementation of write_read_2d_data_raw by reading the input data one
          part of a pixel at a time.
@@ -1150,6 +1234,9 @@ class SEMComedi(model.HwComponent):
                 self._scan_raw_to_pixel(rshape, margin, osr, dpr, x, y,
                                         px_rbuf[..., i], b, adtype)
 
+            if on_lines and y == data.shape[1] - 1 and x < data.shape[0] - 1:
+                on_lines(buf, x + 1)
+
         return buf
 
     @staticmethod
@@ -1170,7 +1257,8 @@ class SEMComedi(model.HwComponent):
         oarray[x, y - margin] = numpy.sum(data, dtype=adtype) / (osr * dpr)
 
     def _fake_write_read_raw_one_cmd(self, wchannels, wranges, rchannels, rranges,
-                                     period, osr, data, settling_samples, rest=False):
+                                     period, osr, data, settling_samples, rest=False,
+                                     block=None, on_data=None):
         """
         Imitates _write_read_raw_one_cmd() but works with the comedi_test driver,
           just read data.
@@ -1208,7 +1296,7 @@ class SEMComedi(model.HwComponent):
             self._writer.prepare(wbuf, expected_time)
 
             # prepare read buffer info
-            self._reader.prepare(nrscans * nrchans, expected_time)
+            self._reader.prepare(nrscans * nrchans, expected_time, block, on_data)
 
         # FIXME: some times, after many fine acquisitions, this command fails
         # with "ComediError: returned -1 -> (16) Device or resource busy"
@@ -1236,15 +1324,18 @@ class SEMComedi(model.HwComponent):
         logging.debug("Waiting %g s for the acquisition to finish", timeout)
         rbuf = self._reader.wait(timeout)
         self._writer.wait(0.1)
+        logging.debug("acquisition took %g s, init=%g s", time.time() - begin, start - begin)
+        if on_data is not None:
+            return None  # data already passed
         # reshape to 2D
         rbuf.shape = (nrscans, nrchans)
         if rest:
             rbuf = rbuf[:-osr, :] # remove data read during rest positioning
-        logging.debug("acquisition took %g s, init=%g s", time.time() - begin, start - begin)
         return rbuf
 
     def _write_read_raw_one_cmd(self, wchannels, wranges, rchannels, rranges,
-                                period, osr, data, settling_samples, rest=False):
+                                period, osr, data, settling_samples, rest=False,
+                                block=None, on_data=None):
         """
         write data on the given analog output channels and read synchronously
           on the given analog input channels in one command
@@ -1261,7 +1352,12 @@ class SEMComedi(model.HwComponent):
         settling_samples (int): number of first write samples used for the
           settling of the beam, and so don't need to trigger newPosition
         rest (boolean): if True, will add one more write to set to rest position
-        return (2D numpy.array with dtype=device type)
+        block (None or 0 < int): number of values to pass at once to on_data
+        on_data (None or callable (int, 1D numpy.array) -> None): if not None,
+          the raw data read is passed to this function, block per block, as
+          soon as it is read (see Reader.prepare()). In such case, nothing is
+          returned.
+        return (None or 2D numpy.array with dtype=device type)
             the raw data read (first dimension is data.shape[0] * osr) for each
             channel (as second dimension).
         raises:
@@ -1296,7 +1392,7 @@ class SEMComedi(model.HwComponent):
             self.setup_timed_command(self._ai_subdevice, rchannels, rranges,
                                      rperiod_ns, stop_arg=nrscans, aref=comedi.AREF_DIFF)
             # prepare to read
-            self._reader.prepare(nrscans * nrchans, expected_time)
+            self._reader.prepare(nrscans * nrchans, expected_time, block, on_data)
 
             # create a command for writing
             # HACK WARNING:
@@ -1350,6 +1446,8 @@ class SEMComedi(model.HwComponent):
         rbuf = self._reader.wait(timeout)
         if nwscans != 1:
             self._writer.wait() # writer is faster, so there should be no wait
+        if on_data is not None:
+            return None  # data already passed
         # reshape to 2D
         rbuf.shape = (nrscans, nrchans)
         if rest:
@@ -1406,19 +1504,16 @@ class SEMComedi(model.HwComponent):
         # Although, that means in practice that any dpr > 1 will cause uint64,
         # which is probably overkill
 
-        # allocate one buffer for the write data with duplication
-        # TODO: not needed if dpr == 1
-        ldata = numpy.empty((maxlines, wdata.shape[1], dpr, wdata.shape[2]), dtype=wdata.dtype)
-
         # read "maxlines" lines at a time
         x = 0
         while x < wdata.shape[0]:
             lines = min(wdata.shape[0] - x, maxlines)
             logging.debug("Going to read %d lines", lines)
-            # copy the right couple of lines in the buffer
-            for i in range(dpr):  # TODO: use numpy reshape to avoid the loop
-                ldata[:, :, i, :] = wdata[x:x + lines, :, :]
-            ldata = ldata.reshape(-1, wdata.shape[2])  # flatten X/Y
+            # duplicate each pixel dpr times, and flatten X/Y
+            ldata = wdata[x:x + lines, :, :]
+            if dpr > 1:
+                ldata = numpy.repeat(ldata, dpr, axis=1)
+            ldata = ldata.reshape(-1, wdata.shape[2])
             rbuf = self._write_count_raw_one_cmd(wchannels, wranges, counter,
                                                  period / dpr, ldata)
 
@@ -1793,9 +1888,19 @@ class SEMComedi(model.HwComponent):
         for dmdi, mdi in zip(dmd, md):
             mdi.update(dmdi)
 
+        # In case of long frames, send the lines already acquired to the
+        # detectors which have partial frames requested
+        pdets = [(i, d, md[i]) for i, d in enumerate(detectors) if d.partialData.active]
+        if pdets and scan.shape[0] * scan.shape[1] * period > 2 * driver.PARTIAL_FRAME_PERIOD:
+            on_lines = PartialFrameNotifier(pdets)
+        else:
+            on_lines = None
+
         # write and read the raw data
+        startt = time.time()
         rbuf = self.write_read_2d_data_raw(wchannels, wranges, rchannels,
-                            rranges, period, margin, osr, dpr, scan)
+                            rranges, period, margin, osr, dpr, scan, on_lines)
+        self._update_dead_time(time.time() - startt, scan.shape[0] * scan.shape[1] * period)
 
         # TODO: if fast_park, immediately go to rest position, and otherwise,
         # immediately go to initial position, to already position the beam for
@@ -1817,6 +1922,18 @@ class SEMComedi(model.HwComponent):
 
         return rdas
 
+    def _update_dead_time(self, duration, expected):
+        """
+        Records the time lost during the acquisition of a frame, compared to
+          the time the beam actually scanned.
+        duration (float): time it took to acquire the frame (in s)
+        expected (float): time of the scan (in s)
+        """
+        self._frame_dead_time = max(0, duration - expected)
+        logging.debug("Frame acquired in %g s, with %g s (%.1f %%) of dead time",
+                      duration, self._frame_dead_time,
+                      self._frame_dead_time / duration * 100)
+
     def _acquire_counting_detector(self, detectors):
         """
         Run the acquisition for one counting detector (and the other detectors
@@ -1871,8 +1988,10 @@ class SEMComedi(model.HwComponent):
             mdi.update(dmdi)
 
         # write and read the raw data
+        startt = time.time()
         rbuf = self.write_count_2d_data_raw(wchannels, wranges, counter,
                                             period, margin, dpr, scan)
+        self._update_dead_time(time.time() - startt, scan.shape[0] * scan.shape[1] * period)
 
         # Transform raw data + metadata into a 2D DataArray
         rdas = []
@@ -2062,14 +2181,24 @@ class Reader(Accesser):
         self.count = None
         self._lock = threading.Lock()
 
-    def prepare(self, count, duration):
+    def prepare(self, count, duration, block=None, on_data=None):
         """
         count: number of values to read
         duration: expected total duration it will take (in s)
+        block (None or 0 < int): number of values to read at once, if on_data
+          is provided
+        on_data (None or callable (int, 1D numpy.array) -> None): if not None,
+          the data is not kept, but passed block per block, as soon as it is
+          read, with the index of the first value of the block. It is called
+          from a separate thread, so that the next block is read meanwhile.
         """
         with self._lock:
             self.count = count
             self.duration = duration
+            self._block = block
+            self._on_data = on_data
+            self._nread = 0
+            self._nprocessed = 0
             self.cancelled = False
             if self.thread and self.thread.isAlive():
                 logging.warning("Preparing a new acquisition while previous one is not over")
@@ -2086,7 +2215,10 @@ class Reader(Accesser):
     def _thread(self):
         """To be called in a separate thread"""
         try:
-            self.buf = numpy.fromfile(self.file, dtype=self.dtype, count=self.count)
+            if self._on_data is None:
+                self.buf = numpy.fromfile(self.file, dtype=self.dtype, count=self.count)
+            else:
+                self._read_blocks()
             logging.debug("read took %g s", time.time() - self._begin)
             # Kernel 4.4+ requires to cancel reading (it's also possible to try
             # to read further and get a EOF, but if the device has extra data,
@@ -2098,9 +2230,51 @@ class Reader(Accesser):
         except:
             logging.exception("Unhandled error in reading thread")
 
+    def _read_blocks(self):
+        """
+        Reads the data block per block, and passes each block to _on_data from
+          a separate thread. That allows the kernel buffer to be drained
+          continuously, while the previous block is being processed.
+        """
+        # At most one block waiting, while another one is being processed
+        blocks = Queue.Queue(maxsize=1)
+        pthread = threading.Thread(name="SEMComedi reader processing",
+                                   target=self._process_blocks, args=(blocks,))
+        pthread.start()
+        try:
+            while self._nread < self.count and not self.cancelled:
+                n = min(self._block, self.count - self._nread)
+                data = numpy.fromfile(self.file, dtype=self.dtype, count=n)
+                blocks.put((self._nread, data))
+                self._nread += data.size
+                if data.size < n:
+                    break  # Most likely cancelled
+        finally:
+            blocks.put(None)
+            pthread.join()
+
+    def _process_blocks(self, blocks):
+        """
+        Passes the blocks to _on_data, until None is received
+        blocks (Queue of (int, numpy.array) or None): offset and data of each block
+        """
+        while True:
+            b = blocks.get()
+            if b is None:
+                return
+            offset, data = b
+            try:
+                self._on_data(offset, data)
+                self._nprocessed += data.size
+            except Exception:
+                # Keep reading the blocks, to not block the reader
+                logging.exception("Failed to process data block at %d", offset)
+
     def wait(self, timeout=None):
         """
         timeout (float): maximum number of seconds to wait for the read to finish
+        return (None or numpy.array): the data read, or None if the data was
+          passed to on_data.
         """
         timeout = timeout or self.duration
 
@@ -2116,6 +2290,12 @@ class Reader(Accesser):
             logging.warning("Reading thread is still running after %g s", timeout)
             self.cancel()
 
+        if self._on_data is not None:
+            if self._nprocessed != self.count:
+                raise IOError("Read only %d values from the %d expected" %
+                              (self._nprocessed, self.count))
+            return None
+
         # the result should be in self.buf
         if self.buf is None:
             raise IOError("Failed to read all the %d expected values" % self.count)
@@ -2258,10 +2438,13 @@ class MMapReader(Reader):
     def close(self):
         Reader.close(self)
 
-    def prepare(self, count, duration):
+    def prepare(self, count, duration, block=None, on_data=None):
+        if on_data is not None:
+            raise NotImplementedError("MMapReader doesn't support reading by block")
         with self._lock:
             self.count = count
             self.duration = duration
+            self._on_data = None
             self.buf = numpy.empty(count, dtype=self.dtype)
             self.remaining = self.buf.nbytes
             self.buf_offset = 0
@@ -3279,6 +3462,11 @@ class AnalogDetector(model.Detector):
         # Special event to request software unblocking on the scan
         self.softwareTrigger = model.Event()
 
+        # When subscribed, for long frames, the data is also sent on it by
+        # blocks of lines as soon as they are acquired. The complete frame is
+        # only sent on .data. The partial frames have MD_FRAME_POS and MD_FRAME_RES.
+        self.partialData = driver.PartialDataFlow()
+
         self._metadata[model.MD_DET_TYPE] = model.MD_DT_NORMAL
 
     @roattribute
@@ -3593,6 +3781,43 @@ class FakeCountingDetector(CountingDetector):
     def setup_count_command(self):
         pass  # nothing to do
 
+class PartialFrameNotifier(object):
+    """
+    Sends the lines acquired so far to the detectors, as partial frames on
+    their .partialData, at most every PARTIAL_FRAME_PERIOD. To be passed as
+    on_lines to write_read_2d_data_raw().
+    """
+    def __init__(self, detectors):
+        """
+        detectors (list of (int, AnalogDetector, dict)): for each detector to
+          notify, the index of its buffer, the detector and the metadata of the
+          complete frame.
+        """
+        self._detectors = detectors
+        self._sent_lines = 0  # number of lines already sent
+        self._last_send = time.time()
+
+    def __call__(self, bufs, nlines):
+        now = time.time()
+        if now < self._last_send + driver.PARTIAL_FRAME_PERIOD or nlines <= self._sent_lines:
+            return
+
+        y = self._sent_lines
+        for i, d, md in self._detectors:
+            b = bufs[i]
+            # These lines are complete, so they will not be modified anymore
+            da = b[y:nlines]
+            if d.inverted:
+                da = (d.shape[0] - 1) - da
+            pmd = md.copy()
+            pmd[model.MD_FRAME_POS] = (0, y)
+            pmd[model.MD_FRAME_RES] = b.shape[::-1]
+            d.partialData.notify(model.DataArray(da, pmd))
+
+        self._sent_lines = nlines
+        self._last_send = now
+
+
 class SEMDataFlow(model.DataFlow):
     def __init__(self, detector, sem):
         """
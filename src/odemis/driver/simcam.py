@@ -28,6 +28,7 @@ from odemis import model, util, dataio
 from odemis.model import isasync, oneway
 import os
 from scipy import ndimage
+import threading
 import time
 
 
@@ -37,13 +38,19 @@ class Camera(model.DigitalCamera):
     given at initialisation.
     '''
 
-    def __init__(self, name, role, image, children=None, daemon=None, **kwargs):
+    def __init__(self, name, role, image, children=None, frame_bank=None,
+                 daemon=None, **kwargs):
         '''
         children (dict string->kwargs): parameters setting for the children.
             The only possible child is "focus".
             They will be provided back in the .children VA
         image (str or None): path to a file to use as fake image (relative to
          the directory of this class)
+        frame_bank (None or 0<int): if set, runs in "high-rate" mode: this
+          number of frames are pre-rendered (with noise), and sent in loop at
+          exactly one frame every exposureTime, which can then be as short as
+          10µs. The frames have MD_FRAME_NUM set. Useful to test the load on
+          the software.
         '''
         # TODO: support transpose? If not, warn that it's not accepted
         # fake image setup
@@ -100,7 +107,15 @@ class Camera(model.DigitalCamera):
                                               setter=self._setTranslation)
 
         exp = self._img.metadata.get(model.MD_EXP_TIME, 0.1) # s
-        self.exposureTime = model.FloatContinuous(exp, (1e-3, 1e3), unit="s")
+        if frame_bank:
+            self._frame_bank = FrameBank(frame_bank, self._render_bank_frame,
+                                         self._get_bank_settings,
+                                         lambda: self.exposureTime.value)
+            min_exp = 10e-6
+        else:
+            self._frame_bank = None
+            min_exp = 1e-3
+        self.exposureTime = model.FloatContinuous(exp, (min_exp, 1e3), unit="s")
         # Some code care about the readout rate to know how long an acquisition will take
         self.readoutRate = model.FloatVA(1e9, unit="Hz", readonly=True)
 
@@ -189,9 +204,14 @@ class Camera(model.DigitalCamera):
         if self._generator is not None:
             logging.warning("Generator already running")
             return
-        self._generator = util.RepeatingTimer(self.exposureTime.value,
-                                              self._generate,
-                                              "SimCam image generator")
+        if self._frame_bank:
+            self._generator = BankGenerator(self._frame_bank, self.data.notify,
+                                            self.data._waitSync,
+                                            "SimCam high-rate generator")
+        else:
+            self._generator = util.RepeatingTimer(self.exposureTime.value,
+                                                  self._generate,
+                                                  "SimCam image generator")
         self._generator.start()
 
     def _stop_generate(self):
@@ -199,6 +219,33 @@ class Camera(model.DigitalCamera):
             self._generator.cancel()
             self._generator = None
 
+    def _get_bank_settings(self):
+        """
+        returns (tuple): all the settings which affect the frames of the bank
+        """
+        focus = self._focus.position.value["z"] if self._focus else None
+        return (self.binning.value, self.resolution.value,
+                self.translation.value, self.exposureTime.value, focus)
+
+    def _render_bank_frame(self, i):
+        """
+        Renders one frame of the bank
+        i (int): index of the frame in the bank
+        returns (DataArray): the frame, with noise and metadata
+        """
+        if i == 0:
+            # Same as _generate(), but done only once for the whole bank
+            img = self._simulate()
+            metadata = img.metadata.copy()
+            metadata.update(self._metadata)
+            metadata[model.MD_EXP_TIME] = self.exposureTime.value
+            if self._focus:
+                pos = self._focus.position.value['z']
+                dist = abs(pos - self._focus._good_focus) * 1e4
+                img = ndimage.gaussian_filter(img, sigma=dist)
+            self._bank_base = model.DataArray(img, metadata)
+        return add_noise(self._bank_base, 16)
+
     def _generate(self):
         """
         Generates the fake output based on the translation, resolution and
@@ -257,6 +304,153 @@ class Camera(model.DigitalCamera):
         return sim_img
 
 
+class FrameBank(object):
+    """
+    Pre-renders a set of frames, and sends them in loop, at a precise rate.
+    This allows to generate data at a much higher rate than when simulating
+    each frame separately, to test the load on the data transport and the
+    consumers. Each frame sent has MD_FRAME_NUM and MD_ACQ_DATE set. If the
+    frames cannot be sent on time, they are first sent late, as from a
+    hardware buffer. When the buffer is full, the late frames are dropped,
+    which is visible as a gap in the frame numbers.
+    Note: the frames sent share their data with the bank, so they should not
+    be modified.
+    """
+
+    def __init__(self, size, render, get_settings, get_period, buffer_size=10):
+        """
+        size (0<int): number of frames to pre-render
+        render (callable: int -> DataArray): called with the index of the frame
+          in the bank, returns the frame. The frames should differ (eg, by noise).
+        get_settings (callable: None -> object): returns the current settings.
+          When they are different (!=) from the ones used for rendering the
+          bank, the frames are rendered again.
+        get_period (callable: None -> float): returns the current time (in s)
+          between two frames
+        buffer_size (0<=int): number of frames which can be late before being
+          dropped
+        """
+        self.size = size
+        self._render = render
+        self._get_settings = get_settings
+        self._get_period = get_period
+        self._buffer_size = buffer_size
+        self._settings = None
+        self._frames = []
+
+    def _update_frames(self):
+        """
+        Renders the frames again if the settings have changed
+        return (bool): True if the frames were rendered again
+        """
+        settings = self._get_settings()
+        if self._frames and settings == self._settings:
+            return False
+        startt = time.time()
+        self._settings = settings
+        self._frames = [self._render(i) for i in range(self.size)]
+        logging.debug("Rendered %d frames of shape %s in %g s", self.size,
+                      self._frames[0].shape, time.time() - startt)
+        return True
+
+    def generate(self, callback, must_stop, wait_sync=None):
+        """
+        Sends the frames until must_stop is set. Blocks until then.
+        callback (callable: DataArray -> None): called for each frame
+        must_stop (threading.Event): set when the generation must stop
+        wait_sync (None or callable: None -> bool): if not None, called before
+          each frame, and blocks until the frame can be started. It returns
+          True if it waited for a synchronisation event.
+        """
+        seqn = 0
+        ndropped = 0
+        nxt = None  # time at which the next frame should be sent
+        startt = time.time()
+        try:
+            while not must_stop.is_set():
+                period = self._get_period()
+                if self._update_frames() or nxt is None:
+                    # Rendering takes time, so restart the clock
+                    nxt = time.time() + period
+
+                if wait_sync and wait_sync():
+                    if must_stop.is_set():
+                        break
+                    # The frame starts when the event is received
+                    nxt = max(nxt, time.time() + period)
+
+                now = time.time()
+                if now < nxt:
+                    # Event.wait() is not precise, so only use it to wait for
+                    # most of long periods, and sleep() for the rest.
+                    if nxt - now > 0.1 and must_stop.wait(nxt - now - 0.05):
+                        break
+                    time.sleep(max(0, nxt - time.time()))
+                    if must_stop.is_set():
+                        break
+                elif now - nxt > (self._buffer_size + 1) * period:
+                    # Too late for more frames than the buffer => drop them
+                    late = int((now - nxt) // period) - self._buffer_size
+                    seqn += late
+                    ndropped += late
+                    nxt += late * period
+
+                frame = self._frames[seqn % self.size]
+                md = frame.metadata.copy()
+                md[model.MD_FRAME_NUM] = seqn
+                md[model.MD_ACQ_DATE] = nxt - period  # beginning of the frame
+                callback(model.DataArray(frame, md))
+                seqn += 1
+                nxt += period
+        finally:
+            dur = time.time() - startt
+            logging.debug("Sent %d frames in %g s (%g fps), %d dropped",
+                          seqn - ndropped, dur, (seqn - ndropped) / max(dur, 1e-9),
+                          ndropped)
+
+
+def add_noise(img, amplitude):
+    """
+    Adds some uniform noise to an image
+    img (DataArray of int): the image
+    amplitude (0<int): maximum value of the noise
+    returns (DataArray): a new image with the same dtype and metadata
+    """
+    noise = numpy.random.randint(0, amplitude + 1, img.shape)
+    nimg = img.astype(numpy.int64) + noise
+    idt = numpy.iinfo(img.dtype)
+    numpy.clip(nimg, idt.min, idt.max, out=nimg)
+    return model.DataArray(nimg.astype(img.dtype), img.metadata.copy())
+
+
+class BankGenerator(threading.Thread):
+    """
+    Thread sending the frames of a FrameBank, until cancel() is called.
+    (Same interface as util.RepeatingTimer)
+    """
+    def __init__(self, bank, callback, wait_sync=None, name="BankGeneratorThread"):
+        """
+        bank (FrameBank): the frames to send
+        callback (callable: DataArray -> None): called for each frame
+        wait_sync (None or callable): see FrameBank.generate()
+        """
+        threading.Thread.__init__(self, name=name)
+        self.daemon = True
+        self._bank = bank
+        self._callback = callback
+        self._wait_sync = wait_sync
+        self._must_stop = threading.Event()
+
+    def run(self):
+        try:
+            self._bank.generate(self._callback, self._must_stop, self._wait_sync)
+        except Exception:
+            logging.exception("Failure while generating frames in '%s'", self.name)
+
+    def cancel(self):
+        self._must_stop.set()
+
+
 class SimpleDataFlow(model.DataFlow):
     def __init__(self, ccd):
         super(SimpleDataFlow, self).__init__()
@@ -301,9 +495,12 @@ class SimpleDataFlow(model.DataFlow):
         Block until the Event on which the dataflow is synchronised has been
           received. If the DataFlow is not synchronised on any event, this
           method immediatly returns
+        returns (bool): True if it waited for an event
         """
         if self._sync_event:
             self._evtq.get()
+            return True
+        return False
 
 
 class CamFocus(model.Actuator):
@@ -26,8 +26,10 @@ import logging
 import math
 import numpy
 from odemis import model, util, dataio
+from odemis.driver import simcam
 from odemis.model import isasync
 from odemis.util import img
+from odemis.util.driver import PartialDataFlow, PARTIAL_FRAME_PERIOD
 import os
 import random
 from scipy import ndimage
@@ -45,7 +47,7 @@ class SimSEM(model.HwComponent):
     '''
 
     def __init__(self, name, role, children, image=None, drift_period=None,
-                 daemon=None, **kwargs):
+                 frame_bank=None, daemon=None, **kwargs):
         '''
         children (dict string->kwargs): parameters setting for the children.
             Known children are "scanner", "detector0", and the optional "focus"
@@ -53,6 +55,11 @@ class SimSEM(model.HwComponent):
         image (str or None): path to a file to use as fake image (relative to
          the directory of this class)
         drift_period (None or 0<float): time period for drift updating in seconds
+        frame_bank (None or 0<int): if set, runs in "high-rate" mode: for each
+          detector, this number of frames are pre-rendered (with noise), and
+          sent in loop at exactly one frame every dwellTime * resolution, with
+          a dwellTime which can then be as short as 1ns. The frames have
+          MD_FRAME_NUM set. Useful to test the load on the software.
         Raise an exception if the device cannot be opened
         '''
         # fake image setup
@@ -66,6 +73,7 @@ class SimSEM(model.HwComponent):
         self.fake_img = img.ensure2DImage(converter.read_data(image)[0])
 
         self._drift_period = drift_period
+        self._frame_bank_size = frame_bank
 
         # we will fill the set of children with Components later in ._children
         model.HwComponent.__init__(self, name, role, daemon=daemon, **kwargs)
@@ -197,7 +205,9 @@ class Scanner(model.Emitter):
         self.rotation = model.FloatContinuous(0, [0, 2 * math.pi], unit="rad",
                                               readonly=True)
 
-        self.dwellTime = model.FloatContinuous(1e-06, (1e-06, 1000), unit="s")
+        # In high-rate mode, allow very short frames
+        min_dt = 1e-9 if parent._frame_bank_size else 1e-06
+        self.dwellTime = model.FloatContinuous(1e-06, (min_dt, 1000), unit="s")
 
         # VAs to control the ebeam, purely fake
         self.probeCurrent = model.FloatEnumerated(1.3e-9,
@@ -365,6 +375,19 @@ class Detector(model.Detector):
         if parent._drift_period:
             self._update_drift_timer.start()
 
+        # When subscribed, for long frames, the data is also sent on it by
+        # blocks of lines as soon as they are "scanned". The complete frame is
+        # only sent on .data. The partial frames have MD_FRAME_POS and MD_FRAME_RES.
+        self.partialData = PartialDataFlow()
+
+        if parent._frame_bank_size:
+            self._frame_bank = simcam.FrameBank(parent._frame_bank_size,
+                                                self._render_bank_frame,
+                                                self._get_bank_settings,
+                                                self._get_frame_duration)
+        else:
+            self._frame_bank = None
+
         self._metadata[model.MD_DET_TYPE] = model.MD_DT_NORMAL
 
     def terminate(self):
@@ -487,6 +510,38 @@ class Detector(model.Detector):
             metadata[model.MD_EBEAM_VOLTAGE] = scanner.accelVoltage.value
             return model.DataArray(sim_img, metadata)
 
+    def _get_frame_duration(self):
+        """
+        returns (float): time (in s) to scan a complete frame
+        """
+        scanner = self.parent._scanner
+        return numpy.prod(scanner.resolution.value) * scanner.dwellTime.value
+
+    def _get_bank_settings(self):
+        """
+        returns (tuple): all the settings which affect the frames of the bank
+        """
+        # Note: the drift is not taken into account, as it changes very often.
+        # It's only updated when the frames are rendered again.
+        scanner = self.parent._scanner
+        focus = self.parent._focus
+        return (scanner.translation.value, scanner.scale.value,
+                scanner.resolution.value, scanner.shift.value,
+                scanner.horizontalFoV.value, scanner.dwellTime.value,
+                scanner.probeCurrent.value, scanner.accelVoltage.value,
+                self.bpp.value,
+                focus.position.value["z"] if focus else None)
+
+    def _render_bank_frame(self, i):
+        """
+        Renders one frame of the bank
+        i (int): index of the frame in the bank
+        returns (DataArray): the frame, with noise and metadata
+        """
+        if i == 0:
+            self._bank_base = self._simulate_image()
+        return simcam.add_noise(self._bank_base, 16)
+
     def _acquire_thread(self, callback):
         """
         Thread that simulates the SEM acquisition. It calculates and updates the
@@ -495,10 +550,15 @@ class Detector(model.Detector):
         the Dataflow.
         """
         try:
+            if self._frame_bank:
+                # Note: partial frames are not supported in high-rate mode
+                self._frame_bank.generate(callback, self._acquisition_must_stop)
             while not self._acquisition_must_stop.is_set():
-                dwelltime = self.parent._scanner.dwellTime.value
-                resolution = self.parent._scanner.resolution.value
-                duration = numpy.prod(resolution) * dwelltime
+                duration = self._get_frame_duration()
+                if self.partialData.active and duration > 2 * PARTIAL_FRAME_PERIOD:
+                    if self._acquire_partial_frames(callback, duration):
+                        break
+                    continue
                 if self._acquisition_must_stop.wait(duration):
                     break
                 callback(self._simulate_image())
@@ -508,6 +568,34 @@ class Detector(model.Detector):
             logging.debug("Acquisition thread closed")
             self._acquisition_must_stop.clear()
 
+    def _acquire_partial_frames(self, callback, duration):
+        """
+        Simulates the acquisition of one frame, sending the lines on
+        .partialData as soon as they are "scanned", and then the complete frame.
+        callback (callable): function to call with the complete frame
+        duration (float): time to acquire the complete frame (in s)
+        return (bool): True if the acquisition was requested to stop
+        """
+        # The settings at the beginning of the frame are used for the whole frame
+        sim_img = self._simulate_image()
+        res = sim_img.shape[::-1]
+        line_dur = duration / res[1]
+        nlines = max(1, int(math.ceil(PARTIAL_FRAME_PERIOD / line_dur)))
+        for y in range(0, res[1], nlines):
+            ey = min(y + nlines, res[1])
+            if self._acquisition_must_stop.wait(line_dur * (ey - y)):
+                return True
+            if ey == res[1]:
+                break  # The last block is sent as the complete frame
+
+            md = sim_img.metadata.copy()
+            md[model.MD_FRAME_POS] = (0, y)
+            md[model.MD_FRAME_RES] = res
+            self.partialData.notify(model.DataArray(sim_img[y:ey], md))
+
+        callback(sim_img)
+        return False
+
 
 class SEMDataFlow(model.DataFlow):
     """
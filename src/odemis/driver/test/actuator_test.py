@@ -64,6 +64,47 @@ class MultiplexTest(unittest.TestCase, simulated_test.ActuatorTest):
         self.child2.speed.value = sc2
         self.assertEqual(self.dev.speed.value["y"], 2)
 
+    def test_parallel_moves(self):
+        """
+        Moves on different children should not wait for each other, but the
+        ones on the same child should stay in order.
+        """
+        self.dev.speed.value = {"x": 0.01, "y": 1}
+        orig_pos = dict(self.dev.position.value)
+        fx1 = self.dev.moveRel({"x": 0.005})  # 0.5 s
+        fx2 = self.dev.moveAbs({"x": orig_pos["x"] + 0.001})  # must be after fx1
+        fy = self.dev.moveRel({"y": 0.001})  # ~1 ms
+        fy.result()
+        self.assertFalse(fx1.done())
+        fx2.result()
+        self.assertTrue(fx1.done())
+        self.assertAlmostEqual(self.dev.position.value["x"], orig_pos["x"] + 0.001)
+
+        stats = self.dev.getSchedulingStatistics()
+        self.assertEqual(stats["moves"], 3)
+        self.assertEqual(stats["queued"], 0)
+        self.assertGreaterEqual(stats["max_queued"], 1)
+        self.assertGreater(stats["wait_max"], 0.3)
+
+    def test_update_coalesce(self):
+        """
+        Consecutive update moves should be merged while waiting to be executed
+        """
+        self.dev.speed.value = {"x": 0.01, "y": 1}
+        orig_pos = dict(self.dev.position.value)
+        f0 = self.dev.moveRel({"x": 0.003})  # 0.3 s, the next moves wait for it
+        fs = [self.dev.moveRel({"x": 0.001}, update=True) for i in range(5)]
+        fy = self.dev.moveRel({"y": 0.001}, update=True)
+        fy.result()
+        for f in fs:
+            f.result()
+        self.assertTrue(f0.done())
+        self.assertAlmostEqual(self.dev.position.value["x"], orig_pos["x"] + 0.008)
+
+        stats = self.dev.getSchedulingStatistics()
+        self.assertEqual(stats["moves"], 3)
+        self.assertEqual(stats["coalesced"], 4)
+
 
 class MultiplexOneTest(unittest.TestCase, simulated_test.ActuatorTest):
 
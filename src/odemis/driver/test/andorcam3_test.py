@@ -24,6 +24,8 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 from __future__ import division
 
 import logging
+import numpy
+from odemis import model
 from odemis.driver import andorcam3
 import unittest
 from unittest.case import skip
@@ -59,6 +61,51 @@ class TestSynchronized(VirtualTestSynchronized, unittest.TestCase):
     camera_type = CLASS
     camera_kwargs = KWARGS
 
+class TestBufferPool(unittest.TestCase):
+    """
+    Test the BufferPool (doesn't need a camera)
+    """
+
+    def test_reuse(self):
+        pool = andorcam3.BufferPool(1001, max_buffers=4)
+        b1 = pool.get()
+        self.assertGreaterEqual(b1.nbytes, 1001)
+        self.assertEqual(b1.ctypes.data % 8, 0)
+
+        # Still in use => new buffer
+        b2 = pool.get()
+        self.assertIsNot(b1, b2)
+
+        # A view (DataArray) on the buffer keeps it in use
+        addr1 = b1.ctypes.data
+        da = model.DataArray(b1.view(numpy.uint16)[:500].reshape(20, 25)[:, :20])
+        del b1
+        b3 = pool.get()
+        self.assertNotEqual(b3.ctypes.data, addr1)
+        self.assertEqual(pool.allocated, 3)
+
+        # Once not used anymore, the buffer is reused
+        del da
+        b4 = pool.get()
+        self.assertEqual(b4.ctypes.data, addr1)
+        self.assertEqual(pool.reused, 1)
+        self.assertEqual(len(pool), 3)
+
+    def test_max_buffers(self):
+        pool = andorcam3.BufferPool(100, max_buffers=4)
+        bufs = [pool.get() for i in range(10)]
+        self.assertEqual(len(pool), 4)
+        self.assertEqual(pool.allocated, 10)
+        # All are still valid
+        for b in bufs:
+            b[:] = 1
+
+        del bufs
+        b = pool.get()
+        self.assertEqual(pool.reused, 1)
+        self.assertEqual(len(pool), 4)
+
+
 # Notes on testing the reconnection (which is pretty impossible to do non-manually):
 # * Test both cable disconnect/reconnect and turning off/on
 # * Test the different scenarios:
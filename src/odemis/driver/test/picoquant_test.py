@@ -22,6 +22,7 @@ from __future__ import division
 
 import copy
 import logging
+import numpy
 from odemis import model
 from odemis.driver import picoquant
 import os
@@ -160,5 +161,110 @@ class TestPH300(unittest.TestCase):
         self._cnt += 1
         self._lastdata = data
 
+
+class TestTTTRDecoding(unittest.TestCase):
+    """
+    Tests the decoding of the time-tagged records (generated by the simulator)
+    """
+
+    def _generate(self, mode, dur, count=picoquant.TTREADMAX):
+        dll = picoquant.FakePHDLL()
+        dll.PH_Initialize(0, mode)
+        dll.PH_StartMeas(0, 100000)
+        dll._tttr_last -= dur  # Pretend it started earlier
+        recs = dll._generate_records(count)
+        dll.PH_StopMeas(0)
+        return recs
+
+    def test_t3(self):
+        recs = self._generate(picoquant.MODE_T3, 0.5)
+        chan, dtime, sync, sync_offset = picoquant.decodeT3Records(recs)
+        self.assertGreater(chan.size, 0)
+        self.assertLess(chan.size, recs.size)  # Some overflow records
+        self.assertTrue(numpy.all(chan == 0))
+        self.assertTrue(numpy.all(dtime < picoquant.T3HISTCHAN))
+        self.assertTrue(numpy.all(numpy.diff(sync) >= 0))
+        self.assertGreaterEqual(sync_offset, picoquant.T3WRAPAROUND)
+
+        # Decoding in two parts should give the same result
+        chan1, dtime1, sync1, so1 = picoquant.decodeT3Records(recs[:1000])
+        chan2, dtime2, sync2, so2 = picoquant.decodeT3Records(recs[1000:], so1)
+        numpy.testing.assert_array_equal(numpy.concatenate([sync1, sync2]), sync)
+        numpy.testing.assert_array_equal(numpy.concatenate([dtime1, dtime2]), dtime)
+        self.assertEqual(so2, sync_offset)
+
+    def test_t2(self):
+        recs = self._generate(picoquant.MODE_T2, 0.2)
+        chan, ttime, time_offset = picoquant.decodeT2Records(recs)
+        self.assertGreater(chan.size, 0)
+        self.assertTrue(numpy.all(chan == 1))
+        self.assertTrue(numpy.all(numpy.diff(ttime) >= 0))
+        # ~0.2 s, in base resolution units
+        self.assertAlmostEqual(ttime[-1] * 4e-12, 0.2, places=2)
+
+    def test_decode_speed(self):
+        """
+        Report the number of records decoded per second
+        """
+        recs = self._generate(picoquant.MODE_T3, 40, 4 * 10 ** 6)
+        startt = time.time()
+        picoquant.decodeT3Records(recs)
+        dur = time.time() - startt
+        logging.info("Decoded %d T3 records in %g s = %g Mrec/s",
+                     recs.size, dur, recs.size / dur / 1e6)
+        # The FIFO can deliver ~10 Mrec/s, so decoding must be faster
+        self.assertGreater(recs.size / dur, 10e6)
+
+
+class TestPH300TTTR(unittest.TestCase):
+    """
+    Tests the T3 mode (only with the simulator)
+    """
+    @classmethod
+    def setUpClass(cls):
+        sim_config = copy.deepcopy(CONFIG_PH)
+        sim_config["device"] = "fake"
+        sim_config["tttr"] = True
+        cls.dev = picoquant.PH300(**sim_config)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.dev.terminate()
+
+    def test_acquire_sub(self):
+        """
+        Check the histograms are sent continuously, without dead time
+        """
+        dt = 0.1
+        self.dev.dwellTime.value = dt
+        exp_shape = self.dev.shape[-2::-1]
+
+        self._data = []
+        self.dev.data.subscribe(self._on_det)
+        time.sleep(2)
+        self.dev.data.unsubscribe(self._on_det)
+        self.assertGreater(len(self._data), 10)
+        prev_end = None
+        for d in self._data:
+            self.assertEqual(d.shape, exp_shape)
+            self.assertGreater(d.sum(), 0)
+            md = d.metadata
+            self.assertAlmostEqual(md[model.MD_DWELL_TIME], dt)
+            if prev_end is not None:
+                self.assertAlmostEqual(md[model.MD_ACQ_DATE], prev_end, delta=1e-6)
+            prev_end = md[model.MD_ACQ_DATE] + md[model.MD_DWELL_TIME]
+
+    def _on_det(self, df, data):
+        self._data.append(data)
+
+    def test_acquire_get(self):
+        dt = 0.05
+        self.dev.dwellTime.value = dt
+        for i in range(3):
+            data = self.dev.data.get()
+            self.assertEqual(data.shape, self.dev.shape[-2::-1])
+            self.assertAlmostEqual(data.metadata[model.MD_DWELL_TIME], dt)
+
+
 if __name__ == "__main__":
     unittest.main()
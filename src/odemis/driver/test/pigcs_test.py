@@ -159,6 +159,66 @@ class TestFakeCL(TestController):
         self.config_ctrl = CONFIG_CTRL_CL
 
 
+#@skip("faster")
+class TestBusAccesser(unittest.TestCase):
+    """
+    Test the pipelined commands on the daisy chain simulator
+    """
+    def setUp(self):
+        self.ser = pigcs.FakeBus._openSerialPort(PORT, _addresses={1: False, 2: True})
+        self.accesser = pigcs.SerialBusAccesser(self.ser)
+
+    def tearDown(self):
+        self.accesser.terminate()
+
+    def test_pipelined(self):
+        queries = [(1, "*IDN?\n"), (2, "ERR?\n"), (1, "SAI?\n"),
+                   (2, "HLP?\n"), (1, "CSV?\n"), (2, "POS? 1\n")]
+        ans = self.accesser.sendQueryCommands(queries)
+        self.assertEqual(len(ans), len(queries))
+        self.assertIn("Physik Instrumente", ans[0])
+        self.assertEqual(ans[1], "0")
+        self.assertEqual(ans[2], "1")
+        self.assertIsInstance(ans[3], list)  # multi-line
+        self.assertEqual(ans[4], "2.0")
+
+        # Should be the same as one at a time
+        for (addr, com), a in zip(queries, ans):
+            self.assertEqual(self.accesser.sendQueryCommand(addr, com), a)
+
+        # Multiple commands to the same controller
+        ans = self.accesser.sendQueryCommand(1, ["ERR?\n", "CSV?\n"])
+        self.assertEqual(ans, ["0", "2.0"])
+
+        stats = self.accesser.getLatencyStatistics()
+        self.assertEqual(stats["*IDN?"].count, 2)
+        self.assertEqual(stats["ERR?"].count, 3)
+        self.assertEqual(sum(stats["ERR?"].histogram), 3)
+        self.assertGreater(stats["HLP?"].mean, 0)
+
+    def test_speed(self):
+        """
+        Compare the time to read the status of the two controllers one at a
+        time or pipelined
+        """
+        queries = [(1, "ERR?\n"), (2, "ERR?\n"), (1, "SAI?\n"), (2, "SAI?\n")] * 5
+
+        startt = time.time()
+        for addr, com in queries:
+            self.accesser.sendQueryCommand(addr, com)
+        dur_seq = time.time() - startt
+
+        startt = time.time()
+        self.accesser.sendQueryCommands(queries)
+        dur_pip = time.time() - startt
+
+        logging.info("%d queries took %g s sequentially, and %g s pipelined",
+                     len(queries), dur_seq, dur_pip)
+        for name, st in self.accesser.getLatencyStatistics().items():
+            logging.info("Latency of %s: %s", name, st)
+        self.assertLess(dur_pip, dur_seq)
+
+
 #@skip("faster")
 class TestActuator(unittest.TestCase):
 
@@ -425,6 +485,34 @@ class TestActuator(unittest.TestCase):
         self.assertEqual(self.called, 11)
         stage.terminate()
 
+    def test_batched_status(self):
+        """
+        Check the status of the axes on different controllers is read with
+        queries sent all at once
+        """
+        stage = CLASS(**self.kwargs_two)
+        if not any(c.getMovingQueries(ch) is not None for c, ch in stage._axis_to_cc.values()):
+            stage.terminate()
+            self.skipTest("Controllers don't support batched status queries")
+
+        batched = []
+        orig_send = stage.accesser.sendQueryCommands
+
+        def record_send(queries):
+            batched.append(set(a for a, q in queries))
+            return orig_send(queries)
+
+        stage.accesser.sendQueryCommands = record_send
+        orig_pos = stage.position.value
+        stage.moveRel({"x": 10e-6, "y": -20e-6}).result()
+        stage.moveAbs(orig_pos).result()
+        stage.accesser.sendQueryCommands = orig_send
+
+        # At least once, all the controllers were queried together
+        addrs = set(c.address for c, ch in stage._axis_to_cc.values())
+        self.assertIn(addrs, batched)
+        stage.terminate()
+
 #    @skip("faster")
     def test_cancel(self):
         stage = CLASS(**self.kwargs)
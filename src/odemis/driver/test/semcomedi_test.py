@@ -21,6 +21,7 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 from __future__ import division
 from odemis import model
 from odemis.driver import semcomedi
+from odemis.util import driver
 import Pyro4
 import comedi
 import copy
@@ -542,6 +543,88 @@ class TestSEM(unittest.TestCase):
         time.sleep(0.1)
         self.assertEqual(self.events, numbert)
 
+#     @unittest.skip("simple")
+    def test_dead_time(self):
+        """
+        Check that a frame acquired in multiple parts doesn't have much more
+        dead time than in one command
+        """
+        self.scanner.dwellTime.value = 10e-6  # s
+        self.size = (1024, 512)
+        self.scanner.resolution.value = self.size
+        expected_duration = self.compute_expected_duration()
+
+        # Force reading a few lines at a time
+        max_bufsz = self.sem._max_bufsz
+        max_ai_scans = self.sem._max_ai_scans
+        try:
+            self.sem._max_bufsz = 256 * 2 ** 10  # a few dozens of lines
+            im = self.sed.data.get()
+            self.assertEqual(im.shape, self.size[::-1])
+            stream_dt = self.sem._frame_dead_time
+
+            # Command per block of lines
+            self.sem._max_ai_scans = 1
+            im = self.sed.data.get()
+            self.assertEqual(im.shape, self.size[::-1])
+            block_dt = self.sem._frame_dead_time
+        finally:
+            self.sem._max_bufsz = max_bufsz
+            self.sem._max_ai_scans = max_ai_scans
+
+        logging.info("Dead time for a frame of %g s: %g s streamed, %g s by blocks",
+                     expected_duration, stream_dt, block_dt)
+        self.assertLess(stream_dt, block_dt)
+
+#     @unittest.skip("simple")
+    def test_partial_frames(self):
+        """
+        Check the lines are received before the end of the frame
+        """
+        self.scanner.dwellTime.value = 20e-6  # s
+        self.size = (512, 512)
+        self.scanner.resolution.value = self.size
+        expected_duration = self.compute_expected_duration()  # ~5s
+        self.assertGreater(expected_duration, 2 * driver.PARTIAL_FRAME_PERIOD)
+
+        partials = []
+        frames = []
+        def receive_partial(df, da):
+            partials.append((time.time(), da))
+
+        def receive_frame(df, da):
+            frames.append((time.time(), da))
+            self.acq_done.set()
+
+        self.sed.partialData.subscribe(receive_partial)
+        try:
+            start = time.time()
+            self.sed.data.subscribe(receive_frame)
+            self.acq_done.wait(expected_duration * 1.5 + 2)
+            self.sed.data.unsubscribe(receive_frame)
+        finally:
+            self.sed.partialData.unsubscribe(receive_partial)
+
+        # The main dataflow only receives the complete frame
+        self.assertEqual(len(frames), 1)
+        tframe, im = frames[0]
+        self.assertEqual(im.shape, self.size[::-1])
+        self.assertNotIn(model.MD_FRAME_POS, im.metadata)
+        self.assertGreater(len(partials), 2)
+        # The first lines arrive well before the end of the frame
+        self.assertLess(partials[0][0] - start, expected_duration / 2)
+
+        # The partial frames follow each other and contain the same data as the frame
+        y = 0
+        for t, pim in partials:
+            self.assertLessEqual(t, tframe)
+            self.assertEqual(pim.metadata[model.MD_FRAME_RES], self.size)
+            self.assertEqual(pim.metadata[model.MD_FRAME_POS], (0, y))
+            self.assertEqual(pim.shape[1], self.size[0])
+            numpy.testing.assert_array_equal(pim, im[y:y + pim.shape[0]])
+            y += pim.shape[0]
+        self.assertLess(y, self.size[1])
+
     def onEvent(self):
         """
         Called by the SEM when a new position happens
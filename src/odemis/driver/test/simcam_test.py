@@ -302,6 +302,68 @@ class TestSimCam(unittest.TestCase):
         f.result()
         self.assertEqual(self.focus.position.value, pos)
 
+
+class TestSimCamHighRate(unittest.TestCase):
+    """
+    Test the "high-rate" mode, with pre-rendered frames
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.camera = CLASS(frame_bank=8, **KWARGS)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.camera.terminate()
+
+    def setUp(self):
+        size = self.camera.shape[:-1]
+        # If RGB, the images have the RGB dim at the end
+        if len(size) >= 3 and size[-1] in {3, 4}:
+            self.rgbshp = size[-1:]
+        else:
+            self.rgbshp = ()
+
+    def test_rate(self):
+        self.camera.resolution.value = (64, 64)
+        self.camera.exposureTime.value = 1e-3  # s => 1000 fps
+        frames = []
+        def receive(df, da):
+            frames.append((time.time(), da))
+
+        self.camera.data.subscribe(receive)
+        time.sleep(2)
+        self.camera.data.unsubscribe(receive)
+        time.sleep(0.1)
+
+        nums = [da.metadata[model.MD_FRAME_NUM] for t, da in frames]
+        dropped = nums[-1] + 1 - len(nums)
+        dates = [da.metadata[model.MD_ACQ_DATE] for t, da in frames]
+        latency = [t - d - 1e-3 for (t, da), d in zip(frames, dates)]
+        logging.info("Received %d frames (%d dropped), latency %g s (max %g s)",
+                     len(frames), dropped, sum(latency) / len(latency), max(latency))
+        self.assertEqual(nums[0], 0)
+        self.assertEqual(nums, sorted(set(nums)))
+        self.assertLess(dropped, len(frames) * 0.1)
+        # The frames are regularly timed
+        self.assertAlmostEqual((dates[-1] - dates[0]) / (nums[-1] - nums[0]), 1e-3, delta=1e-5)
+        self.assertGreater(len(frames), 1000)
+        self.assertEqual(frames[0][1].shape, (64, 64) + self.rgbshp)
+        # Not all the same frame
+        self.assertFalse((frames[0][1] == frames[1][1]).all())
+
+    def test_settings_change(self):
+        self.camera.resolution.value = (64, 32)
+        self.camera.exposureTime.value = 10e-3  # s
+        im = self.camera.data.get()
+        self.assertEqual(im.shape, (32, 64) + self.rgbshp)
+        self.assertEqual(im.metadata[model.MD_EXP_TIME], 10e-3)
+
+        self.camera.resolution.value = (32, 64)
+        im = self.camera.data.get()
+        self.assertEqual(im.shape, (64, 32) + self.rgbshp)
+
+
 if __name__ == '__main__':
     unittest.main()
 
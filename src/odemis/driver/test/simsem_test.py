@@ -23,8 +23,10 @@ from __future__ import division
 import Pyro4
 import copy
 import logging
+import numpy
 from odemis import model
 from odemis.driver import simsem
+from odemis.util import driver
 import os
 import pickle
 import threading
@@ -404,6 +406,61 @@ class TestSEM(unittest.TestCase):
         # if it has acquired a least 5 pictures we are already happy
         self.assertLessEqual(self.left, 10000)
 
+    def test_partial_frames(self):
+        """
+        Check the lines are received before the end of the frame
+        """
+        self.scanner.dwellTime.value = 20e-6  # s
+        self.scanner.resolution.value = (512, 512)
+        self.size = self.scanner.resolution.value
+        expected_duration = self.compute_expected_duration()  # ~5s
+        self.assertGreater(expected_duration, 2 * driver.PARTIAL_FRAME_PERIOD)
+
+        partials = []
+        frames = []
+        def receive_partial(df, da):
+            partials.append((time.time(), da))
+
+        def receive_frame(df, da):
+            frames.append((time.time(), da))
+            self.acq_done.set()
+
+        self.sed.partialData.subscribe(receive_partial)
+        try:
+            start = time.time()
+            self.sed.data.subscribe(receive_frame)
+            self.acq_done.wait(expected_duration * 1.5 + 2)
+            self.sed.data.unsubscribe(receive_frame)
+        finally:
+            self.sed.partialData.unsubscribe(receive_partial)
+
+        # The main dataflow only receives the complete frame
+        self.assertEqual(len(frames), 1)
+        tframe, im = frames[0]
+        self.assertEqual(im.shape, self.size[::-1])
+        self.assertNotIn(model.MD_FRAME_POS, im.metadata)
+        self.assertGreater(len(partials), 2)
+        # The first lines arrive well before the end of the frame
+        self.assertLess(partials[0][0] - start, expected_duration / 2)
+
+        # The partial frames follow each other and contain the same data as the frame
+        y = 0
+        for t, pim in partials:
+            self.assertLessEqual(t, tframe)
+            self.assertEqual(pim.metadata[model.MD_FRAME_RES], self.size)
+            self.assertEqual(pim.metadata[model.MD_FRAME_POS], (0, y))
+            self.assertEqual(pim.shape[1], self.size[0])
+            self.assertEqual(pim.metadata[model.MD_POS], im.metadata[model.MD_POS])
+            numpy.testing.assert_array_equal(pim, im[y:y + pim.shape[0]])
+            y += pim.shape[0]
+        self.assertLess(y, self.size[1])
+
+        # Without partial frames, only full frames are received
+        self.scanner.dwellTime.value = 10e-6  # s
+        im = self.sed.data.get()
+        self.assertNotIn(model.MD_FRAME_POS, im.metadata)
+        self.assertEqual(im.shape, self.size[::-1])
+
     def receive_image(self, dataflow, image):
         """
         callback for df of test_acquire_flow()
@@ -437,5 +494,51 @@ class TestSEM(unittest.TestCase):
         f.result()
         self.assertEqual(self.focus.position.value, pos)
 
+
+class TestSEMHighRate(unittest.TestCase):
+    """
+    Test the "high-rate" mode, with pre-rendered frames
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        config = copy.deepcopy(CONFIG_SEM)
+        config["frame_bank"] = 4
+        cls.sem = simsem.SimSEM(**config)
+        for child in cls.sem.children.value:
+            if child.name == CONFIG_SED["name"]:
+                cls.sed = child
+            elif child.name == CONFIG_SCANNER["name"]:
+                cls.scanner = child
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sem.terminate()
+
+    def test_rate(self):
+        self.scanner.resolution.value = (256, 256)
+        self.scanner.dwellTime.value = 5e-9  # s => ~3 kHz
+        period = numpy.prod(self.scanner.resolution.value) * self.scanner.dwellTime.value
+        frames = []
+        def receive(df, da):
+            frames.append(da)
+
+        self.sed.data.subscribe(receive)
+        time.sleep(2)
+        self.sed.data.unsubscribe(receive)
+        time.sleep(0.1)
+
+        nums = [da.metadata[model.MD_FRAME_NUM] for da in frames]
+        logging.info("Received %d frames at %g fps (%d dropped)", len(frames),
+                     1 / period, nums[-1] + 1 - len(nums))
+        self.assertEqual(nums, sorted(set(nums)))
+        self.assertGreater(len(frames), 0.5 / period)
+        dates = [da.metadata[model.MD_ACQ_DATE] for da in frames]
+        self.assertAlmostEqual((dates[-1] - dates[0]) / (nums[-1] - nums[0]), period,
+                               delta=period * 0.01)
+        self.assertEqual(frames[0].shape, (256, 256))
+        self.assertEqual(frames[0].metadata[model.MD_DWELL_TIME], 5e-9)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -90,6 +90,86 @@ class TestStatic(unittest.TestCase):
         dev.terminate()
 
 
+class TestStatusPolling(unittest.TestCase):
+    """
+    Tests of the batched instructions and status polling, on the simulator
+    """
+    def setUp(self):
+        self.dev = CLASS(**KWARGS_SIM)
+
+    def tearDown(self):
+        self.dev.terminate()
+
+    def test_send_instructions(self):
+        dev = self.dev
+        # Same results as sending one instruction at a time
+        exp = [dev.GetAxisParam(1, 1), dev.GetAxisParam(2, 1), dev.GetAxisParam(1, 4)]
+        vals = dev.SendInstructions([(6, 1, 1, 0), (6, 1, 2, 0), (6, 4, 1, 0)])
+        self.assertEqual(vals, exp)
+
+        # An error in the middle doesn't prevent the next instructions
+        with self.assertRaises(tmcm.TMCLError):
+            dev.SendInstructions([(6, 1, 1, 0), (6, 1, 200, 0), (6, 1, 2, 0)])
+        self.assertEqual(dev.GetAxisParam(1, 1), exp[0])
+
+    def test_latency_stats(self):
+        dev = self.dev
+        for i in range(10):
+            dev.GetAxisParam(1, 1)
+        stats = dev.getLatencyStatistics()
+        self.assertIn(6, stats)  # GAP
+        self.assertGreaterEqual(stats[6].count, 10)
+        self.assertGreater(stats[6].mean, 0)
+        self.assertGreaterEqual(stats[6].max, stats[6].mean)
+        self.assertEqual(sum(stats[6].histogram), stats[6].count)
+
+    def test_concurrent_moves(self):
+        dev = self.dev
+        f1 = dev.moveRel({"x": 50e-6})
+        f2 = dev.moveRel({"y": -50e-6})
+        f1.result()
+        f2.result()
+        self.assertAlmostEqual(dev.position.value["x"], 50e-6, delta=1e-8)
+        self.assertAlmostEqual(dev.position.value["y"], -50e-6, delta=1e-8)
+
+        f1 = dev.moveAbs({"x": 0})
+        f2 = dev.moveAbs({"y": 0})
+        f1.result()
+        f2.result()
+        self.assertAlmostEqual(dev.position.value["x"], 0)
+        self.assertAlmostEqual(dev.position.value["y"], 0)
+        self.assertEqual(dev._moving_axes, set())
+
+    def test_multi_axis_move_update(self):
+        """
+        Check the position of all the axes is updated until the end of the move,
+        even the axes which reach their target first
+        """
+        dev = self.dev
+        updates = []
+        orig_update = dev._updatePositionFromStatus
+
+        def record_update(status):
+            updates.append(set(status.keys()))
+            orig_update(status)
+
+        dev._updatePositionFromStatus = record_update
+        try:
+            # y reaches its target long before x
+            f = dev.moveRel({"x": 1e-3, "y": 5e-6})
+            f.result()
+        finally:
+            dev._updatePositionFromStatus = orig_update
+
+        self.assertGreater(len(updates), 1)
+        for axes in updates:
+            self.assertEqual(axes, {1, 2})
+        self.assertAlmostEqual(dev.position.value["y"], 5e-6, delta=1e-8)
+
+        f = dev.moveAbs({"x": 0, "y": 0})
+        f.result()
+
+
 # @skip("faster")
 class TestActuator(unittest.TestCase):
 
@@ -79,6 +79,10 @@ REFPROC_2XFF = "2xFinalForward" # fast then slow, always finishing by forward mo
 REFPROC_STD = "Standard"  # Use the standard reference search built in the controller (depends on the axis parameters)
 REFPROC_FAKE = "FakeReferencing"  # was used for simulator when it didn't support referencing
 
+# Status polling during moves
+STATUS_MAX_AGE = 0.01  # s, a status more recent than this is shared between moves
+STATUS_MIN_PERIOD = 0.005  # s, minimum time between two status checks of a move
+
 # Model number (int) of devices tested
 KNOWN_MODELS = {3110, 6110}
 
@@ -201,6 +205,7 @@ class TMCLController(model.Actuator):
         self._refproc_lock = {}  # axis number -> lock
 
         self._ser_access = threading.Lock()
+        self._latencies = {}  # int (instruction ID) -> LatencyStats
         self._serial, ra = self._findDevice(port, address)
         self._target = ra  # same as address, but always the actual one
         self._port = port  # or self._serial.name ?
@@ -234,6 +239,11 @@ class TMCLController(model.Actuator):
         # will take care of executing axis move asynchronously
         self._executor = ParallelThreadPoolExecutor()  # one task at a time
 
+        # Status of the axes, shared between the moves
+        self._status_lock = threading.Lock()
+        self._status = {}  # int (axis ID) -> (float, bool, int): time, target reached, position
+        self._moving_axes = set()  # int (axis ID): axes currently moving
+
         axes_def = {}
         for n, i in self._name_to_axis.items():
             if not n:
@@ -593,43 +603,96 @@ class TMCLController(model.Actuator):
             IOError: if problem with sending/receiving data over the serial port
             TMCLError: if status if bad
         """
-        msg = numpy.empty(9, dtype=numpy.uint8)
-        struct.pack_into('>BBBBiB', msg, 0, self._target, n, typ, mot, val, 0)
-        # compute the checksum (just the sum of all the bytes)
-        msg[-1] = numpy.sum(msg[:-1], dtype=numpy.uint8)
+        return self.SendInstructions([(n, typ, mot, val)])[0]
+
+    def SendInstructions(self, instrs):
+        """
+        Sends multiple instructions in a row, without waiting for the reply of
+        each instruction before sending the next one, and return the replies.
+        It's much faster than sending the instructions one at a time, as the
+        latency of the serial link is only paid once.
+        instrs (list of (int, int, int, int)): instruction ID, type, motor/bank
+          number, and value of each instruction (see SendInstruction())
+        return (list of (0<=int<2**32)): value of the reply of each instruction
+        raises:
+            IOError: if problem with sending/receiving data over the serial port
+            TMCLError: if status if bad (for any of the instructions)
+        """
+        msgs = []
+        for n, typ, mot, val in instrs:
+            msg = numpy.empty(9, dtype=numpy.uint8)
+            struct.pack_into('>BBBBiB', msg, 0, self._target, n, typ, mot, val, 0)
+            # compute the checksum (just the sum of all the bytes)
+            msg[-1] = numpy.sum(msg[:-1], dtype=numpy.uint8)
+            msgs.append(msg)
+
+        rvals = []
+        error = None
         with self._ser_access:
-            logging.debug("Sending %s", self._instr_to_str(msg))
-            self._serial.write(msg)
+            for msg in msgs:
+                logging.debug("Sending %s", self._instr_to_str(msg))
+            start = time.time()
+            self._serial.write(numpy.concatenate(msgs))
             self._serial.flush()
-            while True:
-                res = self._serial.read(9)
-                if len(res) < 9: # TODO: TimeoutError?
-                    logging.warning("Received only %d bytes after %s, will fail the instruction",
-                                    len(res), self._instr_to_str(msg))
-                    raise IOError("Received only %d bytes after %s" %
-                                  (len(res), self._instr_to_str(msg)))
-                logging.debug("Received %s", self._reply_to_str(res))
-                ra, rt, status, rn, rval, chk = struct.unpack('>BBBBiB', res)
+            for msg, (n, typ, mot, val) in zip(msgs, instrs):
+                while True:
+                    res = self._serial.read(9)
+                    if len(res) < 9: # TODO: TimeoutError?
+                        logging.warning("Received only %d bytes after %s, will fail the instruction",
+                                        len(res), self._instr_to_str(msg))
+                        raise IOError("Received only %d bytes after %s" %
+                                      (len(res), self._instr_to_str(msg)))
+                    logging.debug("Received %s", self._reply_to_str(res))
+                    ra, rt, status, rn, rval, chk = struct.unpack('>BBBBiB', res)
+
+                    # Check it's a valid message
+                    npres = numpy.frombuffer(res, dtype=numpy.uint8)
+                    good_chk = numpy.sum(npres[:-1], dtype=numpy.uint8)
+                    if chk == good_chk:
+                        if self._target != 0 and self._target != rt:  # 0 means 'any device'
+                            logging.warning("Received a message from %d while expected %d",
+                                            rt, self._target)
+                        if rn != n:
+                            logging.info("Skipping a message about instruction %d (waiting for %d)",
+                                         rn, n)
+                            continue
+                        if status not in TMCL_OK_STATUS and error is None:
+                            # Raise it only after receiving all the replies,
+                            # to stay synchronised with the device
+                            error = TMCLError(status, rval, self._instr_to_str(msg))
+                    else:
+                        # TODO: investigate more why once in a while (~1/1000 msg)
+                        # the message is garbled
+                        logging.warning("Message checksum incorrect (%d), will assume it's all fine", chk)
+
+                    self._addLatency(n, time.time() - start)
+                    rvals.append(rval)
+                    break
 
-                # Check it's a valid message
-                npres = numpy.frombuffer(res, dtype=numpy.uint8)
-                good_chk = numpy.sum(npres[:-1], dtype=numpy.uint8)
-                if chk == good_chk:
-                    if self._target != 0 and self._target != rt:  # 0 means 'any device'
-                        logging.warning("Received a message from %d while expected %d",
-                                        rt, self._target)
-                    if rn != n:
-                        logging.info("Skipping a message about instruction %d (waiting for %d)",
-                                     rn, n)
-                        continue
-                    if status not in TMCL_OK_STATUS:
-                        raise TMCLError(status, rval, self._instr_to_str(msg))
-                else:
-                    # TODO: investigate more why once in a while (~1/1000 msg)
-                    # the message is garbled
-                    logging.warning("Message checksum incorrect (%d), will assume it's all fine", chk)
+        if error:
+            raise error
+        return rvals
 
-                return rval
+    def _addLatency(self, n, dur):
+        """
+        Record the latency of an instruction
+        n (0<=int<=255): instruction ID
+        dur (float): time between the sending and the end of the reply (in s)
+        """
+        try:
+            stats = self._latencies[n]
+        except KeyError:
+            stats = driver.LatencyStats()
+            self._latencies[n] = stats
+        stats.add(dur)
+
+    def getLatencyStatistics(self):
+        """
+        return (dict int -> driver.LatencyStats): for each instruction ID, the
+          statistics on the time between sending the instruction and receiving
+          the whole reply.
+        """
+        return dict(self._latencies)
 
     # Low level functions
     def GetVersion(self):
@@ -1195,10 +1258,12 @@ class TMCLController(model.Actuator):
         # uses the current values (converted to internal representation)
         pos = self._applyInversion(self.position.value)
 
-        for n, i in self._name_to_axis.items():
-            if axes is None or n in axes:
-                # param 1 = current position
-                pos[n] = self.GetAxisParam(i, 1) * self._ustepsize[i]
+        # Read all the positions in one go
+        names = [n for n in self._name_to_axis if axes is None or n in axes]
+        # param 1 = current position
+        vals = self.SendInstructions([(6, 1, self._name_to_axis[n], 0) for n in names])
+        for n, v in zip(names, vals):
+            pos[n] = v * self._ustepsize[self._name_to_axis[n]]
 
         pos = self._applyInversion(pos)
 
@@ -1208,6 +1273,47 @@ class TMCLController(model.Actuator):
         self.position._value = pos
         self.position.notify(self.position.value)
 
+    def _updatePositionFromStatus(self, status):
+        """
+        update the position VA, with the position read by _getAxesStatus()
+        status (dict int -> (bool, int)): axis ID -> target reached, position
+        """
+        pos = self._applyInversion(self.position.value)
+        for n, i in self._name_to_axis.items():
+            if i in status:
+                pos[n] = status[i][1] * self._ustepsize[i]
+        pos = self._applyInversion(pos)
+
+        logging.debug("Updated position to %s", pos)
+        self.position._value = pos
+        self.position.notify(self.position.value)
+
+    def _getAxesStatus(self, axes, max_age=STATUS_MAX_AGE):
+        """
+        Read whether the target position is reached, and the current position
+        of the given axes. All the axes currently moving (possibly for other
+        move futures) are queried in one batch, and the result is shared, so
+        that concurrent moves don't each have to query the controller.
+        axes (set of int): the axes IDs to check
+        max_age (0<=float): maximum time (in s) since a previous reading to
+          reuse it.
+        return (dict int -> (bool, int)): axis ID -> target reached, position
+          (in µsteps)
+        """
+        with self._status_lock:
+            now = time.time()
+            if any(now - self._status.get(a, (0,))[0] > max_age for a in axes):
+                poll_axes = sorted(set(axes) | self._moving_axes)
+                instrs = []
+                for a in poll_axes:
+                    instrs.append((6, 8, a, 0))  # target reached?
+                    instrs.append((6, 1, a, 0))  # current position
+                vals = self.SendInstructions(instrs)
+                now = time.time()
+                for i, a in enumerate(poll_axes):
+                    self._status[a] = (now, vals[2 * i] != 0, vals[2 * i + 1])
+            return {a: self._status[a][1:] for a in axes}
+
     def _updateSpeed(self):
         """
         Update the speed VA from the controller settings
@@ -1486,6 +1592,11 @@ class TMCLController(model.Actuator):
             CancelledError: if cancelled before the end of the move
         """
         moving_axes = set(axes)
+        with self._status_lock:
+            self._moving_axes |= moving_axes
+            # Forget the previous status, as it was from before the move started
+            for a in moving_axes:
+                self._status.pop(a, None)
 
         last_upd = time.time()
         dur = max(0.01, min(end - last_upd, 60))
@@ -1493,10 +1604,14 @@ class TMCLController(model.Actuator):
         logging.debug("Expecting a move of %g s, will wait up to %g s", dur, max_dur)
         timeout = last_upd + max_dur
         last_axes = moving_axes.copy()
+        overrun = 0  # number of checks since the expected end of the move
         try:
             while not future._must_stop.is_set():
-                for aid in moving_axes.copy(): # need copy to remove during iteration
-                    if self._isOnTarget(aid):
+                # Read all the axes of the move, so that the position of the
+                # ones which already reached their target is still updated
+                status = self._getAxesStatus(axes)
+                for aid, (reached, p) in status.items():
+                    if reached:
                         moving_axes.discard(aid)
                 if not moving_axes:
                     # no more axes to wait for
@@ -1511,16 +1626,21 @@ class TMCLController(model.Actuator):
                                        "expected it takes only %g s" %
                                        (max_dur, dur))
 
-                # Update the position from time to time (10 Hz)
+                # Update the position from time to time (10 Hz), with the
+                # position just read
                 if now - last_upd > 0.1 or last_axes != moving_axes:
-                    last_names = set(n for n, i in self._name_to_axis.items() if i in last_axes)
-                    self._updatePosition(last_names)
-                    last_upd = time.time()
+                    self._updatePositionFromStatus(status)
+                    last_upd = now
                     last_axes = moving_axes.copy()
 
-                # Wait half of the time left (maximum 0.1 s)
+                # Wait half of the time left (maximum 0.1 s). If the move takes
+                # longer than expected, check less and less often.
                 left = end - time.time()
-                sleept = max(0.001, min(left / 2, 0.1))
+                if left > 0:
+                    sleept = max(STATUS_MIN_PERIOD, min(left / 2, 0.1))
+                else:
+                    sleept = min(STATUS_MIN_PERIOD * 2 ** overrun, 0.1)
+                    overrun += 1
                 future._must_stop.wait(sleept)
             else:
                 logging.debug("Move of axes %s cancelled before the end", axes)
@@ -1530,6 +1650,8 @@ class TMCLController(model.Actuator):
                 future._was_stopped = True
                 raise CancelledError()
         finally:
+            with self._status_lock:
+                self._moving_axes -= set(axes)
             # TODO: check if the move succeded ? (= Not failed due to stallguard/limit switch)
             self._updatePosition() # update (all axes) with final position
 
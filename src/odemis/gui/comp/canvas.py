@@ -138,6 +138,7 @@ from abc import ABCMeta, abstractmethod
 import cairo
 from decorator import decorator
 import logging
+import numpy
 from odemis import util
 from odemis.gui import BLEND_DEFAULT, BLEND_SCREEN, BufferSizeEvent
 from odemis.gui.comp.overlay.base import WorldOverlay, ViewOverlay
@@ -145,6 +146,7 @@ from odemis.gui.evt import EVT_KNOB_ROTATE, EVT_KNOB_PRESS
 from odemis.gui.util import call_in_wx_main
 from odemis.gui.util.img import add_alpha_byte, apply_rotation, apply_shear, apply_flip, get_sub_img
 from odemis.util import intersect
+from odemis.util.img import decimatePlot
 from odemis.gui.util.conversion import wxcol_to_frgb
 from odemis import model
 import os
@@ -1735,7 +1737,7 @@ class PlotCanvas(BufferedCanvas):
     def __init__(self, *args, **kwargs):
         BufferedCanvas.__init__(self, *args, **kwargs)
 
-        # The data to be plotted: list of 2-tuples (x, y, for each point)
+        # The data to be plotted: numpy array of shape N, 2 (x, y, for each point)
         self._data = None
 
         # The range of the x and y data
@@ -1744,6 +1746,10 @@ class PlotCanvas(BufferedCanvas):
 
         self.data_prop = None  # data_width, range_x, data_height, range_y
 
+        # Cache of the data reduced to the canvas width, as drawn
+        self._plot_key = None  # width, range_x of the cached data
+        self._plot_cache = None  # list of 2-tuples
+
         # TODO not used?
         self.unit_x = None
         self.unit_y = None
@@ -1767,34 +1773,41 @@ class PlotCanvas(BufferedCanvas):
         if len(xs) != len(ys):
             msg = "X and Y list are of unequal length. X: %s, Y: %s, Xs: %s..."
             raise ValueError(msg % (len(xs), len(ys), str(xs)[:30]))
-        self.set_data(zip(xs, ys), unit_x, unit_y, range_x, range_y)
+        if len(xs) == 0:
+            self.set_data(None, unit_x, unit_y, range_x, range_y)
+            return
+        data = numpy.empty((len(xs), 2), dtype=numpy.float64)
+        data[:, 0] = xs
+        data[:, 1] = ys
+        self.set_data(data, unit_x, unit_y, range_x, range_y)
 
     def set_data(self, data, unit_x=None, unit_y=None, range_x=None, range_y=None):
         """ Set the data to be plotted
 
-        :param data: (list of 2-tuples) The X, Y coordinates of each point. The X values must be
-            ordered and not duplicated.
+        :param data: (list of 2-tuples or ndarray of shape N, 2) The X, Y coordinates of each
+            point. The X values must be ordered and not duplicated.
 
         """
-        if data:
+        if data is not None and len(data) > 0:
+            data = numpy.array(data, dtype=numpy.float64)
+            if data.ndim != 2 or data.shape[1] != 2:
+                raise ValueError("The data should be 2D!")
+
             # Check if sorted
-            s = all(data[i][0] < data[i + 1][0] for i in xrange(len(data) - 1))
+            dx = numpy.diff(data[:, 0])
             try:
-                if not s:
-                    if any(data[i][0] == data[i + 1][0] for i in xrange(len(data) - 1)):
+                if not (dx > 0).all():
+                    if (dx == 0).any():
                         raise ValueError("The horizontal data points should be unique.")
                     else:
                         raise ValueError("The horizontal data should be sorted.")
             except ValueError:
                 # Try to display the data any way
                 logging.exception("Horizontal data is incorrect, will drop it. Was: %s",
-                                  [d[0] for d in data])
-                data = [(i, d[1]) for i, d in enumerate(data)]
+                                  data[:, 0])
+                data[:, 0] = numpy.arange(len(data))
                 unit_x = None
 
-            if len(data[0]) != 2:
-                raise ValueError("The data should be 2D!")
-
             self._data = data
 
             self.unit_x = unit_x
@@ -1803,6 +1816,13 @@ class PlotCanvas(BufferedCanvas):
             self.range_x = range_x
             self.range_y = range_y
 
+            # Computed immediately, as the value conversions (eg, called by the
+            # overlays on mouse events) can be used before the next drawing.
+            self.data_prop = self._calc_data_characteristics(self._data)
+            # Will be recomputed at the next drawing
+            self._plot_key = None
+            self._plot_cache = None
+
         else:
             logging.warn("Trying to fill PlotCanvas with empty data!")
             self.clear()
@@ -1816,6 +1836,8 @@ class PlotCanvas(BufferedCanvas):
         self.range_x = None
         self.range_y = None
         self.data_prop = None
+        self._plot_key = None
+        self._plot_cache = None
         BufferedCanvas.clear(self)
 
     def has_data(self):
@@ -1831,16 +1853,11 @@ class PlotCanvas(BufferedCanvas):
 
         """
 
-        try:
-            horz, vert = zip(*data)
-        except TypeError:
-            logging.exception("Failed to separate tuples in %s", data)
-            raise
-
-        min_x = min(horz)
-        max_x = max(horz)
-        min_y = min(vert)
-        max_y = max(vert)
+        # X is sorted
+        min_x = data[0, 0]
+        max_x = data[-1, 0]
+        min_y = data[:, 1].min()
+        max_y = data[:, 1].max()
 
         # If a range is not given, we calculate it from the data
         if not self.range_x:
@@ -1933,26 +1950,39 @@ class PlotCanvas(BufferedCanvas):
 
         if snap:
             # Return the value closest to val_x
-            return util.find_closest(val_x, [x for x, _ in self._data])
+            return float(self._data[self._index_closest_x(val_x), 0])
         else:
             # Clip the value
             val_x = max(min(val_x, self.data_prop[1][1]), self.data_prop[1][0])
 
         return val_x
 
+    def _index_closest_x(self, val_x):
+        """
+        Find the index of the point from the data with the X value closest to
+        the given X value. As the data is sorted over X, it's a dichotomy search.
+        val_x (number): the value in X
+        return (int): index in the data
+        """
+        xs = self._data[:, 0]
+        i = int(numpy.searchsorted(xs, val_x))
+        if i >= len(xs):
+            return len(xs) - 1
+        elif i > 0 and val_x - xs[i - 1] <= xs[i] - val_x:
+            return i - 1
+        return i
+
     def val_x_to_val(self, val_x):
         """
         Find the X/Y value from the data closest to the given X value
         val_x (number): the value in X
         return (tuple of data): X, Y value
         """
-        # TODO: as _data is sorted over X, it would be much faster to use
-        # dichotomy search, cf bisect.bisect() or numpy.searchsorted()
-        return min(self._data, key=lambda v: abs(v[0] - val_x))
+        return tuple(self._data[self._index_closest_x(val_x)].tolist())
 
     def _val_x_to_val_y(self, val_x, snap=False):
         """ Map the given x pixel value to a y value """
-        return min((abs(val_x - x), y) for x, y in self._data)[1]
+        return float(self._data[self._index_closest_x(val_x), 1])
 
     def SetForegroundColour(self, *args, **kwargs):
         BufferedCanvas.SetForegroundColour(self, *args, **kwargs)
@@ -1986,20 +2016,37 @@ class PlotCanvas(BufferedCanvas):
             ctx = wxcairo.ContextFromDC(self._dc_buffer)
             self._draw_background(ctx)
 
-            if self._data:
-                data = self._data
-                # TODO: reuse data_prop if the data has not changed
-                data_width, range_x, data_height, range_y = self._calc_data_characteristics(data)
-                self.data_prop = (data_width, range_x, data_height, range_y)
+            if self._data is not None:
+                data_width, range_x, data_height, range_y = self.data_prop
+                data = self._get_plot_data(range_x)
                 ctx = wxcairo.ContextFromDC(self._dc_buffer)
                 self._plot_data(ctx, data, data_width, range_x, data_height, range_y)
 
             # self._locked = False
 
+    def _get_plot_data(self, range_x):
+        """ Get the data reduced to what can be displayed on the canvas width
+
+        The (min/max envelope) decimation is cached, and only recomputed when the data, the
+        canvas width or the X range change.
+
+        :param range_x: (float, float) The X values at the left and right of the canvas
+        :return: (list of 2-tuples) The X, Y coordinates of each point to draw
+
+        """
+        width = max(1, self.ClientSize.x)
+        key = (width, tuple(range_x))
+        if self._plot_key != key:
+            xs, ys = decimatePlot(self._data[:, 0], self._data[:, 1], width, range_x)
+            self._plot_cache = zip(xs.tolist(), ys.tolist())
+            self._plot_key = key
+            logging.debug("Plotting %d points out of %d", len(self._plot_cache), len(self._data))
+        return self._plot_cache
+
     def _plot_data(self, ctx, data, data_width, range_x, data_height, range_y):
-        """ Plot the current `_data` to the given context """
+        """ Plot the given data (list of 2-tuples) to the given context """
 
-        if self._data:
+        if data:
             if self.plot_mode == PLOT_MODE_LINE:
                 self._line_plot(ctx, data, data_width, range_x, data_height, range_y)
             elif self.plot_mode == PLOT_MODE_BAR:
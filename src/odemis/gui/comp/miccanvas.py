@@ -1290,7 +1290,7 @@ class BarPlotCanvas(canvas.PlotCanvas):
 
         super(BarPlotCanvas, self).set_data(data, unit_x, unit_y, range_x, range_y)
 
-        if data:
+        if self._data is not None:
             self.markline_overlay.activate()
         else:
             self.markline_overlay.deactivate()
@@ -986,7 +986,7 @@ class PointSpectrumViewport(PlotViewport):
 
             self.bottom_legend.unit = unit_x
             self.bottom_legend.range = (spectrum_range[0], spectrum_range[-1])
-            self.left_legend.range = (min(data), max(data))
+            self.left_legend.range = (float(data.min()), float(data.max()))
             # For testing
             # import random
             # self.left_legend.range = (min(data) + random.randint(0, 100),
@@ -1031,7 +1031,7 @@ class PointSpectrumViewport(PlotViewport):
 
         self.bottom_legend.unit = unit_x
         self.bottom_legend.range = (spectrum_range[0], spectrum_range[-1])
-        self.left_legend.range = (min(data), max(data))
+        self.left_legend.range = (float(data.min()), float(data.max()))
 
         self.Refresh()
 
@@ -1078,7 +1078,7 @@ class ChronographViewport(PlotViewport):
             range_x = (min(x[0], -self.stream.windowPeriod.value), x[-1])
             # Put the data axis with -5% of min and +5% of max:
             # the margin hints the user the display is not clipped
-            extrema = (float(min(data)), float(max(data)))  # float() to avoid numpy arrays
+            extrema = (float(data.min()), float(data.max()))  # float() to avoid numpy arrays
             data_width = extrema[1] - extrema[0]
             if data_width == 0:
                 range_y = (0, extrema[1] * 1.05)
@@ -1086,7 +1086,7 @@ class ChronographViewport(PlotViewport):
                 range_y = (max(0, extrema[0] - data_width * 0.05),
                            extrema[1] + data_width * 0.05)
 
-            self.canvas.set_data(zip(x, y), unit_x, range_x=range_x, range_y=range_y)
+            self.canvas.set_1d_data(x, y, unit_x, range_x=range_x, range_y=range_y)
 
             self.bottom_legend.unit = unit_x
             self.bottom_legend.range = range_x
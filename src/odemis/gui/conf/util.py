@@ -623,8 +623,9 @@ def create_setting_entry(container, name, va, hw_comp, conf=None, change_callbac
                                                          clearlabel,
                                                          dialog_style=dialog_style)
 
-        # TODO: allow to change the wildcard via a conf key?
-        # value_ctrl.SetWildcard(wildcards)
+        wildcard = conf.get('wildcard')  # Formats proposed in the file dialog
+        if wildcard is not None:
+            value_ctrl.SetWildcard(wildcard)
 
         # Add the corresponding setting entry
         setting_entry = SettingEntry(name=label_text, va=va, hw_comp=hw_comp,
@@ -25,12 +25,13 @@ from __future__ import division
 from collections import OrderedDict
 import logging
 from odemis import model, dataio
-from odemis.dataio import get_converter
+from odemis.dataio import get_converter, png
 from odemis.gui.comp import popup
 from odemis.gui.conf import get_acqui_conf
 from odemis.gui.util import formats_to_wildcards
 from odemis.gui.util import call_in_wx_main
-from odemis.gui.util.img import ar_to_export_data, spectrum_to_export_data, images_to_export_data, line_to_export_data
+from odemis.gui.util.img import ar_to_export_data, spectrum_to_export_data, images_to_export_data, \
+    images_to_export_file, line_to_export_data
 import os
 import time
 import wx
@@ -166,9 +167,14 @@ class ExportController(object):
             self._conf.export_raw = raw
             self._conf.last_export_path = os.path.dirname(filepath)
 
-            exported_data = self.export(export_type, raw)
-            # record everything to a file
-            exporter.export(filepath, exported_data)
+            if export_type == 'spatial' and not raw and export_format == png.FORMAT:
+                # Written directly to the file, without holding the whole
+                # image in memory, as it can be very large
+                self.export_to_file(filepath)
+            else:
+                exported_data = self.export(export_type, raw)
+                # record everything to a file
+                exporter.export(filepath, exported_data)
 
             popup.show_message(self._main_frame,
                                "Exported in %s" % (filepath,),
@@ -230,12 +236,7 @@ class ExportController(object):
             exported_data = line_to_export_data(vp.stream, raw)
         else:
             export_type = 'spatial'
-            view_px = tuple(vp.canvas.ClientSize)
-            view_mpp = fview.mpp.value
-            view_hfw = (view_mpp * view_px[0], view_mpp * view_px[1])
-            view_pos = fview.view_pos.value
-            draw_merge_ratio = fview.stream_tree.kwargs.get("merge", 0.5)
-            interpolate_data = fview.interpolate_content.value
+            view_hfw, view_pos, draw_merge_ratio, interpolate_data = self._get_spatial_settings(fview, vp)
             exported_data = images_to_export_data(streams,
                                                   view_hfw, view_pos,
                                                   draw_merge_ratio, raw,
@@ -244,6 +245,40 @@ class ExportController(object):
 
         return exported_data
 
+    def export_to_file(self, filepath):
+        """
+        Writes the print-ready spatial export of the focused view directly
+          to a PNG file.
+
+        :param filepath (str): full path to the destination file
+        raises:
+            LookupError: if no data found to export
+        """
+        fview = self._data_model.focussedView.value
+        vp = self.get_viewport_by_view(fview)
+        view_hfw, view_pos, draw_merge_ratio, interpolate_data = self._get_spatial_settings(fview, vp)
+        images_to_export_file(filepath, fview.getStreams(),
+                              view_hfw, view_pos, draw_merge_ratio,
+                              interpolate_data=interpolate_data,
+                              logo=self._main_frame.legend_logo)
+
+    def _get_spatial_settings(self, fview, vp):
+        """
+        Returns the settings of the view, as needed for the spatial export
+        returns:
+            view_hfw (float, float): width and height of the view (in m)
+            view_pos (float, float): center of the view (in m)
+            draw_merge_ratio (float): merge ratio of the streams
+            interpolate_data (bool): whether the data is interpolated
+        """
+        view_px = tuple(vp.canvas.ClientSize)
+        view_mpp = fview.mpp.value
+        view_hfw = (view_mpp * view_px[0], view_mpp * view_px[1])
+        view_pos = fview.view_pos.value
+        draw_merge_ratio = fview.stream_tree.kwargs.get("merge", 0.5)
+        interpolate_data = fview.interpolate_content.value
+        return view_hfw, view_pos, draw_merge_ratio, interpolate_data
+
     def get_viewport_by_view(self, view):
         """ Return the ViewPort associated with the given view """
 
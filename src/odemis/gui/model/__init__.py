@@ -956,6 +956,10 @@ class StreamView(View):
             if hasattr(stream, 'rect'): # the stream is probably pyramidal
                 stream.rect.value = stream.rect.clip(view_rect)
                 stream.mpp.value = stream.mpp.clip(self.mpp.value)
+            elif hasattr(stream, 'setViewRegion'):  # live stream
+                if self.fov_buffer.value == (0, 0):
+                    continue  # Not yet displayed => nothing known
+                stream.setViewRegion(self, view_rect, self.mpp.value)
 
     def has_stage(self):
         return self._stage is not None
@@ -1231,9 +1235,8 @@ class StreamView(View):
         with self._streams_lock:
             self.stream_tree.add_stream(stream)
 
-        if isinstance(stream, RGBSpatialProjection):
-            # sets the current mpp and viewport to the projection
-            self._updateStreamsViewParams()
+        # sets the current mpp and viewport to the stream/projection
+        self._updateStreamsViewParams()
 
         # subscribe to the stream's image
         if hasattr(stream, "image"):
@@ -1254,6 +1257,8 @@ class StreamView(View):
         # Stop listening to the stream changes
         if hasattr(stream, "image"):
             stream.image.unsubscribe(self._onNewImage)
+        if hasattr(stream, "setViewRegion"):
+            stream.setViewRegion(self, None)
 
         with self._streams_lock:
             streams = self.stream_tree.getStreams()
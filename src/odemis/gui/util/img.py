@@ -25,15 +25,21 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 from __future__ import division
 
 import cairo
+import collections
+from concurrent import futures
+import itertools
 import logging
 import math
+import multiprocessing
 import numpy
 from odemis import model
+from odemis.dataio import png
 from odemis.gui import BLEND_SCREEN, BLEND_DEFAULT
 from odemis.gui.comp.overlay.base import Label
 from odemis.util import intersect, fluo, conversion
 from odemis.util import polar, img
 from odemis.util import units
+import os
 import time
 import wx
 
@@ -44,6 +50,7 @@ import odemis.gui.img as guiimg
 BAR_PLOT_COLOUR = (0.5, 0.5, 0.5)
 CROP_RES_LIMIT = 1024
 MAX_RES_FACTOR = 5  # upper limit resolution factor to exported image
+EXPORT_TILE_SIZE = 1024  # px, size of the tiles drawn in parallel for export
 SPEC_PLOT_SIZE = 1024
 SPEC_SCALE_WIDTH = 150  # ticks + text vertically
 SPEC_SCALE_HEIGHT = 100  # ticks + text horizontally
@@ -207,6 +214,37 @@ def apply_flip(ctx, flip, b_im_rect):
         ctx.translate(-flip_x, -flip_y)
 
 
+def get_untransformed_rect(rect, rotation, shear, flip, b_im_rect):
+    """
+    Computes which part of the image is needed to draw a given area of the
+    buffer, once the rotation, shear and flip are applied to the image.
+
+    rect: (float, float, float, float) left, top, width, height of the area,
+        in buffer coordinates
+    rotation, shear, flip: as passed to apply_rotation(), apply_shear() and
+        apply_flip()
+    b_im_rect: (float, float, float, float) top, left, width, height rectangle
+        containing the image in buffer coordinates
+    returns (float, float, float, float): left, top, width, height of the
+        bounding box of the area, in buffer coordinates before the
+        transformations (ie, the same coordinates as b_im_rect)
+    """
+    # Use a temporary context, to get exactly the same transformations as
+    # when drawing
+    ctx = cairo.Context(cairo.ImageSurface(cairo.FORMAT_A8, 1, 1))
+    apply_rotation(ctx, rotation, b_im_rect)
+    apply_shear(ctx, shear, b_im_rect)
+    apply_flip(ctx, flip, b_im_rect)
+    mat = ctx.get_matrix()
+    mat.invert()
+
+    x, y, w, h = rect
+    corners = [mat.transform_point(cx, cy)
+               for cx, cy in ((x, y), (x + w, y), (x, y + h), (x + w, y + h))]
+    xs, ys = zip(*corners)
+    return min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys)
+
+
 def ar_create_tick_labels(client_size, ticksize, num_ticks, margin=0):
     """
     Create list of tick labels for AR polar representation
@@ -573,7 +611,8 @@ def calc_img_buffer_rect(im_data, im_scale, p_im_center, buffer_center, buffer_s
 
 def draw_image(ctx, im_data, p_im_center, buffer_center, buffer_scale,
                buffer_size, opacity=1.0, im_scale=(1.0, 1.0), rotation=None,
-               shear=None, flip=None, blend_mode=BLEND_DEFAULT, interpolate_data=False):
+               shear=None, flip=None, blend_mode=BLEND_DEFAULT, interpolate_data=False,
+               buffer_rect=None):
     """ Draw the given image to the Cairo context
 
     The buffer is considered to have it's 0,0 origin at the top left
@@ -591,6 +630,9 @@ def draw_image(ctx, im_data, p_im_center, buffer_center, buffer_scale,
     flip (wx.HORIZONTAL | wx.VERTICAL): If and how to flip the image
     blend_mode (int): Graphical blending type used for transparency
     interpolate_data (boolean): apply interpolation if True
+    buffer_rect (None or 4 ints): left, top, width, height of the part of the
+      buffer which is actually drawn by the context (ex: a tile). If None, the
+      whole buffer is drawn.
 
     """
 
@@ -609,8 +651,11 @@ def draw_image(ctx, im_data, p_im_center, buffer_center, buffer_scale,
         logging.debug("Skipping draw: too small")
         return
 
-    # Get the intersection with the actual buffer
-    buffer_rect = (0, 0) + buffer_size
+    # Get the intersection with the actual buffer. As the image might be
+    # rotated, sheared or flipped, compute it before these transformations.
+    if buffer_rect is None:
+        buffer_rect = (0, 0) + buffer_size
+    buffer_rect = get_untransformed_rect(buffer_rect, rotation, shear, flip, b_im_rect)
 
     intersection = intersect(buffer_rect, b_im_rect)
 
@@ -639,9 +684,8 @@ def draw_image(ctx, im_data, p_im_center, buffer_center, buffer_scale,
         # If very little data is trimmed, it's better to scale the entire image than to create
         # a slightly smaller copy first.
         if b_im_rect[2] > intersection[2] * 1.1 or b_im_rect[3] > intersection[3] * 1.1:
-            # This is just to make sure there are no blank parts when cropping and
-            # then rotating
-            # TODO: move these 10% into calc_img_buffer_rect()
+            # This is just to make sure there are no blank parts due to the
+            # rounding when cropping and then transforming
             intersection = (intersection[0] - 0.1 * intersection[2],
                             intersection[1] - 0.1 * intersection[3],
                             1.2 * intersection[2],
@@ -1757,29 +1801,20 @@ def get_sub_img(b_intersect, b_im_rect, im_data, total_scale):
     return im_data, b_new
 
 
-def images_to_export_data(streams, view_hfw, view_pos,
-                          draw_merge_ratio, raw=False,
-                          interpolate_data=False, logo=None):
+def _get_export_buffer(images, view_hfw, view_pos):
     """
+    Compute the buffer on which the images have to be drawn for exporting
+    images (list of DataArray): the images as returned by convert_streams_to_images()
     view_hfw (tuple of float): X (width), Y (height) in m
     view_pos (tuple of float): center position X, Y in m
-    raw (bool): if False, generates one RGB image out of all the streams, otherwise
-      generates one image per stream using the raw data
-    logo (RGBA DataArray): Image to display in the legend
-    return (list of DataArray)
+    return:
+        buffer_size (int, int): size of the buffer in px
+        buffer_center (float, float): center of the buffer in m
+        buffer_scale (float, float): pixel size of the buffer in m
+        view_hfw (float, float): X (width), Y (height) in m of the buffer
+          (smaller than the view if the buffer was cropped to the data)
     raise LookupError: if no data visible in the selected FoV
     """
-    images, im_min_type = convert_streams_to_images(streams, raw)
-    if not images:
-        raise LookupError("There is no stream data to be exported")
-
-    if interpolate_data and im_min_type != numpy.uint8:
-        # TODO: make interpolation work also with 16 bits and higher data type
-        # For now, as Cairo is convinced it's RGB, it computes wrong data.
-        # cf util.img.rescale_hq() before casting to RGB?
-        logging.debug("Disabling interpolation as data is not 8 bits")
-        interpolate_data = False
-
     # Find min pixel size
     min_pxs = min(im.metadata['dc_scale'] for im in images)
 
@@ -1837,18 +1872,17 @@ def images_to_export_data(streams, view_hfw, view_pos,
 
     # TODO: make sure that Y dim of the buffer_size is not crazy high
 
-    # The list of images to export
-    data_to_export = []
+    return buffer_size, buffer_center, buffer_scale, view_hfw
+
 
+def _get_merge_ratios(images, draw_merge_ratio, raw=False):
+    """
+    Compute the opacity of each image, when they are all drawn on the same buffer
+    return (list of floats): the opacity of each image
+    """
     n = len(images)
+    merge_ratios = []
     for i, im in enumerate(images):
-        if raw or i == 0:  # when print-ready, share the surface to draw
-            # Make surface based on the maximum resolution
-            data_to_draw = numpy.zeros((buffer_size[1], buffer_size[0], 4), dtype=numpy.uint8)
-            surface = cairo.ImageSurface.create_for_data(
-                data_to_draw, cairo.FORMAT_ARGB32, buffer_size[0], buffer_size[1])
-            ctx = cairo.Context(surface)
-
         if im.metadata['blend_mode'] == BLEND_SCREEN or raw:
             # No transparency in case of "raw" export
             merge_ratio = 1.0
@@ -1859,7 +1893,28 @@ def images_to_export_data(streams, view_hfw, view_pos,
                 merge_ratio = draw_merge_ratio
         else:
             merge_ratio = 1 - i / n
+        merge_ratios.append(merge_ratio)
 
+    return merge_ratios
+
+
+def _draw_export_tile(images, merge_ratios, tile_rect, buffer_center, buffer_scale,
+                      buffer_size, interpolate_data=False):
+    """
+    Draw the part of the buffer corresponding to one tile
+    tile_rect (4 ints): left, top, width, height of the tile in the buffer
+    return (numpy.array of shape YX4 and dtype uint8): the tile, in the cairo
+      ARGB32 format
+    """
+    x, y, w, h = tile_rect
+    data_to_draw = numpy.zeros((h, w, 4), dtype=numpy.uint8)
+    surface = cairo.ImageSurface.create_for_data(
+        data_to_draw, cairo.FORMAT_ARGB32, w, h)
+    ctx = cairo.Context(surface)
+    # Draw as if it was the whole buffer, but only the tile ends up in the surface
+    ctx.translate(-x, -y)
+
+    for im, merge_ratio in zip(images, merge_ratios):
         draw_image(
             ctx,
             im,
@@ -1873,11 +1928,124 @@ def images_to_export_data(streams, view_hfw, view_pos,
             shear=im.metadata['dc_shear'],
             flip=im.metadata['dc_flip'],
             blend_mode=im.metadata['blend_mode'],
-            interpolate_data=interpolate_data
+            interpolate_data=interpolate_data,
+            buffer_rect=tile_rect
         )
 
-        # Create legend for each raw image
-        if raw:
+    surface.flush()
+    return data_to_draw
+
+
+def render_export_tiles(images, merge_ratios, buffer_center, buffer_scale, buffer_size,
+                        interpolate_data=False, tile_size=EXPORT_TILE_SIZE, max_workers=None):
+    """
+    Draw the images on a buffer, split into tiles. The tiles are drawn
+    concurrently, but only a few of them are drawn in advance, so that the
+    memory usage stays bounded, independently of the size of the buffer.
+    images (list of DataArray): the images as returned by convert_streams_to_images()
+    merge_ratios (list of float): the opacity of each image
+    buffer_center (float, float): center of the buffer in m
+    buffer_scale (float, float): pixel size of the buffer in m
+    buffer_size (int, int): size of the buffer in px
+    interpolate_data (bool): apply interpolation if True
+    tile_size (int): maximum width and height of the tiles in px
+    max_workers (None or int): number of tiles drawn simultaneously. If None,
+      it's the number of CPUs.
+    yields ((int, int, int, int), numpy.array of shape YX4 and dtype uint8):
+      left, top, width, height of the tile in the buffer, and its data (in the
+      cairo ARGB32 format). The tiles are ordered row by row.
+    """
+    if max_workers is None:
+        max_workers = multiprocessing.cpu_count()
+
+    def tile_rects():
+        for t in range(0, buffer_size[1], tile_size):
+            for l in range(0, buffer_size[0], tile_size):
+                yield (l, t, min(tile_size, buffer_size[0] - l), min(tile_size, buffer_size[1] - t))
+
+    rects = tile_rects()
+    executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+    queue = collections.deque()  # (rect, future) of the tiles being drawn, in order
+    try:
+        # Cairo releases the GIL while painting, so the tiles are really drawn in parallel
+        for r in itertools.islice(rects, max_workers * 2):
+            f = executor.submit(_draw_export_tile, images, merge_ratios, r,
+                                buffer_center, buffer_scale, buffer_size, interpolate_data)
+            queue.append((r, f))
+
+        while queue:
+            r, f = queue.popleft()
+            # Start drawing a new tile, to replace the one being returned
+            for nr in itertools.islice(rects, 1):
+                nf = executor.submit(_draw_export_tile, images, merge_ratios, nr,
+                                     buffer_center, buffer_scale, buffer_size, interpolate_data)
+                queue.append((nr, nf))
+            yield r, f.result()
+    finally:
+        # In case the caller stopped early, don't draw the other tiles
+        for r, f in queue:
+            f.cancel()
+        executor.shutdown(wait=True)
+
+
+def _bgra_to_rgba(im):
+    """
+    Swap in place the red and blue channels (cairo ARGB32 is BGRA in memory)
+    im (numpy.array of shape YX4)
+    """
+    im[:, :, [2, 0]] = im[:, :, [0, 2]]
+
+
+def _check_interpolation(interpolate_data, im_min_type):
+    """
+    return (bool): whether the interpolation can be used for exporting the images
+    """
+    if interpolate_data and im_min_type != numpy.uint8:
+        # TODO: make interpolation work also with 16 bits and higher data type
+        # For now, as Cairo is convinced it's RGB, it computes wrong data.
+        # cf util.img.rescale_hq() before casting to RGB?
+        logging.debug("Disabling interpolation as data is not 8 bits")
+        return False
+    return interpolate_data
+
+
+def images_to_export_data(streams, view_hfw, view_pos,
+                          draw_merge_ratio, raw=False,
+                          interpolate_data=False, logo=None,
+                          tile_size=EXPORT_TILE_SIZE, max_workers=None):
+    """
+    view_hfw (tuple of float): X (width), Y (height) in m
+    view_pos (tuple of float): center position X, Y in m
+    raw (bool): if False, generates one RGB image out of all the streams, otherwise
+      generates one image per stream using the raw data
+    logo (RGBA DataArray): Image to display in the legend
+    tile_size (int): maximum width and height of the tiles drawn in parallel
+    max_workers (None or int): number of tiles drawn simultaneously. If None,
+      it's the number of CPUs.
+    return (list of DataArray)
+    raise LookupError: if no data visible in the selected FoV
+    """
+    images, im_min_type = convert_streams_to_images(streams, raw)
+    if not images:
+        raise LookupError("There is no stream data to be exported")
+
+    interpolate_data = _check_interpolation(interpolate_data, im_min_type)
+    buffer_size, buffer_center, buffer_scale, view_hfw = _get_export_buffer(images, view_hfw, view_pos)
+    merge_ratios = _get_merge_ratios(images, draw_merge_ratio, raw)
+
+    def render(out, ims, mrs, convert):
+        # Draw the images directly into the output (above the legend), tile by tile
+        for (x, y, w, h), tile in render_export_tiles(ims, mrs, buffer_center, buffer_scale,
+                                                      buffer_size, interpolate_data,
+                                                      tile_size, max_workers):
+            out[y:y + h, x:x + w] = convert(tile)
+
+    # The list of images to export
+    data_to_export = []
+
+    if raw:
+        # One image per stream, each with its legend
+        for im, merge_ratio in zip(images, merge_ratios):
             legend_rgb = draw_export_legend(images, buffer_size, buffer_scale,
                                             view_hfw[0], im.metadata['date'],
                                             im.metadata['stream'], logo)
@@ -1888,25 +2056,93 @@ def images_to_export_data(streams, view_hfw, view_pos,
             else:
                 data_raw = stream.raw[0]
             legend_as_raw = _adapt_rgb_to_raw(legend_rgb, data_raw, stream, im_min_type)
-            new_data_to_draw = _unpack_raw_data(data_to_draw, im_min_type)
-            data_with_legend = numpy.append(new_data_to_draw, legend_as_raw, axis=0)
+
+            data_with_legend = numpy.empty((buffer_size[1] + legend_as_raw.shape[0], buffer_size[0]),
+                                           dtype=im_min_type)
+            render(data_with_legend, [im], [merge_ratio],
+                   lambda t: _unpack_raw_data(t, im_min_type))
+            data_with_legend[buffer_size[1]:] = legend_as_raw
 
             md = {model.MD_DESCRIPTION: im.metadata['name']}
             data_to_export.append(model.DataArray(data_with_legend, md))
-
-    # Create legend for print-ready
-    if not raw:
+    else:
+        # Print-ready: all the streams drawn on the same image
         date = max(im.metadata['date'] for im in images)
         legend_rgb = draw_export_legend(images, buffer_size, buffer_scale,
                                         view_hfw[0], date, logo=logo)
-        data_with_legend = numpy.append(data_to_draw, legend_rgb, axis=0)
-        data_with_legend[:, :, [2, 0]] = data_with_legend[:, :, [0, 2]]
+        data_with_legend = numpy.empty((buffer_size[1] + legend_rgb.shape[0], buffer_size[0], 4),
+                                       dtype=numpy.uint8)
+        render(data_with_legend, images, merge_ratios, lambda t: t)
+        data_with_legend[buffer_size[1]:] = legend_rgb
+        _bgra_to_rgba(data_with_legend)
         md = {model.MD_DIMS: 'YXC'}
         data_to_export.append(model.DataArray(data_with_legend, md))
 
     return data_to_export
 
 
+def images_to_export_file(filename, streams, view_hfw, view_pos, draw_merge_ratio,
+                          interpolate_data=False, logo=None,
+                          tile_size=EXPORT_TILE_SIZE, max_workers=None):
+    """
+    Same as images_to_export_data() for the print-ready export, but writes
+    directly the image to a PNG file, without ever holding the whole image in
+    memory. Only a row of tiles is kept in memory at a time, so it's suitable
+    for exporting very large images.
+    filename (unicode): the PNG file to write
+    view_hfw (tuple of float): X (width), Y (height) in m
+    view_pos (tuple of float): center position X, Y in m
+    logo (RGBA DataArray): Image to display in the legend
+    tile_size (int): maximum width and height of the tiles drawn in parallel
+    max_workers (None or int): number of tiles drawn simultaneously. If None,
+      it's the number of CPUs.
+    return (int, int): the size of the image written (including the legend)
+    raise LookupError: if no data visible in the selected FoV
+    """
+    images, im_min_type = convert_streams_to_images(streams, raw=False)
+    if not images:
+        raise LookupError("There is no stream data to be exported")
+
+    interpolate_data = _check_interpolation(interpolate_data, im_min_type)
+    buffer_size, buffer_center, buffer_scale, view_hfw = _get_export_buffer(images, view_hfw, view_pos)
+    merge_ratios = _get_merge_ratios(images, draw_merge_ratio)
+    date = max(im.metadata['date'] for im in images)
+    legend_rgb = draw_export_legend(images, buffer_size, buffer_scale,
+                                    view_hfw[0], date, logo=logo)
+    size = buffer_size[0], buffer_size[1] + legend_rgb.shape[0]
+
+    writer = png.PNGRowWriter(filename, size[0], size[1], alpha=True)
+    try:
+        strip = None  # one row of tiles
+        for (x, y, w, h), tile in render_export_tiles(images, merge_ratios, buffer_center,
+                                                      buffer_scale, buffer_size, interpolate_data,
+                                                      tile_size, max_workers):
+            if x == 0:  # new row
+                if strip is not None:
+                    _bgra_to_rgba(strip)
+                    writer.write_rows(strip)
+                strip = numpy.empty((h, buffer_size[0], 4), dtype=numpy.uint8)
+            strip[:, x:x + w] = tile
+        _bgra_to_rgba(strip)
+        writer.write_rows(strip)
+        del strip
+
+        legend_rgb = numpy.ascontiguousarray(legend_rgb)
+        _bgra_to_rgba(legend_rgb)
+        writer.write_rows(legend_rgb)
+    except Exception:
+        writer.close()
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+        raise
+    else:
+        writer.close()
+
+    return size
+
+
 def _adapt_rgb_to_raw(imrgb, data_raw, stream, dtype):
     """
     imrgb (ndarray Y,X,4): RGB image to convert to a greyscale
@@ -25,6 +25,7 @@ import cairo
 import logging
 import numpy
 import os
+import scipy.misc
 import time
 import unittest
 import wx
@@ -542,6 +543,132 @@ class TestSpatialExport(unittest.TestCase):
         self.assertEqual(len(exp_data[0].shape), 2)  # greyscale
         self.assertEqual(exp_data[0].shape[1], img.CROP_RES_LIMIT)
 
+    def _create_pattern_stream(self):
+        """
+        Creates a stream with a known pattern: black and white squares of 8 px,
+        with a pixel size which is kept for the export (so no resampling).
+        return (Stream, view_hfw, view_pos)
+        """
+        shape = (1200, 1600)
+        yy, xx = numpy.mgrid[0:shape[0], 0:shape[1]]
+        data = (((yy // 8) + (xx // 8)) % 2 * 255).astype(numpy.uint8)
+        # Some lines and columns to detect any shift
+        data[::97, :] = 255
+        data[:, ::89] = 0
+        pxs = 2 ** -23  # ~0.1 µm, exactly representable, to avoid rounding errors
+        md = {model.MD_PIXEL_SIZE: (pxs, pxs),
+              model.MD_POS: (0, 0),
+              model.MD_ACQ_DATE: time.time(),
+              model.MD_DESCRIPTION: "Pattern"}
+        pstream = stream.StaticSEMStream("Pattern", model.DataArray(data, md))
+        time.sleep(0.5)  # Wait for the RGB image
+        view_hfw = (shape[1] * pxs, shape[0] * pxs)
+        return stream.RGBSpatialProjection(pstream), view_hfw, (0, 0), data
+
+    def test_tiled(self):
+        """
+        Drawing with small tiles gives the same result as with big tiles
+        """
+        pstream, view_hfw, view_pos, data = self._create_pattern_stream()
+        exp_big = img.images_to_export_data([pstream], view_hfw, view_pos, 0.3, False,
+                                            tile_size=100000, max_workers=1)
+        exp_small = img.images_to_export_data([pstream], view_hfw, view_pos, 0.3, False,
+                                              tile_size=200, max_workers=4)
+        self.assertEqual(exp_big[0].shape[1], data.shape[1])
+        self.assertGreater(exp_big[0].shape[0], data.shape[0])  # + legend
+        numpy.testing.assert_array_equal(exp_big[0], exp_small[0])
+        # The pattern is drawn as-is (greyscale, so all the channels are equal)
+        numpy.testing.assert_array_equal(exp_big[0][:data.shape[0], :, 0], data)
+
+        # Same for the raw data
+        exp_big = img.images_to_export_data([pstream], view_hfw, view_pos, 0.3, True,
+                                            tile_size=100000, max_workers=1)
+        exp_small = img.images_to_export_data([pstream], view_hfw, view_pos, 0.3, True,
+                                              tile_size=200, max_workers=4)
+        numpy.testing.assert_array_equal(exp_big[0], exp_small[0])
+
+        # With the original streams, with various pixel sizes
+        view_hfw = (8.191282393266523e-05, 6.205915392651362e-05)
+        view_pos = [-0.001203511795256, -0.000295338300158]
+        exp_big = img.images_to_export_data(self.streams, view_hfw, view_pos, 0.3, False,
+                                            tile_size=100000, max_workers=1)
+        exp_small = img.images_to_export_data(self.streams, view_hfw, view_pos, 0.3, False,
+                                              tile_size=200, max_workers=4)
+        numpy.testing.assert_array_equal(exp_big[0], exp_small[0])
+
+    def test_tiled_transformed(self):
+        """
+        Drawing with small tiles gives the same result as with one tile, also
+        when the images are upscaled, rotated and sheared
+        """
+        pxs = 2 ** -23
+        shape = (300, 400)
+        yy, xx = numpy.mgrid[0:shape[0], 0:shape[1]]
+        data = (((yy // 8) + (xx // 8)) % 2 * 200 + 55).astype(numpy.uint8)
+        md = {model.MD_PIXEL_SIZE: (pxs * 4, pxs * 4),  # upscaled 4x in the export
+              model.MD_POS: (0, 0),
+              model.MD_ROTATION: 0.3,  # rad
+              model.MD_SHEAR: 0.1,
+              model.MD_ACQ_DATE: time.time(),
+              model.MD_DESCRIPTION: "Rotated"}
+        rstream = stream.StaticSEMStream("Rotated", model.DataArray(data, md))
+        # A small image, with the smallest pixel size, which fixes the pixel size of the export
+        md = {model.MD_PIXEL_SIZE: (pxs, pxs),
+              model.MD_POS: (0, 0),
+              model.MD_ACQ_DATE: time.time(),
+              model.MD_DESCRIPTION: "Small"}
+        sstream = stream.StaticSEMStream("Small", model.DataArray(numpy.zeros((16, 16), numpy.uint8), md))
+        time.sleep(0.5)  # Wait for the RGB images
+        streams = [stream.RGBSpatialProjection(rstream), stream.RGBSpatialProjection(sstream)]
+
+        # Larger than the image, to contain it even when rotated
+        view_hfw = (shape[1] * 4 * pxs * 1.4, shape[0] * 4 * pxs * 1.4)
+        exp_big = img.images_to_export_data(streams, view_hfw, (0, 0), 0.3, False,
+                                            tile_size=100000, max_workers=1)
+        exp_small = img.images_to_export_data(streams, view_hfw, (0, 0), 0.3, False,
+                                              tile_size=128, max_workers=4)
+        self.assertEqual(exp_big[0].shape, exp_small[0].shape)
+        # The buffer has the same pixel size as the small image => upscaled
+        self.assertEqual(exp_big[0].shape[1], shape[1] * 4)
+
+        # Only a few pixels exactly on the border of the image data pixels might
+        # be different, due to floating point rounding.
+        diff = numpy.any(exp_big[0] != exp_small[0], axis=2)
+        self.assertLess(numpy.count_nonzero(diff), diff.size * 1e-3)
+
+        # The export is cropped to the bounding box of the image, without
+        # rotation, so the rotated image covers ~90% of it (and the pattern is
+        # never black).
+        buf_h = shape[0] * 4  # without legend
+        coverage = numpy.count_nonzero(exp_small[0][:buf_h, :, 0]) / (buf_h * exp_small[0].shape[1])
+        self.assertGreater(coverage, 0.8)
+
+    def test_export_file(self):
+        """
+        Export directly to a PNG file, and check it's the same as in memory
+        """
+        pstream, view_hfw, view_pos, data = self._create_pattern_stream()
+        filename = "test-export.png"
+
+        startt = time.time()
+        exp_data = img.images_to_export_data([pstream], view_hfw, view_pos, 0.3, False,
+                                             tile_size=256)
+        dur_mem = time.time() - startt
+
+        startt = time.time()
+        size = img.images_to_export_file(filename, [pstream], view_hfw, view_pos,
+                                         0.3, tile_size=256)
+        dur_file = time.time() - startt
+        logging.info("Exported %s in %g s in memory, and %g s to file", size, dur_mem, dur_file)
+
+        self.assertEqual(size, exp_data[0].shape[1::-1])
+        rdata = scipy.misc.imread(filename)
+        self.assertEqual(rdata.shape, exp_data[0].shape)
+        numpy.testing.assert_array_equal(rdata, exp_data[0])
+        numpy.testing.assert_array_equal(rdata[:data.shape[0], :, 0], data)
+
+        os.remove(filename)
+
 
 class TestSpatialExportAcquisitionData(unittest.TestCase):
 
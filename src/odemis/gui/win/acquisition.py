@@ -589,7 +589,7 @@ def ShowAcquisitionFileDialog(parent, filename):
     conf = get_acqui_conf()
 
     # Find the available formats (and corresponding extensions)
-    formats_to_ext = dataio.get_available_formats()
+    formats_to_ext = dataio.get_available_formats(os.O_WRONLY)
 
     # current filename
     path, base = os.path.split(filename)
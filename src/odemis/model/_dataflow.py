@@ -35,11 +35,90 @@ from odemis.util.weak import WeakMethod, WeakRefLostError
 import os
 import threading
 import time
+import weakref
 import zmq
 
 from . import _core
 
 
+class _MetadataDict(dict):
+    """
+    Metadata dict of a DataArray, which can be shared with the arrays derived
+    from it (views, slices, ufunc results...). Before it is modified, the
+    arrays still sharing it get their own copy, so that they keep the metadata
+    as it was when they were derived.
+    """
+    # weakrefs to the DataArrays sharing this dict (without owning it)
+    __slots__ = ("_sharers",)
+
+    def __reduce__(self):
+        # Pickled as a standard dict (the sharers are only meaningful locally)
+        return dict, (dict(self),)
+
+    def _share(self, da):
+        """
+        da (DataArray): an array which uses this dict until it accesses it
+        """
+        try:
+            sharers = self._sharers
+        except AttributeError:
+            sharers = self._sharers = []
+        n = len(sharers)
+        if n >= 64 and not n & (n - 1):  # From time to time, drop the dead arrays
+            sharers[:] = [r for r in sharers if r() is not None]
+        sharers.append(weakref.ref(da))
+
+    def _unshare(self):
+        """
+        Gives a copy of the dict to the arrays still sharing it
+        """
+        sharers = self._sharers
+        self._sharers = []
+        snapshot = None
+        for r in sharers:
+            da = r()
+            if da is not None and da._md_shared and da._md is self:
+                if snapshot is None:
+                    snapshot = _MetadataDict(self)
+                da._md = snapshot
+                snapshot._share(da)
+
+    def __setitem__(self, key, value):
+        if getattr(self, "_sharers", None):
+            self._unshare()
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        if getattr(self, "_sharers", None):
+            self._unshare()
+        dict.__delitem__(self, key)
+
+    def clear(self):
+        if getattr(self, "_sharers", None):
+            self._unshare()
+        dict.clear(self)
+
+    def pop(self, *args):
+        if getattr(self, "_sharers", None):
+            self._unshare()
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        if getattr(self, "_sharers", None):
+            self._unshare()
+        return dict.popitem(self)
+
+    def setdefault(self, *args):
+        if getattr(self, "_sharers", None):
+            self._unshare()
+        return dict.setdefault(self, *args)
+
+    def update(self, *args, **kwargs):
+        if getattr(self, "_sharers", None):
+            self._unshare()
+        dict.update(self, *args, **kwargs)
+
+
 class DataArray(numpy.ndarray):
     """
     Array of data (a numpy nd.array) + metadata.
@@ -59,20 +138,49 @@ class DataArray(numpy.ndarray):
         """
         obj = numpy.asarray(input_array).view(cls)
         if metadata is None:
-            metadata = {}
+            metadata = _MetadataDict()
         obj.metadata = metadata
         return obj
 
+    # The arrays derived from a DataArray (views, slices, ufunc results...)
+    # share its metadata dict, and only copy it when they access it. As most of
+    # these derived arrays are temporary and never look at their metadata, this
+    # avoids copying the dict for each of them. Only a _MetadataDict can be
+    # shared, as it takes care of the sharing arrays before being modified. A
+    # dict passed by the caller is always copied.
+    # _md_shared is True if _md belongs to another array.
+    _md_shared = False
+
     def __array_finalize__(self, obj):
         if obj is None:
             return
 
-        if hasattr(obj, 'metadata'):
+        md = getattr(obj, "_md", None)
+        if isinstance(md, _MetadataDict):
+            md._share(self)
+            self._md = md
+            self._md_shared = True
+        elif hasattr(obj, 'metadata'):
             # Create a shallow copy of the meta data, otherwise when the array
             # gets copied, both will use the same meta data dictionary.
-            self.metadata = obj.metadata.copy()
+            self._md = _MetadataDict(obj.metadata)
         else:
-            self.metadata = {}
+            self._md = _MetadataDict()
+
+    @property
+    def metadata(self):
+        """
+        dict str-> value: the metadata, only used by this array
+        """
+        if self._md_shared:
+            self._md = _MetadataDict(self._md)
+            self._md_shared = False
+        return self._md
+
+    @metadata.setter
+    def metadata(self, md):
+        self._md = md
+        self._md_shared = False
 
     # Used to send the DataArray over Pyro (over ZMQ, we use an optimised way)
     def __reduce__(self):
@@ -573,7 +681,8 @@ class SubscribeProxyThread(threading.Thread):
                     else: # frombuffer doesn't support zero length array
                         array = numpy.empty((0,), dtype=array_format["dtype"])
                     array.shape = array_format["shape"]
-                    darray = DataArray(array, metadata=array_md)
+                    # The metadata is only used by this array => can be shared
+                    darray = DataArray(array, metadata=_MetadataDict(array_md))
 
                     try:
                         self.w_notifier(darray)
@@ -120,7 +120,10 @@ class ParallelThreadPoolExecutor(ThreadPoolExecutor):
     """
     An extended ThreadPoolExecutor that can execute multiple jobs in parallel
     -if not on the same dependences set.
-    Note that the tasks are still always executed in order they were submitted.
+    Note that the tasks with intersecting dependences are still always executed
+    in the order they were submitted. However, a task can start before an older
+    task which is waiting, if they have no dependence in common (ie, X>AB>X can
+    be executed as X/AB>X, but XA>AB>X must be executed as XA>AB/X).
     It also allows non standard Future to be created.
     """
     def __init__(self):
@@ -134,27 +137,32 @@ class ParallelThreadPoolExecutor(ThreadPoolExecutor):
         self._set_remove = threading.Lock()
 
     def _schedule_work(self):
-        while self._waiting_work:
-            with self._set_remove:
-                w, f, dependences = self._waiting_work.pop()
+        with self._set_remove:
+            # dependences of the tasks which have to wait, so that the later
+            # tasks using them wait too (to keep the order)
+            blocked = set()
+            waiting = collections.deque()
+            while self._waiting_work:
+                w, f, dependences = self._waiting_work.pop()  # oldest first
                 if f not in self._queue:
                     # the future has already been cancelled => forget about it
                     continue
 
-                # do not schedule the task (and any later ones) if its dependences
-                # set has an intersection with some of the ongoing tasks
-                for dep in self._sets_in_progress.values():
-                    if dep & dependences:  # intersects?
-                        logging.debug("Waiting for scheduling task with dep %s, conflicting with current %s",
-                                      dependences, set.union(*self._sets_in_progress.values()))
-                        # put it back to the queue
-                        self._waiting_work.append((w, f, dependences))
-                        return
+                # do not schedule the task if its dependences set has an
+                # intersection with some of the ongoing tasks or with an older
+                # task still waiting
+                if (blocked & dependences or
+                    any(dep & dependences for dep in self._sets_in_progress.values())):
+                    logging.debug("Waiting for scheduling task with dep %s", dependences)
+                    blocked |= dependences
+                    waiting.appendleft((w, f, dependences))
                 else:
                     self._work_queue.put(w)
                     self._adjust_thread_count()
                     self._sets_in_progress[id(f)] = dependences
 
+            self._waiting_work = waiting
+
     def submitf(self, dependences, f, fn, *args, **kwargs):
         """
         submit a task, handled by the given fresh Future
@@ -26,6 +26,7 @@ These are the conventional metadata available in a DataArray.
 MD_EXP_TIME = "Exposure time" # s
 MD_ACQ_DATE = "Acquisition date" # s since epoch
 MD_AD_LIST = "Acquisition dates" # s since epoch for each element in dimension T
+MD_FRAME_NUM = "Frame number"  # int, sequence number of the frame since the beginning of the acquisition (a gap indicates dropped frames)
 # distance between two points on the sample that are seen at the centre of two
 # adjacent pixels considering that these two points are in focus
 MD_PIXEL_SIZE = "Pixel size" # (m, m)
@@ -46,6 +47,9 @@ MD_SENSOR_SIZE = "Sensor size" # px, px, maximum resolution that can be acquire
 MD_SENSOR_TEMP = "Sensor temperature" # C
 MD_POS = "Centre position" # (m, m), location of the picture centre. X goes right, and Y goes up
 # Note that for angular resolved acquisitions, MD_POS corresponds to the position of the e-beam on the sample
+MD_FRAME_POS = "Frame position"  # (px, px), X/Y position of the top-left pixel of a partial frame (only present on partial frames)
+MD_FRAME_RES = "Frame resolution"  # (px, px), X/Y resolution of the complete frame which a partial frame is part of (also present on frames still being assembled from partial frames)
+# Note: the rest of the metadata of a partial frame (eg, MD_POS) is the one of the complete frame
 MD_ROTATION = "Rotation" # radians (0<=float<2*PI) rotation applied to the image (from its center) counter-clockwise
 # Note that the following two might be a set of ranges
 MD_IN_WL = "Input wavelength range" # (m, m) or (m, m, m, m, m), lower and upper range of the wavelength input
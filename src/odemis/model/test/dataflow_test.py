@@ -24,6 +24,7 @@ from __future__ import division
 from Pyro4.core import oneway
 from odemis import model
 import logging
+import numpy
 import pickle
 import threading
 import time
@@ -171,6 +172,99 @@ class TestDataFlow(unittest.TestCase):
         self.assertEqual(darray.metadata, up_darray.metadata, "metadata is different after pickling")
         self.assertEqual(up_darray.metadata["a"], 1)
 
+    def test_dataarray_metadata(self):
+        md = {"a": 1, "b": 2}
+        darray = model.DataArray(numpy.zeros((10, 10)), metadata=md)
+        self.assertIs(darray.metadata, md)
+
+        # Derived arrays start with the same metadata, but are independent
+        view = darray[2:5]
+        res = darray + 1
+        self.assertEqual(view.metadata, md)
+        self.assertEqual(res.metadata, md)
+        darray.metadata["c"] = 3
+        self.assertNotIn("c", view.metadata)
+        self.assertNotIn("c", res.metadata)
+        view.metadata["d"] = 4
+        self.assertNotIn("d", darray.metadata)
+        self.assertNotIn("d", res.metadata)
+        self.assertIn("d", view[1:].metadata)
+
+        # Pickling a derived array keeps its metadata
+        up_view = pickle.loads(pickle.dumps(view[1:], pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(up_view.metadata, view.metadata)
+
+        # Views from a standard ndarray have empty metadata
+        self.assertEqual(numpy.zeros(3).view(model.DataArray).metadata, {})
+
+    def test_dataarray_metadata_shared(self):
+        """
+        The metadata is shared with the derived arrays, but they behave as if
+        it had been copied
+        """
+        darray = model.DataArray(numpy.zeros((10, 10)))
+        darray.metadata.update({"a": 1, "b": 2})
+
+        # Changing the metadata, via a reference obtained before deriving
+        md = darray.metadata
+        view = darray[1:]
+        view2 = view[1:]  # derived from an array which still shares the metadata
+        md["x"] = 1
+        self.assertIs(darray.metadata, md)
+        self.assertNotIn("x", view.metadata)
+        self.assertNotIn("x", view2.metadata)
+        self.assertEqual(view.metadata, {"a": 1, "b": 2})
+        del md["a"]
+        self.assertEqual(darray[1:].metadata, {"b": 2, "x": 1})
+        self.assertEqual(view2.metadata, {"a": 1, "b": 2})
+
+        # The reference stays valid after deriving an array
+        md2 = darray.metadata
+        res = darray * 2
+        md2["y"] = 2
+        self.assertIn("y", darray.metadata)
+        self.assertIs(darray.metadata, md2)
+        self.assertNotIn("y", res.metadata)
+        res.metadata["z"] = 3
+        self.assertNotIn("z", darray.metadata)
+
+        # Pickled (and copied) as a standard dict
+        up_res = pickle.loads(pickle.dumps(res, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(up_res.metadata, res.metadata)
+        self.assertEqual(type(pickle.loads(pickle.dumps(res.metadata))), dict)
+
+    def _measure_derive(self, darray):
+        """
+        return (float): the time (in s) to slice the array, and read the slice
+        """
+        n = 10000
+        durs = []
+        for r in range(5):
+            startt = time.time()
+            for i in range(n):
+                darray[i % 100]
+            durs.append((time.time() - startt) / n)
+        return min(durs)
+
+    def test_dataarray_derive_speed(self):
+        """
+        Deriving an array without looking at its metadata is faster if the
+        metadata doesn't need to be copied
+        """
+        md = dict(("key%d" % i, i) for i in range(40))
+        # The metadata is a dict given by the caller => it's copied (as before)
+        darray_cp = model.DataArray(numpy.zeros((100, 100), dtype=numpy.uint16), metadata=md)
+        # The metadata belongs to the DataArray => it's shared
+        darray = model.DataArray(numpy.zeros((100, 100), dtype=numpy.uint16))
+        darray.metadata.update(md)
+
+        dur_cp = self._measure_derive(darray_cp)
+        dur_shared = self._measure_derive(darray)
+        logging.info("Slicing takes %g µs with copy, %g µs with sharing",
+                     dur_cp * 1e6, dur_shared * 1e6)
+        self.assertLess(dur_shared, dur_cp)
+        self.assertEqual(darray.metadata, md)
+
 #    @unittest.skip("simple")
     def test_df_subscribe_get(self):
         self.df = SimpleDataFlow()
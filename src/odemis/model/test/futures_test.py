@@ -170,6 +170,25 @@ class TestExecutor(unittest.TestCase):
             self.assertIsInstance(f.result(), int)
             self.assertTrue(f.done())
 
+    def test_parallel_order(self):
+        """
+        Check tasks can overtake waiting tasks only if they have no dependence
+        in common.
+        """
+        self.executor = ParallelThreadPoolExecutor()
+        startt = time.time()
+        fx1 = self.executor.submit({"x"}, self._task, 0.5)
+        fx2 = self.executor.submit({"x", "a"}, self._task, 0.1)
+        fa = self.executor.submit({"a"}, self._task, 0.1)  # must wait for fx2
+        fb = self.executor.submit({"b"}, self._task, 0.1)  # can run immediately
+        fb.result()
+        self.assertLess(time.time() - startt, 0.4)
+        self.assertFalse(fx2.done())
+        fa.result()
+        self.assertTrue(fx1.done())
+        self.assertTrue(fx2.done())
+        self.assertGreaterEqual(time.time() - startt, 0.7)
+
     def _cancellable_task(self, future, dur=0):
         """
         Fake task
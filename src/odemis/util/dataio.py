@@ -78,6 +78,8 @@ def data_to_static_streams(data):
             # (expected it's on the 4th dim, in s, instead of 5th dim in m).
             # FIXME: make the StaticSpectrumStream more generic, to support any
             # 3D data (ie, dYX).
+            if isinstance(d, model.DataArrayShadow):
+                d = d.getData()
             i3d = [0] * (d.ndim - 2) + [slice(None), slice(None)]
             i3d[ti] = slice(None)
             sda = d[tuple(i3d)] # basically, d[0, :, 0, :, :] for CTZYX
@@ -129,7 +131,8 @@ def data_to_static_streams(data):
             # Now, either it's a flat greyscale image and we decide it's a SEM image,
             # or it's gone too weird and we try again on flat images
             if numpy.prod(d.shape[:-2]) != 1:
-                # FIXME: doesn't work currently if d is a DAS
+                if isinstance(d, model.DataArrayShadow):
+                    d = d.getData()
                 subdas = _split_planes(d)
                 logging.info("Reprocessing data of shape %s into %d sub-data",
                              d.shape, len(subdas))
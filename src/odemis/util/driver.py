@@ -22,6 +22,7 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 from __future__ import division
 
 from Pyro4.errors import CommunicationError
+import bisect
 import collections
 import logging
 import math
@@ -140,6 +141,61 @@ def estimateMoveDuration(distance, speed, accel):
         return t1 + t2
 
 
+LATENCY_BINS = (1e-3, 2e-3, 5e-3, 10e-3, 20e-3, 50e-3, 100e-3, 200e-3, 500e-3, float("inf"))
+
+
+class LatencyStats(object):
+    """
+    Statistics on the latency of one type of command
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0  # s
+        self.max = 0  # s
+        # number of commands in each bin of LATENCY_BINS
+        self.histogram = [0] * len(LATENCY_BINS)
+
+    def add(self, dur):
+        """
+        dur (0<=float): latency of one command (in s)
+        """
+        self.count += 1
+        self.total += dur
+        self.max = max(self.max, dur)
+        self.histogram[bisect.bisect_left(LATENCY_BINS, dur)] += 1
+
+    @property
+    def mean(self):
+        if self.count == 0:
+            return 0
+        return self.total / self.count
+
+    def __repr__(self):
+        return "<%d commands, mean=%g s, max=%g s, histogram=%s>" % (
+                   self.count, self.mean, self.max, self.histogram)
+
+
+# Minimum time (in s) between two partial frames, when partialData is subscribed
+PARTIAL_FRAME_PERIOD = 0.5
+
+
+class PartialDataFlow(model.DataFlow):
+    """
+    DataFlow on which the partial frames of a detector are sent. Subscribing
+    to it doesn't start the acquisition: the frames are only acquired while
+    the main DataFlow of the detector is subscribed.
+    """
+    def __init__(self):
+        model.DataFlow.__init__(self)
+        self.active = False  # True while there are subscribers
+
+    def start_generate(self):
+        self.active = True
+
+    def stop_generate(self):
+        self.active = False
+
+
 def checkLightBand(band):
     """
     Check that the given object looks like a light band. It should either be
@@ -168,6 +168,73 @@ def compactHistogram(hist, length):
     chist = hist.reshape(length, hist.size // length)
     return numpy.sum(chist, 1)
 
+
+def decimatePlot(xs, ys, width, range_x=None):
+    """
+    Reduce the number of points of a 1D plot, so that it looks the same once
+    drawn on a given number of pixels. For each pixel column, only the first,
+    minimum, maximum and last points are kept (aka M4 decimation), so the
+    envelope of the data is preserved.
+    xs (ndarray 1D of numbers): X values, sorted in strictly increasing order
+    ys (ndarray 1D of numbers): Y values, of the same length as xs
+    width (0<int): number of pixels on which the data will be drawn
+    range_x (None or tuple of 2 numbers): X values shown at the first and last
+      pixel. If None, the first and last X values are used.
+    return xs, ys (ndarray 1D of float): the decimated data, with at most
+      4 * width points, and X still strictly increasing (if it was). If the
+      data is already small enough, it is returned unchanged.
+    """
+    xs = numpy.asarray(xs)
+    ys = numpy.asarray(ys)
+    if xs.shape != ys.shape:
+        raise ValueError("X and Y have different shapes: %s vs %s" % (xs.shape, ys.shape))
+    n = xs.size
+    if n <= 4 * width:
+        return xs, ys
+
+    if range_x is None:
+        range_x = xs[0], xs[-1]
+    if range_x[1] <= range_x[0]:
+        return xs, ys
+
+    # Pixel column of each point. As xs is sorted, the columns are too.
+    # Instead of computing the column of every point, find where each column
+    # starts, which is only O(width * log(n)).
+    bounds = numpy.linspace(range_x[0], range_x[1], width + 1)[1:-1]
+    starts = numpy.searchsorted(xs, bounds, side="left")
+    starts = numpy.unique(numpy.concatenate(([0], starts)))
+    starts = starts[starts < n]
+    ends = numpy.append(starts[1:], n) - 1
+
+    ymin = numpy.minimum.reduceat(ys, starts)
+    ymax = numpy.maximum.reduceat(ys, starts)
+
+    # The X values must stay unique (and sorted), so the min and max are placed
+    # at 1/3 and 2/3 of the column. The order of the min and max inside the
+    # column doesn't matter as it's drawn within one pixel. The columns with
+    # less than 4 points are kept as-is.
+    counts = ends - starts + 1
+    big = counts >= 4
+    sb, eb = starts[big], ends[big]
+    third = (xs[eb] - xs[sb]) / 3
+
+    dxs = numpy.empty((sb.size, 4), dtype=numpy.float64)
+    dys = numpy.empty((sb.size, 4), dtype=numpy.float64)
+    dxs[:, 0] = xs[sb]
+    dxs[:, 1] = xs[sb] + third
+    dxs[:, 2] = xs[eb] - third
+    dxs[:, 3] = xs[eb]
+    dys[:, 0] = ys[sb]
+    dys[:, 1] = ymin[big]
+    dys[:, 2] = ymax[big]
+    dys[:, 3] = ys[eb]
+
+    small = numpy.repeat(~big, counts)  # points of the columns kept as-is
+    dxs = numpy.concatenate((dxs.ravel(), xs[small]))
+    dys = numpy.concatenate((dys.ravel(), ys[small]))
+    order = numpy.argsort(dxs, kind="mergesort")
+    return dxs[order], dys[order]
+
 # TODO: compute histogram faster. There are several ways:
 # * x=numpy.bincount(a.flat, minlength=depth) => fast (~0.03s for
 #   a 2048x2048 array) but only works on flat array with uint8 and uint16 and
@@ -707,6 +774,151 @@ def mergeTiles(tiles):
 
     return result
 
+
+def _readZoomLevel(das, z):
+    """
+    Reads a complete zoom level of a pyramidal DataArrayShadow
+    das (DataArrayShadow): the data, with .maxzoom and .getTile()
+    z (0<=int): the zoom level
+    return (DataArray): the merged tiles
+    """
+    width_zoomed = das.shape[1] / (2 ** z)
+    height_zoomed = das.shape[0] / (2 ** z)
+    num_tiles_x = int(math.ceil(width_zoomed / das.tile_shape[1]))
+    num_tiles_y = int(math.ceil(height_zoomed / das.tile_shape[0]))
+
+    tiles = []
+    for x in range(num_tiles_x):
+        tiles.append([das.getTile(x, y, z) for y in range(num_tiles_y)])
+
+    return mergeTiles(tiles)
+
+
+def _binYX(data, factor, rgb=False):
+    """
+    Reduces the resolution of an image, by averaging blocks of pixels.
+    The pixels which don't fit in a complete block (on the bottom and right
+    borders) are dropped.
+    data (numpy.array): the image, with YX as last dimensions, or YXC if rgb
+    factor (int, int): number of pixels averaged along Y and X
+    rgb (bool): if True, the last dimension is C (and not binned)
+    return (numpy.array of same dtype): the binned image
+    """
+    nt = 1 if rgb else 0
+    tail = data.shape[data.ndim - nt:]
+    lead = data.shape[:data.ndim - 2 - nt]
+    sy, sx = data.shape[data.ndim - 2 - nt:data.ndim - nt]
+    fy, fx = factor
+    h, w = (sy // fy) * fy, (sx // fx) * fx
+
+    # First bin along Y, which only needs a view of the (complete) lines,
+    # then along X, on the (already smaller) data.
+    d = numpy.asarray(data)[(Ellipsis, slice(0, h), slice(None)) + (slice(None),) * nt]
+    d = d.reshape(lead + (h // fy, fy, sx) + tail)
+    d = d.sum(axis=d.ndim - 2 - nt, dtype=numpy.float64)
+    d = d[(Ellipsis, slice(0, w)) + (slice(None),) * nt]
+    d = d.reshape(lead + (h // fy, w // fx, fx) + tail)
+    d = d.sum(axis=d.ndim - 1 - nt)
+    d /= fy * fx
+    return d.astype(data.dtype)
+
+
+def getReducedData(data, shape):
+    """
+    Reduces the spatial resolution of an image to fit in the given shape,
+    while reading (and computing) as little data as possible: for pyramidal
+    data, the smallest zoom level which is still bigger than the shape is used,
+    and for data stored as multiple planes, each plane is read and reduced
+    separately.
+    data (DataArray or DataArrayShadow): the image. The last two dimensions
+      are YX (or YXC, for a RGB image with MD_DIMS = "YXC").
+    shape (int, int): maximum size of the result in Y and X
+    return (DataArray): the data reduced by the same integer factor along Y
+      and X (so the ratio is kept), and the other dimensions are the same.
+      The metadata linked to the pixel size is updated.
+    """
+    dims = data.metadata.get(model.MD_DIMS, "CTZYX"[-data.ndim::])
+    rgb = (dims == "YXC")
+    if rgb:
+        yx_shape = data.shape[0:2]
+    else:
+        yx_shape = data.shape[-2:]
+    # Same factor on both dimensions, so that the pixels stay square
+    factor = max(1, int(math.ceil(max(s / m for s, m in zip(yx_shape, shape)))))
+    zoom = 1
+
+    if hasattr(data, "maxzoom") and (data.ndim == 2 or rgb):
+        # Pick the smallest zoom level which is still bigger than the shape
+        z = min(data.maxzoom, int(math.log(factor, 2)))
+        logging.debug("Reading zoom level %d of image of shape %s", z, data.shape)
+        data = _readZoomLevel(data, z)
+        zoom = 2 ** z
+        yx_shape = data.shape[0:2]
+        factor = max(1, int(math.ceil(max(s / m for s, m in zip(yx_shape, shape)))))
+
+    fyx = tuple(min(factor, s) for s in yx_shape)
+    if fyx == (1, 1):
+        reduced = data if isinstance(data, model.DataArray) else data.getData()
+    elif hasattr(data, "getPlane") and data.ndim > 2 and not rgb:
+        # Reduce each plane independently, so that the whole data never needs
+        # to be in memory.
+        hshape = data.shape[:-2]
+        reduced = numpy.empty(hshape + (yx_shape[0] // fyx[0], yx_shape[1] // fyx[1]),
+                              dtype=data.dtype)
+        for i in numpy.ndindex(*hshape):
+            reduced[i] = _binYX(data.getPlane(i), fyx)
+    else:
+        if not isinstance(data, numpy.ndarray):
+            data = data.getData()
+        reduced = _binYX(data, fyx, rgb)
+
+    # Update the metadata
+    md = data.metadata.copy()
+    fxy = fyx[::-1]
+    scale = tuple(zoom * f for f in fxy)  # total reduction, from the original data
+    if model.MD_PIXEL_SIZE in md:
+        # The tiles of a zoom level already have the pixel size updated
+        md[model.MD_PIXEL_SIZE] = tuple(v * f for v, f in zip(md[model.MD_PIXEL_SIZE], fxy))
+    if model.MD_BINNING in md:
+        md[model.MD_BINNING] = tuple(v * s for v, s in zip(md[model.MD_BINNING], scale))
+    if model.MD_AR_POLE in md:
+        md[model.MD_AR_POLE] = tuple(v / s for v, s in zip(md[model.MD_AR_POLE], scale))
+    return model.DataArray(reduced, md)
+
+
+def getThumbnail(data, shape, irange=None, tint=(255, 255, 255)):
+    """
+    Computes a small RGB image representing the data. The data is reduced
+    before being projected (see getReducedData()), so it's much faster than
+    projecting the whole data and then rescaling it.
+    data (DataArray or DataArrayShadow): the image. The last two dimensions
+      are YX (or YXC, for a RGB image with MD_DIMS = "YXC"). If there are
+      other dimensions (eg, C for a spectrum), they are averaged.
+    shape (int, int): maximum size of the thumbnail in Y and X
+    irange (None or tuple of 2 values): see DataArray2RGB(). Only used for 2D
+      data, otherwise the range is automatically computed.
+    tint (3-tuple of 0 < int <256): see DataArray2RGB()
+    return (DataArray of shape YX3 and uint8): the thumbnail, with MD_DIMS = "YXC"
+    """
+    reduced = getReducedData(data, shape)
+    if (reduced.metadata.get(model.MD_DIMS) == "CYX" and reduced.shape[0] in (3, 4)
+        and reduced.dtype == numpy.uint8):
+        reduced = ensureYXC(reduced)
+    md = reduced.metadata.copy()
+    if md.get(model.MD_DIMS) == "YXC":
+        rgb = reduced[:, :, :3]
+        if rgb.dtype != numpy.uint8:
+            rgb = DataArray2RGB(RGB2Greyscale(rgb), irange, tint)
+    else:
+        if reduced.ndim > 2:
+            reduced = reduced.reshape((-1,) + reduced.shape[-2:]).mean(axis=0)
+            irange = None
+        rgb = DataArray2RGB(reduced, irange, tint)
+
+    md[model.MD_DIMS] = "YXC"
+    return model.DataArray(rgb, md)
+
+
 # TODO: rename without _
 def _getBoundingBox(content):
     """
@@ -16,9 +16,11 @@ You should have received a copy of the GNU General Public License along with Ode
 '''
 from __future__ import division
 
+from concurrent import futures
 from concurrent.futures._base import CancelledError, CANCELLED, FINISHED, RUNNING
 from itertools import izip
 import logging
+import multiprocessing
 import numpy
 from odemis import model
 from scipy.optimize import curve_fit
@@ -205,12 +207,17 @@ class PeakFitter(object):
         # will take care of executing peak fitting asynchronously
         # Maximum one task at a time as curve_fit() is not thread-safe
         self._executor = model.CancellableThreadPoolExecutor(max_workers=1)
+        # Fitting of whole cubes, which is done in separate processes, so it
+        # can run simultaneously to the single spectrum fitting.
+        self._cube_executor = model.CancellableThreadPoolExecutor(max_workers=1)
 
     def __del__(self):
-        if self._executor:
-            self._executor.cancel()
-            self._executor.shutdown()
-            self._executor = None
+        for e in (self._executor, self._cube_executor):
+            if e:
+                e.cancel()
+                e.shutdown()
+        self._executor = None
+        self._cube_executor = None
         logging.debug("PeakFitter destroyed")
 
     def Fit(self, spectrum, wavelength, type='gaussian'):
@@ -252,55 +259,11 @@ class PeakFitter(object):
                 ValueError if fitting cannot be applied
         """
         try:
-            # values based on experimental datasets
-            if len(wavelength) >= 2000:
-                divider = 20
-            elif len(wavelength) >= 1000:
-                divider = 25
-            else:
-                divider = 30
-            init_window_size = max(3, len(wavelength) // divider)
-            window_size = init_window_size
-            logging.debug("Starting peak detection on data (len = %d) with window = %d",
-                          len(wavelength), window_size)
-            try:
-                width = PEAK_WIDTHS[type]
-                FitFunction = PEAK_FUNCTIONS[type]
-            except KeyError:
-                raise KeyError("Given type %s not in available fitting types: %s" % (type, PEAK_FUNCTIONS.keys()))
-            for step in range(5):
-                if future._fit_state == CANCELLED:
-                    raise CancelledError()
-                smoothed = Smooth(spectrum, window_len=window_size)
-                # Increase window size until peak detection finds enough peaks to fit
-                # the spectrum curve
-                peaks = Detect(smoothed, wavelength, lookahead=window_size, delta=5)[0]
-                if peaks == []:
-                    window_size = int(round(window_size * 1.2))
-                    logging.debug("Retrying to fit peak with window = %d", window_size)
-                    continue
-
-                fit_list = []
-                for (pos, amplitude) in peaks:
-                    fit_list.append(pos)
-                    fit_list.append(width)
-                    fit_list.append(amplitude)
-                # Initialize offset to 0
-                fit_list.append(0)
-
+            def check_cancelled():
                 if future._fit_state == CANCELLED:
                     raise CancelledError()
 
-                try:
-                    # => in scipy 0.17, curve_fit() supports the 'bounds' parameter
-                    params, _ = curve_fit(FitFunction, wavelength, spectrum, p0=fit_list)
-                    break
-                except Exception:
-                    window_size = int(round(window_size * 1.2))
-                    logging.debug("Retrying to fit peak with window = %d", window_size)
-                    continue
-            else:
-                raise ValueError("Could not apply peak fitting of type %s." % type)
+            params = _DetectAndFit(spectrum, wavelength, type, check_cancelled)
             # reformat parameters to (list of 3 tuples, offset)
             peaks_params = []
             for pos, width, amplitude in _Grouped(params[:-1], 3):
@@ -339,6 +302,286 @@ class PeakFitter(object):
         # really rough estimation
         return len(data) * 10e-3  # s
 
+    def FitCube(self, data, wavelength, type='gaussian', max_workers=None):
+        """
+        Fits the peaks of every spectrum of a spectrum cube, in parallel.
+        The fitting of each spectrum is first tried by starting from the result
+        of the previous (neighbouring) spectrum, and only if it fails, the
+        peaks are detected.
+        data (3d array of floats): The spectrum cube, with dimensions CYX.
+        wavelength (1d array of floats): The wavelength values corresponding to
+          the C dimension.
+        type (str): Type of fitting to be applied (for now only ‘gaussian’ and
+        ‘lorentzian’ are available).
+        max_workers (None or 0 < int): number of processes to use. If None, it
+          uses as many processes as CPUs.
+        returns (model.ProgressiveFuture): Progress of the fitting. Its result
+          is 4 DataArrays of shape YX: the position, width, amplitude of the
+          strongest peak (with the same convention as the result of Fit()),
+          and the offset. The values are NaN where the fitting failed.
+        raises:
+            KeyError if given type not available
+            ValueError if the data is not a cube
+        """
+        if type not in PEAK_FUNCTIONS:
+            raise KeyError("Given type %s not in available fitting types: %s" % (type, PEAK_FUNCTIONS.keys()))
+        if data.ndim != 3:
+            raise ValueError("Data should be a CYX cube, but got shape %s" % (data.shape,))
+        if data.shape[0] != len(wavelength):
+            raise ValueError("Data has %d wavelengths, but got %d wavelength values" %
+                             (data.shape[0], len(wavelength)))
+        if max_workers is None:
+            max_workers = multiprocessing.cpu_count()
+
+        est_start = time.time() + 0.1
+        f = model.ProgressiveFuture(start=est_start,
+                                    end=est_start + self.estimateFitCubeTime(data, max_workers))
+        f._fit_state = RUNNING
+        f._fit_lock = threading.Lock()
+        f.task_canceller = self._CancelFit
+
+        return self._cube_executor.submitf(f, self._DoFitCube, f, data, wavelength,
+                                           type, max_workers)
+
+    def _DoFitCube(self, future, data, wavelength, type, max_workers):
+        """
+        Splits the cube into blocks of lines, and fits each block in a separate
+          process.
+        returns (4 DataArrays of shape YX): position, width, amplitude, offset
+        """
+        try:
+            # YXC, so that each block is a contiguous set of spectra
+            cube = numpy.moveaxis(numpy.asarray(data), 0, -1)
+            wavelength = numpy.asarray(wavelength, dtype=numpy.float64)
+            ylen = cube.shape[0]
+            # A few blocks per worker, to balance the load, but still long
+            # blocks, so that most of the fits can be seeded by a neighbour.
+            nlines = max(1, ylen // (max_workers * 4))
+            res = numpy.empty(cube.shape[:2] + (4,), dtype=numpy.float64)
+            startt = time.time()
+            done = 0
+            npixels = cube.shape[0] * cube.shape[1]
+
+            executor = futures.ProcessPoolExecutor(max_workers=max_workers)
+            try:
+                pending = {}
+                for y in range(0, ylen, nlines):
+                    block = numpy.ascontiguousarray(cube[y:y + nlines])
+                    bf = executor.submit(_FitSpectra, block, wavelength, type)
+                    pending[bf] = y
+
+                while pending:
+                    if future._fit_state == CANCELLED:
+                        raise CancelledError()
+                    finished, _ = futures.wait(pending.keys(), timeout=0.1,
+                                               return_when=futures.FIRST_COMPLETED)
+                    for bf in finished:
+                        y = pending.pop(bf)
+                        bres = bf.result()
+                        res[y:y + bres.shape[0]] = bres
+                        done += bres.shape[0] * bres.shape[1]
+
+                    if finished:
+                        left = (time.time() - startt) * (npixels - done) / done
+                        future.set_progress(end=time.time() + left)
+            finally:
+                for bf in pending:
+                    bf.cancel()
+                executor.shutdown(wait=True)
+
+            logging.info("Fitted %d spectra in %g s, %d failed", npixels,
+                         time.time() - startt, numpy.isnan(res[:, :, 0]).sum())
+
+            md = {}
+            if hasattr(data, "metadata"):
+                md = data.metadata.copy()
+                for k in (model.MD_WL_LIST, model.MD_WL_POLYNOMIAL, model.MD_DIMS):
+                    md.pop(k, None)
+            return tuple(model.DataArray(res[:, :, i].copy(), md.copy()) for i in range(4))
+        except CancelledError:
+            logging.debug("Fitting of cube with type %s was cancelled.", type)
+        finally:
+            with future._fit_lock:
+                if future._fit_state == CANCELLED:
+                    raise CancelledError()
+                future._fit_state = FINISHED
+
+    def estimateFitCubeTime(self, data, max_workers=1):
+        """
+        Estimates cube fitting duration
+        data (3d array): The spectrum cube, with dimensions CYX
+        max_workers (0 < int): number of processes used
+        """
+        # rough estimation, for fits mostly seeded by the neighbour
+        npixels = data.shape[-1] * data.shape[-2]
+        return npixels * data.shape[0] * 20e-6 / max_workers  # s
+
+
+def _DetectAndFit(spectrum, wavelength, type, check_cancelled=None):
+    """
+    Smooths the spectrum signal, detects the peaks and fits them.
+    spectrum (1d array of floats): The data representing the spectrum.
+    wavelength (1d array of floats): The wavelength values corresponding to the
+    spectrum given.
+    type (str): Type of fitting to be applied
+    check_cancelled (None or callable): called regularly, to give the
+      opportunity to stop the fitting by raising an exception.
+    returns (list of floats): the fitting parameters (pos, width, amplitude)
+      for each peak, followed by the offset.
+    raises:
+            KeyError if given type not available
+            ValueError if fitting cannot be applied
+    """
+    # values based on experimental datasets
+    if len(wavelength) >= 2000:
+        divider = 20
+    elif len(wavelength) >= 1000:
+        divider = 25
+    else:
+        divider = 30
+    init_window_size = max(3, len(wavelength) // divider)
+    window_size = init_window_size
+    logging.debug("Starting peak detection on data (len = %d) with window = %d",
+                  len(wavelength), window_size)
+    try:
+        width = PEAK_WIDTHS[type]
+        FitFunction = PEAK_FUNCTIONS[type]
+    except KeyError:
+        raise KeyError("Given type %s not in available fitting types: %s" % (type, PEAK_FUNCTIONS.keys()))
+    for step in range(5):
+        if check_cancelled:
+            check_cancelled()
+        smoothed = Smooth(spectrum, window_len=window_size)
+        # Increase window size until peak detection finds enough peaks to fit
+        # the spectrum curve
+        peaks = Detect(smoothed, wavelength, lookahead=window_size, delta=5)[0]
+        if peaks == []:
+            window_size = int(round(window_size * 1.2))
+            logging.debug("Retrying to fit peak with window = %d", window_size)
+            continue
+
+        fit_list = []
+        for (pos, amplitude) in peaks:
+            fit_list.append(pos)
+            fit_list.append(width)
+            fit_list.append(amplitude)
+        # Initialize offset to 0
+        fit_list.append(0)
+
+        if check_cancelled:
+            check_cancelled()
+
+        try:
+            # => in scipy 0.17, curve_fit() supports the 'bounds' parameter
+            params, _ = curve_fit(FitFunction, wavelength, spectrum, p0=fit_list)
+            return params
+        except Exception:
+            window_size = int(round(window_size * 1.2))
+            logging.debug("Retrying to fit peak with window = %d", window_size)
+            continue
+
+    raise ValueError("Could not apply peak fitting of type %s." % type)
+
+
+def _FitSpectra(spectra, wavelength, type):
+    """
+    Fits the peaks of each spectrum of a block. Each fit is first tried by
+      starting from the result of the previous spectrum (on the left, or above
+      for the first spectrum of a line). If the result is worse than the
+      neighbour's, or its strongest peak is far from the neighbour's one, the
+      peaks are detected and fitted from scratch.
+    Note: it's called in a separate process.
+    spectra (3d array of floats): the spectra, with dimensions YXC
+    wavelength (1d array of floats): The wavelength values corresponding to C
+    type (str): Type of fitting to be applied
+    returns (3d array of floats of shape YX4): the position, width and amplitude
+      of the strongest peak, and the offset, for each spectrum. NaN if the
+      fitting failed.
+    """
+    FitFunction = PEAK_FUNCTIONS[type]
+    res = numpy.empty(spectra.shape[:2] + (4,), dtype=numpy.float64)
+    res[...] = numpy.nan
+    line_seed = None  # (params, residual) of the first spectrum of the previous line
+    for y in range(spectra.shape[0]):
+        seed = line_seed
+        for x in range(spectra.shape[1]):
+            spectrum = spectra[y, x]
+            # Use the residual relative to the signal amplitude, to be able
+            # to compare it to the neighbour
+            srange = max(numpy.ptp(spectrum), 1e-12)
+            params = None
+            if seed is not None:
+                sparams, sres = seed
+                try:
+                    params, _ = curve_fit(FitFunction, wavelength, spectrum, p0=sparams)
+                    fres = _Residual(FitFunction, wavelength, spectrum, params) / srange
+                    # Detect again if the fit is worse than the neighbour's, or
+                    # if the strongest peak moved by more than a few widths
+                    # (typically, a broad peak fitting the background has
+                    # become the strongest one).
+                    spos, swidth = sparams[:2]
+                    pos = _SignificantPeaks(params, wavelength)[0]
+                    if (not fres <= sres * 1.5 or
+                        abs(pos - spos) > 3 * abs(spos * swidth)):
+                        params = None
+                except Exception:
+                    params = None
+
+            if params is None:
+                try:
+                    params = _DetectAndFit(spectrum, wavelength, type)
+                    fres = _Residual(FitFunction, wavelength, spectrum, params) / srange
+                except Exception:
+                    logging.debug("Failed to fit spectrum at %d,%d", x, y)
+                    seed = None
+                    if x == 0:
+                        line_seed = None
+                    continue
+
+            # Only keep the significant peaks, both to report the strongest
+            # one, and to keep the next fit fast.
+            params = _SignificantPeaks(params, wavelength)
+            seed = params, fres
+            if x == 0:
+                line_seed = seed
+
+            # Report the strongest peak
+            pos, width, amplitude = params[:3]
+            res[y, x] = pos, abs(width), abs(amplitude), params[-1]
+
+    return res
+
+
+def _SignificantPeaks(params, wavelength, min_ratio=0.05):
+    """
+    Select the peaks which are in the wavelength range and not negligible
+      compared to the strongest one. Peaks wider than the wavelength range are
+      not selected either, as they only fit the background.
+    params (list of floats): the fitted parameters (pos, width, amplitude)*N + offset
+    wavelength (1d array of floats): The wavelength values of the spectrum
+    min_ratio (0<float<=1): minimum amplitude, relative to the strongest peak
+    returns (list of floats): the parameters of the selected peaks, sorted by
+      decreasing amplitude, followed by the offset. If no peak is in the
+      range, the strongest peak is kept anyway.
+    """
+    wlmin, wlmax = min(wavelength[0], wavelength[-1]), max(wavelength[0], wavelength[-1])
+    peaks = sorted(_Grouped(params[:-1], 3), key=lambda p: abs(p[2]), reverse=True)
+    inside = [p for p in peaks if wlmin <= p[0] <= wlmax and
+                                  abs(p[0] * p[1]) < wlmax - wlmin]
+    if not inside:
+        inside = peaks[:1]
+    min_amp = abs(inside[0][2]) * min_ratio
+    kept = [p for p in inside if abs(p[2]) >= min_amp]
+    return [v for p in kept for v in p] + [params[-1]]
+
+
+def _Residual(FitFunction, wavelength, spectrum, params):
+    """
+    returns (float): RMS of the difference between the spectrum and the curve
+    """
+    curve = FitFunction(wavelength, *params)
+    return numpy.sqrt(numpy.mean((curve - spectrum) ** 2))
+
 
 def Curve(wavelength, peak_parameters, offset, type='gaussian'):
     """
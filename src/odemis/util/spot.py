@@ -24,18 +24,34 @@ import scipy.signal
 import warnings
 
 
-def _SubtractBackground(data, background=None):
+def _BackgroundNoise(background):
+    """
+    Estimate the maximum value of the noise from a background image
+    background (model.DataArray): Background image
+    returns (float): value under which the signal is considered noise
+    """
     # We actually want to make really sure that only real signal is > 0.
-    if background is not None:
-        # So we subtract the "almost max" of the background signal
-        hist, edges = img.histogram(background)
-        noise_max = img.findOptimalRange(hist, edges, outliers=1e-6)[1]
-    else:
-        try:
-            noise_max = 1.3 * data.metadata[model.MD_BASELINE]
-        except (AttributeError, KeyError):
-            # Fallback: take average of the four corner pixels
-            noise_max = 1.3 * numpy.mean((data[0, 0], data[0, -1], data[-1, 0], data[-1, -1]))
+    # So we subtract the "almost max" of the background signal
+    hist, edges = img.histogram(background)
+    return img.findOptimalRange(hist, edges, outliers=1e-6)[1]
+
+
+def _SubtractBackground(data, background=None, noise_max=None):
+    """
+    background (None or model.DataArray): Background image
+    noise_max (None or float): the noise level, as computed by _BackgroundNoise(),
+      to avoid computing it again if the same background is used many times.
+    """
+    # We actually want to make really sure that only real signal is > 0.
+    if noise_max is None:
+        if background is not None:
+            noise_max = _BackgroundNoise(background)
+        else:
+            try:
+                noise_max = 1.3 * data.metadata[model.MD_BASELINE]
+            except (AttributeError, KeyError):
+                # Fallback: take average of the four corner pixels
+                noise_max = 1.3 * numpy.mean((data[0, 0], data[0, -1], data[-1, 0], data[-1, -1]))
 
     noise_max = data.dtype.type(noise_max)  # ensure we don't change the dtype
     data0 = img.Subtract(data, noise_max)
@@ -46,6 +62,154 @@ def _SubtractBackground(data, background=None):
     return data0
 
 
+class SpotMetrics(object):
+    """
+    Computes the moment of inertia, the spot intensity and the centroid of
+    many optical images of the same background, typically one image per e-beam
+    spot position.
+    The background noise level is only computed once, and the coordinates
+    grids are shared between all the images of the same shape.
+    """
+
+    def __init__(self, background=None):
+        """
+        background (None or model.DataArray): Background image subtracted from
+          the data. If None, for each image, it will try to use the MD_BASELINE
+          metadata, and fall-back to the corner pixels.
+        """
+        self._background = background
+        if background is not None:
+            self._noise_max = _BackgroundNoise(background)
+        else:
+            self._noise_max = None
+        self._grids = {}  # shape -> (ndarray, ndarray): X and Y of each pixel (flattened)
+
+    def _getGrids(self, shape):
+        """
+        returns (ndarray of float, ndarray of float): the X and Y coordinates of
+          each pixel of the (flattened) image, starting from 1.
+        """
+        try:
+            return self._grids[shape]
+        except KeyError:
+            rows, cols = shape
+            xs = numpy.empty(shape, dtype=numpy.float64)
+            ys = numpy.empty(shape, dtype=numpy.float64)
+            xs[:] = numpy.linspace(1, cols, num=cols)
+            ys.T[:] = numpy.linspace(1, rows, num=rows)
+            grids = xs.ravel(), ys.ravel()
+            self._grids[shape] = grids
+            return grids
+
+    def subtractBackground(self, data):
+        """
+        data (model.DataArray): The optical image
+        returns (model.DataArray): the image with only the signal, and 0 elsewhere
+        """
+        return _SubtractBackground(data, noise_max=self._noise_max)
+
+    def _computeMoI(self, data0):
+        """
+        Computes the moment of inertia and the centroid, in a single pass over
+        the pixels which contain some signal.
+        data0 (ndarray of shape Y, X): the image, without background
+        returns (float, (float, float)): moment of inertia, centroid (X, Y)
+        """
+        xs, ys = self._getGrids(data0.shape)
+        flat = data0.ravel()
+        # After background subtraction, typically only a small part of the image
+        # has signal, so only compute on these pixels.
+        idx = numpy.flatnonzero(flat)
+        if idx.size == 0:
+            return float('nan'), (float('nan'), float('nan'))
+        elif idx.size < flat.size // 2:
+            w = flat[idx].astype(numpy.float64)
+            xs = xs[idx]
+            ys = ys[idx]
+        else:
+            w = flat.astype(numpy.float64)
+
+        data_sum = w.sum()
+        cX = numpy.dot(w, xs) / data_sum
+        cY = numpy.dot(w, ys) / data_sum
+        dist = numpy.sqrt((xs - cX) ** 2 + (ys - cY) ** 2)
+        Mdist = numpy.dot(w, dist) / data_sum
+        # In case of just one bright pixel, avoid returning 0 and return unknown
+        # instead.
+        if Mdist == 0:
+            Mdist = float('nan')
+        return Mdist, (cX, cY)
+
+    def compute(self, data, spot_intensity=False):
+        """
+        data (model.DataArray): The optical image
+        spot_intensity (bool): if True, also computes the spot intensity (which
+          is slower)
+        returns:
+          moi (float): moment of inertia (NaN if the image is entirely black)
+          centroid (float, float): center of mass in px (from the top-left
+            pixel, which is 1, 1). NaN if the image is entirely black.
+          intensity (None or 0<=float<=1): spot intensity if spot_intensity is
+            True, otherwise None
+        """
+        data0 = self.subtractBackground(data)
+        moi, centroid = self._computeMoI(data0)
+        if spot_intensity:
+            intens = _SpotIntensity(data0)
+        else:
+            intens = None
+        return moi, centroid, intens
+
+    def computeStack(self, stack):
+        """
+        Computes the moment of inertia and centroid of many images at once.
+        stack (ndarray of shape N, Y, X): the optical images
+        returns:
+          moi (ndarray of float of shape N): moment of inertia of each image
+          centroid (ndarray of float of shape N, 2): center of mass of each image
+        """
+        n = stack.shape[0]
+        rows, cols = stack.shape[1:]
+        if self._noise_max is not None:
+            noise_max = numpy.full((n, 1, 1), self._noise_max)
+        else:
+            try:
+                noise_max = numpy.full((n, 1, 1), 1.3 * stack.metadata[model.MD_BASELINE])
+            except (AttributeError, KeyError):
+                corners = (stack[:, 0, 0].astype(numpy.float64) + stack[:, 0, -1] +
+                           stack[:, -1, 0] + stack[:, -1, -1])
+                noise_max = (1.3 * corners / 4).reshape(n, 1, 1)
+        # Same as img.Subtract(), but with a different value for each image
+        noise_max = noise_max.astype(stack.dtype)
+        data0 = numpy.array(stack, dtype=numpy.float64)
+        data0 -= noise_max
+        numpy.maximum(data0, 0, out=data0)
+
+        x = numpy.linspace(1, cols, num=cols)
+        y = numpy.linspace(1, rows, num=rows)
+        data_sum = data0.sum(axis=(1, 2))
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            cX = numpy.dot(data0.sum(axis=1), x) / data_sum
+            cY = numpy.dot(data0.sum(axis=2), y) / data_sum
+
+        # The distance maps are different for each image, so compute them by
+        # chunks, to limit the memory usage.
+        moi = numpy.empty(n, dtype=numpy.float64)
+        chunk = max(1, 2 ** 22 // (rows * cols))
+        for s in range(0, n, chunk):
+            e = min(s + chunk, n)
+            dx2 = (x[numpy.newaxis, :] - cX[s:e, numpy.newaxis]) ** 2
+            dy2 = (y[numpy.newaxis, :] - cY[s:e, numpy.newaxis]) ** 2
+            dist = numpy.sqrt(dy2[:, :, numpy.newaxis] + dx2[:, numpy.newaxis, :])
+            dist *= data0[s:e]
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                moi[s:e] = dist.sum(axis=(1, 2)) / data_sum[s:e]
+
+        # Same as MomentOfInertia(): 0 (or black) => unknown
+        moi[(moi == 0) | (data_sum == 0)] = float('nan')
+        return moi, numpy.column_stack((cX, cY))
+
+
 def MomentOfInertia(data, background=None):
     """
     Calculates the moment of inertia for a given optical image
@@ -56,35 +220,7 @@ def MomentOfInertia(data, background=None):
     returns (float): moment of inertia
        Note: if the image is entirely black, it will return NaN.
     """
-    # Subtract background, to make sure there is no noise
-    data0 = _SubtractBackground(data, background)
-
-    rows, cols = data0.shape
-    x = numpy.linspace(1, cols, num=cols)
-    y = numpy.linspace(1, rows, num=rows)
-    ysum = numpy.dot(data0.T, y).T.sum()
-    xsum = numpy.dot(data0, x).sum()
-
-    data_sum = data0.sum(dtype=numpy.int64)  # TODO: dtype should depend on data.dtype
-    if data_sum == 0:
-        return float('nan')
-    cY = ysum / data_sum
-    cX = xsum / data_sum
-    xx = (x - cX) ** 2
-    yy = (y - cY) ** 2
-    XX = numpy.ndarray(shape=(rows, cols))  # float
-    YY = numpy.ndarray(shape=(rows, cols))  # float
-    XX[:] = xx
-    YY.T[:] = yy
-    diff = XX + YY
-    totDist = numpy.sqrt(diff)
-    rmsDist = data0 * totDist
-    Mdist = rmsDist.sum() / data_sum
-    # In case of just one bright pixel, avoid returning 0 and return unknown
-    # instead.
-    if Mdist == 0:
-        return float('nan')
-    return Mdist
+    return SpotMetrics(background).compute(data)[0]
 
 
 def SpotIntensity(data, background=None):
@@ -98,6 +234,14 @@ def SpotIntensity(data, background=None):
     returns (0<=float<=1): spot intensity estimation
     """
     data0 = _SubtractBackground(data, background)
+    return _SpotIntensity(data0)
+
+
+def _SpotIntensity(data0):
+    """
+    Same as SpotIntensity(), but on data which already has the background
+    subtracted.
+    """
     total = data0.sum()
     if total == 0:
         return 0  # No data, no spot => same as hugely spread spot
@@ -301,6 +301,66 @@ class TestHistogram(unittest.TestCase):
         numpy.testing.assert_array_equal(hist, nchist)
 
 
+class TestDecimatePlot(unittest.TestCase):
+
+    def test_small(self):
+        xs = numpy.arange(100)
+        ys = numpy.random.random(100)
+        dxs, dys = img.decimatePlot(xs, ys, 200)
+        numpy.testing.assert_array_equal(dxs, xs)
+        numpy.testing.assert_array_equal(dys, ys)
+
+    def test_envelope(self):
+        n = 10 ** 6
+        width = 500
+        xs = numpy.linspace(400e-9, 800e-9, n)
+        ys = numpy.random.random(n)
+        ys[1234] = 10  # spike
+        ys[n // 2] = -5  # dip
+        dxs, dys = img.decimatePlot(xs, ys, width)
+        self.assertLessEqual(len(dxs), 4 * width)
+        self.assertEqual(len(dxs), len(dys))
+        self.assertTrue(numpy.all(numpy.diff(dxs) > 0))
+        # The extremes are kept, as well as the first and last point
+        self.assertEqual(dys.max(), 10)
+        self.assertEqual(dys.min(), -5)
+        self.assertEqual((dxs[0], dys[0]), (xs[0], ys[0]))
+        self.assertEqual((dxs[-1], dys[-1]), (xs[-1], ys[-1]))
+
+        # With a wider range, only part of the columns are used
+        dxs, dys = img.decimatePlot(xs, ys, width, (0, 800e-9))
+        self.assertLessEqual(len(dxs), 4 * width // 2 + 4)
+        self.assertEqual(dys.max(), 10)
+
+    def test_unique_x(self):
+        """
+        The X values stay strictly increasing, also when some columns only
+        contain a few points
+        """
+        n = 10000
+        xs = numpy.logspace(0, 3, n)  # Few points in the last columns
+        ys = numpy.random.random(n)
+        dxs, dys = img.decimatePlot(xs, ys, 1000)
+        self.assertLessEqual(len(dxs), 4 * 1000)
+        self.assertTrue(numpy.all(numpy.diff(dxs) > 0))
+        # Each column with less than 4 points is kept as-is
+        numpy.testing.assert_array_equal(dxs[-10:], xs[-10:])
+        numpy.testing.assert_array_equal(dys[-10:], ys[-10:])
+        self.assertEqual(dys.max(), ys.max())
+        self.assertEqual(dys.min(), ys.min())
+
+    def test_speed(self):
+        n = 10 ** 6
+        xs = numpy.cumsum(numpy.random.random(n) + 0.1)
+        ys = numpy.random.random(n)
+        startt = time.time()
+        for i in range(10):
+            img.decimatePlot(xs, ys, 1000)
+        dur = (time.time() - startt) / 10
+        logging.info("Decimating %d points took %g s", n, dur)
+        self.assertLess(dur, 0.5)
+
+
 class TestDataArray2RGB(unittest.TestCase):
     @staticmethod
     def CountValues(array):
@@ -878,6 +938,100 @@ class TestMergeTiles(unittest.TestCase):
         os.remove(FILENAME)
 
 
+class TestGetThumbnail(unittest.TestCase):
+
+    def test_big_image(self):
+        size = (2048, 3000)
+        md = {model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+              model.MD_BINNING: (1, 1),
+              model.MD_POS: (5.0, 7.0)}
+        data = model.DataArray(numpy.random.randint(0, 4000, size).astype(numpy.uint16), md)
+
+        reduced = img.getReducedData(data, (512, 512))
+        self.assertEqual(reduced.shape, (341, 500))
+        self.assertEqual(reduced.dtype, data.dtype)
+        self.assertEqual(reduced.metadata[model.MD_PIXEL_SIZE], (6e-6, 6e-6))
+        self.assertEqual(reduced.metadata[model.MD_BINNING], (6, 6))
+        self.assertEqual(reduced.metadata[model.MD_POS], (5.0, 7.0))
+        self.assertAlmostEqual(reduced[1, 2], data[6:12, 12:18].mean(), delta=1)
+
+        thumb = img.getThumbnail(data, (512, 512), (0, 4000))
+        self.assertEqual(thumb.shape, (341, 500, 3))
+        self.assertEqual(thumb.dtype, numpy.uint8)
+        self.assertEqual(thumb.metadata[model.MD_DIMS], "YXC")
+
+    def test_small_image(self):
+        """
+        Image already smaller than the thumbnail should not be reduced
+        """
+        data = model.DataArray(numpy.zeros((10, 5), dtype=numpy.uint8))
+        thumb = img.getThumbnail(data, (512, 512))
+        self.assertEqual(thumb.shape, (10, 5, 3))
+
+    def test_rgb(self):
+        data = model.DataArray(numpy.random.randint(0, 255, (1000, 700, 3)).astype(numpy.uint8),
+                               {model.MD_DIMS: "YXC"})
+        thumb = img.getThumbnail(data, (100, 100))
+        self.assertEqual(thumb.shape, (100, 70, 3))
+        self.assertEqual(thumb.metadata[model.MD_DIMS], "YXC")
+
+        data = model.DataArray(numpy.random.randint(0, 255, (3, 1000, 700)).astype(numpy.uint8),
+                               {model.MD_DIMS: "CYX"})
+        thumb = img.getThumbnail(data, (100, 100))
+        self.assertEqual(thumb.shape, (100, 70, 3))
+
+    def test_spectrum(self):
+        data = model.DataArray(numpy.random.random((20, 1, 1, 300, 400)),
+                               {model.MD_AR_POLE: (200, 150)})
+        reduced = img.getReducedData(data, (100, 100))
+        self.assertEqual(reduced.shape, (20, 1, 1, 75, 100))
+        self.assertEqual(reduced.metadata[model.MD_AR_POLE], (50, 37.5))
+
+        thumb = img.getThumbnail(data, (100, 100))
+        self.assertEqual(thumb.shape, (75, 100, 3))
+
+    def test_pyramid(self):
+        FILENAME = u"test" + tiff.EXTENSIONS[0]
+        size = (3000, 2000)
+        md = {
+            model.MD_DIMS: 'YX',
+            model.MD_POS: (5.0, 7.0),
+            model.MD_PIXEL_SIZE: (1e-6, 1e-6),
+        }
+        arr = numpy.random.randint(0, 255, size[::-1]).astype(numpy.uint8)
+        data = model.DataArray(arr, metadata=md)
+        tiff.export(FILENAME, data, pyramid=True)
+
+        rdata = tiff.open_data(FILENAME)
+        thumb = img.getThumbnail(rdata.content[0], (256, 256))
+        self.assertEqual(thumb.shape, (125, 187, 3))
+        numpy.testing.assert_almost_equal(thumb.metadata[model.MD_PIXEL_SIZE], (16e-6, 16e-6))
+
+        del rdata
+        os.remove(FILENAME)
+
+    def test_speed(self):
+        """
+        getThumbnail() should be faster than projecting the whole image and
+        rescaling it.
+        """
+        data = model.DataArray(numpy.random.randint(0, 4000, (4096, 4096)).astype(numpy.uint16))
+
+        startt = time.time()
+        thumb = img.getThumbnail(data, (512, 512), (0, 4000))
+        dur_thumb = time.time() - startt
+
+        startt = time.time()
+        rgb = img.DataArray2RGB(data, (0, 4000))
+        full = img.rescale_hq(rgb, (512, 512, 3))
+        dur_full = time.time() - startt
+
+        logging.info("Thumbnail computed in %g s, vs %g s with the full image",
+                     dur_thumb, dur_full)
+        self.assertEqual(thumb.shape, full.shape)
+        self.assertLess(dur_thumb, dur_full)
+
+
 # TODO: test guessDRange()
 
 if __name__ == "__main__":
@@ -16,11 +16,14 @@ You should have received a copy of the GNU General Public License along with Ode
 '''
 from __future__ import division
 
+from concurrent.futures._base import CancelledError
 import logging
 import numpy
+from odemis import model
 from odemis.dataio import hdf5
 from odemis.util import peak
 import os
+import time
 import unittest
 import matplotlib.pyplot as plt
 
@@ -86,6 +89,98 @@ class TestPeak(unittest.TestCase):
         self.assertRaises(KeyError, peak.Curve, wl, params, offset, type='wrongType')
 
 
+def make_cube(type, shape=(20, 20), width=None):
+    """
+    Generates a noisy spectrum cube, with one peak moving along X and Y
+    type (str): type of peak
+    shape (int, int): YX size of the cube
+    returns (DataArray of shape CYX), (1d array) wavelength, (2d array) peak positions
+    """
+    if width is None:
+        width = 0.04 if type == "gaussian" else 0.01
+    wl = numpy.linspace(400, 800, 200)
+    yy, xx = numpy.mgrid[0:shape[0], 0:shape[1]]
+    pos = 550 + 100 * xx / shape[1] + 30 * yy / shape[0]
+    cube = numpy.empty((len(wl),) + shape)
+    for y in range(shape[0]):
+        for x in range(shape[1]):
+            cube[:, y, x] = peak.PEAK_FUNCTIONS[type](wl, pos[y, x], width, 1000, 50)
+    cube = numpy.random.poisson(cube).astype(numpy.float64)
+    md = {model.MD_PIXEL_SIZE: (1e-6, 1e-6), model.MD_WL_LIST: list(wl * 1e-9)}
+    return model.DataArray(cube, md), wl, pos
+
+
+class TestFitCube(unittest.TestCase):
+    """
+    Test peak fitting of whole spectrum cubes
+    """
+    def setUp(self):
+        self._peak_fitter = peak.PeakFitter()
+        numpy.random.seed(25)  # Always the same noise, for reproducible results
+
+    def test_synthetic(self):
+        for type, width in (("gaussian", 0.04), ("lorentzian", 0.01)):
+            cube, wl, epos = make_cube(type, width=width)
+            f = self._peak_fitter.FitCube(cube, wl, type, max_workers=2)
+            pos, width_map, amp, offset = f.result()
+            self.assertEqual(pos.shape, cube.shape[1:])
+            self.assertNotIn(model.MD_WL_LIST, pos.metadata)
+            self.assertEqual(pos.metadata[model.MD_PIXEL_SIZE], (1e-6, 1e-6))
+            self.assertFalse(numpy.isnan(pos).any())
+            numpy.testing.assert_allclose(pos, epos, atol=2)
+            self.assertAlmostEqual(numpy.median(width_map), width, delta=width * 0.1)
+            self.assertAlmostEqual(numpy.median(amp), 1000, delta=50)
+            self.assertAlmostEqual(numpy.median(offset), 50, delta=10)
+
+    def test_same_as_fit(self):
+        """
+        The strongest peak found by FitCube() should be the same as by Fit()
+        """
+        cube, wl, epos = make_cube("gaussian", shape=(2, 3))
+        pos, width, amp, offset = self._peak_fitter.FitCube(cube, wl).result()
+        for y in range(cube.shape[1]):
+            for x in range(cube.shape[2]):
+                params, _ = self._peak_fitter.Fit(cube[:, y, x], wl).result()
+                # Noise can be fitted with peaks outside of the spectrum
+                params = [p for p in params if wl[0] <= p[0] <= wl[-1]]
+                p = max(params, key=lambda p: p[2])
+                self.assertAlmostEqual(pos[y, x], p[0], delta=1)
+                self.assertAlmostEqual(pos[y, x], epos[y, x], delta=2)
+
+    def test_speed(self):
+        cube, wl, epos = make_cube("gaussian", shape=(4, 8))
+        startt = time.time()
+        for y in range(cube.shape[1]):
+            for x in range(cube.shape[2]):
+                self._peak_fitter.Fit(cube[:, y, x], wl).result()
+        dur_fit = time.time() - startt
+
+        startt = time.time()
+        self._peak_fitter.FitCube(cube, wl).result()
+        dur_cube = time.time() - startt
+        logging.info("Fitted %d spectra in %g s with Fit(), and %g s with FitCube()",
+                     cube.shape[1] * cube.shape[2], dur_fit, dur_cube)
+        self.assertLess(dur_cube, dur_fit)
+
+    def test_cancel(self):
+        cube, wl, epos = make_cube("gaussian", shape=(60, 60))
+        f = self._peak_fitter.FitCube(cube, wl, max_workers=1)
+        time.sleep(1)
+        self.assertTrue(f.cancel())
+        self.assertTrue(f.cancelled())
+        with self.assertRaises(CancelledError):
+            f.result(10)
+
+    def test_wrong_input(self):
+        cube, wl, epos = make_cube("gaussian", shape=(2, 2))
+        with self.assertRaises(KeyError):
+            self._peak_fitter.FitCube(cube, wl, type="wrongType")
+        with self.assertRaises(ValueError):
+            self._peak_fitter.FitCube(cube[:, 0], wl)
+        with self.assertRaises(ValueError):
+            self._peak_fitter.FitCube(cube, wl[:-1])
+
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -16,12 +16,14 @@ You should have received a copy of the GNU General Public License along with Ode
 '''
 from __future__ import division
 
+import logging
 import math
 import numpy
 from odemis import model
 from odemis.dataio import tiff, hdf5
 from odemis.util import spot
 import os
+import time
 import unittest
 
 
@@ -71,6 +73,81 @@ class TestMomentOfInertia(unittest.TestCase):
         self.assertTrue(math.isnan(mi) or mi > 0)
 
 
+class TestSpotMetrics(unittest.TestCase):
+    """
+    Test SpotMetrics
+    """
+    def setUp(self):
+        # Gaussian spots at random (but reproducible) positions, on a noisy background
+        rng = numpy.random.RandomState(10)
+        yy, xx = numpy.mgrid[0:256, 0:320]
+        self.frames = []
+        for i in range(20):
+            cx, cy = rng.uniform(100, 200, 2)
+            d = (xx - cx) ** 2 + (yy - cy) ** 2
+            f = 100 + 3000 * numpy.exp(-d / (2 * 8 ** 2)) + rng.poisson(5, xx.shape)
+            self.frames.append(model.DataArray(f.astype(numpy.uint16)))
+        self.background = model.DataArray((100 + rng.poisson(5, xx.shape)).astype(numpy.uint16))
+
+    def test_precomputed(self):
+        # MoI and spot intensity of the first frames, as computed by the
+        # original implementation of MomentOfInertia() and SpotIntensity()
+        exp_no_bkg = ((9.543813201882596, 0.023229262067280394),
+                      (9.524920023333216, 0.023266085132079464),
+                      (9.55434468543282, 0.023162773881482416),
+                      (9.523168637730915, 0.023270043775155284),
+                      (9.533094957979806, 0.023267646150094936))
+        exp_bkg = ((9.767371264892908, 0.022655125113952953),
+                   (9.770023630867568, 0.022633036806367097),
+                   (9.766791888808083, 0.022620031525582583),
+                   (9.768212103439051, 0.022637031433553716),
+                   (9.7679284216165, 0.022662764032615842))
+        for bkg, exp_vals in ((None, exp_no_bkg), (self.background, exp_bkg)):
+            sm = spot.SpotMetrics(bkg)
+            for f, (emoi, esi) in zip(self.frames, exp_vals):
+                moi, (cx, cy), si = sm.compute(f, spot_intensity=True)
+                self.assertAlmostEqual(moi, emoi)
+                self.assertAlmostEqual(si, esi)
+                self.assertTrue(100 < cx < 210 and 100 < cy < 210)
+                self.assertAlmostEqual(spot.MomentOfInertia(f, bkg), emoi)
+                self.assertAlmostEqual(spot.SpotIntensity(f, bkg), esi)
+
+    def test_stack(self):
+        sm = spot.SpotMetrics(self.background)
+        stack = numpy.array(self.frames)
+        mois, centroids = sm.computeStack(stack)
+        self.assertEqual(mois.shape, (len(self.frames),))
+        self.assertEqual(centroids.shape, (len(self.frames), 2))
+        for f, moi, c in zip(self.frames, mois, centroids):
+            emoi, ec, _ = sm.compute(f)
+            self.assertAlmostEqual(moi, emoi)
+            numpy.testing.assert_almost_equal(c, ec)
+
+    def test_black(self):
+        data = numpy.zeros((2, 48, 64), dtype=numpy.uint16)
+        sm = spot.SpotMetrics()
+        self.assertTrue(math.isnan(sm.compute(model.DataArray(data[0]))[0]))
+        mois, _ = sm.computeStack(data)
+        self.assertTrue(numpy.isnan(mois).all())
+
+    def test_speed(self):
+        sm = spot.SpotMetrics(self.background)
+        startt = time.time()
+        for f in self.frames:
+            spot.MomentOfInertia(f, self.background)
+        dur_func = time.time() - startt
+
+        startt = time.time()
+        for f in self.frames:
+            sm.compute(f)
+        dur_metrics = time.time() - startt
+        logging.info("MoI computed in %g s per frame (%g s with SpotMetrics)",
+                     dur_func / len(self.frames), dur_metrics / len(self.frames))
+        # The background noise is only computed once with SpotMetrics, which
+        # should make it about twice faster
+        self.assertLess(dur_metrics, dur_func)
+
+
 class TestSpotIntensity(unittest.TestCase):
     """
     Test SpotIntensity()